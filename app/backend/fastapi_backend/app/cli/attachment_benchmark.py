@@ -0,0 +1,218 @@
+"""
+添付ファイルを JSON の base64 で送る場合と multipart で送る場合の、リクエストの受信から Bedrock へのリクエストのシリアライズまでの
+ピークメモリ(RSS)を計測する CLI。
+
+使用例:
+    python -m app.cli.attachment_benchmark --size-mb 20
+
+- 各方式のリクエストボディを一時ファイルに作成し、方式ごとに別プロセスで計測して、処理前の RSS と処理中のピーク RSS の差を出力する。
+- json: /bedrock/converse と同じく、リクエストボディ全体を受信して JSON を解析し、MessageList を検証してから変換する。
+- multipart: /bedrock/converse/attachments と同じく、ボディを 64KiB ずつ受信して一時ファイルに書き出し、メモリマップして渡す。
+- どちらも最後に botocore のシリアライザで Converse のリクエストボディを作成する(送信はしない)。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import botocore.session
+import orjson
+from botocore.serialize import create_serializer
+from starlette.requests import Request
+
+from app.config.bedrock_config import BEDROCK_ATTACHMENT_CONFIG
+from app.schemas.bedrock_schema import MessageList
+from app.services.bedrock.attachments import AttachmentUpload
+from app.services.bedrock.message_conversion import to_messages
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from mypy_boto3_bedrock_runtime.type_defs import MessageTypeDef
+
+# リクエストボディを受信する単位
+RECEIVE_CHUNK_SIZE = 64 * 1024
+
+MULTIPART_BOUNDARY = "attachment-benchmark-boundary"
+
+USER_TEXT = "添付した資料の要点を 3 つにまとめてください。"
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="添付ファイルの受信方式ごとのピークメモリを計測する")
+    parser.add_argument("--size-mb", type=int, default=20, help="添付する文書のサイズ(MiB)")
+    parser.add_argument("--mode", choices=["json", "multipart"], help="計測する方式(内部で使用)")
+    parser.add_argument("--body", type=Path, help="計測するリクエストボディのファイル(内部で使用)")
+    return parser.parse_args(argv)
+
+
+def build_json_body(document: bytes) -> bytes:
+    """
+    文書を base64 で埋め込んだ /bedrock/converse のリクエストボディを作成する。
+
+    Args:
+        document (bytes): 文書
+
+    Returns:
+        bytes: リクエストボディ
+    """
+    content = [{"text": USER_TEXT}, {"document": {"format": "pdf", "name": "report", "source": {"bytes": base64.b64encode(document).decode()}}}]
+    return orjson.dumps({"model_type": "Llama3", "user_input": {"messages": [{"role": "user", "content": content}]}})
+
+
+def build_multipart_body(document: bytes) -> bytes:
+    """
+    文書を添付した /bedrock/converse/attachments のリクエストボディを作成する。
+
+    Args:
+        document (bytes): 文書
+
+    Returns:
+        bytes: リクエストボディ
+    """
+    user_input = orjson.dumps({"messages": [{"role": "user", "content": [{"text": USER_TEXT}]}]})
+    parts = [
+        f'--{MULTIPART_BOUNDARY}\r\nContent-Disposition: form-data; name="model_type"\r\n\r\nLlama3\r\n'.encode(),
+        f'--{MULTIPART_BOUNDARY}\r\nContent-Disposition: form-data; name="user_input"\r\n\r\n'.encode() + user_input + b"\r\n",
+        (f'--{MULTIPART_BOUNDARY}\r\nContent-Disposition: form-data; name="files"; filename="report.pdf"\r\nContent-Type: application/pdf\r\n\r\n').encode()
+        + document
+        + b"\r\n",
+        f"--{MULTIPART_BOUNDARY}--\r\n".encode(),
+    ]
+    return b"".join(parts)
+
+
+def serialize(messages: Sequence[MessageTypeDef]) -> int:
+    """
+    botocore のシリアライザで Converse のリクエストボディを作成し、そのサイズを返す。
+
+    Args:
+        messages (Sequence[MessageTypeDef]): 会話履歴
+
+    Returns:
+        int: リクエストボディのサイズ(バイト)
+    """
+    service_model = botocore.session.get_session().get_service_model("bedrock-runtime")
+    operation_model = service_model.operation_model("Converse")
+    serializer = create_serializer(service_model.metadata["protocol"], include_validation=True)
+    serialized = serializer.serialize_to_request({"modelId": "benchmark", "messages": messages}, operation_model)
+    return len(serialized["body"])
+
+
+def run_json(body_path: Path) -> int:
+    """
+    JSON の base64 で受け取った場合の処理を行う。
+
+    Args:
+        body_path (Path): リクエストボディのファイル
+
+    Returns:
+        int: Bedrock へのリクエストボディのサイズ(バイト)
+    """
+    payload: dict[str, Any] = orjson.loads(body_path.read_bytes())
+    messages = to_messages(MessageList.model_validate(payload["user_input"]))
+    for message in messages:
+        for block in message["content"]:
+            if "document" in block:
+                source: Any = block["document"]["source"]
+                source["bytes"] = base64.b64decode(source["bytes"])
+    return serialize(messages)
+
+
+async def run_multipart(body_path: Path) -> int:
+    """
+    multipart で受け取った場合の処理を行う。
+
+    Args:
+        body_path (Path): リクエストボディのファイル
+
+    Returns:
+        int: Bedrock へのリクエストボディのサイズ(バイト)
+    """
+    body_file = body_path.open("rb")
+
+    async def receive() -> dict[str, Any]:
+        chunk = body_file.read(RECEIVE_CHUNK_SIZE)
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunk)}
+
+    scope = {"type": "http", "method": "POST", "headers": [(b"content-type", f"multipart/form-data; boundary={MULTIPART_BOUNDARY}".encode())]}
+    attachments = AttachmentUpload(BEDROCK_ATTACHMENT_CONFIG)
+    try:
+        form = await attachments.parse(Request(scope, receive))
+        user_input = MessageList.model_validate_json(str(form["user_input"]))
+        messages = to_messages(user_input)
+        messages[-1]["content"] = [*messages[-1]["content"], *attachments.content_blocks("files")]
+        return serialize(messages)
+    finally:
+        await attachments.aclose()
+        body_file.close()
+
+
+def measure(mode: str, body_path: Path) -> int:
+    """
+    このプロセスで 1 つの方式を計測し、結果を出力する。
+
+    Args:
+        mode (str): 方式
+        body_path (Path): リクエストボディのファイル
+
+    Returns:
+        int: 終了コード
+    """
+    baseline_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    request_size = run_json(body_path) if mode == "json" else asyncio.run(run_multipart(body_path))
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    body_mib = body_path.stat().st_size / 1024 / 1024
+    print(f"{mode:>10} {body_mib:>9.1f} {request_size / 1024 / 1024:>11.1f} {(peak_kib - baseline_kib) / 1024:>13.1f}")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。方式ごとに別プロセスで計測する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード
+    """
+    args = parse_args(argv)
+    if args.mode is not None:
+        return measure(args.mode, args.body)
+
+    document = os.urandom(args.size_mb * 1024 * 1024)
+    builders = {"json": build_json_body, "multipart": build_multipart_body}
+    print(f"{'mode':>10} {'body_mib':>9} {'request_mib':>11} {'peak_rss_mib':>13}")
+    sys.stdout.flush()
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, build_body in builders.items():
+            body_path = Path(directory) / f"{mode}.body"
+            body_path.write_bytes(build_body(document))
+            command = [sys.executable, "-m", "app.cli.attachment_benchmark", "--mode", mode, "--body", str(body_path)]
+            completed = subprocess.run(command, check=False)
+            if completed.returncode != 0:
+                return completed.returncode
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
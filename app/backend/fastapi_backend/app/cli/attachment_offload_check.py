@@ -0,0 +1,304 @@
+"""
+添付ファイルの S3 への退避(AttachmentOffloader)を、ローカルの偽の S3 エンドポイントに対して動作確認する CLI。
+
+使用例:
+    python -m app.cli.attachment_offload_check --size-kb 256 --concurrency 10
+
+- FakeS3Server を起動し、その URL を endpoint_url に指定した S3 クライアントで AttachmentOffloader を作成する。
+- 次の項目を確認し、項目 / 結果 / 所要時間 の表で出力する。1 つでも失敗した場合は終了コード 1 を返す。
+  - below_threshold: しきい値未満の添付ファイルはバイト列のまま残し、S3 を呼び出さない
+  - offload: しきい値以上の添付ファイルを内容のハッシュ値のキーでアップロードし、bucketOwner 付きの s3Location に置き換える
+  - concurrent_dedupe: 同じ内容の同時の退避はアップロード 1 回にまとまる
+  - existing_object: 記憶していないキーも head_object で存在を確認し、既にあればアップロードしない
+  - mmap: mmap の添付ファイルをコピーせずにアップロードし、内容が一致する
+  - failure_fallback: S3 に接続できない場合はバイト列のまま送り、失敗として数える
+- 認証情報が環境変数にない場合は、ダミーの値を設定する(偽のエンドポイントは署名を検証しない)。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import sys
+import tempfile
+import time
+from typing import TYPE_CHECKING, Any
+
+import boto3
+from botocore.config import Config
+
+from app.cli.fake_s3_server import FakeS3Server
+from app.services.bedrock import attachment_offload
+from app.services.bedrock.attachment_offload import AttachmentOffloader
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from mypy_boto3_s3 import S3Client
+
+    from app.types.bedrock_type_defs import AttachmentOffloadConfigTypeDef
+
+# 退避先のバケットとプレフィックス
+BUCKET = "attachment-offload-check"
+PREFIX = "attachments/"
+
+# 退避先のバケットの所有者のアカウントID
+BUCKET_OWNER = "000000000000"
+
+# 接続できない S3 のエンドポイント(failure_fallback で使用する)
+UNREACHABLE_ENDPOINT_URL = "http://127.0.0.1:9"
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="添付ファイルの S3 への退避を偽のエンドポイントに対して動作確認する")
+    parser.add_argument("--size-kb", type=int, default=256, help="退避させる添付ファイルのサイズ(KB)")
+    parser.add_argument("--concurrency", type=int, default=10, help="同じ内容を同時に退避させる数")
+    return parser.parse_args(argv)
+
+
+class AttachmentOffloadCheck:
+    """
+    偽の S3 エンドポイントに対して AttachmentOffloader を実行して、退避の結果を確認する
+    """
+
+    def __init__(self, s3: FakeS3Server, args: argparse.Namespace) -> None:
+        self.s3 = s3
+        self.args = args
+        self.threshold_bytes = args.size_kb * 1024
+        self._seed = 0
+
+    async def check_below_threshold(self) -> None:
+        """
+        しきい値未満の添付ファイルはバイト列のまま残すことを確認する。
+        """
+        offloader = self._offloader()
+        data = self._payload(self.threshold_bytes - 1)
+        operations = dict(self.s3.operations)
+        messages = await offloader.offload(_messages(data))
+        _expect(_source(messages) == {"bytes": data}, "attachment below the threshold was replaced")
+        _expect(self.s3.operations == operations, f"unexpected S3 calls: {self.s3.operations}")
+
+    async def check_offload(self) -> None:
+        """
+        しきい値以上の添付ファイルを内容のハッシュ値のキーでアップロードし、s3Location に置き換えることを確認する。
+        """
+        offloader = self._offloader()
+        data = self._payload(self.threshold_bytes)
+        messages = await offloader.offload(_messages(data))
+        key = f"{PREFIX}{hashlib.sha256(data).hexdigest()}.mp4"
+        expected = {"s3Location": {"uri": f"s3://{BUCKET}/{key}", "bucketOwner": BUCKET_OWNER}}
+        _expect(_source(messages) == expected, f"unexpected source: {_source(messages)}")
+        _expect(self.s3.get_object(BUCKET, key) == data, "uploaded object does not match the attachment")
+        stats = offloader.stats()
+        _expect(stats["offloaded"] == 1 and stats["uploads"] == 1 and stats["uploaded_bytes"] == len(data), f"unexpected stats: {stats}")
+
+    async def check_concurrent_dedupe(self) -> None:
+        """
+        同じ内容の同時の退避が、アップロード 1 回にまとまることを確認する。
+        """
+        offloader = self._offloader()
+        data = self._payload(self.threshold_bytes)
+        puts = self.s3.operations.get("PutObject", 0)
+        results = await asyncio.gather(*(offloader.offload(_messages(data)) for _ in range(self.args.concurrency)))
+        _expect(all("s3Location" in _source(messages) for messages in results), "some attachments were not offloaded")
+        _expect(self.s3.operations.get("PutObject", 0) - puts == 1, f"{self.s3.operations.get('PutObject', 0) - puts} uploads for the same content")
+        stats = offloader.stats()
+        _expect(stats["dedupe_hits"] == self.args.concurrency - 1, f"unexpected stats: {stats}")
+
+    async def check_existing_object(self) -> None:
+        """
+        記憶していないキーも、S3 に既にあればアップロードしないことを確認する。
+        """
+        data = self._payload(self.threshold_bytes)
+        await self._offloader().offload(_messages(data))
+        puts = self.s3.operations.get("PutObject", 0)
+        # 別のプロセスを想定し、アップロード済みのキーを記憶していない AttachmentOffloader で退避する
+        offloader = self._offloader()
+        messages = await offloader.offload(_messages(data))
+        _expect("s3Location" in _source(messages), "attachment was not offloaded")
+        _expect(self.s3.operations.get("PutObject", 0) == puts, "existing object was uploaded again")
+        _expect(offloader.stats()["dedupe_hits"] == 1, f"unexpected stats: {offloader.stats()}")
+
+    async def check_mmap(self) -> None:
+        """
+        mmap の添付ファイルをアップロードし、内容が一致することを確認する。
+        """
+        offloader = self._offloader()
+        data = self._payload(self.threshold_bytes)
+        with tempfile.TemporaryFile() as file:
+            file.write(data)
+            file.flush()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                # 読み込み位置が先頭でなくても、内容全体をアップロードすることを確認する
+                mapping.seek(len(data) // 2)
+                messages = await offloader.offload(_messages(mapping))
+        key = f"{PREFIX}{hashlib.sha256(data).hexdigest()}.mp4"
+        _expect("s3Location" in _source(messages), "attachment was not offloaded")
+        _expect(self.s3.get_object(BUCKET, key) == data, "uploaded object does not match the attachment")
+
+    async def check_failure_fallback(self) -> None:
+        """
+        S3 に接続できない場合に、バイト列のまま送ることを確認する。
+        """
+        s3_client = boto3.client("s3", endpoint_url=UNREACHABLE_ENDPOINT_URL, config=Config(retries={"max_attempts": 1}, connect_timeout=1))
+        offloader = AttachmentOffloader(self._config(), s3_client)
+        data = self._payload(self.threshold_bytes)
+        messages = await offloader.offload(_messages(data))
+        _expect(_source(messages) == {"bytes": data}, "attachment was not kept as bytes")
+        _expect(offloader.stats()["failures"] == 1, f"unexpected stats: {offloader.stats()}")
+
+    def _offloader(self) -> AttachmentOffloader:
+        """
+        偽のエンドポイントに接続する AttachmentOffloader を作成する。
+
+        Returns:
+            AttachmentOffloader: 作成した AttachmentOffloader
+        """
+        s3_client: S3Client = boto3.client("s3", endpoint_url=self.s3.url)
+        return AttachmentOffloader(self._config(), s3_client)
+
+    def _config(self) -> AttachmentOffloadConfigTypeDef:
+        """
+        確認用の設定を返す。
+
+        Returns:
+            AttachmentOffloadConfigTypeDef: 設定
+        """
+        return {
+            "enabled": True,
+            "bucket": BUCKET,
+            "prefix": PREFIX,
+            "bucket_owner": BUCKET_OWNER,
+            "threshold_bytes": self.threshold_bytes,
+            "known_keys_max_entries": 100,
+        }
+
+    def _payload(self, size: int) -> bytes:
+        """
+        確認項目ごとに異なる内容の添付ファイルを作成する。
+
+        Args:
+            size (int): サイズ(バイト)
+
+        Returns:
+            bytes: 添付ファイルの内容
+        """
+        self._seed += 1
+        block = hashlib.sha256(str(self._seed).encode()).digest()
+        return (block * (size // len(block) + 1))[:size]
+
+
+def _messages(data: bytes | mmap.mmap) -> Any:  # noqa: ANN401
+    """
+    動画の添付ファイルを 1 つ含む会話履歴を作成する。
+
+    Args:
+        data (bytes | mmap.mmap): 添付ファイルの内容
+
+    Returns:
+        Any: 会話履歴
+    """
+    return [{"role": "user", "content": [{"text": "この動画を要約してください。"}, {"video": {"format": "mp4", "source": {"bytes": data}}}]}]
+
+
+def _source(messages: Any) -> Any:  # noqa: ANN401
+    """
+    会話履歴の動画の添付ファイルの source を返す。
+
+    Args:
+        messages (Any): 会話履歴
+
+    Returns:
+        Any: source
+    """
+    return messages[0]["content"][1]["video"]["source"]
+
+
+def _expect(condition: bool, message: str) -> None:
+    """
+    条件を満たさない場合に確認の失敗とする。
+
+    Args:
+        condition (bool): 条件
+        message (str): 失敗時のメッセージ
+
+    Raises:
+        AssertionError: 条件を満たさない場合
+    """
+    if not condition:
+        raise AssertionError(message)
+
+
+async def run(s3: FakeS3Server, args: argparse.Namespace) -> list[tuple[str, str, float]]:
+    """
+    全項目を確認する。
+
+    Args:
+        s3 (FakeS3Server): 偽の S3 エンドポイント
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        list[tuple[str, str, float]]: 項目ごとの名前・結果(ok もしくは失敗の内容)・所要時間(秒)
+    """
+    check = AttachmentOffloadCheck(s3, args)
+    checks: dict[str, Callable[[], Awaitable[None]]] = {
+        "below_threshold": check.check_below_threshold,
+        "offload": check.check_offload,
+        "concurrent_dedupe": check.check_concurrent_dedupe,
+        "existing_object": check.check_existing_object,
+        "mmap": check.check_mmap,
+        "failure_fallback": check.check_failure_fallback,
+    }
+    results: list[tuple[str, str, float]] = []
+    for name, run_check in checks.items():
+        started_at = time.perf_counter()
+        try:
+            await run_check()
+            result = "ok"
+        except Exception as e:  # noqa: BLE001
+            result = f"FAILED: {type(e).__name__}: {e}"
+        results.append((name, result, time.perf_counter() - started_at))
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード(すべて成功した場合は0)
+    """
+    args = parse_args(argv)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    # failure_fallback で想定どおりに出る退避失敗の警告を出力しない
+    logging.getLogger(attachment_offload.__name__).setLevel(logging.ERROR)
+    with FakeS3Server() as s3:
+        results = asyncio.run(run(s3, args))
+    failed = False
+    print(f"{'check':<18} {'time_ms':>9}  result")
+    for name, result, elapsed in results:
+        failed = failed or result != "ok"
+        print(f"{name:<18} {elapsed * 1000:>9.1f}  {result}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
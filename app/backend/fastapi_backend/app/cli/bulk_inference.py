@@ -0,0 +1,193 @@
+"""
+JSONL の会話入力(1 行 1 件の MessageList)を一括で推論するオフライン CLI。
+
+使用例:
+    python -m app.cli.bulk_inference inputs.jsonl outputs.jsonl --model-type Llama3 --concurrency 16
+
+- 結果は出力ファイルに `{"index": 入力のインデックス, "output": 応答}` の JSONL で追記する。
+- エラーになった入力は `<出力ファイル>.errors.jsonl` に書き込み、再実行時に再処理する。
+- 進捗は `<出力ファイル>.checkpoint.jsonl` に記録し、中断後に同じコマンドを再実行すると続きから再開する。
+- 未処理の件数が閾値以上の場合は Bedrock のバッチ推論ジョブを使用する。
+  入力ファイル `<出力ファイル>.batch_input.jsonl` を作成し、--s3-uri / --role-arn が指定されていれば
+  ジョブを実行して出力ファイル `<出力ファイル>.batch_output.jsonl` を取り込む。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import boto3
+
+from app.config.bedrock_config import BEDROCK_BULK_INFERENCE_CONFIG, BEDROCK_CLIENT_CONFIG, BEDROCK_DEFAULT_REGION
+from app.dependencies.bedrock_dependencies import CONFIG_MAPPING, MODEL_MAPPING
+from app.interfaces.bedrock_interface import BedrockModelBase, ISupportsBatchInference, ISupportsConverse
+from app.services.bedrock.bulk_inference import (
+    BedrockBatchJob,
+    BulkInferenceCheckpoint,
+    BulkInferenceError,
+    BulkInferenceWriter,
+    read_batch_job_output,
+    read_inputs,
+    run_online,
+    write_batch_job_input,
+)
+from app.services.bedrock.client_registry import BedrockClientRegistry
+from app.types.bedrock_type_defs import ModelType
+
+if TYPE_CHECKING:
+    from app.schemas.bedrock_schema import MessageList
+
+logger = logging.getLogger(__name__)
+
+# 終了コード
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_BATCH_INPUT_ONLY = 2
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="JSONL の会話入力を一括で推論する")
+    parser.add_argument("input", type=Path, help="入力ファイル(1 行 1 件の MessageList の JSONL)")
+    parser.add_argument("output", type=Path, help="出力ファイル(JSONL)")
+    parser.add_argument("--model-type", type=ModelType, default=ModelType.LLAMA3, help="使用するモデルの種類")
+    parser.add_argument("--concurrency", type=int, default=BEDROCK_BULK_INFERENCE_CONFIG["concurrency"], help="同時実行数")
+    parser.add_argument(
+        "--batch-job-threshold",
+        type=int,
+        default=BEDROCK_BULK_INFERENCE_CONFIG["batch_job_threshold"],
+        help="未処理の件数がこの値以上の場合はバッチ推論ジョブを使用する",
+    )
+    parser.add_argument("--s3-uri", help="バッチ推論ジョブの入出力ファイルを置く S3 のプレフィックス(s3://bucket/prefix)")
+    parser.add_argument("--role-arn", help="バッチ推論ジョブが S3 にアクセスするための IAM ロールの ARN")
+    parser.add_argument("--region", default=BEDROCK_DEFAULT_REGION, help="リージョン")
+    parser.add_argument("--poll-interval", type=float, default=BEDROCK_BULK_INFERENCE_CONFIG["poll_interval"], help="ジョブの状態を確認する間隔(秒)")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> int:
+    """
+    一括推論を実行する。
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        int: 終了コード
+    """
+    input_sha256, inputs = read_inputs(args.input)
+    checkpoint = BulkInferenceCheckpoint(args.output.with_name(f"{args.output.name}.checkpoint.jsonl"), input_sha256, len(inputs))
+    pending = [index for index in range(len(inputs)) if index not in checkpoint.completed]
+    logger.info("入力: %d 件, 完了済み: %d 件, 未処理: %d 件", len(inputs), len(checkpoint.completed), len(pending))
+    if not pending:
+        return EXIT_OK
+
+    client_registry = BedrockClientRegistry(default_region=args.region, client_config=BEDROCK_CLIENT_CONFIG)
+    service: BedrockModelBase = MODEL_MAPPING[args.model_type].from_dependency(
+        client=client_registry.get_client(args.model_type),
+        config=CONFIG_MAPPING[args.model_type],
+    )
+    writer = BulkInferenceWriter(args.output, args.output.with_name(f"{args.output.name}.errors.jsonl"), checkpoint)
+    try:
+        use_batch_job = checkpoint.batch_job_arn is not None or len(pending) >= args.batch_job_threshold
+        if use_batch_job and isinstance(service, ISupportsBatchInference):
+            exit_code = await asyncio.to_thread(run_batch_job, args, service, inputs, pending, writer)
+        elif isinstance(service, ISupportsConverse):
+            await run_online(service, inputs, pending, writer, args.concurrency)
+            exit_code = EXIT_OK
+        else:
+            logger.error("このモデルは対応してません: %s", args.model_type.value)
+            return EXIT_FAILED
+    finally:
+        writer.close()
+        await client_registry.aclose()
+
+    logger.info("完了: 成功=%d, 失敗=%d", writer.succeeded, writer.failed)
+    if exit_code == EXIT_OK and writer.failed:
+        return EXIT_FAILED
+    return exit_code
+
+
+def run_batch_job(
+    args: argparse.Namespace,
+    service: ISupportsBatchInference,
+    inputs: list[MessageList | str],
+    pending: list[int],
+    writer: BulkInferenceWriter,
+) -> int:
+    """
+    バッチ推論ジョブで未処理の入力を推論する。
+    作成済みのジョブがチェックポイントに記録されている場合は、その完了を待って結果を取り込む。
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+        service (ISupportsBatchInference): バッチ推論ジョブに対応したモデルサービス
+        inputs (list[MessageList | str]): 全入力
+        pending (list[int]): 未処理の入力のインデックス
+        writer (BulkInferenceWriter): 結果のライター
+
+    Returns:
+        int: 終了コード
+    """
+    checkpoint = writer.checkpoint
+    session = boto3.session.Session(region_name=args.region)
+    batch_job = BedrockBatchJob(session.client("bedrock"), session.client("s3"))
+
+    if checkpoint.batch_job_arn is None:
+        input_path = args.output.with_name(f"{args.output.name}.batch_input.jsonl")
+        records = write_batch_job_input(service, inputs, pending, input_path, writer)
+        logger.info("バッチ推論ジョブの入力ファイルを作成しました (path=%s, 件数=%d)", input_path, records)
+        if not args.s3_uri or not args.role_arn:
+            logger.info("--s3-uri と --role-arn を指定して再実行すると、バッチ推論ジョブを実行します")
+            return EXIT_BATCH_INPUT_ONLY
+        checkpoint.record_batch_job(batch_job.submit(input_path, args.s3_uri, args.role_arn, service.batch_model_id()))
+
+    job_arn = checkpoint.batch_job_arn
+    if job_arn is None:
+        return EXIT_FAILED
+    status = batch_job.wait(job_arn, args.poll_interval)
+    output_path = args.output.with_name(f"{args.output.name}.batch_output.jsonl")
+    batch_job.download_output(job_arn, output_path)
+    read_batch_job_output(service, output_path, writer)
+    checkpoint.record_batch_job(None)
+    logger.info("バッチ推論ジョブの結果を取り込みました (status=%s)", status)
+    return EXIT_OK
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード
+    """
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - [%(name)s] - %(levelname)s : %(message)s")
+    args = parse_args(argv)
+    try:
+        return asyncio.run(run(args))
+    except BulkInferenceError:
+        logger.exception("一括推論を継続できません")
+        return EXIT_FAILED
+    except KeyboardInterrupt:
+        logger.warning("中断しました。同じコマンドを再実行すると続きから再開します")
+        return EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+一括推論の CLI(app.cli.bulk_inference)を、ローカルの偽の Bedrock と S3 のエンドポイントに対して動作確認する CLI。
+
+使用例:
+    python -m app.cli.bulk_inference_check --inputs 20
+
+- FakeBedrockServer と FakeS3Server を起動し、AWS_ENDPOINT_URL_BEDROCK_RUNTIME・AWS_ENDPOINT_URL_BEDROCK・AWS_ENDPOINT_URL_S3 を
+  それぞれの URL に設定してから、一時ディレクトリ上の入力ファイルで bulk_inference の main を呼び出す。
+- 次の項目を確認し、項目 / 結果 / 所要時間 の表で出力する。1 つでも失敗した場合は終了コード 1 を返す。
+  - online: 検証エラーの行を含む入力を Converse API で処理し、結果とエラーをそれぞれのファイルに書き込む
+  - resume: 同じコマンドを再実行すると、完了済みの入力を Bedrock に送らない
+  - batch_input_only: 未処理の件数が閾値以上で --s3-uri がない場合、バッチ推論ジョブの入力ファイルのみを作成する
+  - batch_job: --s3-uri と --role-arn を指定すると、入力ファイルを S3 に置いてジョブを実行し、出力ファイルを取り込む
+- 認証情報が環境変数にない場合は、ダミーの値を設定する(偽のエンドポイントは署名を検証しない)。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import orjson
+
+from app.cli import bulk_inference
+from app.cli.fake_bedrock_server import FakeBedrockServer
+from app.cli.fake_s3_server import FakeS3Server
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+# バッチ推論ジョブの入出力ファイルを置く S3 のプレフィックス
+S3_URI = "s3://bulk-inference-check/jobs/"
+
+# バッチ推論ジョブに渡す IAM ロールの ARN(偽のエンドポイントは検証しない)
+ROLE_ARN = "arn:aws:iam::000000000000:role/bedrock-batch"
+
+# オンラインで処理させるための、バッチ推論ジョブの閾値
+NO_BATCH_JOB_THRESHOLD = 1_000_000
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="一括推論の CLI を偽のエンドポイントに対して動作確認する")
+    parser.add_argument("--inputs", type=int, default=20, help="入力ファイルの件数")
+    parser.add_argument("--concurrency", type=int, default=8, help="オンラインで処理する場合の同時実行数")
+    return parser.parse_args(argv)
+
+
+class BulkInferenceCheck:
+    """
+    一時ディレクトリ上の入力ファイルで一括推論の CLI を実行して、出力を確認する
+    """
+
+    def __init__(self, workdir: Path, bedrock: FakeBedrockServer, s3: FakeS3Server, args: argparse.Namespace) -> None:
+        self.workdir = workdir
+        self.bedrock = bedrock
+        self.s3 = s3
+        self.args = args
+
+    def check_online(self) -> None:
+        """
+        検証エラーの行を含む入力をオンラインで処理し、結果とエラーが書き込まれることを確認する。
+        """
+        input_path, output_path = self._write_inputs("online", invalid_lines=1)
+        exit_code = self._run(input_path, output_path, "--batch-job-threshold", str(NO_BATCH_JOB_THRESHOLD))
+        _expect(exit_code == bulk_inference.EXIT_FAILED, f"unexpected exit code: {exit_code}")
+        self._expect_outputs(output_path)
+        errors = _read_jsonl(output_path.with_name(f"{output_path.name}.errors.jsonl"))
+        _expect([error["index"] for error in errors] == [self.args.inputs], f"unexpected errors: {errors}")
+
+    def check_resume(self) -> None:
+        """
+        同じコマンドを再実行しても、完了済みの入力を Bedrock に送らないことを確認する。
+        """
+        input_path, output_path = self.workdir / "online.jsonl", self.workdir / "online.out.jsonl"
+        requests = self.bedrock.requests
+        exit_code = self._run(input_path, output_path, "--batch-job-threshold", str(NO_BATCH_JOB_THRESHOLD))
+        _expect(exit_code == bulk_inference.EXIT_FAILED, f"unexpected exit code: {exit_code}")
+        _expect(self.bedrock.requests == requests, f"{self.bedrock.requests - requests} completed inputs were sent again")
+        self._expect_outputs(output_path)
+
+    def check_batch_input_only(self) -> None:
+        """
+        --s3-uri を指定しない場合に、バッチ推論ジョブの入力ファイルのみを作成することを確認する。
+        """
+        input_path, output_path = self._write_inputs("batch")
+        exit_code = self._run(input_path, output_path, "--batch-job-threshold", "1")
+        _expect(exit_code == bulk_inference.EXIT_BATCH_INPUT_ONLY, f"unexpected exit code: {exit_code}")
+        records = _read_jsonl(output_path.with_name(f"{output_path.name}.batch_input.jsonl"))
+        _expect([record["recordId"] for record in records] == [str(index) for index in range(self.args.inputs)], "unexpected batch input records")
+
+    def check_batch_job(self) -> None:
+        """
+        バッチ推論ジョブを実行し、S3 の出力ファイルを取り込むことを確認する。
+        """
+        input_path, output_path = self.workdir / "batch.jsonl", self.workdir / "batch.out.jsonl"
+        jobs = len(self.bedrock.jobs)
+        exit_code = self._run(input_path, output_path, "--batch-job-threshold", "1", "--s3-uri", S3_URI, "--role-arn", ROLE_ARN, "--poll-interval", "0")
+        _expect(exit_code == bulk_inference.EXIT_OK, f"unexpected exit code: {exit_code}")
+        _expect(len(self.bedrock.jobs) == jobs + 1, "batch job was not created")
+        _expect(self.s3.operations.get("PutObject", 0) >= 1 and self.s3.operations.get("GetObject", 0) >= 1, f"unexpected S3 calls: {self.s3.operations}")
+        self._expect_outputs(output_path)
+
+    def _write_inputs(self, name: str, invalid_lines: int = 0) -> tuple[Path, Path]:
+        """
+        入力ファイルを作成する。
+
+        Args:
+            name (str): ファイル名の接頭辞
+            invalid_lines (int, optional): 末尾に追加する検証エラーの行数
+
+        Returns:
+            tuple[Path, Path]: 入力ファイルと出力ファイルのパス
+        """
+        lines = [{"messages": [{"role": "user", "content": [{"text": f"質問 {index}"}]}]} for index in range(self.args.inputs)]
+        lines += [{"messages": [{"role": "system"}]} for _ in range(invalid_lines)]
+        input_path = self.workdir / f"{name}.jsonl"
+        input_path.write_bytes(b"".join(orjson.dumps(line, option=orjson.OPT_APPEND_NEWLINE) for line in lines))
+        return input_path, self.workdir / f"{name}.out.jsonl"
+
+    def _run(self, input_path: Path, output_path: Path, *options: str) -> int:
+        """
+        一括推論の CLI を実行する。
+
+        Args:
+            input_path (Path): 入力ファイルのパス
+            output_path (Path): 出力ファイルのパス
+            *options (str): 追加のコマンドライン引数
+
+        Returns:
+            int: 終了コード
+        """
+        return bulk_inference.main([str(input_path), str(output_path), "--concurrency", str(self.args.concurrency), *options])
+
+    def _expect_outputs(self, output_path: Path) -> None:
+        """
+        すべての有効な入力の結果が 1 件ずつ書き込まれていることを確認する。
+
+        Args:
+            output_path (Path): 出力ファイルのパス
+        """
+        outputs = _read_jsonl(output_path)
+        expected_text = "".join(self.bedrock.delta_texts())
+        _expect(sorted(output["index"] for output in outputs) == list(range(self.args.inputs)), f"unexpected output indexes ({len(outputs)} lines)")
+        _expect(all(output["output"] == expected_text for output in outputs), "unexpected output text")
+
+
+def _read_jsonl(path: Path) -> list[dict[str, Any]]:
+    """
+    JSONL ファイルを読み込む。
+
+    Args:
+        path (Path): ファイルのパス
+
+    Returns:
+        list[dict[str, Any]]: 各行の値。ファイルがない場合は空のリスト
+    """
+    if not path.exists():
+        return []
+    return [orjson.loads(line) for line in path.read_bytes().splitlines() if line.strip()]
+
+
+def _expect(condition: bool, message: str) -> None:
+    """
+    条件を満たさない場合に確認の失敗とする。
+
+    Args:
+        condition (bool): 条件
+        message (str): 失敗時のメッセージ
+
+    Raises:
+        AssertionError: 条件を満たさない場合
+    """
+    if not condition:
+        raise AssertionError(message)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード(すべて成功した場合は0)
+    """
+    args = parse_args(argv)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+    failed = False
+    with FakeS3Server() as s3, FakeBedrockServer(s3=s3) as bedrock, tempfile.TemporaryDirectory() as workdir:
+        os.environ["AWS_ENDPOINT_URL_BEDROCK_RUNTIME"] = bedrock.url
+        os.environ["AWS_ENDPOINT_URL_BEDROCK"] = bedrock.url
+        os.environ["AWS_ENDPOINT_URL_S3"] = s3.url
+        check = BulkInferenceCheck(Path(workdir), bedrock, s3, args)
+        checks: dict[str, Callable[[], None]] = {
+            "online": check.check_online,
+            "resume": check.check_resume,
+            "batch_input_only": check.check_batch_input_only,
+            "batch_job": check.check_batch_job,
+        }
+        results: list[tuple[str, str, float]] = []
+        for name, run_check in checks.items():
+            started_at = time.perf_counter()
+            try:
+                run_check()
+                result = "ok"
+            except Exception as e:  # noqa: BLE001
+                result = f"FAILED: {type(e).__name__}: {e}"
+            results.append((name, result, time.perf_counter() - started_at))
+    print(f"{'check':<18} {'time_ms':>9}  result")
+    for name, result, elapsed in results:
+        failed = failed or result != "ok"
+        print(f"{name:<18} {elapsed * 1000:>9.1f}  {result}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,434 @@
+"""
+Bedrock ランタイム(とバッチ推論ジョブの API)の代わりにローカルで応答する、検証用の偽のエンドポイントを実装する。
+
+使用例:
+    python -m app.cli.fake_bedrock_server --port 9000 --deltas 200 --delta-interval-ms 20
+    BEDROCK_ENDPOINT_URL=http://127.0.0.1:9000 AWS_ACCESS_KEY_ID=test AWS_SECRET_ACCESS_KEY=test uvicorn app.main:app
+
+- Converse / Converse Stream / Invoke Model / Invoke Model With Response Stream の 4 つの API に、
+  本物と同じ形式(JSON とイベントストリームのフレーム)で応答する。署名は検証しない。
+- ストリームは指定した数の差分を指定した間隔で返す。
+- モデルIDが "invalid" で始まる場合は ValidationException(400)を返す。
+  throttle_next に件数を設定すると、その件数のリクエストに ThrottlingException(429)を返す。
+- FakeS3Server を渡した場合は CreateModelInvocationJob / GetModelInvocationJob にも応答する。
+  ジョブは作成時に入力ファイルを S3 から読み込んで出力ファイルを書き込み、すぐに Completed になる。
+- transport_check・bulk_inference_check などの CLI からは FakeBedrockServer をコンテキストマネージャーとして使う。
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import contextlib
+import re
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, Self
+from urllib.parse import unquote, urlparse
+
+import orjson
+
+if TYPE_CHECKING:
+    from types import TracebackType
+
+    from app.cli.fake_s3_server import FakeS3Server
+
+# リクエストのパス(/model/<モデルID>/<操作>)
+_PATH_PATTERN = re.compile(r"^/model/(?P<model_id>[^/]+)/(?P<operation>converse|converse-stream|invoke|invoke-with-response-stream)$")
+
+# バッチ推論ジョブの API のパス
+_JOB_PATH = "/model-invocation-job"
+
+# 応答に使う差分(Llama の 1 トークン程度の長さ)
+DELTA_TEXTS = ["料金", "は", "月額", "の", "基本", "料金", "と", "従量", "課金", "の", "組み合わせ", "です", "。"]
+
+# 応答で返す入力トークン数
+INPUT_TOKENS = 20
+
+# イベントストリームのヘッダーの値の型(文字列)
+_HEADER_TYPE_STRING = 7
+
+
+def encode_event_frame(headers: dict[str, str], payload: bytes) -> bytes:
+    """
+    イベントストリーム(application/vnd.amazon.eventstream)の 1 フレームを組み立てる。
+
+    Args:
+        headers (dict[str, str]): フレームのヘッダー
+        payload (bytes): フレームの本文
+
+    Returns:
+        bytes: プレリュード・ヘッダー・本文と CRC を含むフレーム
+    """
+    encoded_headers = b"".join(
+        struct.pack("!B", len(name)) + name.encode() + struct.pack("!BH", _HEADER_TYPE_STRING, len(value.encode())) + value.encode()
+        for name, value in headers.items()
+    )
+    total_length = 12 + len(encoded_headers) + len(payload) + 4
+    prelude = struct.pack("!II", total_length, len(encoded_headers))
+    message = prelude + struct.pack("!I", zlib.crc32(prelude)) + encoded_headers + payload
+    return message + struct.pack("!I", zlib.crc32(message))
+
+
+def encode_event(event_type: str, body: dict[str, Any]) -> bytes:
+    """
+    イベントの種類と本文から、イベントのフレームを組み立てる。
+
+    Args:
+        event_type (str): イベントの種類(contentBlockDelta・chunk など)
+        body (dict[str, Any]): イベントの本文
+
+    Returns:
+        bytes: イベントのフレーム
+    """
+    headers = {":event-type": event_type, ":content-type": "application/json", ":message-type": "event"}
+    return encode_event_frame(headers, orjson.dumps(body))
+
+
+class _FakeBedrockHTTPServer(ThreadingHTTPServer):
+    """
+    リクエストハンドラーから FakeBedrockServer を参照できるようにした HTTP サーバー
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address: tuple[str, int], fake: FakeBedrockServer) -> None:
+        super().__init__(server_address, FakeBedrockHandler)
+        self.fake = fake
+
+
+class FakeBedrockServer:
+    """
+    別スレッドで起動する偽の Bedrock ランタイムのエンドポイント
+    - with で囲んだ間だけ起動し、url をクライアントの endpoint_url に指定して使う。
+    - 受け付けたリクエストの数と、署名のヘッダー(Authorization)が付いていたリクエストの数を数える。
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, deltas: int = 20, delta_interval: float = 0.0, s3: FakeS3Server | None = None) -> None:
+        self.deltas = deltas
+        self.delta_interval = delta_interval
+        self.s3 = s3
+        self.jobs: dict[str, dict[str, Any]] = {}
+        self.throttle_next = 0
+        self.requests = 0
+        self.signed_requests = 0
+        self._lock = threading.Lock()
+        self._server = _FakeBedrockHTTPServer((host, port), self)
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """
+        エンドポイントの URL。
+
+        Returns:
+            str: http://<ホスト>:<ポート>
+        """
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def start(self) -> None:
+        """
+        別スレッドでリクエストの受け付けを開始する。
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bedrock", daemon=True)
+        self._thread.start()
+
+    def serve_forever(self) -> None:
+        """
+        呼び出したスレッドでリクエストの受け付けを続ける。
+        """
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        """
+        リクエストの受け付けを終了する。
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None) -> None:
+        self.stop()
+
+    def record_request(self, *, signed: bool) -> bool:
+        """
+        リクエストを数え、スロットリングを返すかを判定する。
+
+        Args:
+            signed (bool): 署名のヘッダーが付いていたか
+
+        Returns:
+            bool: ThrottlingException を返す場合はTrue
+        """
+        with self._lock:
+            self.requests += 1
+            self.signed_requests += signed
+            if self.throttle_next > 0:
+                self.throttle_next -= 1
+                return True
+        return False
+
+    def delta_texts(self) -> list[str]:
+        """
+        ストリームで返す差分を返す。
+
+        Returns:
+            list[str]: 差分
+        """
+        return [DELTA_TEXTS[index % len(DELTA_TEXTS)] for index in range(self.deltas)]
+
+    def usage(self) -> dict[str, int]:
+        """
+        Converse API の応答で返すトークン使用量を返す。
+
+        Returns:
+            dict[str, int]: 入力・出力・合計のトークン数
+        """
+        return {"inputTokens": INPUT_TOKENS, "outputTokens": self.deltas, "totalTokens": INPUT_TOKENS + self.deltas}
+
+    def invoke_output(self, request: dict[str, Any]) -> dict[str, Any]:
+        """
+        Invoke Model API(Llama)の応答の本文を返す。バッチ推論ジョブの modelOutput にも使う。
+
+        Args:
+            request (dict[str, Any]): リクエストの本文
+
+        Returns:
+            dict[str, Any]: 応答の本文
+        """
+        return {
+            "generation": "".join(self.delta_texts()),
+            "prompt_token_count": len(str(request.get("prompt", ""))),
+            "generation_token_count": self.deltas,
+            "stop_reason": "stop",
+        }
+
+    def run_job(self, request: dict[str, Any]) -> dict[str, Any]:
+        """
+        バッチ推論ジョブを実行し、GetModelInvocationJob で返すジョブの情報を記録する。
+        入力ファイルの各レコードに modelOutput を付けて、出力先の `<ジョブID>/<入力ファイル名>.out` に書き込む。
+
+        Args:
+            request (dict[str, Any]): CreateModelInvocationJob のリクエストの本文
+
+        Raises:
+            LookupError: S3 が指定されていない、もしくは入力ファイルが存在しない場合
+
+        Returns:
+            dict[str, Any]: ジョブの情報
+        """
+        input_uri = urlparse(request["inputDataConfig"]["s3InputDataConfig"]["s3Uri"])
+        output_uri = urlparse(request["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"])
+        data = self.s3.get_object(input_uri.netloc, input_uri.path.lstrip("/")) if self.s3 is not None else None
+        if self.s3 is None or data is None:
+            msg = f"input file not found: {input_uri.geturl()}"
+            raise LookupError(msg)
+        records = [orjson.loads(line) for line in data.splitlines() if line.strip()]
+        output = b"".join(
+            orjson.dumps({**record, "modelOutput": self.invoke_output(record["modelInput"])}, option=orjson.OPT_APPEND_NEWLINE) for record in records
+        )
+        job_id = uuid.uuid4().hex[:12]
+        output_key = f"{output_uri.path.lstrip('/')}{job_id}/{input_uri.path.rsplit('/', 1)[-1]}.out"
+        self.s3.put_object(output_uri.netloc, output_key, output)
+        job = {
+            **{name: request[name] for name in ("jobName", "roleArn", "modelId", "inputDataConfig", "outputDataConfig")},
+            "jobArn": f"arn:aws:bedrock:us-east-1:000000000000:model-invocation-job/{job_id}",
+            "status": "Completed",
+            "submitTime": "2024-01-01T00:00:00Z",
+        }
+        with self._lock:
+            self.jobs[job["jobArn"]] = job
+        return job
+
+
+class FakeBedrockHandler(BaseHTTPRequestHandler):
+    """
+    偽のエンドポイントのリクエストハンドラー。応答の設定と集計は FakeBedrockServer が持つ。
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: _FakeBedrockHTTPServer
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002, ANN401
+        # アクセスログは出力しない
+        pass
+
+    def do_HEAD(self) -> None:
+        # コネクションの事前確立用
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        job_arn = unquote(self.path.removeprefix(f"{_JOB_PATH}/"))
+        job = self.server.fake.jobs.get(job_arn)
+        if job is None:
+            self._send_error(HTTPStatus.NOT_FOUND, "ResourceNotFoundException", f"job not found: {job_arn}")
+            return
+        self._send_json(HTTPStatus.OK, job)
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        if self.path == _JOB_PATH:
+            self._create_job(orjson.loads(body))
+            return
+        match = _PATH_PATTERN.match(self.path)
+        if match is None:
+            self._send_error(HTTPStatus.NOT_FOUND, "UnknownOperationException", f"unknown path: {self.path}")
+            return
+        model_id, operation = unquote(match["model_id"]), match["operation"]
+        if self.server.fake.record_request(signed="Authorization" in self.headers):
+            self._send_error(HTTPStatus.TOO_MANY_REQUESTS, "ThrottlingException", "Too many requests, please wait before trying again.")
+            return
+        if model_id.startswith("invalid"):
+            self._send_error(HTTPStatus.BAD_REQUEST, "ValidationException", f"The provided model identifier is invalid: {model_id}")
+            return
+        if operation == "converse":
+            self._send_converse()
+        elif operation == "converse-stream":
+            self._send_converse_stream()
+        elif operation == "invoke":
+            self._send_invoke(orjson.loads(body or b"{}"))
+        else:
+            self._send_invoke_stream()
+
+    def _send_json(self, status: HTTPStatus, payload: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+        content = orjson.dumps(payload)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_error(self, status: HTTPStatus, error_type: str, message: str) -> None:
+        self._send_json(status, {"message": message}, {"x-amzn-ErrorType": f"{error_type}:http://internal.amazon.com/coral/com.amazon.bedrock/"})
+
+    def _send_converse(self) -> None:
+        text = "".join(self.server.fake.delta_texts())
+        self._send_json(
+            HTTPStatus.OK,
+            {
+                "output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+                "stopReason": "end_turn",
+                "usage": self.server.fake.usage(),
+                "metrics": {"latencyMs": 1},
+            },
+        )
+
+    def _send_invoke(self, request: dict[str, Any]) -> None:
+        self._send_json(HTTPStatus.OK, self.server.fake.invoke_output(request))
+
+    def _create_job(self, request: dict[str, Any]) -> None:
+        try:
+            job = self.server.fake.run_job(request)
+        except LookupError as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, "ValidationException", str(e))
+            return
+        self._send_json(HTTPStatus.OK, {"jobArn": job["jobArn"]})
+
+    def _start_event_stream(self, headers: dict[str, str] | None = None) -> None:
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _write_frame(self, frame: bytes, *, delay: bool = False) -> None:
+        if delay and self.server.fake.delta_interval > 0:
+            time.sleep(self.server.fake.delta_interval)
+        self.wfile.write(f"{len(frame):x}\r\n".encode() + frame + b"\r\n")
+        self.wfile.flush()
+
+    def _end_event_stream(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _send_converse_stream(self) -> None:
+        self._start_event_stream()
+        self._write_frame(encode_event("messageStart", {"role": "assistant"}))
+        for text in self.server.fake.delta_texts():
+            self._write_frame(encode_event("contentBlockDelta", {"contentBlockIndex": 0, "delta": {"text": text}}), delay=True)
+        self._write_frame(encode_event("contentBlockStop", {"contentBlockIndex": 0}))
+        self._write_frame(encode_event("messageStop", {"stopReason": "end_turn"}))
+        self._write_frame(encode_event("metadata", {"usage": self.server.fake.usage(), "metrics": {"latencyMs": 1}}))
+        self._end_event_stream()
+
+    def _send_invoke_stream(self) -> None:
+        self._start_event_stream({"X-Amzn-Bedrock-Content-Type": "application/json"})
+        texts = self.server.fake.delta_texts()
+        for index, text in enumerate(texts):
+            chunk: dict[str, Any] = {
+                "generation": text,
+                "prompt_token_count": INPUT_TOKENS if index == 0 else None,
+                "generation_token_count": index + 1,
+                "stop_reason": None,
+            }
+            if index == len(texts) - 1:
+                # 最後のチャンクには Bedrock が使用量を付ける
+                chunk["stop_reason"] = "stop"
+                chunk["amazon-bedrock-invocationMetrics"] = {
+                    "inputTokenCount": INPUT_TOKENS,
+                    "outputTokenCount": len(texts),
+                    "invocationLatency": 1,
+                    "firstByteLatency": 1,
+                }
+            self._write_frame(encode_event("chunk", {"bytes": base64.b64encode(orjson.dumps(chunk)).decode()}), delay=True)
+        self._end_event_stream()
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="検証用の偽の Bedrock ランタイムのエンドポイントを起動する")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるホスト")
+    parser.add_argument("--port", type=int, default=9000, help="待ち受けるポート")
+    parser.add_argument("--deltas", type=int, default=20, help="1 応答あたりの差分の数")
+    parser.add_argument("--delta-interval-ms", type=float, default=0.0, help="ストリームの差分の間隔(ミリ秒)")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。Ctrl+C で終了する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード
+    """
+    args = parse_args(argv)
+    server = FakeBedrockServer(args.host, args.port, deltas=args.deltas, delta_interval=args.delta_interval_ms / 1000)
+    print(f"偽の Bedrock ランタイムを起動しました: {server.url}")
+    with contextlib.suppress(KeyboardInterrupt):
+        server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+S3 の代わりにローカルで応答する、検証用の偽のエンドポイントを実装する。
+
+使用例:
+    python -m app.cli.fake_s3_server --port 9001
+    AWS_ENDPOINT_URL_S3=http://127.0.0.1:9001 AWS_ACCESS_KEY_ID=test AWS_SECRET_ACCESS_KEY=test python -m app.cli.bulk_inference ...
+
+- パス形式(/<バケット>/<キー>)の PutObject / GetObject / HeadObject / DeleteObject に応答する。署名は検証しない。
+- オブジェクトはメモリ上に保持し、バケットは事前の作成なしで使用できる。
+- bulk_inference_check・attachment_offload_check などの CLI からは FakeS3Server をコンテキストマネージャーとして使う。
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import hashlib
+import sys
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any, Self
+from urllib.parse import unquote, urlparse
+
+if TYPE_CHECKING:
+    from types import TracebackType
+
+
+class _FakeS3HTTPServer(ThreadingHTTPServer):
+    """
+    リクエストハンドラーから FakeS3Server を参照できるようにした HTTP サーバー
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address: tuple[str, int], fake: FakeS3Server) -> None:
+        super().__init__(server_address, FakeS3Handler)
+        self.fake = fake
+
+
+class FakeS3Server:
+    """
+    別スレッドで起動する偽の S3 のエンドポイント
+    - with で囲んだ間だけ起動し、url をクライアントの endpoint_url(または AWS_ENDPOINT_URL_S3)に指定して使う。
+    - 操作ごとのリクエストの数を数える。
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.objects: dict[tuple[str, str], bytes] = {}
+        self.operations: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = _FakeS3HTTPServer((host, port), self)
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """
+        エンドポイントの URL。
+
+        Returns:
+            str: http://<ホスト>:<ポート>
+        """
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def start(self) -> None:
+        """
+        別スレッドでリクエストの受け付けを開始する。
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-s3", daemon=True)
+        self._thread.start()
+
+    def serve_forever(self) -> None:
+        """
+        呼び出したスレッドでリクエストの受け付けを続ける。
+        """
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        """
+        リクエストの受け付けを終了する。
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None) -> None:
+        self.stop()
+
+    def record_operation(self, operation: str) -> None:
+        """
+        操作ごとのリクエストを数える。
+
+        Args:
+            operation (str): 操作の名前(PutObject など)
+        """
+        with self._lock:
+            self.operations[operation] = self.operations.get(operation, 0) + 1
+
+    def put_object(self, bucket: str, key: str, data: bytes) -> None:
+        """
+        オブジェクトを保存する。
+
+        Args:
+            bucket (str): バケット名
+            key (str): キー
+            data (bytes): オブジェクトの内容
+        """
+        with self._lock:
+            self.objects[bucket, key] = data
+
+    def get_object(self, bucket: str, key: str) -> bytes | None:
+        """
+        オブジェクトを取得する。
+
+        Args:
+            bucket (str): バケット名
+            key (str): キー
+
+        Returns:
+            bytes | None: オブジェクトの内容。存在しない場合はNone
+        """
+        with self._lock:
+            return self.objects.get((bucket, key))
+
+    def delete_object(self, bucket: str, key: str) -> None:
+        """
+        オブジェクトを削除する。
+
+        Args:
+            bucket (str): バケット名
+            key (str): キー
+        """
+        with self._lock:
+            self.objects.pop((bucket, key), None)
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    """
+    偽のエンドポイントのリクエストハンドラー。オブジェクトと集計は FakeS3Server が持つ。
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: _FakeS3HTTPServer
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002, ANN401
+        # アクセスログは出力しない
+        pass
+
+    def do_PUT(self) -> None:
+        bucket, key = self._parse_path()
+        data = self._read_body()
+        self.server.fake.record_operation("PutObject")
+        self.server.fake.put_object(bucket, key, data)
+        self._send(HTTPStatus.OK, b"", {"ETag": _etag(data)})
+
+    def do_GET(self) -> None:
+        bucket, key = self._parse_path()
+        self.server.fake.record_operation("GetObject")
+        data = self.server.fake.get_object(bucket, key)
+        if data is None:
+            self._send_not_found(key)
+            return
+        self._send(HTTPStatus.OK, data, {"ETag": _etag(data), "Content-Type": "application/octet-stream"})
+
+    def do_HEAD(self) -> None:
+        bucket, key = self._parse_path()
+        self.server.fake.record_operation("HeadObject")
+        data = self.server.fake.get_object(bucket, key)
+        if data is None:
+            # HEAD の応答には本文を付けられないため、ステータスコードのみを返す
+            self.send_response(HTTPStatus.NOT_FOUND)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", _etag(data))
+        self.end_headers()
+
+    def do_DELETE(self) -> None:
+        bucket, key = self._parse_path()
+        self.server.fake.record_operation("DeleteObject")
+        self.server.fake.delete_object(bucket, key)
+        self._send(HTTPStatus.NO_CONTENT, b"")
+
+    def _parse_path(self) -> tuple[str, str]:
+        bucket, _, key = urlparse(self.path).path.lstrip("/").partition("/")
+        return unquote(bucket), unquote(key)
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = bytearray()
+            while size := int(self.rfile.readline().split(b";")[0], 16):
+                body += self.rfile.read(size)
+                self.rfile.readline()
+            # 末尾のトレーラー(チェックサム等)を読み捨てる
+            while self.rfile.readline().strip():
+                pass
+            return bytes(body)
+        return self.rfile.read(int(self.headers.get("Content-Length", "0")))
+
+    def _send(self, status: HTTPStatus, content: bytes, headers: dict[str, str] | None = None) -> None:
+        self.send_response(status)
+        if status != HTTPStatus.NO_CONTENT:
+            self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_not_found(self, key: str) -> None:
+        content = f"<Error><Code>NoSuchKey</Code><Message>The specified key does not exist.</Message><Key>{key}</Key></Error>".encode()
+        self._send(HTTPStatus.NOT_FOUND, content, {"Content-Type": "application/xml"})
+
+
+def _etag(data: bytes) -> str:
+    """
+    オブジェクトの ETag(内容の MD5)を返す。
+
+    Args:
+        data (bytes): オブジェクトの内容
+
+    Returns:
+        str: 引用符で囲んだ ETag
+    """
+    return f'"{hashlib.md5(data, usedforsecurity=False).hexdigest()}"'
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="検証用の偽の S3 のエンドポイントを起動する")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるホスト")
+    parser.add_argument("--port", type=int, default=9001, help="待ち受けるポート")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。Ctrl+C で終了する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード
+    """
+    args = parse_args(argv)
+    server = FakeS3Server(args.host, args.port)
+    print(f"偽の S3 を起動しました: {server.url}")
+    with contextlib.suppress(KeyboardInterrupt):
+        server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
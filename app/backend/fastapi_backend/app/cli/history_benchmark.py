@@ -0,0 +1,163 @@
+"""
+会話履歴の長さごとに、履歴を入力トークン数の上限に収めた場合と収めない場合の最初のトークンまでの時間(TTFT)を計測する CLI。
+
+使用例:
+    python -m app.cli.history_benchmark --turns 0 8 32 128 --runs 3
+
+- 履歴は指定したターン数のユーザー・アシスタントの発話を合成して作成する。
+- 生成結果キャッシュを使わず、各計測の最後の発話に一意の文字列を含めて毎回モデルを呼び出す。
+- 結果は ターン数 / 見積もりトークン数 / 方式 / TTFT の中央値 / 全体時間の中央値 の表で出力する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+import uuid
+from typing import TYPE_CHECKING, cast
+
+from app.config.bedrock_config import BEDROCK_CLIENT_CONFIG, BEDROCK_DEFAULT_REGION
+from app.dependencies.bedrock_dependencies import CONFIG_MAPPING, MODEL_MAPPING
+from app.interfaces.bedrock_interface import ISupportsConverseStream
+from app.services.bedrock.client_registry import BedrockClientRegistry
+from app.services.bedrock.conversation_history import MESSAGE_OVERHEAD_TOKENS, estimate_llama3_tokens
+from app.types.bedrock_type_defs import ModelType
+
+if TYPE_CHECKING:
+    from mypy_boto3_bedrock_runtime.type_defs import MessageTypeDef
+
+    from app.types.bedrock_type_defs import ConfigTypeDef
+
+logger = logging.getLogger(__name__)
+
+# 合成する 1 発話あたりの文
+USER_SENTENCE = "新しいサービスの料金体系とサポート体制について、前回の説明を踏まえてもう少し詳しく教えてください。"
+ASSISTANT_SENTENCE = "料金は月額の基本料金と従量課金の組み合わせで、サポートは平日の日中にメールとチャットで対応しています。"
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="会話履歴の長さごとの TTFT を計測する")
+    parser.add_argument("--model-type", type=ModelType, default=ModelType.LLAMA3, help="使用するモデルの種類")
+    parser.add_argument("--turns", type=int, nargs="+", default=[0, 8, 32, 128], help="計測する会話履歴のターン数")
+    parser.add_argument("--runs", type=int, default=3, help="1 条件あたりの計測回数")
+    parser.add_argument("--sentences", type=int, default=4, help="1 発話あたりの文の数")
+    parser.add_argument("--region", default=BEDROCK_DEFAULT_REGION, help="リージョン")
+    return parser.parse_args(argv)
+
+
+def build_history(turns: int, sentences: int) -> list[MessageTypeDef]:
+    """
+    指定したターン数の会話履歴を合成する。最後は一意の文字列を含むユーザーの発話とする。
+
+    Args:
+        turns (int): ユーザー・アシスタントの発話の組の数
+        sentences (int): 1 発話あたりの文の数
+
+    Returns:
+        list[MessageTypeDef]: 会話履歴
+    """
+    messages: list[MessageTypeDef] = []
+    for _ in range(turns):
+        messages.append({"role": "user", "content": [{"text": USER_SENTENCE * sentences}]})
+        messages.append({"role": "assistant", "content": [{"text": ASSISTANT_SENTENCE * sentences}]})
+    messages.append({"role": "user", "content": [{"text": f"{USER_SENTENCE} ({uuid.uuid4().hex})"}]})
+    return messages
+
+
+async def measure(service: ISupportsConverseStream, messages: list[MessageTypeDef]) -> tuple[float, float]:
+    """
+    ストリームの最初のトークンまでの時間と全体の時間を計測する。
+
+    Args:
+        service (ISupportsConverseStream): モデルサービス
+        messages (list[MessageTypeDef]): 会話履歴
+
+    Returns:
+        tuple[float, float]: 最初のトークンまでの時間と全体の時間(秒)
+    """
+    started_at = time.perf_counter()
+    first_token_at: float | None = None
+    async for _ in service.converse_stream(messages):
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+    finished_at = time.perf_counter()
+    return (first_token_at or finished_at) - started_at, finished_at - started_at
+
+
+async def run(args: argparse.Namespace) -> int:
+    """
+    計測を実行し、結果の表を出力する。
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        int: 終了コード
+    """
+    config = CONFIG_MAPPING[args.model_type]
+    if "history" not in config:
+        logger.error("このモデルには会話履歴の上限が設定されていません: %s", args.model_type.value)
+        return 1
+    # BEDROCK_HISTORY_ENABLED の値にかかわらず、上限に収める場合と収めない場合を比較する
+    trimmed_config = cast("ConfigTypeDef", {**config, "history": {**config["history"], "enabled": True}})
+    untrimmed_config = cast("ConfigTypeDef", {name: value for name, value in config.items() if name != "history"})
+
+    client_registry = BedrockClientRegistry(default_region=args.region, client_config=BEDROCK_CLIENT_CONFIG)
+    client = client_registry.get_client(args.model_type)
+    services = {
+        "trimmed": MODEL_MAPPING[args.model_type].from_dependency(client=client, config=trimmed_config),
+        "full": MODEL_MAPPING[args.model_type].from_dependency(client=client, config=untrimmed_config),
+    }
+    print(f"{'turns':>6} {'est_tokens':>10} {'mode':>8} {'ttft_ms':>9} {'total_ms':>9}")
+    try:
+        for turns in args.turns:
+            for mode, service in services.items():
+                if not isinstance(service, ISupportsConverseStream):
+                    logger.error("このモデルは対応してません: %s", args.model_type.value)
+                    return 1
+                ttfts: list[float] = []
+                totals: list[float] = []
+                estimated_tokens = 0
+                for _ in range(args.runs):
+                    messages = build_history(turns, args.sentences)
+                    estimated_tokens = sum(
+                        MESSAGE_OVERHEAD_TOKENS + sum(estimate_llama3_tokens(block.get("text", "")) for block in message["content"]) for message in messages
+                    )
+                    ttft, total = await measure(service, messages)
+                    ttfts.append(ttft)
+                    totals.append(total)
+                print(f"{turns:>6} {estimated_tokens:>10} {mode:>8} {statistics.median(ttfts) * 1000:>9.1f} {statistics.median(totals) * 1000:>9.1f}")
+    finally:
+        await client_registry.aclose()
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード
+    """
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - [%(name)s] - %(levelname)s : %(message)s")
+    return asyncio.run(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+ロギングの方式ごとに、リクエストのレイテンシとスループットを計測する CLI。
+
+使用例:
+    python -m app.cli.logging_benchmark --requests 5000 --concurrency 32 --error-every 10
+
+- off: logging.disable でログを出力しない。
+- sync: 従来の構成。各ロガーに console と file のハンドラーを直接付け、イベントループ上で書き込む。
+- queue: configure_logging の構成。ロガーはキューに入れるのみで、書き込みは QueueListener のスレッドで行う。
+- リクエストは httpx の ASGITransport で app.main のアプリケーションに直接送り、Bedrock は固定の応答を返すクライアントに置き換える。
+  uvicorn を経由しないため、uvicorn と同じ形式のアクセスログを 1 リクエストごとに出力する。
+- --error-every を指定した場合は、その回数に 1 回の割合でバリデーションエラー(422)になるリクエストを送る。
+- コンソールへの出力は /dev/null に、ファイルへの出力は一時ディレクトリに書き込む。
+  --console-delay-ms を指定した場合は、コンソールへの 1 回の書き込みごとに待ち時間を入れ、詰まった標準出力(コンテナのログのパイプなど)を再現する。
+- 結果は 方式 / レイテンシの p50・p99 / スループット / 出力したログの行数 の表で出力する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import copy
+import logging
+import logging.config
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, TextIO
+
+import httpx
+
+from app.config.logging_config import LOGGING_CONFIG, configure_logging
+from app.main import app
+from app.services.bedrock.stream_cancellation import StreamCanceller
+
+CONVERSE_PATH = "/api/v1/bedrock/converse"
+
+CONVERSE_BODY: dict[str, Any] = {
+    "model_type": "Llama3",
+    "user_input": {"messages": [{"role": "user", "content": [{"text": "こんにちは"}]}]},
+}
+
+# バリデーションエラーになるリクエスト(role が不正)
+INVALID_BODY: dict[str, Any] = {
+    "model_type": "Llama3",
+    "user_input": {"messages": [{"role": "system", "content": [{"text": "こんにちは"}]}]},
+}
+
+CONVERSE_RESPONSE: dict[str, Any] = {
+    "output": {"message": {"role": "assistant", "content": [{"text": "こんにちは"}]}},
+    "stopReason": "end_turn",
+    "usage": {"inputTokens": 1, "outputTokens": 1, "totalTokens": 2},
+    "metrics": {"latencyMs": 1},
+}
+
+MODES = ("off", "sync", "queue")
+
+access_logger = logging.getLogger("uvicorn.access")
+
+
+class SlowStream:
+    """書き込みごとに待ち時間を入れる出力先"""
+
+    def __init__(self, stream: TextIO, delay: float) -> None:
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        return self.stream.write(text)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+class FixedConverseClient:
+    """Bedrock を呼ばずに固定の応答を返すクライアント"""
+
+    async def converse(self, _args: Any) -> dict[str, Any]:  # noqa: ANN401
+        return CONVERSE_RESPONSE
+
+
+class FixedClientRegistry:
+    """どのモデルにも FixedConverseClient を返すクライアントの管理"""
+
+    def get_client(self, *_args: Any, **_kwargs: Any) -> FixedConverseClient:  # noqa: ANN401
+        return FixedConverseClient()
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="ロギングの方式ごとにリクエストのレイテンシとスループットを計測する")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES), help="計測するロギングの方式")
+    parser.add_argument("--requests", type=int, default=5000, help="1 方式あたりのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=32, help="同時に送るリクエスト数")
+    parser.add_argument("--error-every", type=int, default=0, help="この回数に 1 回、422 になるリクエストを送る(0 の場合は送らない)")
+    parser.add_argument("--log-format", choices=("text", "json"), default="json", help="ログの形式")
+    parser.add_argument("--console-delay-ms", type=float, default=0.0, help="コンソールへの 1 回の書き込みごとの待ち時間(ミリ秒)")
+    parser.add_argument("--no-sampling", action="store_true", help="queue の方式でサンプリングと流量制限を行わない")
+    return parser.parse_args(argv)
+
+
+def logging_config(mode: str, log_dir: Path, log_format: str, stream: Any, *, sampling: bool = True) -> dict[str, Any]:  # noqa: ANN401
+    """
+    方式に応じた dictConfig の設定を組み立てる。
+
+    Args:
+        mode (str): ロギングの方式(sync もしくは queue)
+        log_dir (Path): ログファイルを書き込むディレクトリ
+        log_format (str): ログの形式
+        stream (Any): コンソールのハンドラーの出力先
+        sampling (bool, optional): queue の方式でサンプリングと流量制限を行うかどうか
+
+    Returns:
+        dict[str, Any]: dictConfig に渡す設定
+    """
+    config = copy.deepcopy({key: value for key, value in LOGGING_CONFIG.items() if key != "handlers"})
+    config["handlers"] = {name: dict(handler) for name, handler in LOGGING_CONFIG["handlers"].items()}
+    config["handlers"]["console"].update(formatter=log_format, stream=stream)
+    config["handlers"]["file"].update(formatter=log_format, filename=log_dir / f"{mode}.log")
+    if mode == "sync":
+        del config["handlers"]["queue"]
+        for logger_config in config["loggers"].values():
+            logger_config["handlers"] = ["console", "file"]
+    elif not sampling:
+        config["handlers"]["queue"]["filters"] = []
+    return config
+
+
+async def run_requests(total: int, concurrency: int, error_every: int) -> tuple[list[float], float]:
+    """
+    リクエストを送り、1 リクエストごとのレイテンシを計測する。
+
+    Args:
+        total (int): リクエスト数
+        concurrency (int): 同時に送るリクエスト数
+        error_every (int): この回数に 1 回、422 になるリクエストを送る(0 の場合は送らない)
+
+    Returns:
+        tuple[list[float], float]: リクエストごとのレイテンシ(秒)と、すべてのリクエストにかかった時間(秒)
+    """
+    latencies: list[float] = []
+    counter = iter(range(total))
+    transport = httpx.ASGITransport(app=app, client=("127.0.0.1", 50000))
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        for index in counter:
+            body = INVALID_BODY if error_every and index % error_every == 0 else CONVERSE_BODY
+            started_at = time.perf_counter()
+            response = await client.post(CONVERSE_PATH, json=body)
+            # uvicorn と同じ引数でアクセスログを出力する
+            access_logger.info('%s - "%s %s HTTP/%s" %d', "127.0.0.1:50000", "POST", CONVERSE_PATH, "1.1", response.status_code)
+            latencies.append(time.perf_counter() - started_at)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        # 初回のリクエストの準備(ミドルウェアの構築など)を計測から除く
+        await client.post(CONVERSE_PATH, json=CONVERSE_BODY)
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started_at
+    return latencies, elapsed
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード
+    """
+    args = parse_args(argv)
+    app.state.bedrock_client_registry = FixedClientRegistry()
+    app.state.attachment_offloader = None
+    app.state.resumable_streams = None
+    app.state.conversation_store = None
+    app.state.stream_canceller = StreamCanceller()
+
+    print(f"{'mode':>6} {'p50_us':>9} {'p99_us':>9} {'req/s':>9} {'lines':>7}")
+    with tempfile.TemporaryDirectory() as tmp, Path(os.devnull).open("w", encoding="utf-8") as devnull:
+        log_dir = Path(tmp)
+        stream = SlowStream(devnull, args.console_delay_ms / 1000) if args.console_delay_ms else devnull
+        for mode in args.modes:
+            logging.disable(logging.CRITICAL if mode == "off" else logging.NOTSET)
+            listener = None
+            if mode == "sync":
+                logging.config.dictConfig(logging_config(mode, log_dir, args.log_format, stream))
+            elif mode == "queue":
+                listener = configure_logging(logging_config(mode, log_dir, args.log_format, stream, sampling=not args.no_sampling))
+
+            latencies, elapsed = asyncio.run(run_requests(args.requests, args.concurrency, args.error_every))
+            if listener is not None:
+                listener.stop()
+            logging.disable(logging.NOTSET)
+
+            log_file = log_dir / f"{mode}.log"
+            lines = len(log_file.read_text(encoding="utf-8").splitlines()) if log_file.exists() else 0
+            p50 = statistics.median(latencies)
+            p99 = statistics.quantiles(latencies, n=100)[98]
+            print(f"{mode:>6} {p50 * 1_000_000:>9.1f} {p99 * 1_000_000:>9.1f} {len(latencies) / elapsed:>9.0f} {lines:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+invoke 系のペイロードの組み立て(Llama 3 のプロンプトの組み立てと JSON へのシリアライズ)にかかる時間とサイズを計測する CLI。
+
+使用例:
+    python -m app.cli.prompt_benchmark --turns 1 8 64 --system-sentences 0 40 --runs 2000
+
+- legacy: 従来の実装。最初のメッセージのみを字下げを含む f-string に埋め込み、ペイロード全体を json.dumps する。
+  会話履歴とシステムプロンプトは反映されない。
+- uncached: すべてのターンとシステムプロンプトを Llama 3 のチャットテンプレートで組み立て、ペイロード全体を毎回 json.dumps する。
+- current: Llama3PromptBuilder でシステムプロンプトまでのシリアライズ済みのプレフィックスを再利用し、会話部分のみをつなぐ。
+- 会話履歴は指定したターン数のユーザー・アシスタントの発話を合成し、最後にユーザーの発話を加える。
+- 結果は ターン数 / システムプロンプトの文の数 / 方式 / 1 リクエストあたりの時間の中央値 / ペイロードのサイズ /
+  プロンプトの見積もりトークン数 の表で出力する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from functools import partial
+from typing import TYPE_CHECKING, Any
+
+from app.config.bedrock_config import LLAMA_CONFIG
+from app.schemas.bedrock_schema import MessageList
+from app.services.bedrock.conversation_history import estimate_llama3_tokens
+from app.services.bedrock.llama3_prompt import PREFIX_CACHE_MAX_ENTRIES, Llama3PromptBuilder
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+# 合成する発話とシステムプロンプトの文
+USER_TEXT = "新しいサービスの料金体系とサポート体制について、前回の説明を踏まえてもう少し詳しく教えてください。"
+ASSISTANT_TEXT = "料金は月額の基本料金と従量課金の組み合わせで、サポートは平日の日中にメールとチャットで対応しています。"
+SYSTEM_SENTENCE = "あなたは社内のサービス窓口のアシスタントです。根拠のない情報は答えず、わからない場合はその旨を伝えてください。"
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="invoke 系のペイロードの組み立て時間とサイズを計測する")
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 8, 64], help="計測する会話履歴のターン数(最後のユーザーの発話を含む)")
+    parser.add_argument("--system-sentences", type=int, nargs="+", default=[0, 40], help="システムプロンプトの文の数")
+    parser.add_argument("--runs", type=int, default=2000, help="1 条件あたりの計測回数")
+    return parser.parse_args(argv)
+
+
+def build_message_list(turns: int) -> MessageList:
+    """
+    指定したターン数の会話履歴を合成する。
+
+    Args:
+        turns (int): 最後のユーザーの発話を含むターン数
+
+    Returns:
+        MessageList: 会話履歴
+    """
+    messages: list[dict[str, Any]] = []
+    for _ in range(turns - 1):
+        messages.append({"role": "user", "content": [{"text": USER_TEXT}]})
+        messages.append({"role": "assistant", "content": [{"text": ASSISTANT_TEXT}]})
+    messages.append({"role": "user", "content": [{"text": USER_TEXT}]})
+    return MessageList.model_validate({"messages": messages})
+
+
+def legacy_payload(params: dict[str, Any], message_list: MessageList) -> bytes:
+    """
+    従来の実装と同じ方法でペイロードを組み立てる。
+
+    Args:
+        params (dict[str, Any]): 推論パラメータ
+        message_list (MessageList): 会話履歴
+
+    Returns:
+        bytes: ペイロードの JSON
+    """
+    text = getattr(message_list.messages[0].content[0], "text", "")
+    formatted_prompt: str = f"""
+        <|begin_of_text|><|start_header_id|>user<|end_header_id|>
+        {text}
+        <|eot_id|>
+        <|start_header_id|>assistant<|end_header_id|>
+        """
+    payload = params.copy()
+    payload["prompt"] = formatted_prompt
+    return json.dumps(payload).encode()
+
+
+def uncached_payload(builder: Llama3PromptBuilder, params: dict[str, Any], message_list: MessageList, system: str) -> bytes:
+    """
+    チャットテンプレートで組み立てたプロンプトを含むペイロード全体を毎回シリアライズする。
+
+    Args:
+        builder (Llama3PromptBuilder): プロンプトの組み立てに使うビルダー
+        params (dict[str, Any]): 推論パラメータ
+        message_list (MessageList): 会話履歴
+        system (str): システムプロンプト
+
+    Returns:
+        bytes: ペイロードの JSON
+    """
+    payload = params.copy()
+    payload["prompt"] = builder.render(message_list.messages, system)
+    return json.dumps(payload).encode()
+
+
+def measure(func: Callable[[], bytes], runs: int) -> tuple[float, bytes]:
+    """
+    処理時間の中央値を計測する。
+
+    Args:
+        func (Callable[[], bytes]): 計測する処理
+        runs (int): 計測回数
+
+    Returns:
+        tuple[float, bytes]: 処理時間の中央値(秒)と組み立てたペイロード
+    """
+    payload = func()
+    elapsed: list[float] = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - started_at)
+    return statistics.median(elapsed), payload
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード
+    """
+    args = parse_args(argv)
+    params: dict[str, Any] = dict(LLAMA_CONFIG["model"]["invoke"])
+    builder = Llama3PromptBuilder(PREFIX_CACHE_MAX_ENTRIES)
+    print(f"{'turns':>6} {'system':>7} {'mode':>9} {'time_us':>9} {'bytes':>8} {'est_tokens':>11}")
+    for turns in args.turns:
+        message_list = build_message_list(turns)
+        for sentences in args.system_sentences:
+            system = SYSTEM_SENTENCE * sentences
+            targets: dict[str, Callable[[], bytes]] = {
+                "legacy": partial(legacy_payload, params, message_list),
+                "uncached": partial(uncached_payload, builder, params, message_list, system),
+                "current": partial(builder.payload, params, message_list.messages, system),
+            }
+            for name, func in targets.items():
+                elapsed, payload = measure(func, args.runs)
+                tokens = estimate_llama3_tokens(json.loads(payload)["prompt"])
+                print(f"{turns:>6} {sentences:>7} {name:>9} {elapsed * 1_000_000:>9.1f} {len(payload):>8} {tokens:>11}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+MessageList の処理にかかる時間とメモリ割り当て量を計測する CLI。
+
+使用例:
+    python -m app.cli.schema_benchmark --turns 1 50 500 --runs 50
+    python -m app.cli.schema_benchmark --target conversion --turns 50 500 5000
+
+- validation: テキストのみのモデルを先に使う現在のスキーマと、すべてのコンテンツブロックを ContentBlockUnion で検証する
+  従来のスキーマで、JSON の検証を比較する。
+- conversion: 検証済みの MessageList から Bedrock の会話履歴への変換を、model_dump する従来の方法と
+  検証済みのモデルから直接組み立てる現在の方法で比較する。
+- 会話履歴は指定したターン数のユーザー・アシスタントの発話を合成した JSON とする。
+- --image-every を指定すると、その間隔で画像ブロックを含む発話を混ぜる。
+- 結果は ターン数 / 方式 / 1 リクエストあたりの時間の中央値 / 割り当てたメモリのピーク の表で出力する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import statistics
+import sys
+import time
+import tracemalloc
+from functools import partial
+from typing import TYPE_CHECKING, Any, List
+
+import orjson
+from pydantic import BaseModel
+
+from app.schemas.bedrock_schema import ContentBlockUnion, MessageList
+from app.services.bedrock.message_conversion import to_messages
+from app.types.bedrock_type_defs import ConversationRoleType
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+class LegacyMessage(BaseModel):
+    role: ConversationRoleType
+    content: List[ContentBlockUnion]
+
+
+class LegacyMessageList(BaseModel):
+    messages: List[LegacyMessage]
+
+
+# 合成する発話
+USER_TEXT = "新しいサービスの料金体系とサポート体制について、前回の説明を踏まえてもう少し詳しく教えてください。"
+ASSISTANT_TEXT = "料金は月額の基本料金と従量課金の組み合わせで、サポートは平日の日中にメールとチャットで対応しています。"
+IMAGE_BYTES = base64.b64encode(b"\x89PNG\r\n\x1a\n" + b"\x00" * 256).decode()
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="MessageList の処理時間とメモリ割り当て量を計測する")
+    parser.add_argument("--target", choices=["validation", "conversion"], default="validation", help="計測する処理")
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 50, 500], help="計測する会話履歴のターン数")
+    parser.add_argument("--runs", type=int, default=50, help="1 条件あたりの計測回数")
+    parser.add_argument("--image-every", type=int, default=0, help="画像ブロックを含めるユーザーの発話の間隔。0 の場合はテキストのみ")
+    return parser.parse_args(argv)
+
+
+def build_payload(turns: int, image_every: int) -> bytes:
+    """
+    指定したターン数の会話履歴を、リクエストボディと同じ JSON で合成する。
+
+    Args:
+        turns (int): ユーザー・アシスタントの発話の組の数
+        image_every (int): 画像ブロックを含めるユーザーの発話の間隔。0 の場合はテキストのみ
+
+    Returns:
+        bytes: MessageList の JSON
+    """
+    messages: list[dict[str, Any]] = []
+    for turn in range(turns):
+        user_content: list[dict[str, Any]] = [{"text": USER_TEXT}]
+        if image_every > 0 and turn % image_every == 0:
+            user_content.append({"image": {"format": "png", "source": {"bytes": IMAGE_BYTES}}})
+        messages.append({"role": "user", "content": user_content})
+        messages.append({"role": "assistant", "content": [{"text": ASSISTANT_TEXT}]})
+    return orjson.dumps({"messages": messages})
+
+
+def legacy_to_messages(message_list: MessageList) -> list[dict[str, Any]]:
+    """
+    従来の方法(model_dump)で MessageList を Bedrock の会話履歴に変換する。
+
+    Args:
+        message_list (MessageList): 検証済みの会話入力
+
+    Returns:
+        list[dict[str, Any]]: 会話履歴
+    """
+    messages: list[dict[str, Any]] = message_list.model_dump(exclude_none=True)["messages"]
+    return messages
+
+
+def measure(func: Callable[[], object], runs: int) -> tuple[float, int]:
+    """
+    処理時間の中央値と、1 回の処理で割り当てたメモリのピークを計測する。
+
+    Args:
+        func (Callable[[], object]): 計測する処理
+        runs (int): 計測回数
+
+    Returns:
+        tuple[float, int]: 処理時間の中央値(秒)と割り当てたメモリのピーク(バイト)
+    """
+    func()
+    elapsed: list[float] = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - started_at)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(elapsed), peak
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード
+    """
+    args = parse_args(argv)
+    print(f"{'turns':>6} {'mode':>8} {'time_ms':>9} {'peak_kib':>9}")
+    for turns in args.turns:
+        payload = build_payload(turns, args.image_every)
+        if args.target == "validation":
+            targets: dict[str, Callable[[], object]] = {
+                "current": partial(MessageList.model_validate_json, payload),
+                "legacy": partial(LegacyMessageList.model_validate_json, payload),
+            }
+        else:
+            message_list = MessageList.model_validate_json(payload)
+            targets = {
+                "current": partial(to_messages, message_list),
+                "legacy": partial(legacy_to_messages, message_list),
+            }
+        for name, func in targets.items():
+            elapsed, peak = measure(func, args.runs)
+            print(f"{turns:>6} {name:>8} {elapsed * 1000:>9.3f} {peak / 1024:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""
+アプリケーションの起動時間を計測する CLI。コンテナのスケールアウト時の起動時間の退行を検知するために使う。
+
+使用例:
+    python -m app.cli.startup_benchmark --runs 5 --import-budget-ms 1500 --ready-budget-ms 3000
+    python -m app.cli.startup_benchmark --request-method POST --request-path /api/v1/bedrock/converse \\
+        --request-body '{"model_type": "Llama3", "user_input": {"messages": [{"role": "user", "content": [{"text": "こんにちは"}]}]}}'
+
+- import: 別プロセスで `python -X importtime -c "import app.main"` を実行し、app.main の読み込み時間と読み込んだモジュール数を計測する。
+  最後の実行で自身の読み込み時間(self)が長いモジュールを上位から出力する。
+- startup: uvicorn でアプリケーションを起動し、プロセスの起動から readiness(/api/v1/health/ready)が 200 を返すまでと、
+  続けて送った計測対象のリクエストが最初に成功するまでの時間を計測する。readiness が返すウォームアップの段階ごとの所要時間も出力する。
+- 各計測の中央値が予算を超えた場合は終了コード 1 を返す。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+# 計測するプロセスの作業ディレクトリ(pyproject.toml のあるディレクトリ)
+PROJECT_DIR = Path(__file__).resolve().parents[2]
+
+READY_PATH = "/api/v1/health/ready"
+
+# -X importtime の出力行(import time: <self(us)> | <cumulative(us)> | <モジュール名>)
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="アプリケーションの読み込み時間と、起動から最初のリクエストが成功するまでの時間を計測する")
+    parser.add_argument("--runs", type=int, default=5, help="計測回数")
+    parser.add_argument("--top", type=int, default=15, help="出力する読み込み時間の長いモジュールの数")
+    parser.add_argument("--skip-startup", action="store_true", help="uvicorn での起動の計測を省略する")
+    parser.add_argument("--request-method", default="GET", help="計測対象のリクエストのメソッド")
+    parser.add_argument("--request-path", default="/api/v1/bedrock/stats", help="計測対象のリクエストのパス")
+    parser.add_argument("--request-body", help="計測対象のリクエストの JSON ボディ")
+    parser.add_argument("--timeout", type=float, default=60.0, help="起動を待つ最大時間(秒)")
+    parser.add_argument("--import-budget-ms", type=float, help="app.main の読み込み時間の予算(ミリ秒)")
+    parser.add_argument("--ready-budget-ms", type=float, help="起動から最初のリクエストが成功するまでの時間の予算(ミリ秒)")
+    return parser.parse_args(argv)
+
+
+def measure_import() -> tuple[float, int, list[tuple[int, str]]]:
+    """
+    別プロセスで app.main を読み込み、-X importtime の出力を集計する。
+
+    Returns:
+        tuple[float, int, list[tuple[int, str]]]: app.main の読み込み時間(秒)、読み込んだモジュール数、
+            モジュールごとの自身の読み込み時間(マイクロ秒)とモジュール名
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0.0
+    modules: list[tuple[int, str]] = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = int(match[1]), int(match[2]), match[3], match[4]
+        modules.append((self_us, name))
+        if name == "app.main" and len(indent) == 1:
+            total = cumulative_us / 1_000_000
+    return total, len(modules), modules
+
+
+def free_port() -> int:
+    """
+    空いているポートを返す。
+
+    Returns:
+        int: ポート番号
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def measure_startup(args: argparse.Namespace) -> tuple[float, float, dict[str, Any]]:
+    """
+    uvicorn でアプリケーションを起動し、readiness と計測対象のリクエストが成功するまでの時間を計測する。
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Raises:
+        RuntimeError: 起動を待つ最大時間を過ぎても成功しない、もしくはプロセスが終了した場合
+
+    Returns:
+        tuple[float, float, dict[str, Any]]: 起動から readiness が 200 を返すまでの時間(秒)、
+            最初のリクエストが成功するまでの時間(秒)、readiness のレスポンス
+    """
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started_at = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_DIR,
+        env={**os.environ, "PYTHONUNBUFFERED": "1"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=base_url, timeout=args.timeout) as client:
+            deadline = started_at + args.timeout
+            ready = _poll(client, process, deadline, client.build_request("GET", READY_PATH))
+            ready_seconds = time.perf_counter() - started_at
+            headers = {"Content-Type": "application/json"} if args.request_body is not None else None
+            first_request = client.build_request(args.request_method, args.request_path, content=args.request_body, headers=headers)
+            _poll(client, process, deadline, first_request)
+            first_request_seconds = time.perf_counter() - started_at
+            return ready_seconds, first_request_seconds, ready.json()
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def _poll(client: httpx.Client, process: subprocess.Popen[bytes], deadline: float, request: httpx.Request) -> httpx.Response:
+    """
+    リクエストが成功するまで送り直す。
+
+    Args:
+        client (httpx.Client): HTTP クライアント
+        process (subprocess.Popen[bytes]): アプリケーションのプロセス
+        deadline (float): 起動を待つ期限(time.perf_counter の時刻)
+        request (httpx.Request): 送信するリクエスト
+
+    Raises:
+        RuntimeError: 期限を過ぎても成功しない、もしくはプロセスが終了した場合
+
+    Returns:
+        httpx.Response: 成功したレスポンス
+    """
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            msg = f"アプリケーションのプロセスが終了しました (returncode={process.returncode})"
+            raise RuntimeError(msg)
+        try:
+            response = client.send(request)
+        except httpx.TransportError:
+            response = None
+        if response is not None and response.is_success:
+            return response
+        time.sleep(0.01)
+    msg = f"期限までに {request.method} {request.url.path} が成功しませんでした"
+    raise RuntimeError(msg)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード。予算を超えた場合は 1
+    """
+    args = parse_args(argv)
+    exit_code = 0
+
+    import_times: list[float] = []
+    module_counts: list[int] = []
+    modules: list[tuple[int, str]] = []
+    for _ in range(args.runs):
+        total, module_count, modules = measure_import()
+        import_times.append(total)
+        module_counts.append(module_count)
+    import_ms = statistics.median(import_times) * 1000
+    print(f"import app.main: {import_ms:.1f} ms (median of {args.runs}), modules: {statistics.median(module_counts):.0f}")
+    print(f"{'self_ms':>9}  module")
+    for self_us, name in sorted(modules, reverse=True)[: args.top]:
+        print(f"{self_us / 1000:>9.1f}  {name}")
+    if args.import_budget_ms is not None and import_ms > args.import_budget_ms:
+        print(f"import budget exceeded: {import_ms:.1f} ms > {args.import_budget_ms:.1f} ms")
+        exit_code = 1
+
+    if args.skip_startup:
+        return exit_code
+
+    ready_times: list[float] = []
+    first_request_times: list[float] = []
+    ready: dict[str, Any] = {}
+    for _ in range(args.runs):
+        ready_seconds, first_request_seconds, ready = measure_startup(args)
+        ready_times.append(ready_seconds)
+        first_request_times.append(first_request_seconds)
+    ready_ms = statistics.median(ready_times) * 1000
+    first_request_ms = statistics.median(first_request_times) * 1000
+    print(f"time to ready: {ready_ms:.1f} ms, time to first successful {args.request_method} {args.request_path}: {first_request_ms:.1f} ms")
+    print(f"warm-up phases (last run): {ready.get('phases')}, loaded modules: {ready.get('loaded_modules')}")
+    if args.ready_budget_ms is not None and first_request_ms > args.ready_budget_ms:
+        print(f"startup budget exceeded: {first_request_ms:.1f} ms > {args.ready_budget_ms:.1f} ms")
+        exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
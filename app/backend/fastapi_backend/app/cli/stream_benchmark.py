@@ -0,0 +1,169 @@
+"""
+ストリーミング応答の text/plain と Server-Sent Events の、スループットとレスポンスの書き込み回数を比較する CLI。
+
+使用例:
+    python -m app.cli.stream_benchmark --deltas 2000 --delta-interval-ms 0 1 5
+
+- Bedrock を呼び出さず、指定した数の差分を指定した間隔で返す Converse Stream のイベントを合成し、
+  LlamaService.converse_stream(text) と converse_stream_events を sse_stream でまとめたもの(sse)を
+  StreamingResponse で返して、ASGI の send が呼ばれた回数と送信したサイズを数える。
+- sse は BEDROCK_SSE_CONFIG の flush_interval・flush_bytes を使用する。--flush-interval・--flush-bytes で上書きできる。
+- 結果は 差分の間隔 / 方式 / 書き込み回数 / 送信サイズ / 経過時間 / 1 秒あたりの差分数 の表で出力する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from typing import TYPE_CHECKING, Any, AsyncGenerator
+
+from fastapi.responses import StreamingResponse
+
+from app.config.bedrock_config import BEDROCK_SSE_CONFIG, LLAMA_CONFIG
+from app.services.bedrock.llama_service import LlamaService
+from app.services.bedrock.sse import SSE_MEDIA_TYPE, sse_stream
+
+if TYPE_CHECKING:
+    from collections.abc import MutableMapping
+
+    from mypy_boto3_bedrock_runtime.type_defs import ConverseStreamOutputTypeDef, ConverseStreamRequestRequestTypeDef
+
+    from app.types.bedrock_type_defs import ConverseStreamResultTypeDef, SseConfigTypeDef
+
+# 合成する差分(Llama の 1 トークン程度の長さ)
+DELTA_TEXTS = ["料金", "は", "月額", "の", "基本", "料金", "と", "従量", "課金", "の", "組み合わせ", "です", "。"]
+
+
+class SyntheticRuntime:
+    """
+    合成した Converse Stream のイベントを返すランタイム
+    """
+
+    def __init__(self, deltas: int, delta_interval: float) -> None:
+        self.deltas = deltas
+        self.delta_interval = delta_interval
+
+    async def converse_stream(self, request_args: ConverseStreamRequestRequestTypeDef) -> ConverseStreamResultTypeDef:  # noqa: ARG002
+        """
+        合成したイベントのストリームを返す。
+
+        Args:
+            request_args (ConverseStreamRequestRequestTypeDef): converse_streamに渡すパラメータ(使用しない)
+
+        Returns:
+            ConverseStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        return {"stream": self._events()}
+
+    async def _events(self) -> AsyncGenerator[ConverseStreamOutputTypeDef]:
+        """
+        Converse Stream API と同じ順序でイベントを返す。
+
+        Yields:
+            ConverseStreamOutputTypeDef: ストリームのイベント
+        """
+        yield {"messageStart": {"role": "assistant"}}
+        for index in range(self.deltas):
+            if self.delta_interval > 0:
+                await asyncio.sleep(self.delta_interval)
+            yield {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": DELTA_TEXTS[index % len(DELTA_TEXTS)]}}}
+        yield {"contentBlockStop": {"contentBlockIndex": 0}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+        yield {"metadata": {"usage": {"inputTokens": 20, "outputTokens": self.deltas, "totalTokens": 20 + self.deltas}, "metrics": {"latencyMs": 0}}}  # type: ignore[typeddict-item]
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="ストリーミング応答の方式ごとのスループットと書き込み回数を計測する")
+    parser.add_argument("--deltas", type=int, default=2000, help="1 応答あたりの差分の数")
+    parser.add_argument("--delta-interval-ms", type=float, nargs="+", default=[0.0, 1.0], help="差分の間隔(ミリ秒)")
+    parser.add_argument("--flush-interval", type=float, default=BEDROCK_SSE_CONFIG["flush_interval"], help="sse の差分をまとめる最大待ち時間(秒)")
+    parser.add_argument("--flush-bytes", type=int, default=BEDROCK_SSE_CONFIG["flush_bytes"], help="sse の差分をまとめる最大サイズ(バイト)")
+    return parser.parse_args(argv)
+
+
+async def measure(response: StreamingResponse) -> tuple[int, int, float]:
+    """
+    StreamingResponse を ASGI アプリケーションとして実行し、本文の書き込み回数・送信サイズ・経過時間を計測する。
+
+    Args:
+        response (StreamingResponse): 計測するレスポンス
+
+    Returns:
+        tuple[int, int, float]: 書き込み回数・送信サイズ(バイト)・経過時間(秒)
+    """
+    writes = 0
+    sent_bytes = 0
+    disconnected = asyncio.Event()
+
+    async def receive() -> MutableMapping[str, Any]:
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: MutableMapping[str, Any]) -> None:
+        nonlocal writes, sent_bytes
+        if message["type"] == "http.response.body" and message.get("body"):
+            writes += 1
+            sent_bytes += len(message["body"])
+
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}, "method": "POST", "headers": []}
+    started_at = time.perf_counter()
+    try:
+        await response(scope, receive, send)
+    finally:
+        disconnected.set()
+    return writes, sent_bytes, time.perf_counter() - started_at
+
+
+async def run(deltas: int, delta_interval: float, sse_config: SseConfigTypeDef) -> dict[str, tuple[int, int, float]]:
+    """
+    text と sse のそれぞれで 1 応答を返し、計測する。
+
+    Args:
+        deltas (int): 差分の数
+        delta_interval (float): 差分の間隔(秒)
+        sse_config (SseConfigTypeDef): SSE の設定
+
+    Returns:
+        dict[str, tuple[int, int, float]]: 方式ごとの書き込み回数・送信サイズ・経過時間
+    """
+    service = LlamaService(SyntheticRuntime(deltas, delta_interval), LLAMA_CONFIG)  # type: ignore[arg-type]
+    messages: Any = [{"role": "user", "content": [{"text": "料金体系を教えてください。"}]}]
+    return {
+        "text": await measure(StreamingResponse(service.converse_stream(messages), media_type="text/plain")),
+        "sse": await measure(StreamingResponse(sse_stream(service.converse_stream_events(messages), sse_config), media_type=SSE_MEDIA_TYPE)),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード
+    """
+    args = parse_args(argv)
+    sse_config: SseConfigTypeDef = {"flush_interval": args.flush_interval, "flush_bytes": args.flush_bytes}
+    print(f"{'interval_ms':>11} {'mode':>5} {'writes':>7} {'bytes':>9} {'time_ms':>9} {'deltas_per_s':>13}")
+    for interval_ms in args.delta_interval_ms:
+        results = asyncio.run(run(args.deltas, interval_ms / 1000, sse_config))
+        for mode, (writes, sent_bytes, elapsed) in results.items():
+            print(f"{interval_ms:>11.1f} {mode:>5} {writes:>7} {sent_bytes:>9} {elapsed * 1000:>9.1f} {args.deltas / elapsed:>13.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+同一ワーカーで多数のストリームを同時に読み込んだときの、イベントループの遅延と先頭ブロッキングを比較する CLI。
+
+使用例:
+    python -m app.cli.stream_pump_benchmark --streams 1 10 50 --deltas 20 --delta-interval-ms 20
+
+- FakeBedrockServer を起動し、差分を指定した間隔で返す Converse Stream を指定した数だけ同時に読み込む。
+- 読み込み方式は次の 3 つ。
+  - inline: botocore の EventStream をイベントループ上で直接反復する(従来の Boto3BedrockRuntime の動作)
+  - pump: EventStreamPump でワーカースレッドから読み込む(現在の Boto3BedrockRuntime)
+  - http: HttpBedrockRuntime でネイティブ非同期に読み込む
+- 読み込み中は一定間隔でスリープするタスクを動かし、予定時刻からの遅れをイベントループの遅延として記録する。
+- 結果は ストリーム数 / 方式 / 最初のイベントまでの時間(p50・p99)/ 全体の経過時間 / ループ遅延(p50・p99・最大)の表で出力する。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import TYPE_CHECKING, Any
+
+from app.cli.fake_bedrock_server import FakeBedrockServer
+from app.config.bedrock_config import BEDROCK_CLIENT_CONFIG, BEDROCK_DEFAULT_REGION
+from app.services.bedrock.boto3_runtime import Boto3BedrockRuntime
+from app.services.bedrock.client_registry import BedrockClientRegistry
+from app.types.bedrock_type_defs import ModelType
+
+if TYPE_CHECKING:
+    from app.interfaces.bedrock_interface import BedrockRuntimeBase
+    from app.types.bedrock_type_defs import BedrockClientConfigTypeDef
+
+# 偽のエンドポイントに送るモデルID
+MODEL_ID = "meta.llama3-fake-v1:0"
+
+# イベントループの遅延を測るタスクのスリープ間隔(秒)
+LAG_PROBE_INTERVAL = 0.005
+
+MESSAGES: Any = [{"role": "user", "content": [{"text": "料金体系を教えてください。"}]}]
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="ストリームの読み込み方式ごとのイベントループの遅延を比較する")
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 10, 50], help="同時に読み込むストリームの数")
+    parser.add_argument("--mode", nargs="+", choices=["inline", "pump", "http"], default=["inline", "pump", "http"], help="比較する読み込み方式")
+    parser.add_argument("--deltas", type=int, default=20, help="1 応答あたりの差分の数")
+    parser.add_argument("--delta-interval-ms", type=float, default=20.0, help="ストリームの差分の間隔(ミリ秒)")
+    return parser.parse_args(argv)
+
+
+async def read_stream(runtime: BedrockRuntimeBase, mode: str) -> float:
+    """
+    1 つのストリームを最後まで読み込み、最初のイベントまでの時間を返す。
+
+    Args:
+        runtime (BedrockRuntimeBase): 読み込みに使うランタイム
+        mode (str): 読み込み方式(inline / pump / http)
+
+    Returns:
+        float: 最初のイベントまでの時間(秒)
+    """
+    started_at = time.perf_counter()
+    first_event_at: float | None = None
+    if mode == "inline" and isinstance(runtime, Boto3BedrockRuntime):
+        client = runtime.client
+        response = await asyncio.to_thread(lambda: client.converse_stream(modelId=MODEL_ID, messages=MESSAGES))
+        # 従来の動作と同じく、次のイベントの受信をイベントループ上で待つ
+        for _event in response["stream"]:
+            first_event_at = first_event_at or time.perf_counter()
+            await asyncio.sleep(0)
+    else:
+        result = await runtime.converse_stream({"modelId": MODEL_ID, "messages": MESSAGES})
+        async for _event in result["stream"]:
+            first_event_at = first_event_at or time.perf_counter()
+    return (first_event_at or time.perf_counter()) - started_at
+
+
+async def probe_loop_lag(lags: list[float], stopped: asyncio.Event) -> None:
+    """
+    一定間隔でスリープし、予定時刻からの遅れを記録する。
+
+    Args:
+        lags (list[float]): 遅れ(秒)を追加するリスト
+        stopped (asyncio.Event): 計測を終了するイベント
+    """
+    while not stopped.is_set():
+        scheduled_at = time.perf_counter() + LAG_PROBE_INTERVAL
+        await asyncio.sleep(LAG_PROBE_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - scheduled_at))
+
+
+async def run(mode: str, streams: int, server: FakeBedrockServer) -> dict[str, float]:
+    """
+    1 つの方式とストリーム数の組み合わせを計測する。
+
+    Args:
+        mode (str): 読み込み方式(inline / pump / http)
+        streams (int): 同時に読み込むストリームの数
+        server (FakeBedrockServer): 偽のエンドポイント
+
+    Returns:
+        dict[str, float]: 計測結果
+    """
+    client_config: BedrockClientConfigTypeDef = {
+        **BEDROCK_CLIENT_CONFIG,
+        "transport": "http" if mode == "http" else "boto3",
+        "endpoint_url": server.url,
+        "max_pool_connections": max(BEDROCK_CLIENT_CONFIG["max_pool_connections"], streams),
+        "stream_pump_threads": max(BEDROCK_CLIENT_CONFIG["stream_pump_threads"], streams),
+    }
+    registry = BedrockClientRegistry(default_region=BEDROCK_DEFAULT_REGION, client_config=client_config)
+    lags: list[float] = []
+    stopped = asyncio.Event()
+    try:
+        runtime = registry.get_client(ModelType.LLAMA3)
+        # 接続の確立を計測から除くため、1 回読み込んでおく
+        await read_stream(runtime, mode)
+        probe = asyncio.create_task(probe_loop_lag(lags, stopped))
+        started_at = time.perf_counter()
+        first_events = await asyncio.gather(*(read_stream(runtime, mode) for _ in range(streams)))
+        elapsed = time.perf_counter() - started_at
+        stopped.set()
+        await probe
+    finally:
+        await registry.aclose()
+    return {
+        "first_p50": statistics.median(first_events),
+        "first_p99": _percentile(first_events, 0.99),
+        "elapsed": elapsed,
+        "lag_p50": statistics.median(lags) if lags else 0.0,
+        "lag_p99": _percentile(lags, 0.99) if lags else 0.0,
+        "lag_max": max(lags, default=0.0),
+    }
+
+
+def _percentile(values: list[float], ratio: float) -> float:
+    """
+    値のパーセンタイルを返す(最近傍法)。
+
+    Args:
+        values (list[float]): 値のリスト
+        ratio (float): 0〜1 の割合
+
+    Returns:
+        float: パーセンタイル
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード
+    """
+    args = parse_args(argv)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+    print(f"{'streams':>7} {'mode':>6} {'first_p50_ms':>12} {'first_p99_ms':>12} {'elapsed_ms':>10} {'lag_p50_ms':>10} {'lag_p99_ms':>10} {'lag_max_ms':>10}")
+    with FakeBedrockServer(deltas=args.deltas, delta_interval=args.delta_interval_ms / 1000) as server:
+        for streams in args.streams:
+            for mode in args.mode:
+                result = asyncio.run(run(mode, streams, server))
+                print(
+                    f"{streams:>7} {mode:>6} {result['first_p50'] * 1000:>12.1f} {result['first_p99'] * 1000:>12.1f} {result['elapsed'] * 1000:>10.1f} "
+                    f"{result['lag_p50'] * 1000:>10.1f} {result['lag_p99'] * 1000:>10.1f} {result['lag_max'] * 1000:>10.1f}",
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""
+boto3 とネイティブ非同期 HTTP の両方のランタイムを、ローカルの偽の Bedrock エンドポイントに対して動作確認する CLI。
+
+使用例:
+    python -m app.cli.transport_check --transport boto3 http --concurrency 200
+
+- FakeBedrockServer を起動し、BEDROCK_CLIENT_CONFIG の endpoint_url をその URL に置き換えた BedrockClientRegistry からランタイムを取得する。
+- 次の項目を確認し、ランタイム / 項目 / 結果 / 所要時間 の表で出力する。1 つでも失敗した場合は終了コード 1 を返す。
+  - converse・converse_stream・invoke_model・invoke_model_with_response_stream の応答が偽のエンドポイントの内容と一致する
+  - ThrottlingException(429)をリトライして成功する
+  - ValidationException(400)が ClientError として伝わる
+  - 指定した数のストリームを同時に最後まで読み込める
+  - すべてのリクエストに SigV4 の署名が付いている
+- 認証情報が環境変数にない場合は、ダミーの値を設定する(偽のエンドポイントは署名を検証しない)。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import TYPE_CHECKING, Any
+
+import orjson
+from botocore.exceptions import ClientError
+
+from app.cli.fake_bedrock_server import FakeBedrockServer
+from app.config.bedrock_config import BEDROCK_CLIENT_CONFIG, BEDROCK_DEFAULT_REGION
+from app.services.bedrock.client_registry import BedrockClientRegistry
+from app.types.bedrock_type_defs import ModelType
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from app.interfaces.bedrock_interface import BedrockRuntimeBase
+    from app.types.bedrock_type_defs import BedrockClientConfigTypeDef
+
+# 偽のエンドポイントに送るモデルID
+MODEL_ID = "meta.llama3-fake-v1:0"
+
+# スロットリングを 1 回返した場合のリクエスト数(初回とリトライ)
+THROTTLED_ATTEMPTS = 2
+
+MESSAGES: Any = [{"role": "user", "content": [{"text": "料金体系を教えてください。"}]}]
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    コマンドライン引数を解析する。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        argparse.Namespace: 解析した引数
+    """
+    parser = argparse.ArgumentParser(description="Bedrock ランタイムを偽のエンドポイントに対して動作確認する")
+    parser.add_argument("--transport", nargs="+", choices=["boto3", "http"], default=["boto3", "http"], help="確認するランタイム")
+    parser.add_argument("--deltas", type=int, default=50, help="1 応答あたりの差分の数")
+    parser.add_argument("--delta-interval-ms", type=float, default=1.0, help="ストリームの差分の間隔(ミリ秒)")
+    parser.add_argument("--concurrency", type=int, default=100, help="同時に読み込むストリームの数")
+    return parser.parse_args(argv)
+
+
+async def check_converse(runtime: BedrockRuntimeBase, server: FakeBedrockServer) -> None:
+    """
+    Converse API の応答を確認する。
+
+    Args:
+        runtime (BedrockRuntimeBase): 確認するランタイム
+        server (FakeBedrockServer): 偽のエンドポイント
+    """
+    response = await runtime.converse({"modelId": MODEL_ID, "messages": MESSAGES})
+    text = response["output"]["message"]["content"][0]["text"]  # type: ignore[typeddict-item]
+    _expect(text == "".join(server.delta_texts()), f"unexpected text: {text!r}")
+    _expect(response["usage"]["outputTokens"] == server.deltas, f"unexpected usage: {response['usage']}")
+
+
+async def check_converse_stream(runtime: BedrockRuntimeBase, server: FakeBedrockServer) -> None:
+    """
+    Converse Stream API のイベントの順序と内容を確認する。
+
+    Args:
+        runtime (BedrockRuntimeBase): 確認するランタイム
+        server (FakeBedrockServer): 偽のエンドポイント
+    """
+    response = await runtime.converse_stream({"modelId": MODEL_ID, "messages": MESSAGES})
+    event_types: list[str] = []
+    deltas: list[str] = []
+    output_tokens = None
+    async for event in response["stream"]:
+        event_types.extend(event.keys())
+        if "contentBlockDelta" in event:
+            deltas.append(event["contentBlockDelta"]["delta"]["text"])  # type: ignore[typeddict-item]
+        if "metadata" in event:
+            output_tokens = event["metadata"]["usage"]["outputTokens"]
+    _expect(deltas == server.delta_texts(), f"unexpected deltas: {deltas[:5]}...")
+    _expect(event_types[0] == "messageStart" and event_types[-1] == "metadata", f"unexpected event order: {event_types[:2]}...{event_types[-2:]}")
+    _expect(output_tokens == server.deltas, f"unexpected output tokens: {output_tokens}")
+
+
+async def check_invoke_model(runtime: BedrockRuntimeBase, server: FakeBedrockServer) -> None:
+    """
+    Invoke Model API の応答を確認する。
+
+    Args:
+        runtime (BedrockRuntimeBase): 確認するランタイム
+        server (FakeBedrockServer): 偽のエンドポイント
+    """
+    body = orjson.dumps({"prompt": "料金体系を教えてください。", "max_gen_len": 64})
+    response = await runtime.invoke_model({"modelId": MODEL_ID, "body": body, "contentType": "application/json", "accept": "application/json"})
+    generation = orjson.loads(response["body"])["generation"]
+    _expect(generation == "".join(server.delta_texts()), f"unexpected generation: {generation!r}")
+
+
+async def check_invoke_model_stream(runtime: BedrockRuntimeBase, server: FakeBedrockServer) -> None:
+    """
+    Invoke Model With Response Stream API のチャンクの内容を確認する。
+
+    Args:
+        runtime (BedrockRuntimeBase): 確認するランタイム
+        server (FakeBedrockServer): 偽のエンドポイント
+    """
+    body = orjson.dumps({"prompt": "料金体系を教えてください。", "max_gen_len": 64})
+    response = await runtime.invoke_model_with_response_stream({"modelId": MODEL_ID, "body": body, "contentType": "application/json"})
+    chunks = [orjson.loads(event["chunk"]["bytes"]) async for event in response["body"] if "chunk" in event]
+    _expect("".join(chunk["generation"] for chunk in chunks) == "".join(server.delta_texts()), "unexpected generation")
+    _expect(chunks[-1]["amazon-bedrock-invocationMetrics"]["outputTokenCount"] == server.deltas, "unexpected invocation metrics")
+
+
+async def check_throttling_retry(runtime: BedrockRuntimeBase, server: FakeBedrockServer) -> None:
+    """
+    ThrottlingException をリトライして成功することを確認する。
+
+    Args:
+        runtime (BedrockRuntimeBase): 確認するランタイム
+        server (FakeBedrockServer): 偽のエンドポイント
+    """
+    requests = server.requests
+    server.throttle_next = 1
+    await check_converse(runtime, server)
+    _expect(server.requests - requests == THROTTLED_ATTEMPTS, f"expected 1 retry, got {server.requests - requests - 1}")
+
+
+async def check_validation_error(runtime: BedrockRuntimeBase, server: FakeBedrockServer) -> None:  # noqa: ARG001
+    """
+    ValidationException が ClientError として伝わることを確認する。
+
+    Args:
+        runtime (BedrockRuntimeBase): 確認するランタイム
+        server (FakeBedrockServer): 偽のエンドポイント(使用しない)
+    """
+    try:
+        await runtime.converse({"modelId": "invalid-model", "messages": MESSAGES})
+    except ClientError as e:
+        code = e.response["Error"]["Code"]
+        _expect(code == "ValidationException", f"unexpected error code: {code}")
+    else:
+        _expect(condition=False, message="ClientError was not raised")
+
+
+def concurrent_streams(concurrency: int) -> Callable[[BedrockRuntimeBase, FakeBedrockServer], Awaitable[None]]:
+    """
+    指定した数のストリームを同時に読み込む確認項目を返す。
+
+    Args:
+        concurrency (int): 同時に読み込むストリームの数
+
+    Returns:
+        Callable[[BedrockRuntimeBase, FakeBedrockServer], Awaitable[None]]: 確認項目
+    """
+
+    async def check(runtime: BedrockRuntimeBase, server: FakeBedrockServer) -> None:
+        await asyncio.gather(*(check_converse_stream(runtime, server) for _ in range(concurrency)))
+
+    return check
+
+
+async def check_signed(runtime: BedrockRuntimeBase, server: FakeBedrockServer) -> None:  # noqa: ARG001
+    """
+    すべてのリクエストに署名が付いていたことを確認する。
+
+    Args:
+        runtime (BedrockRuntimeBase): 確認するランタイム(使用しない)
+        server (FakeBedrockServer): 偽のエンドポイント
+    """
+    _expect(server.signed_requests == server.requests, f"{server.requests - server.signed_requests} of {server.requests} requests were not signed")
+
+
+def _expect(condition: bool, message: str) -> None:
+    """
+    条件を満たさない場合に確認の失敗とする。
+
+    Args:
+        condition (bool): 条件
+        message (str): 失敗時のメッセージ
+
+    Raises:
+        AssertionError: 条件を満たさない場合
+    """
+    if not condition:
+        raise AssertionError(message)
+
+
+async def run(transport: str, args: argparse.Namespace) -> list[tuple[str, str, float]]:
+    """
+    1 つのランタイムで全項目を確認する。
+
+    Args:
+        transport (str): ランタイムの種類(boto3 / http)
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        list[tuple[str, str, float]]: 項目ごとの名前・結果(ok もしくは失敗の内容)・所要時間(秒)
+    """
+    checks: dict[str, Callable[[BedrockRuntimeBase, FakeBedrockServer], Awaitable[None]]] = {
+        "converse": check_converse,
+        "converse_stream": check_converse_stream,
+        "invoke_model": check_invoke_model,
+        "invoke_model_stream": check_invoke_model_stream,
+        "throttling_retry": check_throttling_retry,
+        "validation_error": check_validation_error,
+        f"concurrent_streams({args.concurrency})": concurrent_streams(args.concurrency),
+        "signed": check_signed,
+    }
+    results: list[tuple[str, str, float]] = []
+    with FakeBedrockServer(deltas=args.deltas, delta_interval=args.delta_interval_ms / 1000) as server:
+        client_config: BedrockClientConfigTypeDef = {
+            **BEDROCK_CLIENT_CONFIG,
+            "transport": "http" if transport == "http" else "boto3",
+            "endpoint_url": server.url,
+            "max_pool_connections": max(BEDROCK_CLIENT_CONFIG["max_pool_connections"], args.concurrency),
+            "stream_pump_threads": max(BEDROCK_CLIENT_CONFIG["stream_pump_threads"], args.concurrency),
+        }
+        registry = BedrockClientRegistry(default_region=BEDROCK_DEFAULT_REGION, client_config=client_config)
+        try:
+            runtime = registry.get_client(ModelType.LLAMA3)
+            for name, check in checks.items():
+                started_at = time.perf_counter()
+                try:
+                    await check(runtime, server)
+                    result = "ok"
+                except Exception as e:  # noqa: BLE001
+                    result = f"FAILED: {type(e).__name__}: {e}"
+                results.append((name, result, time.perf_counter() - started_at))
+        finally:
+            await registry.aclose()
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    CLI のエントリーポイント。
+
+    Args:
+        argv (list[str] | None, optional): コマンドライン引数。省略時は sys.argv
+
+    Returns:
+        int: 終了コード(すべて成功した場合は0)
+    """
+    args = parse_args(argv)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+    failed = False
+    print(f"{'transport':>9} {'check':<24} {'time_ms':>9}  result")
+    for transport in args.transport:
+        for name, result, elapsed in asyncio.run(run(transport, args)):
+            failed = failed or result != "ok"
+            print(f"{transport:>9} {name:<24} {elapsed * 1000:>9.1f}  {result}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
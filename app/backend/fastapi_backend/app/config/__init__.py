@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# 各設定モジュールは読み込み時に環境変数を参照するため、どの設定モジュールよりも先に .env を読み込む
+load_dotenv()
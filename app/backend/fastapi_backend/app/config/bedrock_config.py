@@ -2,7 +2,188 @@
 bedrock runtime client で使用する各種設定値を定義する。
 """
 
-from app.types.bedrock_type_defs import ConfigTypeDef, LlamaConfigTypeDef
+import os
+
+from app.types.bedrock_type_defs import (
+    AttachmentOffloadConfigTypeDef,
+    AttachmentUploadConfigTypeDef,
+    BatchConverseConfigTypeDef,
+    BedrockClientConfigTypeDef,
+    BulkInferenceConfigTypeDef,
+    ChatSocketConfigTypeDef,
+    CompletionCacheConfigTypeDef,
+    ConcurrencyLimiterConfigTypeDef,
+    ConfigTypeDef,
+    ConversationHistoryConfigTypeDef,
+    HedgingConfigTypeDef,
+    LlamaConfigTypeDef,
+    RegionRoutingConfigTypeDef,
+    ResumableStreamConfigTypeDef,
+    SseConfigTypeDef,
+)
+
+###################################################################
+# Bedrock ランタイムクライアント
+###################################################################
+
+BEDROCK_DEFAULT_REGION: str = os.getenv("BEDROCK_DEFAULT_REGION", "us-east-1")
+
+BEDROCK_CLIENT_CONFIG: BedrockClientConfigTypeDef = {
+    "transport": "http" if os.getenv("BEDROCK_TRANSPORT") == "http" else "boto3",
+    "endpoint_url": os.getenv("BEDROCK_ENDPOINT_URL"),
+    "max_pool_connections": int(os.getenv("BEDROCK_MAX_POOL_CONNECTIONS", "50")),
+    "connect_timeout": float(os.getenv("BEDROCK_CONNECT_TIMEOUT", "5")),
+    "read_timeout": float(os.getenv("BEDROCK_READ_TIMEOUT", "120")),
+    "max_attempts": int(os.getenv("BEDROCK_MAX_ATTEMPTS", "3")),
+    "retry_mode": "adaptive",
+    "tcp_keepalive": True,
+    "warmup_connections": int(os.getenv("BEDROCK_WARMUP_CONNECTIONS", "4")),
+    "stream_pump_threads": int(os.getenv("BEDROCK_STREAM_PUMP_THREADS", "256")),
+    "stream_buffer_size": int(os.getenv("BEDROCK_STREAM_BUFFER_SIZE", "64")),
+}
+
+###################################################################
+# 生成結果キャッシュ
+###################################################################
+
+# 同じ入力に同じ応答を返すため既定では無効。有効にした場合も既定では temperature が 0 のリクエストだけを対象とする
+BEDROCK_COMPLETION_CACHE_CONFIG: CompletionCacheConfigTypeDef = {
+    "enabled": os.getenv("BEDROCK_CACHE_ENABLED", "false").lower() == "true",
+    "max_bytes": int(os.getenv("BEDROCK_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    "ttl_seconds": float(os.getenv("BEDROCK_CACHE_TTL_SECONDS", "3600")),
+    "max_temperature": float(os.getenv("BEDROCK_CACHE_MAX_TEMPERATURE", "0.0")),
+    "disk_path": os.getenv("BEDROCK_CACHE_DISK_PATH"),
+    "disk_max_entries": int(os.getenv("BEDROCK_CACHE_DISK_MAX_ENTRIES", "100000")),
+}
+
+###################################################################
+# 同時リクエストのまとめ(single-flight)
+###################################################################
+
+BEDROCK_SINGLE_FLIGHT_ENABLED: bool = os.getenv("BEDROCK_SINGLE_FLIGHT_ENABLED", "false").lower() == "true"
+
+###################################################################
+# モデルごとの適応的な同時実行数制御
+###################################################################
+
+BEDROCK_CONCURRENCY_LIMITER_CONFIG: ConcurrencyLimiterConfigTypeDef = {
+    "enabled": os.getenv("BEDROCK_LIMITER_ENABLED", "false").lower() == "true",
+    "initial_limit": int(os.getenv("BEDROCK_LIMITER_INITIAL_LIMIT", "16")),
+    "min_limit": int(os.getenv("BEDROCK_LIMITER_MIN_LIMIT", "1")),
+    "max_limit": int(os.getenv("BEDROCK_LIMITER_MAX_LIMIT", "128")),
+    "additive_increase": float(os.getenv("BEDROCK_LIMITER_ADDITIVE_INCREASE", "1")),
+    "multiplicative_decrease": float(os.getenv("BEDROCK_LIMITER_MULTIPLICATIVE_DECREASE", "0.5")),
+    "queue_timeout": float(os.getenv("BEDROCK_LIMITER_QUEUE_TIMEOUT", "10")),
+    "max_queue": int(os.getenv("BEDROCK_LIMITER_MAX_QUEUE", "1000")),
+    "retry_after": float(os.getenv("BEDROCK_LIMITER_RETRY_AFTER", "2")),
+}
+
+###################################################################
+# 応答時間に応じたリージョンの選択とサーキットブレーカー
+###################################################################
+
+BEDROCK_REGION_ROUTING_CONFIG: RegionRoutingConfigTypeDef = {
+    "enabled": os.getenv("BEDROCK_ROUTING_ENABLED", "false").lower() == "true",
+    "regions": [region.strip() for region in os.getenv("BEDROCK_ROUTING_REGIONS", "us-east-1,us-east-2,us-west-2").split(",") if region.strip()],
+    "ewma_alpha": float(os.getenv("BEDROCK_ROUTING_EWMA_ALPHA", "0.2")),
+    "failure_threshold": int(os.getenv("BEDROCK_ROUTING_FAILURE_THRESHOLD", "5")),
+    "error_rate_threshold": float(os.getenv("BEDROCK_ROUTING_ERROR_RATE_THRESHOLD", "0.5")),
+    "min_samples": int(os.getenv("BEDROCK_ROUTING_MIN_SAMPLES", "20")),
+    "open_duration": float(os.getenv("BEDROCK_ROUTING_OPEN_DURATION", "30")),
+}
+
+###################################################################
+# 別リージョンへのヘッジリクエスト
+###################################################################
+
+BEDROCK_HEDGING_CONFIG: HedgingConfigTypeDef = {
+    "enabled": os.getenv("BEDROCK_HEDGING_ENABLED", "false").lower() == "true",
+    "region": os.getenv("BEDROCK_HEDGING_REGION", "us-west-2"),
+    "percentile": float(os.getenv("BEDROCK_HEDGING_PERCENTILE", "0.95")),
+    "initial_delay": float(os.getenv("BEDROCK_HEDGING_INITIAL_DELAY", "10")),
+    "min_delay": float(os.getenv("BEDROCK_HEDGING_MIN_DELAY", "0.5")),
+    "min_samples": int(os.getenv("BEDROCK_HEDGING_MIN_SAMPLES", "50")),
+    "window_size": int(os.getenv("BEDROCK_HEDGING_WINDOW_SIZE", "1000")),
+    "budget_ratio": float(os.getenv("BEDROCK_HEDGING_BUDGET_RATIO", "0.05")),
+    "budget_burst": int(os.getenv("BEDROCK_HEDGING_BUDGET_BURST", "10")),
+}
+
+###################################################################
+# ストリーミング応答の Server-Sent Events
+###################################################################
+
+BEDROCK_SSE_CONFIG: SseConfigTypeDef = {
+    "flush_interval": float(os.getenv("BEDROCK_SSE_FLUSH_INTERVAL", "0.05")),
+    "flush_bytes": int(os.getenv("BEDROCK_SSE_FLUSH_BYTES", "1024")),
+}
+
+BEDROCK_RESUMABLE_STREAM_CONFIG: ResumableStreamConfigTypeDef = {
+    "enabled": os.getenv("BEDROCK_RESUMABLE_STREAM_ENABLED", "false").lower() == "true",
+    "max_events_per_stream": int(os.getenv("BEDROCK_RESUMABLE_STREAM_MAX_EVENTS", "4096")),
+    "max_total_bytes": int(os.getenv("BEDROCK_RESUMABLE_STREAM_MAX_TOTAL_BYTES", str(64 * 1024 * 1024))),
+    "ttl": float(os.getenv("BEDROCK_RESUMABLE_STREAM_TTL", "300")),
+}
+
+###################################################################
+# WebSocket での会話
+###################################################################
+
+BEDROCK_CHAT_SOCKET_CONFIG: ChatSocketConfigTypeDef = {
+    "max_concurrent_turns": int(os.getenv("BEDROCK_WS_MAX_CONCURRENT_TURNS", "1")),
+    "idle_timeout": float(os.getenv("BEDROCK_WS_IDLE_TIMEOUT", "300")),
+}
+
+###################################################################
+# バッチ Converse
+###################################################################
+
+BEDROCK_BATCH_CONVERSE_CONFIG: BatchConverseConfigTypeDef = {
+    "max_items": int(os.getenv("BEDROCK_BATCH_MAX_ITEMS", "1000")),
+    "default_concurrency": int(os.getenv("BEDROCK_BATCH_DEFAULT_CONCURRENCY", "8")),
+    "max_concurrency": int(os.getenv("BEDROCK_BATCH_MAX_CONCURRENCY", "32")),
+}
+
+###################################################################
+# オフライン一括推論 CLI
+###################################################################
+
+BEDROCK_BULK_INFERENCE_CONFIG: BulkInferenceConfigTypeDef = {
+    "concurrency": int(os.getenv("BEDROCK_BULK_CONCURRENCY", "16")),
+    "batch_job_threshold": int(os.getenv("BEDROCK_BULK_BATCH_JOB_THRESHOLD", "1000")),
+    "poll_interval": float(os.getenv("BEDROCK_BULK_POLL_INTERVAL", "60")),
+}
+
+###################################################################
+# 会話履歴のトークン数の上限
+###################################################################
+
+# 古いターンを切り捨てると応答の内容が変わるため既定では無効
+BEDROCK_CONVERSATION_HISTORY_CONFIG: ConversationHistoryConfigTypeDef = {
+    "enabled": os.getenv("BEDROCK_HISTORY_ENABLED", "false").lower() == "true",
+    "max_input_tokens": int(os.getenv("BEDROCK_HISTORY_MAX_INPUT_TOKENS", "8000")),
+    "summary_enabled": os.getenv("BEDROCK_HISTORY_SUMMARY_ENABLED", "false").lower() == "true",
+    "summary_max_tokens": int(os.getenv("BEDROCK_HISTORY_SUMMARY_MAX_TOKENS", "300")),
+}
+
+###################################################################
+# multipart の添付ファイル
+###################################################################
+
+BEDROCK_ATTACHMENT_CONFIG: AttachmentUploadConfigTypeDef = {
+    "max_files": int(os.getenv("BEDROCK_ATTACHMENT_MAX_FILES", "5")),
+    "max_total_bytes": int(os.getenv("BEDROCK_ATTACHMENT_MAX_TOTAL_BYTES", str(64 * 1024 * 1024))),
+    "memory_limit": int(os.getenv("BEDROCK_ATTACHMENT_MEMORY_LIMIT", str(4 * 1024 * 1024))),
+}
+
+# S3 のエンドポイントは boto3 の環境変数(AWS_ENDPOINT_URL_S3)で変更できる
+BEDROCK_ATTACHMENT_OFFLOAD_CONFIG: AttachmentOffloadConfigTypeDef = {
+    "enabled": os.getenv("BEDROCK_ATTACHMENT_OFFLOAD_ENABLED", "false").lower() == "true",
+    "bucket": os.getenv("BEDROCK_ATTACHMENT_OFFLOAD_BUCKET", ""),
+    "prefix": os.getenv("BEDROCK_ATTACHMENT_OFFLOAD_PREFIX", "attachments/"),
+    "bucket_owner": os.getenv("BEDROCK_ATTACHMENT_OFFLOAD_BUCKET_OWNER"),
+    "threshold_bytes": int(os.getenv("BEDROCK_ATTACHMENT_OFFLOAD_THRESHOLD_BYTES", str(1024 * 1024))),
+    "known_keys_max_entries": int(os.getenv("BEDROCK_ATTACHMENT_OFFLOAD_KNOWN_KEYS", "10000")),
+}
 
 ###################################################################
 # Llama 3
@@ -26,5 +207,7 @@ LLAMA_CONFIG: ConfigTypeDef[LlamaConfigTypeDef] = {
     "model": {
         "invoke": {"prompt": "", "max_gen_len": 512, "temperature": 0.5, "top_p": 0.9},
         "invoke_stream": {"prompt": "", "max_gen_len": 512, "temperature": 0.5, "top_p": 0.9},
+        "system_prompt": os.getenv("LLAMA_INVOKE_SYSTEM_PROMPT", ""),
     },
+    "history": BEDROCK_CONVERSATION_HISTORY_CONFIG,
 }
@@ -1,7 +1,22 @@
+import atexit
+import copy
 import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import UTC, datetime
+from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 from pathlib import Path
 from typing import Any
 
+import orjson
+
+from app.config.base_config import PRODUCTION_FLAG
+from app.types.logging_type_defs import LogSamplingRuleTypeDef
+
 
 class ModuleFilter(logging.Filter):
     """特定のモジュールのプレフィックスでフィルタリング"""
@@ -14,76 +29,241 @@ class ModuleFilter(logging.Filter):
         return record.name.startswith(self.prefix)
 
 
+class LogSamplingFilter(logging.Filter):
+    """
+    ロガーごとにサンプリングと流量制限を行う
+    - ロガー名が一致するか前方一致(「.」区切り)する最も長いルールを適用する。ルールのないロガーと ERROR 以上のログは常に出力する。
+    - sample_rate の割合のみ残し、さらにトークンバケットで 1 秒あたり max_per_second 件までに制限する。
+    - 捨てた件数は、同じルールで次に出力するログの suppressed 項目に付ける。
+    """
+
+    def __init__(self, rules: dict[str, LogSamplingRuleTypeDef]) -> None:
+        super().__init__()
+        self.rules = dict(rules)
+        self._rule_names: dict[str, str | None] = {}  # ロガー名ごとに適用するルール
+        self._tokens = {name: rule["max_per_second"] for name, rule in self.rules.items()}
+        self._refilled_at = dict.fromkeys(self.rules, time.monotonic())
+        self._suppressed = dict.fromkeys(self.rules, 0)
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        rule_name = self._rule_name(record.name)
+        if rule_name is None:
+            return True
+
+        rule = self.rules[rule_name]
+        with self._lock:
+            now = time.monotonic()
+            tokens = min(rule["max_per_second"], self._tokens[rule_name] + (now - self._refilled_at[rule_name]) * rule["max_per_second"])
+            self._refilled_at[rule_name] = now
+            if tokens < 1 or (rule["sample_rate"] < 1 and random.random() >= rule["sample_rate"]):
+                self._tokens[rule_name] = tokens
+                self._suppressed[rule_name] += 1
+                return False
+            self._tokens[rule_name] = tokens - 1
+            suppressed, self._suppressed[rule_name] = self._suppressed[rule_name], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def _rule_name(self, logger_name: str) -> str | None:
+        """
+        ロガーに適用するルールの名前を返す。
+
+        Args:
+            logger_name (str): ロガー名
+
+        Returns:
+            str | None: ルールの名前。適用するルールがない場合はNone
+        """
+        if logger_name not in self._rule_names:
+            matches = [name for name in self.rules if logger_name == name or logger_name.startswith(f"{name}.")]
+            self._rule_names[logger_name] = max(matches, key=len, default=None)
+        return self._rule_names[logger_name]
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    ログをキューに入れるだけのハンドラー。ファイルとコンソールへの書き込みは QueueListener の 1 スレッドで行い、イベントループを止めない
+    - メッセージは呼び出し時に確定させ、例外のトレースバックの整形は書き込みスレッドのフォーマッターで行う。
+    - uvicorn のアクセスログは、クライアント・リクエスト行・ステータスコードを項目として付ける。
+    - キューが満杯の場合は待たずに捨て、捨てた件数を次に入れるログの dropped 項目に付ける。
+    """
+
+    def __init__(self, log_queue: queue.Queue[logging.LogRecord]) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.name == "uvicorn.access" and isinstance(record.args, tuple) and len(record.args) == 5:  # noqa: PLR2004
+            client_addr, method, path, http_version, status_code = record.args
+            record.client_addr = client_addr
+            record.request_line = f"{method} {path} HTTP/{http_version}"
+            record.status_code = status_code
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # emit は Handler のロック内で呼ばれるため、dropped の更新は排他される
+        if self.dropped:
+            record.dropped = self.dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self.dropped = 0
+
+
+# JSON の項目として出力しない LogRecord の標準の属性
+LOG_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", logging.INFO, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    ログを 1 行の JSON に整形する
+    - time(UTC)・level・logger・message・process・thread と、例外・スタックトレースを出力する。
+    - extra で渡した属性(抑制した件数やアクセスログの項目など)はそのまま項目として出力する。
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, tz=UTC).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exception"] = record.exc_text
+        if record.stack_info:
+            payload["stack"] = self.formatStack(record.stack_info)
+        payload.update({key: value for key, value in vars(record).items() if key not in LOG_RECORD_ATTRIBUTES})
+        return orjson.dumps(payload, default=str).decode()
+
+
 # ログフォルダ名
 LOG_DIR_NAME: Path = Path("logs")
 
+# ログの形式(text もしくは json)。本番環境では集計しやすい json を既定にする
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json" if PRODUCTION_FLAG else "text")
+
+# 書き込み待ちのログの上限。超えた分は捨てる
+LOG_QUEUE_MAXSIZE = int(os.getenv("LOG_QUEUE_MAXSIZE", "10000"))
+
+# リクエストごとに出力するロガーのサンプリングと流量制限
+LOG_SAMPLING_RULES: dict[str, LogSamplingRuleTypeDef] = {
+    "uvicorn.access": {
+        "sample_rate": float(os.getenv("LOG_ACCESS_SAMPLE_RATE", "1.0")),
+        "max_per_second": float(os.getenv("LOG_ACCESS_MAX_PER_SECOND", "200")),
+    },
+    "app.routers": {
+        "sample_rate": float(os.getenv("LOG_ROUTER_SAMPLE_RATE", "1.0")),
+        "max_per_second": float(os.getenv("LOG_ROUTER_MAX_PER_SECOND", "200")),
+    },
+    "app.middleware": {
+        "sample_rate": 1.0,
+        "max_per_second": float(os.getenv("LOG_ERROR_HANDLER_MAX_PER_SECOND", "50")),
+    },
+}
+
 LOGGING_CONFIG: dict[str, Any] = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
-        "default": {
+        "text": {
             "format": "%(asctime)s - PID:%(process)d - %(threadName)s - [%(name)s] - %(levelname)s : %(message)s",
         },
-        "uvicorn-error": {
-            "format": "%(asctime)s - PID:%(process)d - %(threadName)s - [uvicorn] - %(levelname)s : %(message)s",
+        "json": {
+            "()": JsonFormatter,
         },
-        "uvicorn-access": {
-            "format": "%(asctime)s - PID:%(process)d - %(threadName)s - [%(name)s] - %(levelname)s - %(client_addr)s : '%(request_line)s' %(status_code)s",
+    },
+    "filters": {
+        "sampling": {
+            "()": LogSamplingFilter,
+            "rules": LOG_SAMPLING_RULES,
         },
     },
     "handlers": {
         "console": {
             "class": "logging.StreamHandler",
             "level": "DEBUG",
-            "formatter": "default",
+            "formatter": LOG_FORMAT,
             "stream": "ext://sys.stdout",
         },
+        # 1 つのファイルを 1 つのハンドラーのみで書き込み、日付の切り替えを競合させない
         "file": {
-            "class": "logging.handlers.TimedRotatingFileHandler",
+            "class": TimedRotatingFileHandler,
             "level": "DEBUG",
-            "formatter": "default",
+            "formatter": LOG_FORMAT,
             "filename": Path.joinpath(LOG_DIR_NAME, "generative_ai_backend.log"),
             "when": "midnight",  # 毎日0時に新ファイルへ切り替え
             "interval": 1,  # 1日ごと("midnight" と組み合わせ)
             "backupCount": 14,  # 14日分のログを保持
             "encoding": "utf-8",
+            "delay": True,  # 最初の書き込み時にファイルを開く
         },
-        "uvicorn-error": {
-            "class": "logging.handlers.TimedRotatingFileHandler",
-            "level": "INFO",
-            "formatter": "uvicorn-error",
-            "filename": Path.joinpath(LOG_DIR_NAME, "generative_ai_backend.log"),
-            "when": "midnight",  # 毎日0時に新ファイルへ切り替え
-            "interval": 1,  # 1日ごと("midnight" と組み合わせ)
-            "backupCount": 14,  # 14日分のログを保持
-            "encoding": "utf-8",
-        },
-        "uvicorn-access": {
-            "class": "logging.handlers.TimedRotatingFileHandler",
-            "level": "INFO",
-            "formatter": "uvicorn-access",
-            "filename": Path.joinpath(LOG_DIR_NAME, "generative_ai_backend.log"),
-            "when": "midnight",  # 毎日0時に新ファイルへ切り替え
-            "interval": 1,  # 1日ごと("midnight" と組み合わせ)
-            "backupCount": 14,  # 14日分のログを保持
-            "encoding": "utf-8",
+        # 各ロガーはキューに入れるだけで、console と file への書き込みは QueueListener のスレッドで行う
+        "queue": {
+            "class": NonBlockingQueueHandler,
+            "filters": ["sampling"],
+            "handlers": ["console", "file"],
+            "queue": {"()": queue.Queue, "maxsize": LOG_QUEUE_MAXSIZE},
+            "respect_handler_level": True,
         },
     },
     "loggers": {
         "app": {
-            "handlers": ["console", "file"],
+            "handlers": ["queue"],
             "level": "DEBUG",
             "propagate": False,
         },
         "uvicorn.access": {
-            "handlers": ["console", "uvicorn-access"],
+            "handlers": ["queue"],
             "level": "INFO",
             "propagate": False,
         },
         "uvicorn.error": {
-            "handlers": ["console", "uvicorn-error"],
+            "handlers": ["queue"],
             "level": "INFO",
             "propagate": False,
         },
     },
 }
+
+# 起動中の書き込みスレッド
+_listener: QueueListener | None = None
+
+
+def configure_logging(config: dict[str, Any] = LOGGING_CONFIG) -> QueueListener:
+    """
+    ロギングを設定し、キューのログを書き込むスレッドを開始する。
+    再設定した場合は前のスレッドを止め、プロセスの終了時にはキューに残ったログを書き込んでから止める。
+
+    Args:
+        config (dict[str, Any], optional): dictConfig に渡す設定。"queue" のハンドラーを含むこと
+
+    Returns:
+        QueueListener: ログを書き込むスレッド
+    """
+    global _listener  # noqa: PLW0603
+
+    LOG_DIR_NAME.mkdir(exist_ok=True)
+    if _listener is not None:
+        _listener.stop()
+        atexit.unregister(_listener.stop)
+    dictConfig(config)
+    handler = logging.getHandlerByName("queue")
+    listener: QueueListener = handler.listener  # type: ignore[union-attr]
+    listener.start()
+    atexit.register(listener.stop)
+    _listener = listener
+    return listener
@@ -0,0 +1,27 @@
+"""
+Prometheus のメトリクスで使用する各種設定値を定義する。
+"""
+
+import os
+
+from app.types.metrics_type_defs import MetricsConfigTypeDef
+
+###################################################################
+# メトリクス
+# - リクエストごとの計測とスレッドプールの計装を伴うため既定では無効。METRICS_ENABLED=true で有効にする。
+# - 複数ワーカーで起動する場合は、ワーカーの起動前に PROMETHEUS_MULTIPROC_DIR に空のディレクトリを指定すること。
+#   各ワーカーはそこにメトリクスを書き込み、/metrics はすべてのワーカーの値を集計して返す。
+###################################################################
+
+METRICS_CONFIG: MetricsConfigTypeDef = {
+    "enabled": os.getenv("METRICS_ENABLED", "false").lower() == "true",
+    "path": os.getenv("METRICS_PATH", "/metrics"),
+    "multiprocess_dir": os.getenv("PROMETHEUS_MULTIPROC_DIR"),
+    "default_thread_pool_workers": int(os.environ["DEFAULT_THREAD_POOL_WORKERS"]) if os.getenv("DEFAULT_THREAD_POOL_WORKERS") else None,
+    "latency_buckets": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+    "time_to_first_token_buckets": (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0),
+    "inter_token_buckets": (0.001, 0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0),
+    "output_tokens_buckets": (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192),
+    "tokens_per_second_buckets": (5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500),
+    "queue_wait_buckets": (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+}
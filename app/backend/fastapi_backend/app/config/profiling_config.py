@@ -0,0 +1,25 @@
+"""
+リクエストのプロファイリングで使用する各種設定値を定義する。
+"""
+
+import os
+
+from app.config.logging_config import LOG_DIR_NAME
+from app.types.profiling_type_defs import ProfilingConfigTypeDef
+
+###################################################################
+# リクエストのプロファイリング
+# - PROFILING_ENABLED が true の場合のみミドルウェアを登録する。無効な場合は処理が一切増えない。
+# - X-Profile-Token ヘッダーに PROFILING_TOKEN を指定したリクエスト、もしくは PROFILING_SAMPLE_RATE の割合のリクエストをプロファイリングする。
+# - 同時にプロファイリングするのは 1 リクエストのみ(スタックの採取と tracemalloc はプロセス全体が対象のため)。
+###################################################################
+
+PROFILING_CONFIG: ProfilingConfigTypeDef = {
+    "enabled": os.getenv("PROFILING_ENABLED", "false").lower() == "true",
+    "token": os.getenv("PROFILING_TOKEN") or None,
+    "sample_rate": float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+    "interval_seconds": float(os.getenv("PROFILING_INTERVAL_MS", "5")) / 1000,
+    "tracemalloc_frames": int(os.getenv("PROFILING_TRACEMALLOC_FRAMES", "16")),
+    "top_allocations": int(os.getenv("PROFILING_TOP_ALLOCATIONS", "30")),
+    "output_dir": LOG_DIR_NAME / "profiles",
+}
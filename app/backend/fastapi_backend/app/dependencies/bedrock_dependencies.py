@@ -4,13 +4,18 @@ Bedrock サービスの依存性注入用定義とマッピングを記載する
 
 from typing import Annotated, Type
 
-import boto3
-from fastapi import Body, Depends, HTTPException
-from mypy_boto3_bedrock_runtime import BedrockRuntimeClient
+from fastapi import Body, Depends, Header, HTTPException, Request
+from starlette.requests import HTTPConnection
 
 from app.config.bedrock_config import LLAMA_CONFIG
 from app.interfaces.bedrock_interface import BedrockModelBase
+from app.services.bedrock.attachment_offload import AttachmentOffloader
+from app.services.bedrock.client_registry import BedrockClientRegistry
+from app.services.bedrock.completion_cache import COMPLETION_CACHE_MODE, completion_cache_mode_from_headers
 from app.services.bedrock.llama_service import LlamaService
+from app.services.bedrock.resumable_stream import ResumableStreamStore
+from app.services.bedrock.sse import SSE_MEDIA_TYPE
+from app.services.bedrock.stream_cancellation import StreamCanceller
 from app.types.bedrock_type_defs import ConfigTypeDef, ModelType
 
 MODEL_MAPPING: dict[ModelType, Type[BedrockModelBase]] = {ModelType.LLAMA3: LlamaService}
@@ -19,23 +24,112 @@ CONFIG_MAPPING: dict[ModelType, ConfigTypeDef] = {ModelType.LLAMA3: LLAMA_CONFIG
 
 
 # 依存関数定義
-def get_bedrock_client() -> BedrockRuntimeClient:
-    """bedrock用ランタイムクライアントを返す
+def get_bedrock_client_registry(connection: HTTPConnection) -> BedrockClientRegistry:
+    """lifespanで生成したbedrock用ランタイムクライアントのレジストリを返す
+
+    Args:
+        connection (HTTPConnection): リクエストもしくは WebSocket の接続
+
+    Returns:
+        BedrockClientRegistry: bedrock用ランタイムクライアントのレジストリ
+    """
+    client_registry: BedrockClientRegistry = connection.app.state.bedrock_client_registry
+    return client_registry
+
+
+def get_attachment_offloader(connection: HTTPConnection) -> AttachmentOffloader | None:
+    """lifespanで生成した添付ファイルの S3 への退避処理を返す
+
+    Args:
+        connection (HTTPConnection): リクエストもしくは WebSocket の接続
+
+    Returns:
+        AttachmentOffloader | None: 添付ファイルの S3 への退避処理。無効な場合はNone
+    """
+    attachment_offloader: AttachmentOffloader | None = connection.app.state.attachment_offloader
+    return attachment_offloader
+
+
+def get_resumable_streams(connection: HTTPConnection) -> ResumableStreamStore | None:
+    """lifespanで生成した再開できるストリーミング応答のストアを返す
+
+    Args:
+        connection (HTTPConnection): リクエストもしくは WebSocket の接続
+
+    Returns:
+        ResumableStreamStore | None: 再開できるストリーミング応答のストア。無効な場合はNone
+    """
+    resumable_streams: ResumableStreamStore | None = connection.app.state.resumable_streams
+    return resumable_streams
+
+
+def get_stream_canceller(connection: HTTPConnection) -> StreamCanceller:
+    """lifespanで生成したストリーミング応答の打ち切り処理を返す
+
+    Args:
+        connection (HTTPConnection): リクエストもしくは WebSocket の接続
 
     Returns:
-        BedrockRuntimeClient: bedrock用ランタイムクライアント
+        StreamCanceller: ストリーミング応答の打ち切り処理
     """
-    return boto3.client(service_name="bedrock-runtime", region_name="us-east-1")
+    stream_canceller: StreamCanceller = connection.app.state.stream_canceller
+    return stream_canceller
+
+
+async def apply_completion_cache_mode(request: Request) -> None:
+    """リクエストヘッダーで指定された生成結果キャッシュの利用方法を設定する
+
+    `X-Bedrock-Cache: bypass|refresh|use` または `Cache-Control: no-store|no-cache` で指定する。
+    コンテキスト変数に設定するため、スレッドで実行されない async の依存関数として定義する。
+
+    Args:
+        request (Request): リクエスト
+    """
+    COMPLETION_CACHE_MODE.set(completion_cache_mode_from_headers(request.headers))
+
+
+def is_sse_requested(
+    accept: Annotated[str | None, Header(description="text/event-stream を指定すると Server-Sent Events で返す")] = None,
+) -> bool:
+    """Accept ヘッダーでストリーミング応答を Server-Sent Events で返すよう指定されたかを返す
+
+    Args:
+        accept (str | None): Accept ヘッダー
+
+    Returns:
+        bool: text/event-stream が指定された場合はTrue
+    """
+    return accept is not None and SSE_MEDIA_TYPE in accept
 
 
 def get_model_service(
+    request: Request,
     model_type: Annotated[ModelType, Body(..., description="使用するモデルの種類", embed=True)],
+    client_registry: Annotated[BedrockClientRegistry, Depends(get_bedrock_client_registry)],
 ) -> BedrockModelBase:
     """
     クエリパラメータからEnumを利用してインスタンスを取得
 
+    Args:
+        request (Request): リクエスト
+        model_type (ModelType): モデルの種類
+        client_registry (BedrockClientRegistry): bedrock用ランタイムクライアントのレジストリ
+
+    Returns:
+        BedrockModelBase: 指定されたモデルタイプに対応するサービスインスタンス
+    """
+    return create_model_service(model_type, client_registry, request)
+
+
+def create_model_service(model_type: ModelType, client_registry: BedrockClientRegistry, connection: HTTPConnection | None = None) -> BedrockModelBase:
+    """
+    モデルの種類に対応するサービスのインスタンスを生成する。
+    接続が指定された場合は、リクエストのメトリクスのラベルに使うためモデルの種類を connection.state に設定する。
+
     Args:
         model_type (ModelType): モデルの種類
+        client_registry (BedrockClientRegistry): bedrock用ランタイムクライアントのレジストリ
+        connection (HTTPConnection | None, optional): リクエストもしくは WebSocket の接続
 
     Raises:
         HTTPException: 無効なmodel_typeが指定された場合に、HTTP 400エラーを発生させる。
@@ -49,8 +143,16 @@ def get_model_service(
     if model_service is None or config is None:
         raise HTTPException(status_code=400, detail="無効なモデルタイプが指定されました")
 
-    return model_service.from_dependency(client=get_bedrock_client(), config=config)
+    if connection is not None:
+        connection.state.model_type = model_type.value
+    return model_service.from_dependency(client=client_registry.get_client(model_type), config=config)
 
 
 # Depends定義
 MODEL_SERVICE_DEPENDS = Depends(get_model_service, use_cache=False)
+CLIENT_REGISTRY_DEPENDS = Depends(get_bedrock_client_registry)
+COMPLETION_CACHE_MODE_DEPENDS = Depends(apply_completion_cache_mode)
+ATTACHMENT_OFFLOADER_DEPENDS = Depends(get_attachment_offloader)
+SSE_REQUESTED_DEPENDS = Depends(is_sse_requested)
+RESUMABLE_STREAMS_DEPENDS = Depends(get_resumable_streams)
+STREAM_CANCELLER_DEPENDS = Depends(get_stream_canceller)
@@ -0,0 +1,30 @@
+"""
+会話セッションの依存性注入用定義を記載する。
+"""
+
+from fastapi import Depends, HTTPException, Request
+
+from app.services.conversation.conversation_store import ConversationStore
+
+
+def get_conversation_store(request: Request) -> ConversationStore:
+    """
+    lifespanで生成した会話セッションのストアを返す
+
+    Args:
+        request (Request): リクエスト
+
+    Raises:
+        HTTPException: 会話セッションが無効な場合に、HTTP 503エラーを発生させる。
+
+    Returns:
+        ConversationStore: 会話セッションのストア
+    """
+    conversation_store: ConversationStore | None = request.app.state.conversation_store
+    if conversation_store is None:
+        raise HTTPException(status_code=503, detail="会話セッションは無効です")
+    return conversation_store
+
+
+# Depends定義
+CONVERSATION_STORE_DEPENDS = Depends(get_conversation_store)
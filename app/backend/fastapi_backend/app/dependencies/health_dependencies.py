@@ -0,0 +1,25 @@
+"""
+ヘルスチェックの依存性注入用定義を記載する。
+"""
+
+from fastapi import Depends
+from starlette.requests import HTTPConnection
+
+from app.services.startup.startup_profiler import StartupProfiler
+
+
+def get_startup_profiler(connection: HTTPConnection) -> StartupProfiler:
+    """lifespanで生成した起動時のウォームアップの計測結果を返す
+
+    Args:
+        connection (HTTPConnection): リクエストもしくは WebSocket の接続
+
+    Returns:
+        StartupProfiler: 起動時のウォームアップの計測結果
+    """
+    startup_profiler: StartupProfiler = connection.app.state.startup_profiler
+    return startup_profiler
+
+
+# Depends定義
+STARTUP_PROFILER_DEPENDS = Depends(get_startup_profiler)
@@ -5,29 +5,32 @@ Bedrock モデル向けのプロトコルと抽象クラスを定義する。
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, AsyncGenerator, Generic, Protocol, runtime_checkable
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Generic, Literal, Protocol, runtime_checkable
 
 from app.types.bedrock_type_defs import ConfigTypeDef, T
 
 if TYPE_CHECKING:
     from collections.abc import Sequence
 
-    from mypy_boto3_bedrock_runtime import BedrockRuntimeClient
     from mypy_boto3_bedrock_runtime.type_defs import (
         BlobTypeDef,
         ConverseRequestRequestTypeDef,
         ConverseResponseTypeDef,
         ConverseStreamRequestRequestTypeDef,
-        ConverseStreamResponseTypeDef,
         InvokeModelRequestRequestTypeDef,
-        InvokeModelResponseTypeDef,
         InvokeModelWithResponseStreamRequestRequestTypeDef,
-        InvokeModelWithResponseStreamResponseTypeDef,
         MessageTypeDef,
         MessageUnionTypeDef,
     )
 
     from app.schemas.bedrock_schema import MessageList
+    from app.types.bedrock_type_defs import (
+        BedrockConnectionPoolStatsTypeDef,
+        ConverseStreamResultTypeDef,
+        InvokeModelResultTypeDef,
+        InvokeModelStreamResultTypeDef,
+        StreamEventTypeDef,
+    )
 
 ####################################################################################################
 # プロトコル定義
@@ -76,6 +79,7 @@ class ISupportsConverseStream(Protocol):
 
     継承するクラスは以下のメソッドを実装する必要がある:
     - converse_stream
+    - converse_stream_events
     - generate_converse_stream_messages
     """
 
@@ -91,6 +95,18 @@ class ISupportsConverseStream(Protocol):
         """
         ...
 
+    def converse_stream_events(self, messages: Sequence[MessageTypeDef]) -> AsyncGenerator[StreamEventTypeDef]:
+        """
+        Converse Stream API を使用して メッセージを送信し、応答の差分に加えて終了理由とトークン使用量のイベントを返す。
+
+        Args:
+            messages (Sequence[MessageUnionTypeDef]): ユーザーの会話履歴
+
+        Yields:
+            StreamEventTypeDef: ストリーミング応答のイベント
+        """
+        ...
+
     def generate_converse_stream_messages(self, message_list_schema: MessageList) -> Sequence[MessageTypeDef]:
         """
         Converse Stream API に渡す会話履歴を作成する。
@@ -146,6 +162,7 @@ class ISupportsInvokeModelStream(Protocol):
 
     継承するクラスは以下のメソッドを実装する必要がある:
     - invoke_model_stream
+    - invoke_model_stream_events
     - generate_invoke_model_stream_payload
     """
 
@@ -161,6 +178,18 @@ class ISupportsInvokeModelStream(Protocol):
         """
         ...
 
+    def invoke_model_stream_events(self, payload: BlobTypeDef) -> AsyncGenerator[StreamEventTypeDef]:
+        """
+        ペイロードを用いてモデルを呼び出し、応答の差分に加えて終了理由とトークン使用量のイベントを返す。
+
+        Args:
+            payload (BlobTypeDef): ペイロード
+
+        Yields:
+            StreamEventTypeDef: ストリーミング応答のイベント
+        """
+        ...
+
     def generate_invoke_model_stream_payload(self, message_list_schema: MessageList) -> BlobTypeDef:
         """
         invoke_model_stream用のペイロードを生成する。
@@ -174,11 +203,141 @@ class ISupportsInvokeModelStream(Protocol):
         ...
 
 
+@runtime_checkable
+class ISupportsBatchInference(Protocol):
+    """
+    Bedrock のバッチ推論ジョブ(model invocation job)をサポートするモデル向けのプロトコル。
+
+    継承するクラスは以下のメソッドを実装する必要がある:
+    - batch_model_id
+    - generate_batch_model_input
+    - parse_batch_model_output
+    """
+
+    def batch_model_id(self) -> str:
+        """
+        バッチ推論ジョブで使用するモデルIDを返す。
+
+        Returns:
+            str: モデルID
+        """
+        ...
+
+    def generate_batch_model_input(self, message_list_schema: MessageList) -> dict[str, Any]:
+        """
+        バッチ推論ジョブの入力レコードの modelInput を生成する。
+
+        Args:
+            message_list_schema (MessageList): ユーザーからの入力
+
+        Returns:
+            dict[str, Any]: modelInput(invoke_model のボディと同じ形式)
+        """
+        ...
+
+    def parse_batch_model_output(self, model_output: dict[str, Any]) -> str:
+        """
+        バッチ推論ジョブの出力レコードの modelOutput から生成テキストを取り出す。
+
+        Args:
+            model_output (dict[str, Any]): modelOutput(invoke_model のレスポンスボディと同じ形式)
+
+        Returns:
+            str: モデルからのレスポンス。
+        """
+        ...
+
+
 #####################################################################################################
 # 抽象クラス定義
 #####################################################################################################
 
 
+class BedrockRuntimeBase(ABC):
+    """
+    Bedrock ランタイムの呼び出し方法(トランスポート)を抽象化した基底クラス
+    モデルサービスはこのクラスを通して Bedrock を呼び出す。
+
+    継承するクラスは以下のメソッドを実装する必要がある:
+    - converse
+    - converse_stream
+    - invoke_model
+    - invoke_model_with_response_stream
+    """
+
+    @abstractmethod
+    async def converse(self, request_args: ConverseRequestRequestTypeDef) -> ConverseResponseTypeDef:
+        """
+        Converse API を呼び出す。
+
+        Args:
+            request_args (ConverseRequestRequestTypeDef): converseに渡すパラメータ
+
+        Returns:
+            ConverseResponseTypeDef: モデルからのレスポンス
+        """
+
+    @abstractmethod
+    async def converse_stream(self, request_args: ConverseStreamRequestRequestTypeDef) -> ConverseStreamResultTypeDef:
+        """
+        Converse Stream API を呼び出す。
+
+        Args:
+            request_args (ConverseStreamRequestRequestTypeDef): converse_streamに渡すパラメータ
+
+        Returns:
+            ConverseStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+
+    @abstractmethod
+    async def invoke_model(self, request_args: InvokeModelRequestRequestTypeDef) -> InvokeModelResultTypeDef:
+        """
+        Invoke Model API を呼び出す。
+
+        Args:
+            request_args (InvokeModelRequestRequestTypeDef): invoke_modelに渡すパラメータ
+
+        Returns:
+            InvokeModelResultTypeDef: 読み込み済みのボディを含むレスポンス
+        """
+
+    @abstractmethod
+    async def invoke_model_with_response_stream(self, request_args: InvokeModelWithResponseStreamRequestRequestTypeDef) -> InvokeModelStreamResultTypeDef:
+        """
+        Invoke Model With Response Stream API を呼び出す。
+
+        Args:
+            request_args (InvokeModelWithResponseStreamRequestRequestTypeDef): invoke_model_with_response_streamに渡すパラメータ
+
+        Returns:
+            InvokeModelStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+
+    async def warm_up(self, connections: int) -> None:  # noqa: ARG002
+        """
+        コネクションを事前に確立する。既定では何もしない。
+
+        Args:
+            connections (int): 確立するコネクション数
+        """
+        return
+
+    def pool_stats(self) -> BedrockConnectionPoolStatsTypeDef | None:
+        """
+        コネクションプールの使用状況を返す。既定ではNoneを返す。
+
+        Returns:
+            BedrockConnectionPoolStatsTypeDef | None: コネクションプールの使用状況
+        """
+        return None
+
+    async def aclose(self) -> None:
+        """
+        保持しているコネクションなどのリソースを解放する。既定では何もしない。
+        """
+        return
+
+
 class BedrockModelBase(ABC, Generic[T]):
     """
     bedrock モデルサービスの抽象基底クラス
@@ -188,19 +347,19 @@ class BedrockModelBase(ABC, Generic[T]):
     - from_dependency
     """
 
-    def __init__(self, client: BedrockRuntimeClient, config: ConfigTypeDef[T]) -> None:
+    def __init__(self, client: BedrockRuntimeBase, config: ConfigTypeDef[T]) -> None:
         self.client = client
         self.config = config
 
     @classmethod
     @abstractmethod
-    def from_dependency(cls, client: BedrockRuntimeClient, config: ConfigTypeDef[T]) -> BedrockModelBase[T]:
+    def from_dependency(cls, client: BedrockRuntimeBase, config: ConfigTypeDef[T]) -> BedrockModelBase[T]:
         """
         FastAPI の `Depends` で使用する依存性注入メソッド。
         サブクラスで必ず実装し、依存性を注入したサービスのインスタンスを生成する。
 
         Args:
-            client (BedrockRuntimeClient): bedrockのクライアント
+            client (BedrockRuntimeBase): bedrockのランタイム
             config (ConfigTypeDef[T]): モデル設定
 
         Returns:
@@ -208,6 +367,22 @@ class BedrockModelBase(ABC, Generic[T]):
         """
         ...
 
+    def max_output_tokens(self, operation: Literal["converse_stream", "invoke_stream"]) -> int | None:
+        """
+        ストリーミング応答で生成するトークン数の上限を返す。途中で打ち切った際に節約したトークン数の見積もりに使う。
+        converse_stream は inferenceConfig の maxTokens を返す。invoke_stream はペイロードがモデル固有のため、
+        上限を返す場合はサブクラスで実装する。
+
+        Args:
+            operation (Literal["converse_stream", "invoke_stream"]): ストリーミング応答の API
+
+        Returns:
+            int | None: 生成するトークン数の上限。不明な場合はNone
+        """
+        if operation == "converse_stream":
+            return self.config["sdk"].get("converse_stream", {}).get("inferenceConfig", {}).get("maxTokens")
+        return None
+
 
 class SupportsConverseMixin(ABC, ISupportsConverse):
     """
@@ -220,20 +395,20 @@ class SupportsConverseMixin(ABC, ISupportsConverse):
     """
 
     @staticmethod
-    def _converse(client: BedrockRuntimeClient, request_args: ConverseRequestRequestTypeDef) -> ConverseResponseTypeDef:
+    async def _converse(client: BedrockRuntimeBase, request_args: ConverseRequestRequestTypeDef) -> ConverseResponseTypeDef:
         """
         Converse API を使用して メッセージを送信する。
         このメソッドは直接使用せず、継承先でラップして使用すること。
 
         Args:
-            client (BedrockRuntimeClient): bedrockランタイムクライアント
+            client (BedrockRuntimeBase): bedrockランタイム
             requestArgs (ConverseRequestRequestTypeDef): converseメソッドの引数に渡すパラメータ
 
         Returns:
             ConverseResponseTypeDef: モデルからのレスポンス
         """
 
-        response: ConverseResponseTypeDef = client.converse(**request_args)
+        response: ConverseResponseTypeDef = await client.converse(request_args)
 
         return response
 
@@ -259,25 +434,24 @@ class SupportsConverseStreamMixin(ABC, ISupportsConverseStream):
 
     継承するクラスは以下のメソッドを実装する必要がある:
     - converse_stream
+    - converse_stream_events
     - generate_converse_stream_messages
     """
 
     @staticmethod
-    def _converse_stream(
-        client: BedrockRuntimeClient, request_args: ConverseStreamRequestRequestTypeDef
-    ) -> ConverseStreamResponseTypeDef:
+    async def _converse_stream(client: BedrockRuntimeBase, request_args: ConverseStreamRequestRequestTypeDef) -> ConverseStreamResultTypeDef:
         """
         Converse Stream API を使用して メッセージを送信する。
         このメソッドは直接使用せず、継承先でラップして使用すること。
 
         Args:
-            client (BedrockRuntimeClient): bedrockランタイムクライアント
+            client (BedrockRuntimeBase): bedrockランタイム
             requestArgs (ConverseStreamRequestRequestTypeDef): converse_streamメソッドに渡すパラメータ
 
         Returns:
-            ConverseStreamRequestRequestTypeDef: モデルからのレスポンス
+            ConverseStreamResultTypeDef: モデルからのレスポンス
         """
-        response: ConverseStreamResponseTypeDef = client.converse_stream(**request_args)
+        response: ConverseStreamResultTypeDef = await client.converse_stream(request_args)
         return response
 
     @abstractmethod
@@ -288,6 +462,14 @@ class SupportsConverseStreamMixin(ABC, ISupportsConverseStream):
         """
         ...
 
+    @abstractmethod
+    def converse_stream_events(self, messages: Sequence[MessageTypeDef]) -> AsyncGenerator[StreamEventTypeDef]:
+        """
+        Converse Stream API を使用して メッセージを送信し、応答の差分・終了理由・トークン使用量のイベントを返す。
+        _converse_streamメソッドを内部で使用すること。
+        """
+        ...
+
     @abstractmethod
     def generate_converse_stream_messages(self, message_list_schema: MessageList) -> Sequence[MessageTypeDef]:
         """
@@ -307,19 +489,19 @@ class SupportsInvokeModelMixin(ABC, ISupportsInvokeModel):
     """
 
     @staticmethod
-    def _invoke_model(client: BedrockRuntimeClient, request_args: InvokeModelRequestRequestTypeDef) -> InvokeModelResponseTypeDef:
+    async def _invoke_model(client: BedrockRuntimeBase, request_args: InvokeModelRequestRequestTypeDef) -> InvokeModelResultTypeDef:
         """
         ペイロードを用いてモデルを呼び出す。
         このメソッドは直接使用せず、継承先でラップして使用すること。
 
         Args:
-            client (BedrockRuntimeClient): bedrockランタイムクライアント
+            client (BedrockRuntimeBase): bedrockランタイム
             request_args (InvokeModelRequestRequestTypeDef): invoke_modelメソッドの引数に渡すパラメータ
 
         Returns:
-            InvokeModelResponseTypeDef: モデルからのレスポンス
+            InvokeModelResultTypeDef: モデルからのレスポンス
         """
-        response: InvokeModelResponseTypeDef = client.invoke_model(**request_args)
+        response: InvokeModelResultTypeDef = await client.invoke_model(request_args)
         return response
 
     @abstractmethod
@@ -345,26 +527,27 @@ class SupportsInvokeModelStreamMixin(ABC, ISupportsInvokeModelStream):
 
     継承するクラスは以下のメソッドを実装する必要がある:
     - invoke_model_stream
+    - invoke_model_stream_events
     - generate_invoke_model_stream_payload
     """
 
     @staticmethod
-    def _invoke_model_stream(
-        client: BedrockRuntimeClient, request_args: InvokeModelWithResponseStreamRequestRequestTypeDef
-    ) -> InvokeModelWithResponseStreamResponseTypeDef:
+    async def _invoke_model_stream(
+        client: BedrockRuntimeBase, request_args: InvokeModelWithResponseStreamRequestRequestTypeDef
+    ) -> InvokeModelStreamResultTypeDef:
         """
         ペイロードを用いてモデルを呼び出す。
         このメソッドは直接使用せず、継承先でラップして使用すること。
 
         Args:
-            client (BedrockRuntimeClient): bedrockランタイムクライアント
+            client (BedrockRuntimeBase): bedrockランタイム
             request_args (InvokeModelWithResponseStreamRequestRequestTypeDef):
                 invoke_model_with_response_streamメソッドの引数に渡すパラメータ
 
         Returns:
-            InvokeModelWithResponseStreamResponseTypeDef: モデルからのレスポンス
+            InvokeModelStreamResultTypeDef: モデルからのレスポンス
         """
-        response: InvokeModelWithResponseStreamResponseTypeDef = client.invoke_model_with_response_stream(**request_args)
+        response: InvokeModelStreamResultTypeDef = await client.invoke_model_with_response_stream(request_args)
         return response
 
     @abstractmethod
@@ -375,9 +558,50 @@ class SupportsInvokeModelStreamMixin(ABC, ISupportsInvokeModelStream):
         """
         ...
 
+    @abstractmethod
+    def invoke_model_stream_events(self, payload: BlobTypeDef) -> AsyncGenerator[StreamEventTypeDef]:
+        """
+        ペイロードを用いてモデルを呼び出し、応答の差分・終了理由・トークン使用量のイベントを返す。
+        _invoke_model_streamメソッドを内部で使用すること。
+        """
+        ...
+
     @abstractmethod
     def generate_invoke_model_stream_payload(self, message_list_schema: MessageList) -> BlobTypeDef:
         """
         invoke_model_stream用のペイロードを生成する。
         """
         ...
+
+
+class SupportsBatchInferenceMixin(ABC, ISupportsBatchInference):
+    """
+    バッチ推論ジョブの入出力を変換する機能を提供するMixin
+    バッチ推論ジョブをサポートしているモデルのサービスクラスに継承すること。
+
+    継承するクラスは以下のメソッドを実装する必要がある:
+    - batch_model_id
+    - generate_batch_model_input
+    - parse_batch_model_output
+    """
+
+    @abstractmethod
+    def batch_model_id(self) -> str:
+        """
+        バッチ推論ジョブで使用するモデルIDを返す。
+        """
+        ...
+
+    @abstractmethod
+    def generate_batch_model_input(self, message_list_schema: MessageList) -> dict[str, Any]:
+        """
+        バッチ推論ジョブの入力レコードの modelInput を生成する。
+        """
+        ...
+
+    @abstractmethod
+    def parse_batch_model_output(self, model_output: dict[str, Any]) -> str:
+        """
+        バッチ推論ジョブの出力レコードの modelOutput から生成テキストを取り出す。
+        """
+        ...
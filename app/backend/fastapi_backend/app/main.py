@@ -1,35 +1,159 @@
+from __future__ import annotations
+
+import asyncio
 import logging
-from logging.config import dictConfig
-from pathlib import Path
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
 
-from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 
-from app.config.logging_config import LOG_DIR_NAME, LOGGING_CONFIG
+from app.config.bedrock_config import (
+    BEDROCK_ATTACHMENT_OFFLOAD_CONFIG,
+    BEDROCK_CLIENT_CONFIG,
+    BEDROCK_COMPLETION_CACHE_CONFIG,
+    BEDROCK_CONCURRENCY_LIMITER_CONFIG,
+    BEDROCK_DEFAULT_REGION,
+    BEDROCK_HEDGING_CONFIG,
+    BEDROCK_REGION_ROUTING_CONFIG,
+    BEDROCK_RESUMABLE_STREAM_CONFIG,
+    BEDROCK_SINGLE_FLIGHT_ENABLED,
+)
+from app.config.database_config import CONVERSATION_STORE_CONFIG
+from app.config.logging_config import configure_logging
+from app.config.metrics_config import METRICS_CONFIG
+from app.config.profiling_config import PROFILING_CONFIG
+from app.dependencies.bedrock_dependencies import MODEL_MAPPING
 from app.middleware.handlers import add_exception_handlers
-from app.middleware.middleware import EnhancedTracebackMiddleware
-from app.routers import router
+from app.middleware.middleware import EnhancedTracebackMiddleware, MetricsMiddleware, ProfilingMiddleware
+from app.routers import include_routers
+from app.services.bedrock.attachment_offload import AttachmentOffloader
+from app.services.bedrock.client_registry import BedrockClientRegistry
+from app.services.bedrock.completion_cache import CompletionCache
+from app.services.bedrock.concurrency_limiter import AdaptiveConcurrencyLimiter
+from app.services.bedrock.hedging import RequestHedger
+from app.services.bedrock.region_router import RegionRouter
+from app.services.bedrock.resumable_stream import ResumableStreamStore
+from app.services.bedrock.single_flight import SingleFlight
+from app.services.bedrock.stream_cancellation import StreamCanceller
+from app.services.conversation.conversation_store import ConversationStore
+from app.services.metrics.prometheus_metrics import mark_worker_stopped
+from app.services.metrics.thread_pool import InstrumentedThreadPoolExecutor
+from app.services.profiling.request_profiler import RequestProfiler
+from app.services.startup.startup_profiler import StartupProfiler
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+    from app.types.bedrock_type_defs import BedrockClientLayersTypeDef
+
+
+def _create_client_layers(completion_cache: CompletionCache | None) -> BedrockClientLayersTypeDef:
+    """
+    設定で有効になっている、Bedrock ランタイムを包む機能を生成する。
+
+    Args:
+        completion_cache (CompletionCache | None): 生成結果キャッシュ。無効な場合はNone
+
+    Returns:
+        BedrockClientLayersTypeDef: BedrockClientRegistry に渡す機能
+    """
+    client_layers: BedrockClientLayersTypeDef = {"instrumented": METRICS_CONFIG["enabled"]}
+    if completion_cache is not None:
+        client_layers["completion_cache"] = completion_cache
+    if BEDROCK_SINGLE_FLIGHT_ENABLED:
+        client_layers["single_flight"] = SingleFlight()
+    if BEDROCK_CONCURRENCY_LIMITER_CONFIG["enabled"]:
+        client_layers["concurrency_limiter"] = AdaptiveConcurrencyLimiter(BEDROCK_CONCURRENCY_LIMITER_CONFIG)
+    if BEDROCK_HEDGING_CONFIG["enabled"]:
+        client_layers["hedger"] = RequestHedger(BEDROCK_HEDGING_CONFIG)
+    if BEDROCK_REGION_ROUTING_CONFIG["enabled"]:
+        client_layers["region_router"] = RegionRouter(BEDROCK_REGION_ROUTING_CONFIG)
+    return client_layers
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    アプリケーションの起動・終了時の処理。
+    bedrock用ランタイムクライアントと生成結果キャッシュを生成し、コネクションを事前に確立しておく。
+    会話セッションが有効な場合は、データベースのコネクションプールも生成する。
+    添付ファイルの S3 への退避が有効な場合は、S3 クライアントを生成する。
+    ストリーミング応答の再開が有効な場合は、イベントを保持するストアを生成する。
+    起動処理はウォームアップの段階ごとに所要時間を計測し、すべて完了してから readiness を受け付け可能にする。
+    メトリクスが有効な場合は、asyncio.to_thread が使うスレッドプールを飽和状況を記録するものに置き換える。
+
+    Args:
+        app (FastAPI): アプリケーション
+    """
+    startup_profiler = StartupProfiler()
+    app.state.startup_profiler = startup_profiler
+
+    if METRICS_CONFIG["enabled"]:
+        asyncio.get_running_loop().set_default_executor(
+            InstrumentedThreadPoolExecutor("default", max_workers=METRICS_CONFIG["default_thread_pool_workers"], thread_name_prefix="asyncio")
+        )
+
+    completion_cache = CompletionCache(BEDROCK_COMPLETION_CACHE_CONFIG) if BEDROCK_COMPLETION_CACHE_CONFIG["enabled"] else None
+    with startup_profiler.phase("bedrock_clients"):
+        client_registry = BedrockClientRegistry(
+            default_region=BEDROCK_DEFAULT_REGION,
+            client_config=BEDROCK_CLIENT_CONFIG,
+            layers=_create_client_layers(completion_cache),
+        )
+        await client_registry.warm_up(MODEL_MAPPING.keys())
+    app.state.bedrock_client_registry = client_registry
+
+    conversation_store = ConversationStore(CONVERSATION_STORE_CONFIG) if CONVERSATION_STORE_CONFIG["enabled"] else None
+    if conversation_store is not None:
+        with startup_profiler.phase("conversation_store"):
+            await conversation_store.open()
+    app.state.conversation_store = conversation_store
+
+    attachment_offloader: AttachmentOffloader | None = None
+    if BEDROCK_ATTACHMENT_OFFLOAD_CONFIG["enabled"]:
+        with startup_profiler.phase("attachment_offload"):
+            import boto3
+
+            attachment_offloader = AttachmentOffloader(BEDROCK_ATTACHMENT_OFFLOAD_CONFIG, boto3.client("s3", region_name=BEDROCK_DEFAULT_REGION))
+    app.state.attachment_offloader = attachment_offloader
+
+    resumable_streams = ResumableStreamStore(BEDROCK_RESUMABLE_STREAM_CONFIG) if BEDROCK_RESUMABLE_STREAM_CONFIG["enabled"] else None
+    app.state.resumable_streams = resumable_streams
+    app.state.stream_canceller = StreamCanceller()
+    startup_profiler.mark_ready()
+
+    yield
 
-load_dotenv()
+    startup_profiler.mark_stopping()
+    if resumable_streams is not None:
+        await resumable_streams.aclose()
+    if conversation_store is not None:
+        await conversation_store.aclose()
+    await client_registry.aclose()
+    if completion_cache is not None:
+        await completion_cache.aclose()
+    mark_worker_stopped()
 
-app: FastAPI = FastAPI(default_response_class=ORJSONResponse)
 
-# ログ保管用ディレクトリ作成
-if not Path.exists(LOG_DIR_NAME):
-    Path.mkdir(LOG_DIR_NAME)
+app: FastAPI = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
-# ロギングの設定
-dictConfig(LOGGING_CONFIG)
+# ロギングの設定(ログ保管用ディレクトリの作成と、ログを書き込むスレッドの開始を含む)
+configure_logging()
 
 # エラーハンドラーの登録
 add_exception_handlers(app)
 
-# ミドルウェアの登録
+# ミドルウェアの登録(後に登録したものが外側になる。メトリクスはエラー応答への変換後のステータスコードを記録する)
+# プロファイリングは無効な場合は登録せず、リクエストごとの処理を増やさない
 app.add_middleware(EnhancedTracebackMiddleware)
+if PROFILING_CONFIG["enabled"]:
+    app.add_middleware(ProfilingMiddleware, profiler=RequestProfiler(PROFILING_CONFIG))
+if METRICS_CONFIG["enabled"]:
+    app.add_middleware(MetricsMiddleware)
 
 # ルーターの追加
-app.include_router(router)
+include_routers(app)
 
 logger = logging.getLogger(__name__)
 
@@ -37,4 +161,5 @@ logger = logging.getLogger(__name__)
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=LOGGING_CONFIG)  # noqa: S104
+    # ロギングはモジュールの読み込み時に設定済みのため、uvicorn では設定し直さない(書き込みスレッドのないキューに置き換わるため)
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)  # noqa: S104
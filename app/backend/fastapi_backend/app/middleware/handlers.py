@@ -1,7 +1,7 @@
 import json
 import logging
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import ORJSONResponse
 
@@ -15,8 +15,16 @@ def add_exception_handlers(app: FastAPI) -> None:
     # カスタムエラーハンドラの定義
     @app.exception_handler(HTTPException)
     async def http_exception_handler(request: Request, exc: HTTPException) -> ORJSONResponse:
-        # ログ出力
-        logger.exception("An http error occurred!")
+        # ログ出力。クライアント起因の 4xx はトレースバックを出さず、1 行で出力する
+        if exc.status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR:
+            logger.exception("An http error occurred!")
+        else:
+            logger.warning("An http error occurred: %s %s -> %d %s", request.method, request.url.path, exc.status_code, exc.detail)
+        # 流量制限(429)はクライアントが Retry-After に従って待機できるよう、本番環境でもそのまま返す
+        if exc.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+            error = ErrorJsonResponse(detail=[ErrorDetail(loc=[f"{request.method} {request.url.path}"], msg=exc.detail, type="rate_limit_error")])
+            return ORJSONResponse(status_code=exc.status_code, content=error.model_dump(), headers=exc.headers)
+
         # 本番環境では詳細を隠し、ステータスコードを 500 に統一
         status_code = 500 if PRODUCTION_FLAG else exc.status_code
         error_detail = "Internal Server Error" if PRODUCTION_FLAG else exc.detail
@@ -25,12 +33,17 @@ def add_exception_handlers(app: FastAPI) -> None:
         error = ErrorJsonResponse(
             detail=[ErrorDetail(loc=[f"{request.method} {request.url.path}"], msg=error_detail, type=type_name)]
         )
-        return ORJSONResponse(status_code=status_code, content=error.model_dump())
+        return ORJSONResponse(status_code=status_code, content=error.model_dump(), headers=None if PRODUCTION_FLAG else exc.headers)
 
     @app.exception_handler(RequestValidationError)
     async def validation_exception_handler(request: Request, exc: RequestValidationError) -> ORJSONResponse:
-        # ログ出力
-        logger.exception("An validation error occurred!")
+        # ログ出力。入力値は含めず、エラーの位置と種類のみ出力する
+        logger.warning(
+            "An validation error occurred: %s %s -> %s",
+            request.method,
+            request.url.path,
+            [{"loc": error["loc"], "type": error["type"]} for error in exc.errors()],
+        )
         # 本番環境では詳細を隠し、ステータスコードを 500 に統一
         status_code = 500 if PRODUCTION_FLAG else 422
         error_detail = "Internal Server Error" if PRODUCTION_FLAG else json.dumps(exc.errors())
@@ -1,4 +1,5 @@
 import logging
+import time
 from typing import Any, MutableMapping
 
 from fastapi.responses import ORJSONResponse
@@ -6,6 +7,8 @@ from starlette.types import ASGIApp, Receive, Scope, Send
 
 from app.config.base_config import PRODUCTION_FLAG
 from app.schemas.error_response_schema import ErrorDetail, ErrorJsonResponse
+from app.services.metrics.prometheus_metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_PROGRESS, UNMATCHED_ROUTE
+from app.services.profiling.request_profiler import PROFILE_ID_HEADER, RequestProfiler
 
 logger = logging.getLogger(__name__)
 
@@ -53,3 +56,82 @@ class EnhancedTracebackMiddleware:
             )
             response = ORJSONResponse(status_code=500, content=error.model_dump())
             await response(scope, receive, send)
+
+
+class MetricsMiddleware:
+    """
+    リクエストの所要時間をルート・モデル・ステータスコードごとにメトリクスに記録する ASGI ミドルウェア
+    - route はルートのパスのテンプレートとし、一致するルートがない場合は unmatched とする。
+    - model はモデルのサービスの依存関数が request.state に設定したモデルの種類とし、モデルを使わないルートは空文字とする。
+    - ストリーミング応答は最後のチャンクの送信まで計測する。
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # HTTP以外のスコープはそのまま通す
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        status_code = 500
+        # 依存関数が request.state に設定した値を、処理の後に読めるようにする
+        state: dict[str, Any] = scope.setdefault("state", {})
+
+        # send関数をラップして、ステータスコードを記録する
+        async def send_wrapper(message: MutableMapping[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(scope["method"])
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            HTTP_REQUEST_DURATION.labels(scope["method"], route, state.get("model_type", ""), str(status_code)).observe(time.perf_counter() - started_at)
+
+
+class ProfilingMiddleware:
+    """
+    指定されたリクエストの処理中にスタックの採取とメモリ確保の記録を行う ASGI ミドルウェア
+    - プロファイリングしたリクエストは、レスポンスの X-Profile-Id ヘッダーで出力したプロファイルのIDを返す。
+    - ストリーミング応答は最後のチャンクの送信までを対象とする。
+    - 対象外のリクエストでは、ヘッダーの確認(トークンの設定時)と乱数の生成(割合の設定時)のみ行う。
+    """
+
+    def __init__(self, app: ASGIApp, profiler: RequestProfiler) -> None:
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # HTTP以外のスコープはそのまま通す
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trigger = self.profiler.trigger(scope["headers"])
+        profile = None if trigger is None else self.profiler.begin(scope["method"], scope["path"], trigger)
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        # send関数をラップして、ステータスコードを記録し、プロファイルのIDをヘッダーに追加する
+        async def send_wrapper(message: MutableMapping[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (PROFILE_ID_HEADER, profile.profile_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            await self.profiler.end(profile, status_code)
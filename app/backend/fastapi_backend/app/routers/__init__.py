@@ -1,7 +1,23 @@
-from fastapi import APIRouter
+from fastapi import FastAPI
 
-from app.routers.v1 import router as v1_router
+from app.config.metrics_config import METRICS_CONFIG
+from app.routers import metrics_router
+from app.routers.v1 import ROUTERS as V1_ROUTERS
+from app.routers.v1 import V1_PREFIX
 
-router = APIRouter(prefix="/api")
+API_PREFIX = "/api"
 
-router.include_router(v1_router)
+
+def include_routers(app: FastAPI) -> None:
+    """
+    ルーターをアプリケーションに登録する。
+    include_router はルートを登録先で作り直すため、APIRouter を入れ子にせずアプリケーションに直接登録して起動時間を抑える。
+    メトリクスは Prometheus が直接取得するため、API のプレフィックスを付けずに登録する。
+
+    Args:
+        app (FastAPI): アプリケーション
+    """
+    for router, tag in V1_ROUTERS:
+        app.include_router(router, prefix=API_PREFIX + V1_PREFIX, tags=[tag])
+    if METRICS_CONFIG["enabled"]:
+        app.include_router(metrics_router.router)
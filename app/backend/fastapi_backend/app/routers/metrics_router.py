@@ -0,0 +1,23 @@
+"""
+Prometheus のメトリクス用のルーティングを定義する。
+"""
+
+from fastapi import APIRouter, Response
+
+from app.config.metrics_config import METRICS_CONFIG
+from app.services.metrics.prometheus_metrics import render_metrics
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get(METRICS_CONFIG["path"], include_in_schema=False)
+def metrics() -> Response:
+    """
+    Prometheus のテキスト形式でメトリクスを返すエンドポイント。
+    複数ワーカーの場合はメトリクスのファイルを読み込んで集計するため、イベントループを止めないよう同期関数(スレッドで実行)とする。
+
+    Returns:
+        Response: メトリクスを含むレスポンス
+    """
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
@@ -1,8 +1,14 @@
 from fastapi import APIRouter
 
-from app.routers.v1 import bedrock_router, scraper_router
+from app.routers.v1 import bedrock_router, chat_socket_router, conversation_router, health_router, scraper_router
 
-router = APIRouter(prefix="/v1")
+V1_PREFIX = "/v1"
 
-router.include_router(bedrock_router.router, tags=["V1 Bedrock"])
-router.include_router(scraper_router.router, tags=["V1 Scraper"])
+# v1 のルーターとタグ
+ROUTERS: list[tuple[APIRouter, str]] = [
+    (bedrock_router.router, "V1 Bedrock"),
+    (chat_socket_router.router, "V1 Chat Socket"),
+    (conversation_router.router, "V1 Conversation"),
+    (health_router.router, "V1 Health"),
+    (scraper_router.router, "V1 Scraper"),
+]
@@ -3,19 +3,33 @@ bedrock用のルーティングを定義する。
 """
 
 import logging
-from typing import TYPE_CHECKING, Annotated, AsyncGenerator
+from typing import TYPE_CHECKING, Annotated, AsyncGenerator, cast
 
-from fastapi import APIRouter, Body, HTTPException
+from fastapi import APIRouter, Body, Header, HTTPException, Path, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import ValidationError
 
-from app.schemas.bedrock_schema import MessageList
+from app.schemas.bedrock_schema import MessageList, StreamStopCondition
 
 if TYPE_CHECKING:
     from collections.abc import Sequence
 
-    from mypy_boto3_bedrock_runtime.type_defs import BlobTypeDef, MessageTypeDef, MessageUnionTypeDef
+    from mypy_boto3_bedrock_runtime.type_defs import BlobTypeDef, ContentBlockTypeDef, MessageTypeDef, MessageUnionTypeDef
 
-from app.dependencies.bedrock_dependencies import MODEL_SERVICE_DEPENDS
+    from app.types.bedrock_type_defs import StreamEventTypeDef
+
+from app.config.bedrock_config import BEDROCK_ATTACHMENT_CONFIG, BEDROCK_BATCH_CONVERSE_CONFIG, BEDROCK_SSE_CONFIG
+from app.dependencies.bedrock_dependencies import (
+    ATTACHMENT_OFFLOADER_DEPENDS,
+    CLIENT_REGISTRY_DEPENDS,
+    COMPLETION_CACHE_MODE_DEPENDS,
+    MODEL_SERVICE_DEPENDS,
+    RESUMABLE_STREAMS_DEPENDS,
+    SSE_REQUESTED_DEPENDS,
+    STREAM_CANCELLER_DEPENDS,
+    create_model_service,
+)
 from app.interfaces.bedrock_interface import (
     BedrockModelBase,
     ISupportsConverse,
@@ -23,8 +37,17 @@ from app.interfaces.bedrock_interface import (
     ISupportsInvokeModel,
     ISupportsInvokeModelStream,
 )
-
-router = APIRouter(prefix="/bedrock", tags=["Bedrock"])
+from app.services.bedrock.attachment_offload import AttachmentOffloader
+from app.services.bedrock.attachments import AttachmentUpload
+from app.services.bedrock.batch_converse import converse_batch_ndjson
+from app.services.bedrock.client_registry import BedrockClientRegistry
+from app.services.bedrock.resumable_stream import ResumableStreamStore, parse_event_id
+from app.services.bedrock.sse import SSE_HEADERS, SSE_MEDIA_TYPE, sse_stream
+from app.services.bedrock.stream_cancellation import StreamCanceller
+from app.services.bedrock.stream_utils import DisconnectAwareStreamingResponse, delta_texts, prefetch_stream
+from app.types.bedrock_type_defs import ModelType
+
+router = APIRouter(prefix="/bedrock", tags=["Bedrock"], dependencies=[COMPLETION_CACHE_MODE_DEPENDS])
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +56,7 @@ logger = logging.getLogger(__name__)
 async def converse(
     user_input: Annotated[MessageList, Body(..., description="ConverseAPI用のユーザー入力", embed=True)],
     bedrock_service: Annotated[BedrockModelBase, MODEL_SERVICE_DEPENDS],
+    attachment_offloader: Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS],
 ) -> ORJSONResponse:
     """
     Converse API 用エンドポイント。
@@ -43,6 +67,8 @@ async def converse(
             モデルサービスのインスタンス。各種モデル固有の処理を提供する。
         user_input (Annotated[MessageList, Body, optional):
             ユーザーからの会話入力。
+        attachment_offloader (Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS]):
+            大きな添付ファイルの S3 への退避処理。無効な場合はNone。
 
     Raises:
         HTTPException: 指定されたモデルが Converse API に対応していない、もしくは入力が無効な場合。
@@ -56,6 +82,8 @@ async def converse(
     logger.info("Converse 処理開始")
 
     converse_messages: Sequence[MessageUnionTypeDef] = bedrock_service.generate_converse_messages(user_input)
+    if attachment_offloader is not None:
+        converse_messages = await attachment_offloader.offload(converse_messages)
     reply_text: str = await bedrock_service.converse(converse_messages)
 
     logger.info("Converse 処理終了")
@@ -63,23 +91,87 @@ async def converse(
     return ORJSONResponse(content=reply_text)
 
 
+@router.post("/converse/batch")
+async def converse_batch(
+    user_inputs: Annotated[
+        list[MessageList],
+        Body(..., description="ConverseAPI用のユーザー入力の一覧", embed=True, min_length=1, max_length=BEDROCK_BATCH_CONVERSE_CONFIG["max_items"]),
+    ],
+    bedrock_service: Annotated[BedrockModelBase, MODEL_SERVICE_DEPENDS],
+    concurrency: Annotated[
+        int,
+        Body(description="同時実行数", embed=True, ge=1, le=BEDROCK_BATCH_CONVERSE_CONFIG["max_concurrency"]),
+    ] = BEDROCK_BATCH_CONVERSE_CONFIG["default_concurrency"],
+) -> StreamingResponse:
+    """
+    バッチ Converse API 用エンドポイント。
+    複数のユーザー入力を同時実行数の上限付きで並行に処理し、完了した順に NDJSON で結果を返す。
+    各行は入力のインデックスと、応答(output)またはエラー(error)を含む。個々の入力のエラーでバッチ全体は失敗しない。
+
+    Args:
+        user_inputs (Annotated[list[MessageList], Body]):
+            ユーザーからの会話入力の一覧。
+        bedrock_service (Annotated[BedrockModelBase, MODEL_SERVICE_DEPENDS]):
+            モデルサービスのインスタンス。各種モデル固有の処理を提供する。
+        concurrency (Annotated[int, Body], optional):
+            同時実行数。
+
+    Raises:
+        HTTPException: 指定されたモデルが Converse API に対応していない場合。
+
+    Returns:
+        StreamingResponse: NDJSON で結果を返すレスポンス。
+    """
+    if not isinstance(bedrock_service, ISupportsConverse):
+        raise HTTPException(status_code=400, detail="このモデルは対応してません")
+
+    logger.info("Converse Batch 処理開始 (件数=%d, 同時実行数=%d)", len(user_inputs), concurrency)
+
+    return DisconnectAwareStreamingResponse(converse_batch_ndjson(bedrock_service, user_inputs, concurrency), media_type="application/x-ndjson")
+
+
 @router.post("/converse/stream")
 async def converse_stream(
     user_input: Annotated[MessageList, Body(..., description="ConverseAPI用のユーザー入力", embed=True)],
+    *,
     bedrock_service: Annotated[BedrockModelBase, MODEL_SERVICE_DEPENDS],
+    attachment_offloader: Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS],
+    sse_requested: Annotated[bool, SSE_REQUESTED_DEPENDS],
+    resumable_streams: Annotated[ResumableStreamStore | None, RESUMABLE_STREAMS_DEPENDS],
+    stream_canceller: Annotated[StreamCanceller, STREAM_CANCELLER_DEPENDS],
+    stop_condition: Annotated[StreamStopCondition | None, Body(description="サーバー側で応答を打ち切る条件", embed=True)] = None,
+    last_event_id: Annotated[str | None, Header(description="再開する Server-Sent Events の最後に受信したイベントID")] = None,
 ) -> StreamingResponse:
     """
     Converse Stream API 用エンドポイント。
     ユーザーの入力に基づいてストリーミングで対話応答を返す。
+    Accept ヘッダーに text/event-stream を指定した場合は、差分をまとめた delta イベントと、
+    終了理由の messageStop・トークン使用量とレイテンシの metadata イベントを Server-Sent Events で返す。
+    ストリーミング応答の再開が有効な場合、Server-Sent Events には生成IDを含むイベントIDを付け、
+    Last-Event-ID ヘッダーを指定した再接続では、モデルを呼び出さずに同じ生成の続きを返す。
+    クライアントが切断した場合は上流の生成をすぐに止める。stop_condition を指定した場合は、条件に一致した時点で
+    stopReason が stop_condition の messageStop を返して上流の生成を止める。
 
     Args:
         bedrock_service (Annotated[BedrockModelBase, MODEL_SERVICE_DEPENDS]):
             モデルサービスのインスタンス。各種モデル固有の処理を提供する
         user_input (Annotated[MessageList, Body, optional):
             ユーザーからの会話入力。
+        attachment_offloader (Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS]):
+            大きな添付ファイルの S3 への退避処理。無効な場合はNone。
+        sse_requested (Annotated[bool, SSE_REQUESTED_DEPENDS]):
+            Server-Sent Events で返すか。
+        resumable_streams (Annotated[ResumableStreamStore | None, RESUMABLE_STREAMS_DEPENDS]):
+            再開できるストリーミング応答のストア。無効な場合はNone。
+        stream_canceller (Annotated[StreamCanceller, STREAM_CANCELLER_DEPENDS]):
+            クライアントの切断や打ち切り条件で上流の生成を止める処理。
+        stop_condition (Annotated[StreamStopCondition | None, Body], optional):
+            正規表現・最大文字数・JSON の完了のいずれかで応答を打ち切る条件。
+        last_event_id (Annotated[str | None, Header], optional):
+            再接続時に最後に受信したイベントID。
 
     Raises:
-        HTTPException: 指定されたモデルが Converse API に対応していない、もしくは入力が無効な場合。
+        HTTPException: 指定されたモデルが Converse API に対応していない、入力が無効な場合、もしくは再開できる続きが残っていない場合。
 
     Returns:
         StreamingResponse: ストリーミングで対話応答を含むレスポンス。
@@ -87,14 +179,124 @@ async def converse_stream(
     if not isinstance(bedrock_service, ISupportsConverseStream):
         raise HTTPException(status_code=400, detail="このモデルは対応してません")
 
+    if sse_requested and resumable_streams is not None and last_event_id is not None:
+        logger.info("Converse Stream 再開 (Last-Event-ID=%s)", last_event_id)
+        return await _resume_sse(resumable_streams, *parse_event_id(last_event_id))
+
     logger.info("Converse Stream 処理開始")
 
     converse_messages: Sequence[MessageTypeDef] = bedrock_service.generate_converse_stream_messages(user_input)
-    stream_generator: AsyncGenerator[str, None] = bedrock_service.converse_stream(converse_messages)
+    if attachment_offloader is not None:
+        converse_messages = cast("list[MessageTypeDef]", await attachment_offloader.offload(converse_messages))
+    events = stream_canceller.watch(
+        bedrock_service.converse_stream_events(converse_messages), stop_condition, bedrock_service.max_output_tokens("converse_stream")
+    )
+    if sse_requested:
+        sse_response = await _start_sse(events, resumable_streams)
+        logger.info("Converse Stream 処理終了 (SSE)")
+        return sse_response
+    stream_generator: AsyncGenerator[str] = await prefetch_stream(delta_texts(events))
 
     logger.info("Converse Stream 処理終了")
 
-    return StreamingResponse(stream_generator, media_type="text/plain")
+    return DisconnectAwareStreamingResponse(stream_generator, media_type="text/plain")
+
+
+@router.post("/converse/attachments")
+async def converse_with_attachments(
+    request: Request,
+    client_registry: Annotated[BedrockClientRegistry, CLIENT_REGISTRY_DEPENDS],
+    attachment_offloader: Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS],
+) -> ORJSONResponse:
+    """
+    添付ファイル付きの Converse API 用エンドポイント。
+    multipart/form-data の model_type・user_input(MessageList の JSON)・files(添付ファイル、複数可)を受け取り、
+    添付ファイルを最後のユーザーの発話に加えて対話応答を返す。
+
+    Args:
+        request (Request):
+            multipart/form-data のリクエスト。
+        client_registry (Annotated[BedrockClientRegistry, CLIENT_REGISTRY_DEPENDS]):
+            bedrock用ランタイムクライアントのレジストリ。
+        attachment_offloader (Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS]):
+            大きな添付ファイルの S3 への退避処理。無効な場合はNone。
+
+    Raises:
+        HTTPException: 指定されたモデルが Converse API に対応していない、もしくは入力が無効な場合。
+
+    Returns:
+        ORJSONResponse: モデルからの応答を含むレスポンス。
+    """
+    attachments = AttachmentUpload(BEDROCK_ATTACHMENT_CONFIG)
+    try:
+        bedrock_service, user_input, content_blocks = await _parse_attachment_request(request, attachments, client_registry)
+        if not isinstance(bedrock_service, ISupportsConverse):
+            raise HTTPException(status_code=400, detail="このモデルは対応してません")
+
+        logger.info("Converse Attachments 処理開始 (添付ファイル=%d件)", len(content_blocks))
+
+        converse_messages = _attach(bedrock_service.generate_converse_messages(user_input), content_blocks)
+        if attachment_offloader is not None:
+            converse_messages = cast("list[MessageTypeDef]", await attachment_offloader.offload(converse_messages))
+        reply_text: str = await bedrock_service.converse(converse_messages)
+    finally:
+        await attachments.aclose()
+
+    logger.info("Converse Attachments 処理終了")
+
+    return ORJSONResponse(content=reply_text)
+
+
+@router.post("/converse/attachments/stream")
+async def converse_stream_with_attachments(
+    request: Request,
+    client_registry: Annotated[BedrockClientRegistry, CLIENT_REGISTRY_DEPENDS],
+    attachment_offloader: Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS],
+    stream_canceller: Annotated[StreamCanceller, STREAM_CANCELLER_DEPENDS],
+) -> StreamingResponse:
+    """
+    添付ファイル付きの Converse Stream API 用エンドポイント。
+    入力は /converse/attachments と同じで、ストリーミングで対話応答を返す。添付ファイルはストリームを返し終えてから解放する。
+
+    Args:
+        request (Request):
+            multipart/form-data のリクエスト。
+        client_registry (Annotated[BedrockClientRegistry, CLIENT_REGISTRY_DEPENDS]):
+            bedrock用ランタイムクライアントのレジストリ。
+        attachment_offloader (Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS]):
+            大きな添付ファイルの S3 への退避処理。無効な場合はNone。
+        stream_canceller (Annotated[StreamCanceller, STREAM_CANCELLER_DEPENDS]):
+            クライアントの切断時に上流の生成を止める処理。
+
+    Raises:
+        HTTPException: 指定されたモデルが Converse Stream API に対応していない、もしくは入力が無効な場合。
+
+    Returns:
+        StreamingResponse: ストリーミングで対話応答を含むレスポンス。
+    """
+    attachments = AttachmentUpload(BEDROCK_ATTACHMENT_CONFIG)
+    stream_generator: AsyncGenerator[str] | None = None
+    try:
+        bedrock_service, user_input, content_blocks = await _parse_attachment_request(request, attachments, client_registry)
+        if not isinstance(bedrock_service, ISupportsConverseStream):
+            raise HTTPException(status_code=400, detail="このモデルは対応してません")
+
+        logger.info("Converse Stream Attachments 処理開始 (添付ファイル=%d件)", len(content_blocks))
+
+        converse_messages = _attach(bedrock_service.generate_converse_stream_messages(user_input), content_blocks)
+        if attachment_offloader is not None:
+            converse_messages = cast("list[MessageTypeDef]", await attachment_offloader.offload(converse_messages))
+        max_tokens = bedrock_service.max_output_tokens("converse_stream")
+        events = stream_canceller.watch(bedrock_service.converse_stream_events(converse_messages), max_tokens=max_tokens)
+        stream_generator = await prefetch_stream(attachments.close_after(delta_texts(events)))
+    finally:
+        # ストリームを返せなかった場合のみここで解放する(返した場合はストリームの終了時に解放される)
+        if stream_generator is None:
+            await attachments.aclose()
+
+    logger.info("Converse Stream Attachments 処理終了")
+
+    return DisconnectAwareStreamingResponse(stream_generator, media_type="text/plain")
 
 
 @router.post("/invoke-model")
@@ -134,20 +336,38 @@ async def invoke_model(
 @router.post("/invoke-model/stream")
 async def invoke_model_stream(
     user_input: Annotated[MessageList, Body(..., description="ユーザーの入力", embed=True)],
+    *,
     bedrock_service: Annotated[BedrockModelBase, MODEL_SERVICE_DEPENDS],
+    sse_requested: Annotated[bool, SSE_REQUESTED_DEPENDS],
+    resumable_streams: Annotated[ResumableStreamStore | None, RESUMABLE_STREAMS_DEPENDS],
+    stream_canceller: Annotated[StreamCanceller, STREAM_CANCELLER_DEPENDS],
+    stop_condition: Annotated[StreamStopCondition | None, Body(description="サーバー側で応答を打ち切る条件", embed=True)] = None,
+    last_event_id: Annotated[str | None, Header(description="再開する Server-Sent Events の最後に受信したイベントID")] = None,
 ) -> StreamingResponse:
     """
     Invoke Model Stream API 用エンドポイント。
     ユーザーの入力に基づいてストリーミングでモデルの対話応答を返す。
+    Accept ヘッダーに text/event-stream を指定した場合は、/converse/stream と同じ形式の Server-Sent Events で返し、
+    同じく Last-Event-ID ヘッダーでの再開と、切断・stop_condition による上流の生成の打ち切りに対応する。
 
     Args:
         bedrock_service (Annotated[BedrockModelBase, MODEL_SERVICE_DEPENDS]):
             モデルサービスのインスタンス。各種モデル固有の処理を提供する。
         user_input (Annotated[MessageList, Body, optional):
             ユーザーからの入力データ。
+        sse_requested (Annotated[bool, SSE_REQUESTED_DEPENDS]):
+            Server-Sent Events で返すか。
+        resumable_streams (Annotated[ResumableStreamStore | None, RESUMABLE_STREAMS_DEPENDS]):
+            再開できるストリーミング応答のストア。無効な場合はNone。
+        stream_canceller (Annotated[StreamCanceller, STREAM_CANCELLER_DEPENDS]):
+            クライアントの切断や打ち切り条件で上流の生成を止める処理。
+        stop_condition (Annotated[StreamStopCondition | None, Body], optional):
+            正規表現・最大文字数・JSON の完了のいずれかで応答を打ち切る条件。
+        last_event_id (Annotated[str | None, Header], optional):
+            再接続時に最後に受信したイベントID。
 
     Raises:
-        HTTPException: 指定されたモデルが Converse API に対応していない、もしくは入力が無効な場合。
+        HTTPException: 指定されたモデルが Converse API に対応していない、入力が無効な場合、もしくは再開できる続きが残っていない場合。
 
     Returns:
         StreamingResponse: ストリーミングで対話応答を含むレスポンス。
@@ -155,11 +375,195 @@ async def invoke_model_stream(
     if not isinstance(bedrock_service, ISupportsInvokeModelStream):
         raise HTTPException(status_code=400, detail="このモデルは対応してません")
 
+    if sse_requested and resumable_streams is not None and last_event_id is not None:
+        logger.info("invoke Model Stream 再開 (Last-Event-ID=%s)", last_event_id)
+        return await _resume_sse(resumable_streams, *parse_event_id(last_event_id))
+
     logger.info("invoke Model Stream 処理開始")
 
     payload: BlobTypeDef = bedrock_service.generate_invoke_model_stream_payload(user_input)
-    stream_generator: AsyncGenerator[str, None] = bedrock_service.invoke_model_stream(payload)
+    events = stream_canceller.watch(bedrock_service.invoke_model_stream_events(payload), stop_condition, bedrock_service.max_output_tokens("invoke_stream"))
+    if sse_requested:
+        sse_response = await _start_sse(events, resumable_streams)
+        logger.info("invoke Model Stream 処理終了 (SSE)")
+        return sse_response
+    stream_generator: AsyncGenerator[str] = await prefetch_stream(delta_texts(events))
 
     logger.info("invoke Model Stream 処理終了")
 
-    return StreamingResponse(stream_generator, media_type="text/plain")
+    return DisconnectAwareStreamingResponse(stream_generator, media_type="text/plain")
+
+
+@router.get("/streams/{generation_id}")
+async def resume_stream(
+    generation_id: Annotated[str, Path(description="再開する生成のID")],
+    resumable_streams: Annotated[ResumableStreamStore | None, RESUMABLE_STREAMS_DEPENDS],
+    last_event_id: Annotated[str | None, Header(description="最後に受信したイベントID")] = None,
+) -> StreamingResponse:
+    """
+    開始済みのストリーミング応答を Server-Sent Events で再開するエンドポイント。
+    Last-Event-ID ヘッダーを指定した場合はその次のイベントから、指定しない場合は先頭から返す。
+    EventSource の自動再接続のように、リクエストの本文を再送できないクライアントから使用する。
+
+    Args:
+        generation_id (Annotated[str, Path]):
+            ストリーミング応答の X-Generation-Id ヘッダーで返した生成ID。
+        resumable_streams (Annotated[ResumableStreamStore | None, RESUMABLE_STREAMS_DEPENDS]):
+            再開できるストリーミング応答のストア。無効な場合はNone。
+        last_event_id (Annotated[str | None, Header], optional):
+            最後に受信したイベントID。
+
+    Raises:
+        HTTPException: ストリーミング応答の再開が無効な場合、もしくは再開できる続きが残っていない場合。
+
+    Returns:
+        StreamingResponse: 続きのイベントを含む Server-Sent Events のレスポンス。
+    """
+    if resumable_streams is None:
+        raise HTTPException(status_code=404, detail="ストリーミング応答の再開は無効です")
+    last_seq: int | None = None
+    if last_event_id is not None:
+        event_generation_id, last_seq = parse_event_id(last_event_id)
+        if event_generation_id != generation_id:
+            raise HTTPException(status_code=400, detail="Last-Event-ID の生成IDが一致しません")
+    return await _resume_sse(resumable_streams, generation_id, last_seq)
+
+
+@router.get("/stats")
+async def stats(
+    client_registry: Annotated[BedrockClientRegistry, CLIENT_REGISTRY_DEPENDS],
+    attachment_offloader: Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS],
+    resumable_streams: Annotated[ResumableStreamStore | None, RESUMABLE_STREAMS_DEPENDS],
+    stream_canceller: Annotated[StreamCanceller, STREAM_CANCELLER_DEPENDS],
+) -> ORJSONResponse:
+    """
+    Bedrock 呼び出しに関する統計情報を返すエンドポイント。
+
+    Args:
+        client_registry (Annotated[BedrockClientRegistry, CLIENT_REGISTRY_DEPENDS]):
+            bedrock用ランタイムクライアントのレジストリ。
+        attachment_offloader (Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS]):
+            大きな添付ファイルの S3 への退避処理。無効な場合はNone。
+        resumable_streams (Annotated[ResumableStreamStore | None, RESUMABLE_STREAMS_DEPENDS]):
+            再開できるストリーミング応答のストア。無効な場合はNone。
+        stream_canceller (Annotated[StreamCanceller, STREAM_CANCELLER_DEPENDS]):
+            ストリーミング応答の打ち切り処理。
+
+    Returns:
+        ORJSONResponse: コネクションプール・生成結果キャッシュ・single-flight・同時実行数制御・ヘッジ・リージョンの選択・添付ファイルの退避・
+            ストリーミング応答の再開と打ち切りの使用状況などを含むレスポンス。
+    """
+    completion_cache = client_registry.completion_cache
+    single_flight = client_registry.single_flight
+    concurrency_limiter = client_registry.concurrency_limiter
+    hedger = client_registry.hedger
+    region_router = client_registry.region_router
+    return ORJSONResponse(
+        content={
+            "client_pool": client_registry.pool_stats(),
+            "completion_cache": completion_cache.stats() if completion_cache is not None else None,
+            "single_flight": single_flight.stats() if single_flight is not None else None,
+            "concurrency_limiter": concurrency_limiter.stats() if concurrency_limiter is not None else None,
+            "hedging": hedger.stats() if hedger is not None else None,
+            "region_routing": region_router.stats() if region_router is not None else None,
+            "attachment_offload": attachment_offloader.stats() if attachment_offloader is not None else None,
+            "resumable_streams": resumable_streams.stats() if resumable_streams is not None else None,
+            "stream_cancellation": stream_canceller.stats(),
+        }
+    )
+
+
+async def _start_sse(events: "AsyncGenerator[StreamEventTypeDef]", resumable_streams: ResumableStreamStore | None) -> StreamingResponse:
+    """
+    ストリーミング応答のイベントを Server-Sent Events で返すレスポンスを作成する。
+    ストリーミング応答の再開が有効な場合は、ストアで生成を開始し、生成IDを X-Generation-Id ヘッダーで返す。
+    この場合は再接続に備えて、クライアントが切断しても上流の生成を最後まで読み込む。
+
+    Args:
+        events (AsyncGenerator[StreamEventTypeDef, None]): ストリーミング応答のイベント
+        resumable_streams (ResumableStreamStore | None): 再開できるストリーミング応答のストア。無効な場合はNone
+
+    Returns:
+        StreamingResponse: Server-Sent Events のレスポンス
+    """
+    if resumable_streams is None:
+        sse_generator: AsyncGenerator[bytes] = await prefetch_stream(sse_stream(events, BEDROCK_SSE_CONFIG))
+        return DisconnectAwareStreamingResponse(sse_generator, media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+    generation_id = resumable_streams.start(events)
+    sse_generator = await prefetch_stream(sse_stream(resumable_streams.subscribe(generation_id), BEDROCK_SSE_CONFIG))
+    return DisconnectAwareStreamingResponse(sse_generator, media_type=SSE_MEDIA_TYPE, headers={**SSE_HEADERS, "X-Generation-Id": generation_id})
+
+
+async def _resume_sse(resumable_streams: ResumableStreamStore, generation_id: str, last_seq: int | None) -> StreamingResponse:
+    """
+    開始済みの生成の続きを Server-Sent Events で返すレスポンスを作成する。
+
+    Args:
+        resumable_streams (ResumableStreamStore): 再開できるストリーミング応答のストア
+        generation_id (str): 生成ID
+        last_seq (int | None): 最後に受信したイベントの連番。None の場合は先頭から返す
+
+    Raises:
+        HTTPException: 再開できる続きが残っていない場合
+
+    Returns:
+        StreamingResponse: Server-Sent Events のレスポンス
+    """
+    sse_generator: AsyncGenerator[bytes] = await prefetch_stream(sse_stream(resumable_streams.resume(generation_id, last_seq), BEDROCK_SSE_CONFIG))
+    return DisconnectAwareStreamingResponse(sse_generator, media_type=SSE_MEDIA_TYPE, headers={**SSE_HEADERS, "X-Generation-Id": generation_id})
+
+
+async def _parse_attachment_request(
+    request: Request, attachments: AttachmentUpload, client_registry: BedrockClientRegistry
+) -> "tuple[BedrockModelBase, MessageList, list[ContentBlockTypeDef]]":
+    """
+    添付ファイル付きのリクエストを読み込み、モデルサービス・ユーザーの入力・添付ファイルのコンテンツブロックを返す。
+
+    Args:
+        request (Request): multipart/form-data のリクエスト
+        attachments (AttachmentUpload): 添付ファイルを保持するオブジェクト
+        client_registry (BedrockClientRegistry): bedrock用ランタイムクライアントのレジストリ
+
+    Raises:
+        HTTPException: model_type・user_input が指定されていない、もしくは無効な場合
+        RequestValidationError: user_input が MessageList として不正な場合
+
+    Returns:
+        tuple[BedrockModelBase, MessageList, list[ContentBlockTypeDef]]: モデルサービス・ユーザーの入力・コンテンツブロック
+    """
+    form = await attachments.parse(request)
+    model_type = form.get("model_type")
+    raw_user_input = form.get("user_input")
+    if not isinstance(model_type, str) or not isinstance(raw_user_input, str):
+        raise HTTPException(status_code=400, detail="model_type と user_input を指定してください")
+    try:
+        bedrock_service = create_model_service(ModelType(model_type), client_registry, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="無効なmodel_typeです") from e
+    try:
+        user_input = MessageList.model_validate_json(raw_user_input)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors()) from e
+    return bedrock_service, user_input, attachments.content_blocks("files")
+
+
+def _attach(messages: "Sequence[MessageUnionTypeDef]", content_blocks: "list[ContentBlockTypeDef]") -> "list[MessageTypeDef]":
+    """
+    添付ファイルのコンテンツブロックを、最後のユーザーの発話に加える。
+    Converse API と Converse Stream API のどちらにも渡せるよう、入力側の型のメッセージに詰め替えて返す。
+
+    Args:
+        messages (Sequence[MessageUnionTypeDef]): 会話履歴
+        content_blocks (list[ContentBlockTypeDef]): 添付ファイルのコンテンツブロック
+
+    Raises:
+        HTTPException: 最後の発話がユーザーの発話でない場合
+
+    Returns:
+        list[MessageTypeDef]: 添付ファイルを加えた会話履歴
+    """
+    if not messages or messages[-1]["role"] != "user":
+        raise HTTPException(status_code=400, detail="最後の発話のロールは user を指定してください")
+    attached: list[MessageTypeDef] = [{"role": message["role"], "content": message["content"]} for message in messages]
+    attached[-1] = {"role": "user", "content": [*messages[-1]["content"], *content_blocks]}
+    return attached
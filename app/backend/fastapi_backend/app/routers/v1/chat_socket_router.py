@@ -0,0 +1,66 @@
+"""
+WebSocket で複数ターンの会話を行うルーティングを定義する。
+"""
+
+import logging
+from typing import Annotated
+
+from fastapi import APIRouter, Query, WebSocket
+from starlette import status
+
+from app.config.bedrock_config import BEDROCK_CHAT_SOCKET_CONFIG
+from app.dependencies.bedrock_dependencies import ATTACHMENT_OFFLOADER_DEPENDS, CLIENT_REGISTRY_DEPENDS, create_model_service
+from app.interfaces.bedrock_interface import ISupportsConverseStream
+from app.services.bedrock.attachment_offload import AttachmentOffloader
+from app.services.bedrock.chat_socket import ChatSocketSession
+from app.services.bedrock.client_registry import BedrockClientRegistry
+from app.types.bedrock_type_defs import ModelType
+
+router = APIRouter(prefix="/bedrock", tags=["Chat Socket"])
+
+logger = logging.getLogger(__name__)
+
+
+@router.websocket("/ws")
+async def chat_socket(
+    websocket: WebSocket,
+    model_type: Annotated[ModelType, Query(description="使用するモデルの種類")],
+    client_registry: Annotated[BedrockClientRegistry, CLIENT_REGISTRY_DEPENDS],
+    attachment_offloader: Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS],
+) -> None:
+    """
+    WebSocket で複数ターンの会話を行うエンドポイント。
+    会話履歴は接続が続く間サーバー側で保持し、クライアントは新しい発話のみを送る。
+
+    クライアントからのメッセージ(JSON のテキストフレーム):
+    - {"type": "message", "id": "任意", "content": [コンテンツブロック]}: 新しいユーザーの発話
+    - {"type": "cancel", "id": "任意"}: 生成中の応答の取り消し。id を省略するとすべて取り消す
+
+    サーバーからのメッセージ(JSON のテキストフレーム。id は発話の id もしくは接続内の連番):
+    - {"type": "delta", "id", "text"}: 応答の差分
+    - {"type": "messageStop", "id", "stopReason"} / {"type": "metadata", "id", "usage", "metrics"}: 応答の終了とトークン使用量
+    - {"type": "cancelled", "id"}: 取り消した応答
+    - {"type": "error", "id", "status_code", "detail"}: エラー。接続は閉じない
+
+    Args:
+        websocket (WebSocket):
+            WebSocket の接続。
+        model_type (Annotated[ModelType, Query]):
+            使用するモデルの種類。
+        client_registry (Annotated[BedrockClientRegistry, CLIENT_REGISTRY_DEPENDS]):
+            bedrock用ランタイムクライアントのレジストリ。
+        attachment_offloader (Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS]):
+            大きな添付ファイルの S3 への退避処理。無効な場合はNone。
+    """
+    bedrock_service = create_model_service(model_type, client_registry)
+    if not isinstance(bedrock_service, ISupportsConverseStream):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="このモデルは対応してません")
+        return
+
+    await websocket.accept()
+    logger.info("Chat Socket 接続開始 (model_type=%s)", model_type.value)
+
+    session = ChatSocketSession(websocket, bedrock_service, BEDROCK_CHAT_SOCKET_CONFIG, attachment_offloader)
+    await session.run()
+
+    logger.info("Chat Socket 接続終了 (ターン数=%d)", len(session.history) // 2)
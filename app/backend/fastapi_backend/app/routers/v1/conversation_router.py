@@ -0,0 +1,200 @@
+"""
+サーバー側で履歴を保持する会話セッション用のルーティングを定義する。
+"""
+
+import logging
+import uuid
+from typing import TYPE_CHECKING, Annotated, AsyncGenerator, cast
+
+from fastapi import APIRouter, Body, HTTPException, Path, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+
+from app.dependencies.bedrock_dependencies import (
+    ATTACHMENT_OFFLOADER_DEPENDS,
+    CLIENT_REGISTRY_DEPENDS,
+    COMPLETION_CACHE_MODE_DEPENDS,
+    STREAM_CANCELLER_DEPENDS,
+    create_model_service,
+)
+from app.dependencies.conversation_dependencies import CONVERSATION_STORE_DEPENDS
+from app.interfaces.bedrock_interface import ISupportsConverse, ISupportsConverseStream
+from app.schemas.bedrock_schema import Message, MessageList
+from app.services.bedrock.attachment_offload import AttachmentOffloader
+from app.services.bedrock.client_registry import BedrockClientRegistry
+from app.services.bedrock.stream_cancellation import StreamCanceller
+from app.services.bedrock.stream_utils import DisconnectAwareStreamingResponse, delta_texts, prefetch_stream
+from app.services.conversation.conversation_store import ConversationStore
+from app.types.bedrock_type_defs import ModelType
+
+if TYPE_CHECKING:
+    from mypy_boto3_bedrock_runtime.type_defs import MessageTypeDef
+
+router = APIRouter(prefix="/bedrock/sessions", tags=["Conversation"], dependencies=[COMPLETION_CACHE_MODE_DEPENDS])
+
+logger = logging.getLogger(__name__)
+
+
+@router.post("")
+async def create_session(
+    model_type: Annotated[ModelType, Body(..., description="使用するモデルの種類", embed=True)],
+    conversation_store: Annotated[ConversationStore, CONVERSATION_STORE_DEPENDS],
+) -> ORJSONResponse:
+    """
+    会話セッションを作成するエンドポイント。
+
+    Args:
+        model_type (Annotated[ModelType, Body]):
+            セッションで使用するモデルの種類。
+        conversation_store (Annotated[ConversationStore, CONVERSATION_STORE_DEPENDS]):
+            会話セッションのストア。
+
+    Returns:
+        ORJSONResponse: 作成したセッションのIDを含むレスポンス。
+    """
+    session = await conversation_store.create(model_type)
+    return ORJSONResponse(content={"session_id": str(session.session_id)}, status_code=201)
+
+
+@router.post("/{session_id}/converse")
+async def converse(
+    request: Request,
+    session_id: Annotated[uuid.UUID, Path(description="会話セッションのID")],
+    message: Annotated[Message, Body(..., description="新しいユーザーの発話", embed=True)],
+    *,
+    conversation_store: Annotated[ConversationStore, CONVERSATION_STORE_DEPENDS],
+    client_registry: Annotated[BedrockClientRegistry, CLIENT_REGISTRY_DEPENDS],
+    attachment_offloader: Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS],
+) -> ORJSONResponse:
+    """
+    会話セッションの Converse API 用エンドポイント。
+    保存済みの履歴に新しい発話を加えて応答を返し、発話と応答をセッションに追記する。
+
+    Args:
+        request (Request):
+            リクエスト。
+        session_id (Annotated[uuid.UUID, Path]):
+            会話セッションのID。
+        message (Annotated[Message, Body]):
+            新しいユーザーの発話。
+        conversation_store (Annotated[ConversationStore, CONVERSATION_STORE_DEPENDS]):
+            会話セッションのストア。
+        client_registry (Annotated[BedrockClientRegistry, CLIENT_REGISTRY_DEPENDS]):
+            bedrock用ランタイムクライアントのレジストリ。
+        attachment_offloader (Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS]):
+            大きな添付ファイルの S3 への退避処理。無効な場合はNone。退避した添付ファイルは s3Location でセッションに保存する。
+
+    Raises:
+        HTTPException: セッションのモデルが Converse API に対応していない、もしくは入力が無効な場合。
+
+    Returns:
+        ORJSONResponse: モデルからの応答を含むレスポンス。
+    """
+    session = await conversation_store.load(session_id)
+    bedrock_service = create_model_service(session.model_type, client_registry, request)
+    if not isinstance(bedrock_service, ISupportsConverse):
+        raise HTTPException(status_code=400, detail="このモデルは対応してません")
+
+    logger.info("Session Converse 処理開始 (session_id=%s, 履歴=%d件)", session_id, len(session.messages))
+
+    new_messages = cast("list[MessageTypeDef]", bedrock_service.generate_converse_messages(_new_turn(message)))
+    if attachment_offloader is not None:
+        new_messages = cast("list[MessageTypeDef]", await attachment_offloader.offload(new_messages))
+    reply_text: str = await bedrock_service.converse([*session.messages, *new_messages])
+    await conversation_store.append(session, [*new_messages, {"role": "assistant", "content": [{"text": reply_text}]}])
+
+    logger.info("Session Converse 処理終了")
+
+    return ORJSONResponse(content=reply_text)
+
+
+@router.post("/{session_id}/converse/stream")
+async def converse_stream(
+    request: Request,
+    session_id: Annotated[uuid.UUID, Path(description="会話セッションのID")],
+    message: Annotated[Message, Body(..., description="新しいユーザーの発話", embed=True)],
+    *,
+    conversation_store: Annotated[ConversationStore, CONVERSATION_STORE_DEPENDS],
+    client_registry: Annotated[BedrockClientRegistry, CLIENT_REGISTRY_DEPENDS],
+    attachment_offloader: Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS],
+    stream_canceller: Annotated[StreamCanceller, STREAM_CANCELLER_DEPENDS],
+) -> StreamingResponse:
+    """
+    会話セッションの Converse Stream API 用エンドポイント。
+    保存済みの履歴に新しい発話を加えてストリーミングで応答を返し、最後まで返し終えたら発話と応答をセッションに追記する。
+    クライアントが切断した場合は上流の生成をすぐに止め、セッションには追記しない。
+
+    Args:
+        request (Request):
+            リクエスト。
+        session_id (Annotated[uuid.UUID, Path]):
+            会話セッションのID。
+        message (Annotated[Message, Body]):
+            新しいユーザーの発話。
+        conversation_store (Annotated[ConversationStore, CONVERSATION_STORE_DEPENDS]):
+            会話セッションのストア。
+        client_registry (Annotated[BedrockClientRegistry, CLIENT_REGISTRY_DEPENDS]):
+            bedrock用ランタイムクライアントのレジストリ。
+        attachment_offloader (Annotated[AttachmentOffloader | None, ATTACHMENT_OFFLOADER_DEPENDS]):
+            大きな添付ファイルの S3 への退避処理。無効な場合はNone。退避した添付ファイルは s3Location でセッションに保存する。
+        stream_canceller (Annotated[StreamCanceller, STREAM_CANCELLER_DEPENDS]):
+            クライアントの切断時に上流の生成を止める処理。
+
+    Raises:
+        HTTPException: セッションのモデルが Converse Stream API に対応していない、もしくは入力が無効な場合。
+
+    Returns:
+        StreamingResponse: ストリーミングで対話応答を含むレスポンス。
+    """
+    session = await conversation_store.load(session_id)
+    bedrock_service = create_model_service(session.model_type, client_registry, request)
+    if not isinstance(bedrock_service, ISupportsConverseStream):
+        raise HTTPException(status_code=400, detail="このモデルは対応してません")
+
+    logger.info("Session Converse Stream 処理開始 (session_id=%s, 履歴=%d件)", session_id, len(session.messages))
+
+    new_messages = list(bedrock_service.generate_converse_stream_messages(_new_turn(message)))
+    if attachment_offloader is not None:
+        new_messages = cast("list[MessageTypeDef]", await attachment_offloader.offload(new_messages))
+    events = stream_canceller.watch(
+        bedrock_service.converse_stream_events([*session.messages, *new_messages]), max_tokens=bedrock_service.max_output_tokens("converse_stream")
+    )
+    stream_generator: AsyncGenerator[str] = await prefetch_stream(conversation_store.append_streamed_reply(session, new_messages, delta_texts(events)))
+
+    logger.info("Session Converse Stream 処理終了")
+
+    return DisconnectAwareStreamingResponse(stream_generator, media_type="text/plain")
+
+
+@router.get("/stats")
+async def stats(
+    conversation_store: Annotated[ConversationStore, CONVERSATION_STORE_DEPENDS],
+) -> ORJSONResponse:
+    """
+    会話セッションのキャッシュの統計情報を返すエンドポイント。
+
+    Args:
+        conversation_store (Annotated[ConversationStore, CONVERSATION_STORE_DEPENDS]):
+            会話セッションのストア。
+
+    Returns:
+        ORJSONResponse: キャッシュのヒット数・ミス数・同時追記による失敗数などを含むレスポンス。
+    """
+    return ORJSONResponse(content=conversation_store.stats())
+
+
+def _new_turn(message: Message) -> MessageList:
+    """
+    新しい発話を、モデルサービスに渡せる MessageList にする。
+
+    Args:
+        message (Message): 新しい発話
+
+    Raises:
+        HTTPException: 発話のロールが user でない場合
+
+    Returns:
+        MessageList: 新しい発話のみを含む MessageList
+    """
+    if message.role != "user":
+        raise HTTPException(status_code=400, detail="新しい発話のロールは user を指定してください")
+    return MessageList(messages=[message])
@@ -0,0 +1,39 @@
+"""
+ヘルスチェック用のルーティングを定義する。
+"""
+
+from typing import Annotated
+
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+
+from app.dependencies.health_dependencies import STARTUP_PROFILER_DEPENDS
+from app.services.startup.startup_profiler import StartupProfiler
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+
+@router.get("/live")
+async def live() -> ORJSONResponse:
+    """
+    プロセスが応答できるかを返すエンドポイント(liveness)。
+
+    Returns:
+        ORJSONResponse: 常に 200 のレスポンス
+    """
+    return ORJSONResponse(content={"status": "ok"})
+
+
+@router.get("/ready")
+async def ready(startup_profiler: Annotated[StartupProfiler, STARTUP_PROFILER_DEPENDS]) -> ORJSONResponse:
+    """
+    リクエストを受け付けられるかを返すエンドポイント(readiness)。
+    起動時のウォームアップが完了するまでと、終了処理の開始後は 503 を返す。
+
+    Args:
+        startup_profiler (Annotated[StartupProfiler, STARTUP_PROFILER_DEPENDS]): 起動時のウォームアップの計測結果
+
+    Returns:
+        ORJSONResponse: 起動の状態と、ウォームアップの段階ごとの所要時間を含むレスポンス
+    """
+    return ORJSONResponse(status_code=200 if startup_profiler.ready else 503, content=startup_profiler.stats())
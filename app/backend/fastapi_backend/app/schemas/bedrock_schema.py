@@ -2,9 +2,12 @@
 Bedrock サービスで使用するデータモデルを定義する。
 """
 
-from typing import Any, Dict, List
+from typing import Annotated, Any, Dict, List, Literal
 
-from mypy_boto3_bedrock_runtime.literals import (
+from pydantic import BaseModel, ConfigDict, Discriminator, Field, Tag
+
+from app.types.bedrock_type_defs import (
+    BlobTypeDef,
     ConversationRoleType,
     DocumentFormatType,
     GuardrailConverseContentQualifierType,
@@ -13,8 +16,6 @@ from mypy_boto3_bedrock_runtime.literals import (
     ToolResultStatusType,
     VideoFormatType,
 )
-from mypy_boto3_bedrock_runtime.type_defs import BlobTypeDef
-from pydantic import BaseModel, ConfigDict, Field
 
 
 ###############################################################################################################################
@@ -248,14 +249,73 @@ class ContentBlockOutput(BaseModel):
 ContentBlockUnion = ContentBlock | ContentBlockOutput
 
 
+# テキストのみのコンテンツブロック
+# リクエストの大半はテキストのみのため、ContentBlockUnion の各モデルを試さずにこのモデルだけで検証する
+class TextContentBlock(BaseModel):
+    text: str
+    model_config = ConfigDict(extra="forbid")
+
+
+def _content_block_tag(value: Any) -> str:  # noqa: ANN401
+    """
+    コンテンツブロックを検証するモデルを選ぶ。
+    キーが text のみで値が文字列のブロックはテキストのみのモデル、それ以外は ContentBlockUnion で検証する。
+
+    Args:
+        value (Any): 検証前のコンテンツブロック(dict)、もしくは検証済みのモデル
+
+    Returns:
+        str: 検証に使うモデルのタグ
+    """
+    if isinstance(value, TextContentBlock):
+        return "text"
+    if isinstance(value, dict) and len(value) == 1 and isinstance(value.get("text"), str):
+        return "text"
+    return "block"
+
+
+MessageContentBlock = Annotated[
+    Annotated[TextContentBlock, Tag("text")] | Annotated[ContentBlockUnion, Tag("block")],
+    Discriminator(_content_block_tag),
+]
+
+
 class Message(BaseModel):
     role: ConversationRoleType
-    content: List[ContentBlockUnion]
+    content: List[MessageContentBlock]
 
 
 class MessageList(BaseModel):
     messages: List[Message]
 
 
+###############################################################################################################################
+# ストリーミング応答の打ち切り条件のモデル定義
+###############################################################################################################################
+class StreamStopCondition(BaseModel):
+    # 応答にいずれかが現れた時点で打ち切る文字列。正規表現としては扱わず、一致した部分は返さない
+    stop_sequences: List[Annotated[str, Field(min_length=1, max_length=256)]] | None = Field(default=None, min_length=1, max_length=8)
+    max_chars: int | None = Field(default=None, ge=1)  # 応答がこの文字数に達した時点で打ち切る
+    json_complete: bool = False  # 応答の最初の JSON のオブジェクトもしくは配列が閉じた時点で打ち切る
+    model_config = ConfigDict(extra="forbid")
+
+
+###############################################################################################################################
+# WebSocket での会話のモデル定義
+###############################################################################################################################
+class ChatSocketUserMessage(BaseModel):
+    type: Literal["message"]
+    id: str | None = None  # 応答のイベントに付けるID。省略時は接続内の連番
+    content: List[MessageContentBlock] = Field(min_length=1)
+
+
+class ChatSocketCancel(BaseModel):
+    type: Literal["cancel"]
+    id: str | None = None  # 取り消す応答のID。省略時は生成中のすべての応答
+
+
+ChatSocketRequest = Annotated[ChatSocketUserMessage | ChatSocketCancel, Field(discriminator="type")]
+
+
 # ── Forward Ref の更新 ──
 MessageList.model_rebuild()
@@ -0,0 +1,199 @@
+"""
+大きな添付ファイルを内容のハッシュ値をキーとして S3 に一度だけアップロードし、Bedrock には s3Location で参照させる処理を実装する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import mmap
+from collections import OrderedDict
+from typing import IO, TYPE_CHECKING, Any, cast
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from mypy_boto3_bedrock_runtime.type_defs import MessageUnionTypeDef
+    from mypy_boto3_s3 import S3Client
+
+    from app.types.bedrock_type_defs import AttachmentOffloadConfigTypeDef, AttachmentOffloadStatsTypeDef
+
+
+logger = logging.getLogger(__name__)
+
+# s3Location で参照できるコンテンツブロックの種類
+S3_LOCATION_BLOCK_TYPES = ("video",)
+
+# オブジェクトが存在しない場合の head_object のエラーコード
+NOT_FOUND_ERROR_CODES = frozenset({"404", "NoSuchKey", "NotFound"})
+
+
+class AttachmentOffloader:
+    """
+    大きな添付ファイルを S3 に退避する
+    - しきい値以上のバイト列を持つ添付ファイルを、内容の SHA-256 をキーとするオブジェクトにアップロードし、s3Location に置き換える。
+    - 同じ内容のオブジェクトは一度だけアップロードする。アップロード済みのキーはプロセス内に記憶し、
+      記憶していないキーも head_object で存在を確認してからアップロードする。同じキーの同時のアップロードは 1 回にまとめる。
+    - 退避は最適化のため、失敗した場合は記録のみ行い、バイト列のまま Bedrock に送る。
+    """
+
+    def __init__(self, config: AttachmentOffloadConfigTypeDef, s3_client: S3Client) -> None:
+        self.config = config
+        self.s3_client = s3_client
+        self._known_keys: OrderedDict[str, None] = OrderedDict()
+        self._uploading: dict[str, asyncio.Future[None]] = {}
+        self._offloaded = 0
+        self._uploads = 0
+        self._uploaded_bytes = 0
+        self._dedupe_hits = 0
+        self._failures = 0
+
+    async def offload(self, messages: Sequence[MessageUnionTypeDef]) -> list[MessageUnionTypeDef]:
+        """
+        会話履歴の大きな添付ファイルを S3 に退避し、s3Location で参照する会話履歴を返す。
+
+        Args:
+            messages (Sequence[MessageUnionTypeDef]): 会話履歴
+
+        Returns:
+            list[MessageUnionTypeDef]: 退避した添付ファイルを s3Location に置き換えた会話履歴
+        """
+        offloaded: list[MessageUnionTypeDef] = []
+        for message in messages:
+            content = [await self._offload_block(block) for block in message["content"]]
+            offloaded.append({**message, "content": content})
+        return offloaded
+
+    def stats(self) -> AttachmentOffloadStatsTypeDef:
+        """
+        統計情報を返す。
+
+        Returns:
+            AttachmentOffloadStatsTypeDef: 統計情報
+        """
+        return {
+            "offloaded": self._offloaded,
+            "uploads": self._uploads,
+            "uploaded_bytes": self._uploaded_bytes,
+            "dedupe_hits": self._dedupe_hits,
+            "failures": self._failures,
+        }
+
+    async def _offload_block(self, block: Any) -> Any:  # noqa: ANN401
+        """
+        コンテンツブロックがしきい値以上の添付ファイルであれば S3 に退避し、s3Location に置き換える。
+
+        Args:
+            block (Any): コンテンツブロック
+
+        Returns:
+            Any: 置き換えたコンテンツブロック。対象でない場合はそのまま
+        """
+        for block_type in S3_LOCATION_BLOCK_TYPES:
+            attachment = block.get(block_type)
+            if attachment is None:
+                continue
+            data = attachment.get("source", {}).get("bytes")
+            if not isinstance(data, (bytes, bytearray, mmap.mmap)) or len(data) < self.config["threshold_bytes"]:
+                return block
+            try:
+                uri = await self._upload(data, attachment["format"])
+            except (BotoCoreError, ClientError):
+                self._failures += 1
+                logger.warning("添付ファイルを S3 に退避できなかったため、バイト列のまま送ります", exc_info=True)
+                return block
+            self._offloaded += 1
+            location: dict[str, str] = {"uri": uri}
+            if self.config["bucket_owner"]:
+                location["bucketOwner"] = self.config["bucket_owner"]
+            return {**block, block_type: {**attachment, "source": {"s3Location": location}}}
+        return block
+
+    async def _upload(self, data: bytes | bytearray | mmap.mmap, extension: str) -> str:
+        """
+        内容のハッシュ値をキーとして、S3 にまだない場合のみアップロードする。
+
+        Args:
+            data (bytes | bytearray | mmap.mmap): 添付ファイルの内容
+            extension (str): キーに付ける拡張子
+
+        Returns:
+            str: オブジェクトの S3 URI
+        """
+        digest = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+        key = f"{self.config['prefix']}{digest}.{extension}"
+        uri = f"s3://{self.config['bucket']}/{key}"
+        if key in self._known_keys:
+            self._known_keys.move_to_end(key)
+            self._dedupe_hits += 1
+            return uri
+
+        uploading = self._uploading.get(key)
+        if uploading is not None:
+            # 同じ内容を別のリクエストがアップロード中のため、その完了を待つ。失敗した場合は自身でアップロードする
+            await asyncio.wait([uploading])
+            if not uploading.cancelled() and uploading.exception() is None:
+                self._dedupe_hits += 1
+                return uri
+            return await self._upload(data, extension)
+
+        uploading = asyncio.get_running_loop().create_future()
+        self._uploading[key] = uploading
+        try:
+            uploaded = await asyncio.to_thread(self._put_if_absent, key, data)
+        except asyncio.CancelledError:
+            uploading.cancel()
+            raise
+        except Exception as e:
+            uploading.set_exception(e)
+            # 待っているリクエストがない場合に、取得されない例外の警告を出さないようにする
+            uploading.exception()
+            raise
+        else:
+            uploading.set_result(None)
+        finally:
+            del self._uploading[key]
+
+        if uploaded:
+            self._uploads += 1
+            self._uploaded_bytes += len(data)
+        else:
+            self._dedupe_hits += 1
+        self._known_keys[key] = None
+        while len(self._known_keys) > self.config["known_keys_max_entries"]:
+            self._known_keys.popitem(last=False)
+        return uri
+
+    def _put_if_absent(self, key: str, data: bytes | bytearray | mmap.mmap) -> bool:
+        """
+        オブジェクトが存在しない場合のみアップロードする。スレッドで実行する。
+
+        Args:
+            key (str): オブジェクトのキー
+            data (bytes | bytearray | mmap.mmap): 添付ファイルの内容
+
+        Raises:
+            ClientError: 存在の確認もしくはアップロードに失敗した場合
+
+        Returns:
+            bool: アップロードした場合はTrue、既に存在した場合はFalse
+        """
+        try:
+            self.s3_client.head_object(Bucket=self.config["bucket"], Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in NOT_FOUND_ERROR_CODES:
+                raise
+        else:
+            return False
+        body: bytes | IO[bytes]
+        if isinstance(data, mmap.mmap):
+            # mmap はファイルと同じく read / seek を持つため、コピーせずに先頭からストリーミングさせる
+            data.seek(0)
+            body = cast("IO[bytes]", data)
+        else:
+            body = bytes(data)
+        self.s3_client.put_object(Bucket=self.config["bucket"], Key=key, Body=body)
+        return True
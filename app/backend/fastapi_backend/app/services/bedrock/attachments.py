@@ -0,0 +1,257 @@
+"""
+multipart で受け取った添付ファイル(画像・文書・動画)を一時ファイルに書き出し、コピーせずに Bedrock のコンテンツブロックとして渡す処理を実装する。
+"""
+
+from __future__ import annotations
+
+import logging
+import mmap
+import re
+from pathlib import PurePath
+from typing import TYPE_CHECKING, AsyncGenerator, TypeVar, cast
+
+from fastapi import HTTPException
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+if TYPE_CHECKING:
+    from fastapi import Request
+    from mypy_boto3_bedrock_runtime.type_defs import ContentBlockTypeDef
+    from starlette.datastructures import FormData, Headers
+
+    from app.types.bedrock_type_defs import AttachmentUploadConfigTypeDef, BlobTypeDef, DocumentFormatType, ImageFormatType, VideoFormatType
+
+
+logger = logging.getLogger(__name__)
+
+ChunkT = TypeVar("ChunkT")
+
+# 添付ファイル以外のフィールド数の上限
+MAX_FORM_FIELDS = 16
+
+# 拡張子と Bedrock の形式の対応
+IMAGE_FORMATS: dict[str, ImageFormatType] = {"png": "png", "jpg": "jpeg", "jpeg": "jpeg", "gif": "gif", "webp": "webp"}
+DOCUMENT_FORMATS: dict[str, DocumentFormatType] = {
+    "pdf": "pdf",
+    "csv": "csv",
+    "doc": "doc",
+    "docx": "docx",
+    "xls": "xls",
+    "xlsx": "xlsx",
+    "html": "html",
+    "txt": "txt",
+    "md": "md",
+}
+VIDEO_FORMATS: dict[str, VideoFormatType] = {
+    "mkv": "mkv",
+    "mov": "mov",
+    "mp4": "mp4",
+    "webm": "webm",
+    "flv": "flv",
+    "mpeg": "mpeg",
+    "mpg": "mpg",
+    "wmv": "wmv",
+    "3gp": "three_gp",
+}
+
+# 文書名に使用できない文字(英数字・空白・ハイフン・括弧以外)と連続する空白
+_DOCUMENT_NAME_INVALID = re.compile(r"[^0-9A-Za-z\s\-()\[\]]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class AttachmentTooLargeError(MultiPartException):
+    """
+    添付ファイルの合計サイズが上限を超えた場合の例外
+    """
+
+
+class AttachmentMultiPartParser(MultiPartParser):
+    """
+    添付ファイルの合計サイズとメモリ使用量を制限する multipart のパーサー
+    - ファイルごとにメモリ上に保持する上限を、リクエストあたりの上限をファイル数の上限で割った値とし、超えた分は一時ファイルに書き出す。
+    - 受信しながら合計サイズを数え、上限を超えた時点で読み込みを打ち切る。
+    """
+
+    def __init__(self, headers: Headers, stream: AsyncGenerator[bytes], config: AttachmentUploadConfigTypeDef) -> None:
+        super().__init__(headers, stream, max_files=config["max_files"], max_fields=MAX_FORM_FIELDS, max_part_size=config["memory_limit"])
+        # Starlette が SpooledTemporaryFile の max_size に使用する値
+        self.max_file_size = max(config["memory_limit"] // max(config["max_files"], 1), 1)
+        self.max_total_bytes = config["max_total_bytes"]
+        self._total_bytes = 0
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        """
+        パートのデータを受け取る。添付ファイルの場合は合計サイズを数える。
+
+        Args:
+            data (bytes): 受信したデータ
+            start (int): パートのデータの開始位置
+            end (int): パートのデータの終了位置
+
+        Raises:
+            AttachmentTooLargeError: 添付ファイルの合計サイズが上限を超えた場合
+        """
+        if self._current_part.file is not None:
+            self._total_bytes += end - start
+            if self._total_bytes > self.max_total_bytes:
+                msg = f"添付ファイルの合計サイズが上限({self.max_total_bytes}バイト)を超えています"
+                raise AttachmentTooLargeError(msg)
+        super().on_part_data(data, start, end)
+
+
+class AttachmentUpload:
+    """
+    multipart のリクエストから受け取った添付ファイルを保持する
+    - 添付ファイルは一時ファイルに書き出し、メモリマップした mmap をそのまま Bedrock のリクエストの bytes に渡す。
+      base64 の文字列やデコードしたバイト列を保持しないため、リクエストの送信時にシリアライズされる分以外はメモリ上にコピーしない。
+    - mmap と一時ファイルは Bedrock の呼び出しが終わるまで保持し、aclose で解放する。
+    """
+
+    def __init__(self, config: AttachmentUploadConfigTypeDef) -> None:
+        self.config = config
+        self._form: FormData | None = None
+        self._mappings: list[mmap.mmap] = []
+
+    async def parse(self, request: Request) -> FormData:
+        """
+        リクエストの multipart を読み込む。
+
+        Args:
+            request (Request): リクエスト
+
+        Raises:
+            HTTPException: 添付ファイルの合計サイズが上限を超えた、もしくは multipart が不正な場合
+
+        Returns:
+            FormData: 読み込んだフォーム
+        """
+        parser = AttachmentMultiPartParser(request.headers, request.stream(), self.config)
+        try:
+            self._form = await parser.parse()
+        except AttachmentTooLargeError as e:
+            raise HTTPException(status_code=413, detail=e.message) from e
+        except MultiPartException as e:
+            raise HTTPException(status_code=400, detail=e.message) from e
+        return self._form
+
+    def content_blocks(self, field_name: str) -> list[ContentBlockTypeDef]:
+        """
+        フォームの添付ファイルを、拡張子に応じた画像・文書・動画のコンテンツブロックにする。
+
+        Args:
+            field_name (str): 添付ファイルのフィールド名
+
+        Returns:
+            list[ContentBlockTypeDef]: コンテンツブロック
+        """
+        if self._form is None:
+            return []
+        return [self._content_block(upload) for upload in self._form.getlist(field_name) if isinstance(upload, UploadFile)]
+
+    async def aclose(self) -> None:
+        """
+        メモリマップと一時ファイルを解放する。
+        """
+        for mapping in self._mappings:
+            mapping.close()
+        self._mappings.clear()
+        if self._form is not None:
+            await self._form.close()
+            self._form = None
+
+    async def close_after(self, stream: AsyncGenerator[ChunkT]) -> AsyncGenerator[ChunkT]:
+        """
+        ストリームを最後まで返し終えてから、添付ファイルを解放する。
+
+        Args:
+            stream (AsyncGenerator[ChunkT]): 添付ファイルを参照するリクエストのストリーム
+
+        Yields:
+            ChunkT: ストリームのチャンク
+        """
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+            await self.aclose()
+
+    def _content_block(self, upload: UploadFile) -> ContentBlockTypeDef:
+        """
+        添付ファイルをコンテンツブロックにする。
+
+        Args:
+            upload (UploadFile): 添付ファイル
+
+        Raises:
+            HTTPException: 対応していない形式の場合
+
+        Returns:
+            ContentBlockTypeDef: コンテンツブロック
+        """
+        filename = upload.filename or ""
+        extension = PurePath(filename).suffix.lower().lstrip(".")
+        if extension in IMAGE_FORMATS:
+            return {"image": {"format": IMAGE_FORMATS[extension], "source": {"bytes": _as_blob(self._map(upload))}}}
+        if extension in DOCUMENT_FORMATS:
+            return {
+                "document": {
+                    "format": DOCUMENT_FORMATS[extension],
+                    "name": _document_name(filename),
+                    "source": {"bytes": _as_blob(self._map(upload))},
+                }
+            }
+        if extension in VIDEO_FORMATS:
+            return {"video": {"format": VIDEO_FORMATS[extension], "source": {"bytes": _as_blob(self._map(upload))}}}
+        raise HTTPException(status_code=400, detail=f"対応していない形式の添付ファイルです: {filename}")
+
+    def _map(self, upload: UploadFile) -> mmap.mmap:
+        """
+        添付ファイルをメモリマップする。メモリ上にある小さなファイルも一時ファイルに書き出してからマップする。
+
+        Args:
+            upload (UploadFile): 添付ファイル
+
+        Raises:
+            HTTPException: 添付ファイルが空の場合
+
+        Returns:
+            mmap.mmap: 読み込み専用のメモリマップ
+        """
+        if not upload.size:
+            raise HTTPException(status_code=400, detail=f"添付ファイルが空です: {upload.filename}")
+        # SpooledTemporaryFile は fileno() の呼び出しで一時ファイルに書き出される
+        file_descriptor = upload.file.fileno()
+        upload.file.flush()
+        mapping = mmap.mmap(file_descriptor, 0, access=mmap.ACCESS_READ)
+        self._mappings.append(mapping)
+        return mapping
+
+
+def _as_blob(mapping: mmap.mmap) -> BlobTypeDef:
+    """
+    メモリマップをコンテンツブロックの bytes として渡す。
+    どちらのランタイムも botocore のシリアライザーが blob をバッファプロトコルで base64 エンコードするため、bytes にコピーせずに渡せる
+    (mypy_boto3 の BlobTypeDef はバッファプロトコルの型を含まないため、ここで型を合わせる)。
+
+    Args:
+        mapping (mmap.mmap): 添付ファイルのメモリマップ
+
+    Returns:
+        BlobTypeDef: コンテンツブロックの bytes
+    """
+    return cast("BlobTypeDef", mapping)
+
+
+def _document_name(filename: str) -> str:
+    """
+    ファイル名から Bedrock の文書名に使用できる名前を作る。
+
+    Args:
+        filename (str): ファイル名
+
+    Returns:
+        str: 文書名
+    """
+    name = _WHITESPACE.sub(" ", _DOCUMENT_NAME_INVALID.sub(" ", PurePath(filename).stem)).strip()
+    return name or "document"
@@ -0,0 +1,98 @@
+"""
+複数の会話入力を同時実行数の上限付きで並行に Converse API へ送信するバッチ処理を実装する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import TYPE_CHECKING, AsyncGenerator
+
+import orjson
+from fastapi import HTTPException
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from app.interfaces.bedrock_interface import ISupportsConverse
+    from app.schemas.bedrock_schema import MessageList
+    from app.types.bedrock_type_defs import ConverseBatchItemResultTypeDef
+
+
+logger = logging.getLogger(__name__)
+
+
+async def converse_batch(service: ISupportsConverse, user_inputs: Sequence[MessageList], concurrency: int) -> AsyncGenerator[ConverseBatchItemResultTypeDef]:
+    """
+    会話入力を並行に Converse API へ送信し、完了した順に結果を返す。
+    同時実行数は concurrency 以下に抑え、個々の入力のエラーは結果として返してバッチ全体は継続する。
+    ジェネレーターが閉じられた場合(クライアントの切断等)は実行中の呼び出しを取り消す。
+
+    Args:
+        service (ISupportsConverse): Converse API に対応したモデルサービス
+        user_inputs (Sequence[MessageList]): 会話入力の一覧
+        concurrency (int): 同時実行数の上限
+
+    Yields:
+        ConverseBatchItemResultTypeDef: 入力のインデックス付きの結果
+    """
+    pending: asyncio.Queue[int] = asyncio.Queue()
+    for index in range(len(user_inputs)):
+        pending.put_nowait(index)
+    results: asyncio.Queue[ConverseBatchItemResultTypeDef] = asyncio.Queue()
+
+    async def _worker() -> None:
+        while not pending.empty():
+            index = pending.get_nowait()
+            await results.put(await _converse_item(service, index, user_inputs[index]))
+
+    workers = [asyncio.create_task(_worker()) for _ in range(min(concurrency, len(user_inputs)))]
+    try:
+        for _ in range(len(user_inputs)):
+            yield await results.get()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def converse_batch_ndjson(service: ISupportsConverse, user_inputs: Sequence[MessageList], concurrency: int) -> AsyncGenerator[bytes]:
+    """
+    バッチ処理の結果を NDJSON(1 行 1 結果)として返す。
+
+    Args:
+        service (ISupportsConverse): Converse API に対応したモデルサービス
+        user_inputs (Sequence[MessageList]): 会話入力の一覧
+        concurrency (int): 同時実行数の上限
+
+    Yields:
+        bytes: 結果の JSON と改行
+    """
+    # 送信中に閉じられた場合も、内側のジェネレーターを GC を待たずに閉じて実行中の呼び出しを取り消す
+    async with aclosing(converse_batch(service, user_inputs, concurrency)) as results:
+        async for result in results:
+            yield orjson.dumps(result, option=orjson.OPT_APPEND_NEWLINE)
+
+
+async def _converse_item(service: ISupportsConverse, index: int, user_input: MessageList) -> ConverseBatchItemResultTypeDef:
+    """
+    1 件の会話入力を Converse API へ送信し、結果またはエラーを返す。
+
+    Args:
+        service (ISupportsConverse): Converse API に対応したモデルサービス
+        index (int): 入力のインデックス
+        user_input (MessageList): 会話入力
+
+    Returns:
+        ConverseBatchItemResultTypeDef: 入力のインデックス付きの結果
+    """
+    try:
+        messages = service.generate_converse_messages(user_input)
+        output = await service.converse(messages)
+    except HTTPException as e:
+        return {"index": index, "error": {"status_code": e.status_code, "detail": str(e.detail)}}
+    except Exception:
+        logger.exception("バッチの処理中にエラーが発生しました (index=%d)", index)
+        return {"index": index, "error": {"status_code": 500, "detail": "内部エラーが発生しました"}}
+    return {"index": index, "output": output}
@@ -0,0 +1,83 @@
+"""
+Bedrock 呼び出しのエラーの判定と、HTTP エラーへの変換を実装する。
+"""
+
+from __future__ import annotations
+
+import math
+
+from botocore.exceptions import BotoCoreError, ClientError
+from fastapi import HTTPException
+
+from app.config.bedrock_config import BEDROCK_CONCURRENCY_LIMITER_CONFIG
+
+# スロットリングとして扱うエラーコード
+THROTTLING_ERROR_CODES: frozenset[str] = frozenset(
+    {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException", "ModelNotReadyException"}
+)
+
+# リージョン側の障害として扱うエラーコード(スロットリングを除く)
+REGION_FAILURE_ERROR_CODES: frozenset[str] = frozenset({"InternalServerException", "ServiceUnavailableException", "ModelTimeoutException"})
+
+
+class BedrockThrottlingError(ClientError):
+    """
+    流量制御により Bedrock を呼び出さずに打ち切った場合の例外
+    上流のスロットリングと同じく扱えるよう、エラーコード ThrottlingException の ClientError として送出する。
+    """
+
+    def __init__(self, message: str, operation_name: str, retry_after: float) -> None:
+        super().__init__({"Error": {"Code": "ThrottlingException", "Message": message}}, operation_name)
+        self.retry_after = retry_after
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """
+    例外が Bedrock のスロットリングによるものか判定する。
+
+    Args:
+        error (BaseException): 例外
+
+    Returns:
+        bool: スロットリングの場合はTrue
+    """
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+def is_region_failure(error: BaseException) -> bool:
+    """
+    例外が呼び出し先リージョンの障害・スロットリングによるものか判定する。
+    入力の誤りなどリクエスト自体の問題や、流量制御によりこのプロセス内で打ち切った場合は含めない。
+
+    Args:
+        error (BaseException): 例外
+
+    Returns:
+        bool: リージョンの障害・スロットリングの場合はTrue
+    """
+    if isinstance(error, BedrockThrottlingError):
+        return False
+    if isinstance(error, BotoCoreError):
+        return True
+    return is_throttling_error(error) or (isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in REGION_FAILURE_ERROR_CODES)
+
+
+def to_http_exception(error: ClientError) -> HTTPException:
+    """
+    Bedrock のエラーを HTTP エラーに変換する。
+    スロットリングは 429 と Retry-After を返し、クライアントがすぐに再試行して負荷を強めないようにする。
+
+    Args:
+        error (ClientError): Bedrock のエラー
+
+    Returns:
+        HTTPException: HTTP エラー
+    """
+    if is_throttling_error(error):
+        retry_after = getattr(error, "retry_after", BEDROCK_CONCURRENCY_LIMITER_CONFIG["retry_after"])
+        return HTTPException(
+            status_code=429,
+            detail="リクエストが混み合っています。しばらくしてから再度お試しください",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+    return HTTPException(status_code=400, detail="無効な入力です")
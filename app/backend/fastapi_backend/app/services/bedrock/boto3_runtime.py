@@ -0,0 +1,177 @@
+"""
+boto3 の Bedrock ランタイムクライアントをスレッド経由で呼び出すランタイムを実装する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any
+
+from botocore.exceptions import BotoCoreError
+from urllib3.exceptions import HTTPError as URLLib3HTTPError
+
+from app.interfaces.bedrock_interface import BedrockRuntimeBase
+from app.services.bedrock.event_stream_pump import pump_event_stream
+from app.services.bedrock.service_model import resolve_operation_shapes
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    from mypy_boto3_bedrock_runtime import BedrockRuntimeClient
+    from mypy_boto3_bedrock_runtime.type_defs import (
+        ConverseRequestRequestTypeDef,
+        ConverseResponseTypeDef,
+        ConverseStreamRequestRequestTypeDef,
+        InvokeModelRequestRequestTypeDef,
+        InvokeModelWithResponseStreamRequestRequestTypeDef,
+    )
+
+    from app.types.bedrock_type_defs import (
+        BedrockClientConfigTypeDef,
+        BedrockConnectionPoolStatsTypeDef,
+        ConverseStreamResultTypeDef,
+        InvokeModelResultTypeDef,
+        InvokeModelStreamResultTypeDef,
+    )
+
+logger = logging.getLogger(__name__)
+
+
+class Boto3BedrockRuntime(BedrockRuntimeBase):
+    """
+    boto3 クライアントの同期 API を `asyncio.to_thread` で呼び出すランタイム
+    ストリームの読み込みは専用のワーカースレッドで行い、イベントループをブロックしない。
+    """
+
+    def __init__(self, client: BedrockRuntimeClient, stream_executor: Executor, client_config: BedrockClientConfigTypeDef) -> None:
+        self.client = client
+        self.stream_executor = stream_executor
+        self.max_pool_connections = client_config["max_pool_connections"]
+        self.stream_buffer_size = client_config["stream_buffer_size"]
+
+    async def converse(self, request_args: ConverseRequestRequestTypeDef) -> ConverseResponseTypeDef:
+        """
+        Converse API を呼び出す。
+
+        Args:
+            request_args (ConverseRequestRequestTypeDef): converseに渡すパラメータ
+
+        Returns:
+            ConverseResponseTypeDef: モデルからのレスポンス
+        """
+        return await asyncio.to_thread(lambda: self.client.converse(**request_args))
+
+    async def converse_stream(self, request_args: ConverseStreamRequestRequestTypeDef) -> ConverseStreamResultTypeDef:
+        """
+        Converse Stream API を呼び出す。
+
+        Args:
+            request_args (ConverseStreamRequestRequestTypeDef): converse_streamに渡すパラメータ
+
+        Returns:
+            ConverseStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        response = await asyncio.to_thread(lambda: self.client.converse_stream(**request_args))
+        return {"stream": pump_event_stream(response["stream"], self.stream_executor, self.stream_buffer_size)}
+
+    async def invoke_model(self, request_args: InvokeModelRequestRequestTypeDef) -> InvokeModelResultTypeDef:
+        """
+        Invoke Model API を呼び出す。ボディの読み込みもスレッド内で行う。
+
+        Args:
+            request_args (InvokeModelRequestRequestTypeDef): invoke_modelに渡すパラメータ
+
+        Returns:
+            InvokeModelResultTypeDef: 読み込み済みのボディを含むレスポンス
+        """
+
+        def _invoke() -> InvokeModelResultTypeDef:
+            response = self.client.invoke_model(**request_args)
+            return {"body": response["body"].read(), "contentType": response["contentType"]}
+
+        return await asyncio.to_thread(_invoke)
+
+    async def invoke_model_with_response_stream(self, request_args: InvokeModelWithResponseStreamRequestRequestTypeDef) -> InvokeModelStreamResultTypeDef:
+        """
+        Invoke Model With Response Stream API を呼び出す。
+
+        Args:
+            request_args (InvokeModelWithResponseStreamRequestRequestTypeDef): invoke_model_with_response_streamに渡すパラメータ
+
+        Returns:
+            InvokeModelStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        response = await asyncio.to_thread(lambda: self.client.invoke_model_with_response_stream(**request_args))
+        return {
+            "body": pump_event_stream(response["body"], self.stream_executor, self.stream_buffer_size),
+            "contentType": response["contentType"],
+        }
+
+    async def warm_up(self, connections: int) -> None:
+        """
+        リクエストで使う操作の定義を組み立て、コネクションプールに TLS 接続済みのコネクションを事前に補充する。
+
+        Args:
+            connections (int): 確立するコネクション数
+        """
+        resolve_operation_shapes(self.client.meta.service_model)
+        pool = self._connection_pool()
+        try:
+            await asyncio.to_thread(self._open_connections, pool, min(connections, self.max_pool_connections))
+        except (BotoCoreError, URLLib3HTTPError, OSError) as e:
+            # 起動自体は止めず、初回リクエスト時の接続にフォールバックする
+            logger.warning("コネクションの事前確立に失敗しました (endpoint=%s): %s", self.client.meta.endpoint_url, e)
+
+    def pool_stats(self) -> BedrockConnectionPoolStatsTypeDef:
+        """
+        コネクションプールの使用状況を返す。
+
+        Returns:
+            BedrockConnectionPoolStatsTypeDef: コネクションプールの使用状況
+        """
+        pool = self._connection_pool()
+        return {
+            "transport": "boto3",
+            "max_pool_connections": self.max_pool_connections,
+            "opened_connections": pool.num_connections,
+            "idle_connections": sum(conn is not None for conn in pool.pool.queue) if pool.pool else 0,
+            "requests": pool.num_requests,
+        }
+
+    async def aclose(self) -> None:
+        """
+        クライアントのコネクションを閉じる。
+        """
+        self.client.close()
+
+    def _connection_pool(self) -> Any:  # noqa: ANN401
+        """
+        クライアントが内部で使用している urllib3 のコネクションプールを取得する。
+
+        Returns:
+            Any: urllib3 の HTTPSConnectionPool
+        """
+        endpoint_url = self.client.meta.endpoint_url
+        http_session = self.client._endpoint.http_session  # type: ignore[attr-defined] # noqa: SLF001
+        manager = http_session._get_connection_manager(endpoint_url)  # noqa: SLF001
+        pool = manager.connection_from_url(endpoint_url)
+        http_session._setup_ssl_cert(pool, endpoint_url, http_session._verify)  # noqa: SLF001
+        return pool
+
+    @staticmethod
+    def _open_connections(pool: Any, count: int) -> None:  # noqa: ANN401
+        """
+        コネクションプールに TLS 接続済みのコネクションを補充する。
+
+        Args:
+            pool (Any): urllib3 の HTTPSConnectionPool
+            count (int): 開いておくコネクション数
+        """
+        connections = [pool._get_conn() for _ in range(count)]  # noqa: SLF001
+        try:
+            for conn in connections:
+                conn.connect()
+        finally:
+            for conn in connections:
+                pool._put_conn(conn)  # noqa: SLF001
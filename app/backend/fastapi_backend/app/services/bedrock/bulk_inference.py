@@ -0,0 +1,376 @@
+"""
+JSONL の会話入力を一括で推論するオフライン処理(チェックポイント・バッチ推論ジョブ)を実装する。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import time
+from datetime import UTC, datetime
+from typing import IO, TYPE_CHECKING, Any
+from urllib.parse import urlparse
+
+import orjson
+from pydantic import ValidationError
+
+from app.schemas.bedrock_schema import MessageList
+from app.services.bedrock.batch_converse import converse_batch
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from pathlib import Path
+
+    from mypy_boto3_bedrock import BedrockClient
+    from mypy_boto3_s3 import S3Client
+
+    from app.interfaces.bedrock_interface import ISupportsBatchInference, ISupportsConverse
+    from app.types.bedrock_type_defs import ConverseBatchItemResultTypeDef
+
+
+logger = logging.getLogger(__name__)
+
+# 進捗をログに出力する間隔(件数)
+PROGRESS_LOG_INTERVAL: int = 1000
+
+# バッチ推論ジョブの終了状態
+BATCH_JOB_SUCCEEDED_STATUSES: frozenset[str] = frozenset({"Completed", "PartiallyCompleted"})
+BATCH_JOB_FAILED_STATUSES: frozenset[str] = frozenset({"Failed", "Stopped", "Expired"})
+
+
+class BulkInferenceError(Exception):
+    """
+    一括推論を継続できない場合の例外
+    """
+
+
+def read_inputs(path: Path) -> tuple[str, list[MessageList | str]]:
+    """
+    JSONL の入力ファイルを読み込み、1 行ずつ MessageList として検証する。
+
+    Args:
+        path (Path): 入力ファイルのパス
+
+    Returns:
+        tuple[str, list[MessageList | str]]: 入力ファイルのハッシュ値と、各行の入力(検証エラーの場合はエラーメッセージ)
+    """
+    digest = hashlib.sha256()
+    inputs: list[MessageList | str] = []
+    with path.open("rb") as f:
+        for line in f:
+            digest.update(line)
+            if not line.strip():
+                continue
+            try:
+                inputs.append(MessageList.model_validate_json(line))
+            except ValidationError as e:
+                inputs.append(str(e))
+    return digest.hexdigest(), inputs
+
+
+class BulkInferenceCheckpoint:
+    """
+    一括推論の進捗を記録するチェックポイントファイル
+    追記のみの JSONL で、1 行目に入力ファイルの情報、以降に完了した入力のインデックスとバッチ推論ジョブの ARN を記録する。
+    中断後に同じ入力で再実行すると、完了済みの入力を飛ばして再開する。
+    """
+
+    def __init__(self, path: Path, input_sha256: str, records: int) -> None:
+        self.path = path
+        self.completed: set[int] = set()
+        self.batch_job_arn: str | None = None
+        if path.exists():
+            self._load(input_sha256)
+        else:
+            self._append({"input_sha256": input_sha256, "records": records})
+
+    def mark_completed(self, index: int) -> None:
+        """
+        入力の処理完了を記録する。
+
+        Args:
+            index (int): 入力のインデックス
+        """
+        self.completed.add(index)
+        self._append({"index": index})
+
+    def record_batch_job(self, job_arn: str | None) -> None:
+        """
+        実行中のバッチ推論ジョブを記録する。Noneの場合は記録を解除する。
+
+        Args:
+            job_arn (str | None): バッチ推論ジョブの ARN
+        """
+        self.batch_job_arn = job_arn
+        self._append({"batch_job_arn": job_arn})
+
+    def _load(self, input_sha256: str) -> None:
+        """
+        チェックポイントファイルから進捗を読み込む。書き込み途中で中断した最終行は無視する。
+
+        Args:
+            input_sha256 (str): 入力ファイルのハッシュ値
+
+        Raises:
+            BulkInferenceError: チェックポイントが別の入力ファイルのものである場合
+        """
+        with self.path.open("rb") as f:
+            lines = f.read().splitlines()
+        for number, line in enumerate(lines):
+            try:
+                record: dict[str, Any] = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                logger.warning("チェックポイントの不正な行を無視します (line=%d)", number + 1)
+                continue
+            if number == 0:
+                if record.get("input_sha256") != input_sha256:
+                    msg = f"チェックポイントが別の入力ファイルのものです: {self.path}"
+                    raise BulkInferenceError(msg)
+            elif "index" in record:
+                self.completed.add(record["index"])
+            elif "batch_job_arn" in record:
+                self.batch_job_arn = record["batch_job_arn"]
+
+    def _append(self, record: dict[str, Any]) -> None:
+        """
+        チェックポイントファイルに 1 行追記する。
+
+        Args:
+            record (dict[str, Any]): 記録する内容
+        """
+        with self.path.open("ab") as f:
+            f.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+
+
+class BulkInferenceWriter:
+    """
+    推論結果を出力ファイル、エラーをエラーファイルに JSONL で書き込むライター
+    成功した結果の書き込み後にチェックポイントへ完了を記録するため、中断時も結果が欠けることはない。
+    (書き込みと記録の間で中断した場合のみ、再実行時に同じインデックスの結果が重複しうる)
+    """
+
+    def __init__(self, output_path: Path, errors_path: Path, checkpoint: BulkInferenceCheckpoint) -> None:
+        self.checkpoint = checkpoint
+        self.succeeded = 0
+        self.failed = 0
+        self._output: IO[bytes] = output_path.open("ab")
+        # エラーになった入力は再実行時に再処理するため、エラーファイルは実行ごとに作り直す
+        self._errors: IO[bytes] = errors_path.open("wb")
+
+    def write(self, result: ConverseBatchItemResultTypeDef) -> None:
+        """
+        推論結果を書き込む。
+
+        Args:
+            result (ConverseBatchItemResultTypeDef): 入力のインデックス付きの結果
+        """
+        line = orjson.dumps(result, option=orjson.OPT_APPEND_NEWLINE)
+        if "error" in result:
+            self._errors.write(line)
+            self._errors.flush()
+            self.failed += 1
+        else:
+            self._output.write(line)
+            self._output.flush()
+            self.checkpoint.mark_completed(result["index"])
+            self.succeeded += 1
+
+        if (self.succeeded + self.failed) % PROGRESS_LOG_INTERVAL == 0:
+            logger.info("進捗: 成功=%d, 失敗=%d", self.succeeded, self.failed)
+
+    def close(self) -> None:
+        """
+        出力ファイルを閉じる。
+        """
+        self._output.close()
+        self._errors.close()
+
+
+async def run_online(
+    service: ISupportsConverse,
+    inputs: Sequence[MessageList | str],
+    pending: Sequence[int],
+    writer: BulkInferenceWriter,
+    concurrency: int,
+) -> None:
+    """
+    未処理の入力を Converse API で同時実行数の上限付きで推論する。
+
+    Args:
+        service (ISupportsConverse): Converse API に対応したモデルサービス
+        inputs (Sequence[MessageList | str]): 全入力
+        pending (Sequence[int]): 未処理の入力のインデックス
+        writer (BulkInferenceWriter): 結果のライター
+        concurrency (int): 同時実行数の上限
+    """
+    targets: list[int] = []
+    user_inputs: list[MessageList] = []
+    for index in pending:
+        user_input = inputs[index]
+        if isinstance(user_input, str):
+            writer.write({"index": index, "error": {"status_code": 422, "detail": user_input}})
+        else:
+            targets.append(index)
+            user_inputs.append(user_input)
+
+    async for result in converse_batch(service, user_inputs, concurrency):
+        writer.write({**result, "index": targets[result["index"]]})
+
+
+def write_batch_job_input(
+    service: ISupportsBatchInference,
+    inputs: Sequence[MessageList | str],
+    pending: Sequence[int],
+    path: Path,
+    writer: BulkInferenceWriter,
+) -> int:
+    """
+    未処理の入力からバッチ推論ジョブの入力ファイル(recordId / modelInput の JSONL)を作成する。
+    recordId には入力のインデックスを使用する。
+
+    Args:
+        service (ISupportsBatchInference): バッチ推論ジョブに対応したモデルサービス
+        inputs (Sequence[MessageList | str]): 全入力
+        pending (Sequence[int]): 未処理の入力のインデックス
+        path (Path): 作成する入力ファイルのパス
+        writer (BulkInferenceWriter): 検証エラーを書き込むライター
+
+    Returns:
+        int: 入力ファイルのレコード数
+    """
+    records = 0
+    with path.open("wb") as f:
+        for index in pending:
+            user_input = inputs[index]
+            if isinstance(user_input, str):
+                writer.write({"index": index, "error": {"status_code": 422, "detail": user_input}})
+                continue
+            record = {"recordId": str(index), "modelInput": service.generate_batch_model_input(user_input)}
+            f.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+            records += 1
+    return records
+
+
+def read_batch_job_output(service: ISupportsBatchInference, path: Path, writer: BulkInferenceWriter) -> None:
+    """
+    バッチ推論ジョブの出力ファイル(recordId / modelOutput または error の JSONL)を結果として書き込む。
+
+    Args:
+        service (ISupportsBatchInference): バッチ推論ジョブに対応したモデルサービス
+        path (Path): 出力ファイルのパス
+        writer (BulkInferenceWriter): 結果のライター
+    """
+    with path.open("rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record: dict[str, Any] = orjson.loads(line)
+            index = int(record["recordId"])
+            if "modelOutput" not in record:
+                error = record.get("error", {})
+                writer.write({"index": index, "error": {"status_code": int(error.get("errorCode", 500)), "detail": str(error.get("errorMessage", ""))}})
+                continue
+            try:
+                writer.write({"index": index, "output": service.parse_batch_model_output(record["modelOutput"])})
+            except (KeyError, TypeError):
+                writer.write({"index": index, "error": {"status_code": 500, "detail": "レスポンスの構造が不正です"}})
+
+
+class BedrockBatchJob:
+    """
+    入力ファイルを S3 にアップロードして Bedrock のバッチ推論ジョブを実行し、出力ファイルを取得する。
+    S3 と Bedrock のエンドポイントは boto3 の環境変数(AWS_ENDPOINT_URL_S3 / AWS_ENDPOINT_URL_BEDROCK)で
+    ローカルの代替サービスに向けることができる。
+    """
+
+    def __init__(self, bedrock_client: BedrockClient, s3_client: S3Client) -> None:
+        self.bedrock_client = bedrock_client
+        self.s3_client = s3_client
+
+    def submit(self, input_path: Path, s3_uri: str, role_arn: str, model_id: str) -> str:
+        """
+        入力ファイルを S3 にアップロードし、バッチ推論ジョブを作成する。
+
+        Args:
+            input_path (Path): 入力ファイルのパス
+            s3_uri (str): 入出力ファイルを置く S3 のプレフィックス(s3://bucket/prefix)
+            role_arn (str): ジョブが S3 にアクセスするための IAM ロールの ARN
+            model_id (str): モデルID
+
+        Returns:
+            str: バッチ推論ジョブの ARN
+        """
+        job_name = f"bulk-inference-{datetime.now(tz=UTC).strftime('%Y%m%d%H%M%S')}"
+        bucket, prefix = _parse_s3_uri(s3_uri)
+        input_key = f"{prefix}{job_name}/input/{input_path.name}"
+        self.s3_client.upload_file(str(input_path), bucket, input_key)
+        response = self.bedrock_client.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=role_arn,
+            modelId=model_id,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{bucket}/{input_key}", "s3InputFormat": "JSONL"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"s3://{bucket}/{prefix}{job_name}/output/"}},
+        )
+        logger.info("バッチ推論ジョブを作成しました (job=%s)", response["jobArn"])
+        return response["jobArn"]
+
+    def wait(self, job_arn: str, poll_interval: float) -> str:
+        """
+        バッチ推論ジョブの終了を待つ。
+
+        Args:
+            job_arn (str): バッチ推論ジョブの ARN
+            poll_interval (float): 状態を確認する間隔(秒)
+
+        Raises:
+            BulkInferenceError: ジョブが失敗した場合
+
+        Returns:
+            str: ジョブの終了状態
+        """
+        while True:
+            job = self.bedrock_client.get_model_invocation_job(jobIdentifier=job_arn)
+            status = job["status"]
+            if status in BATCH_JOB_SUCCEEDED_STATUSES:
+                return status
+            if status in BATCH_JOB_FAILED_STATUSES:
+                msg = f"バッチ推論ジョブが終了しました (status={status}): {job.get('message', '')}"
+                raise BulkInferenceError(msg)
+            logger.info("バッチ推論ジョブの完了を待っています (status=%s)", status)
+            time.sleep(poll_interval)
+
+    def download_output(self, job_arn: str, local_path: Path) -> None:
+        """
+        バッチ推論ジョブの出力ファイルをダウンロードする。
+        出力ファイルは出力先プレフィックスの `<ジョブID>/<入力ファイル名>.out` に作成される。
+
+        Args:
+            job_arn (str): バッチ推論ジョブの ARN
+            local_path (Path): 保存先のパス
+        """
+        job = self.bedrock_client.get_model_invocation_job(jobIdentifier=job_arn)
+        input_name = job["inputDataConfig"]["s3InputDataConfig"]["s3Uri"].rsplit("/", 1)[-1]
+        bucket, prefix = _parse_s3_uri(job["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"])
+        job_id = job_arn.rsplit("/", 1)[-1]
+        self.s3_client.download_file(bucket, f"{prefix}{job_id}/{input_name}.out", str(local_path))
+
+
+def _parse_s3_uri(s3_uri: str) -> tuple[str, str]:
+    """
+    S3 の URI をバケット名と、末尾にスラッシュを付けたキーのプレフィックスに分解する。
+
+    Args:
+        s3_uri (str): S3 の URI
+
+    Raises:
+        BulkInferenceError: S3 の URI でない場合
+
+    Returns:
+        tuple[str, str]: バケット名とプレフィックス
+    """
+    parsed = urlparse(s3_uri)
+    if parsed.scheme != "s3" or not parsed.netloc:
+        msg = f"S3 の URI ではありません: {s3_uri}"
+        raise BulkInferenceError(msg)
+    prefix = parsed.path.strip("/")
+    return parsed.netloc, f"{prefix}/" if prefix else ""
@@ -0,0 +1,353 @@
+"""
+生成結果キャッシュを参照してから Bedrock を呼び出すランタイムを実装する。
+"""
+
+from __future__ import annotations
+
+import base64
+import contextlib
+import logging
+from typing import TYPE_CHECKING, Any, AsyncGenerator, cast
+
+import orjson
+
+from app.services.bedrock.completion_cache import COMPLETION_CACHE_MODE
+from app.services.bedrock.request_key import request_key
+from app.services.bedrock.runtime_wrapper import BedrockRuntimeWrapper
+from app.types.bedrock_type_defs import CompletionCacheMode
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from mypy_boto3_bedrock_runtime.type_defs import (
+        ConverseRequestRequestTypeDef,
+        ConverseResponseTypeDef,
+        ConverseStreamOutputTypeDef,
+        ConverseStreamRequestRequestTypeDef,
+        InvokeModelRequestRequestTypeDef,
+        InvokeModelWithResponseStreamRequestRequestTypeDef,
+        ResponseMetadataTypeDef,
+        ResponseStreamTypeDef,
+    )
+
+    from app.interfaces.bedrock_interface import BedrockRuntimeBase
+    from app.services.bedrock.completion_cache import CompletionCache
+    from app.types.bedrock_type_defs import (
+        ConverseStreamResultTypeDef,
+        InvokeModelResultTypeDef,
+        InvokeModelStreamResultTypeDef,
+    )
+
+
+logger = logging.getLogger(__name__)
+
+# キャッシュから返したレスポンスに付与するメタデータ
+CACHED_RESPONSE_METADATA: ResponseMetadataTypeDef = {
+    "RequestId": "",
+    "HTTPStatusCode": 200,
+    "HTTPHeaders": {},
+    "RetryAttempts": 0,
+}
+
+
+class CachedBedrockRuntime(BedrockRuntimeWrapper):
+    """
+    同一リクエストの生成結果をキャッシュから返すランタイム
+    - キーはモデルID・推論設定・正規化したメッセージ(invoke の場合はボディ)の正規化 JSON のハッシュ。
+    - temperature が設定の上限を超えるリクエストは出力が決定的でないため、キャッシュの対象外とする。
+    - converse と converse_stream は同じキーを共有し、どちらの結果もストリームとして再生できる。
+    - ストリームは最後まで読み切った場合のみ保存する。
+    """
+
+    def __init__(self, inner: BedrockRuntimeBase, cache: CompletionCache) -> None:
+        super().__init__(inner)
+        self.cache = cache
+
+    async def converse(self, request_args: ConverseRequestRequestTypeDef) -> ConverseResponseTypeDef:
+        """
+        キャッシュを参照してから Converse API を呼び出す。
+
+        Args:
+            request_args (ConverseRequestRequestTypeDef): converseに渡すパラメータ
+
+        Returns:
+            ConverseResponseTypeDef: モデルからのレスポンス
+        """
+        key = self._cache_key("converse", request_args, request_args.get("inferenceConfig", {}).get("temperature"))
+        if key is not None:
+            cached = await self._read(key)
+            if cached is not None:
+                return cast("ConverseResponseTypeDef", {**cached, "ResponseMetadata": CACHED_RESPONSE_METADATA})
+
+        response = await self.inner.converse(request_args)
+        if key is not None:
+            completion = {name: value for name, value in response.items() if name != "ResponseMetadata"}
+            if _is_text_completion(completion):
+                self._write(key, completion)
+        return response
+
+    async def converse_stream(self, request_args: ConverseStreamRequestRequestTypeDef) -> ConverseStreamResultTypeDef:
+        """
+        キャッシュを参照してから Converse Stream API を呼び出す。キャッシュにある場合はストリームとして再生する。
+
+        Args:
+            request_args (ConverseStreamRequestRequestTypeDef): converse_streamに渡すパラメータ
+
+        Returns:
+            ConverseStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        key = self._cache_key("converse", request_args, request_args.get("inferenceConfig", {}).get("temperature"))
+        if key is None:
+            return await self.inner.converse_stream(request_args)
+
+        cached = await self._read(key)
+        if cached is not None:
+            return {"stream": _replay_converse_stream(cached)}
+
+        response = await self.inner.converse_stream(request_args)
+        return {"stream": self._record_converse_stream(key, response["stream"])}
+
+    async def invoke_model(self, request_args: InvokeModelRequestRequestTypeDef) -> InvokeModelResultTypeDef:
+        """
+        キャッシュを参照してから Invoke Model API を呼び出す。
+
+        Args:
+            request_args (InvokeModelRequestRequestTypeDef): invoke_modelに渡すパラメータ
+
+        Returns:
+            InvokeModelResultTypeDef: 読み込み済みのボディを含むレスポンス
+        """
+        key = self._invoke_cache_key("invoke", request_args)
+        if key is not None:
+            cached = await self._read(key)
+            if cached is not None:
+                return {"body": base64.b64decode(cached["body"]), "contentType": cached["contentType"]}
+
+        response = await self.inner.invoke_model(request_args)
+        if key is not None:
+            self._write(key, {"body": base64.b64encode(response["body"]).decode(), "contentType": response["contentType"]})
+        return response
+
+    async def invoke_model_with_response_stream(self, request_args: InvokeModelWithResponseStreamRequestRequestTypeDef) -> InvokeModelStreamResultTypeDef:
+        """
+        キャッシュを参照してから Invoke Model With Response Stream API を呼び出す。キャッシュにある場合はストリームとして再生する。
+
+        Args:
+            request_args (InvokeModelWithResponseStreamRequestRequestTypeDef): invoke_model_with_response_streamに渡すパラメータ
+
+        Returns:
+            InvokeModelStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        key = self._invoke_cache_key("invoke_stream", request_args)
+        if key is None:
+            return await self.inner.invoke_model_with_response_stream(request_args)
+
+        cached = await self._read(key)
+        if cached is not None:
+            return {"body": _replay_invoke_stream(cached["chunks"]), "contentType": cached["contentType"]}
+
+        response = await self.inner.invoke_model_with_response_stream(request_args)
+        return {"body": self._record_invoke_stream(key, response["body"], response["contentType"]), "contentType": response["contentType"]}
+
+    def _cache_key(self, operation: str, request_args: Mapping[str, Any], temperature: float | None) -> str | None:
+        """
+        リクエストのキャッシュキーを作成する。キャッシュを使用しない場合はNoneを返す。
+
+        Args:
+            operation (str): キャッシュキーの名前空間(操作名)
+            request_args (Mapping[str, Any]): リクエストのパラメータ
+            temperature (float | None): リクエストの temperature
+
+        Returns:
+            str | None: キャッシュキー
+        """
+        if COMPLETION_CACHE_MODE.get() == CompletionCacheMode.BYPASS or temperature is None or temperature > self.cache.max_temperature:
+            self.cache.record_bypass()
+            return None
+        try:
+            return request_key(operation, request_args)
+        except TypeError:
+            # ファイルオブジェクト等、正規化できない値を含む場合はキャッシュしない
+            self.cache.record_bypass()
+            return None
+
+    def _invoke_cache_key(
+        self, operation: str, request_args: InvokeModelRequestRequestTypeDef | InvokeModelWithResponseStreamRequestRequestTypeDef
+    ) -> str | None:
+        """
+        invoke 系リクエストのキャッシュキーを作成する。JSON のボディは解析してから正規化する。
+
+        Args:
+            operation (str): キャッシュキーの名前空間(操作名)
+            request_args (InvokeModelRequestRequestTypeDef | InvokeModelWithResponseStreamRequestRequestTypeDef): リクエストのパラメータ
+
+        Returns:
+            str | None: キャッシュキー
+        """
+        body: Any = request_args.get("body")
+        if isinstance(body, (str, bytes)):
+            # JSON でないボディはそのままハッシュする
+            with contextlib.suppress(orjson.JSONDecodeError):
+                body = orjson.loads(body)
+        temperature = body.get("temperature") if isinstance(body, dict) else None
+        return self._cache_key(operation, {**request_args, "body": body}, temperature)
+
+    async def _read(self, key: str) -> dict[str, Any] | None:
+        """
+        キャッシュから生成結果を取得する。REFRESH 指定の場合は参照しない。
+
+        Args:
+            key (str): キャッシュキー
+
+        Returns:
+            dict[str, Any] | None: 生成結果
+        """
+        if COMPLETION_CACHE_MODE.get() == CompletionCacheMode.REFRESH:
+            return None
+        value = await self.cache.get(key)
+        if value is None:
+            return None
+        cached: dict[str, Any] = orjson.loads(value)
+        return cached
+
+    def _write(self, key: str, completion: dict[str, Any]) -> None:
+        """
+        生成結果をキャッシュに保存する。
+
+        Args:
+            key (str): キャッシュキー
+            completion (dict[str, Any]): 生成結果
+        """
+        self.cache.set(key, orjson.dumps(completion))
+
+    async def _record_converse_stream(self, key: str, stream: AsyncGenerator[ConverseStreamOutputTypeDef]) -> AsyncGenerator[ConverseStreamOutputTypeDef]:
+        """
+        ストリームのイベントを中継しながら記録し、最後まで読み切った場合に生成結果を保存する。
+
+        Args:
+            key (str): キャッシュキー
+            stream (AsyncGenerator[ConverseStreamOutputTypeDef]): 上流のストリーム
+
+        Yields:
+            ConverseStreamOutputTypeDef: ストリームのイベント
+        """
+        events: list[ConverseStreamOutputTypeDef] = []
+        try:
+            async for event in stream:
+                events.append(event)
+                yield event
+        finally:
+            await stream.aclose()
+
+        completion = _completion_from_events(events)
+        if completion is not None:
+            self._write(key, completion)
+
+    async def _record_invoke_stream(self, key: str, stream: AsyncGenerator[ResponseStreamTypeDef], content_type: str) -> AsyncGenerator[ResponseStreamTypeDef]:
+        """
+        ストリームのチャンクを中継しながら記録し、最後まで読み切った場合に保存する。
+
+        Args:
+            key (str): キャッシュキー
+            stream (AsyncGenerator[ResponseStreamTypeDef]): 上流のストリーム
+            content_type (str): レスポンスのコンテンツタイプ
+
+        Yields:
+            ResponseStreamTypeDef: ストリームのイベント
+        """
+        chunks: list[str] = []
+        try:
+            async for event in stream:
+                if "chunk" in event:
+                    chunks.append(base64.b64encode(event["chunk"]["bytes"]).decode())
+                yield event
+        finally:
+            await stream.aclose()
+
+        self._write(key, {"chunks": chunks, "contentType": content_type})
+
+
+def _is_text_completion(completion: Mapping[str, Any]) -> bool:
+    """
+    生成結果がテキストのみで構成されているか判定する。ストリームとして再生できるのはテキストのみ。
+
+    Args:
+        completion (Mapping[str, Any]): converse の生成結果
+
+    Returns:
+        bool: テキストのみの場合はTrue
+    """
+    content = completion.get("output", {}).get("message", {}).get("content")
+    return bool(content) and all(set(block) == {"text"} for block in content)
+
+
+def _completion_from_events(events: list[ConverseStreamOutputTypeDef]) -> dict[str, Any] | None:
+    """
+    converse_stream のイベントから converse と同じ形式の生成結果を組み立てる。
+
+    Args:
+        events (list[ConverseStreamOutputTypeDef]): ストリームのイベント
+
+    Returns:
+        dict[str, Any] | None: 生成結果。テキスト以外を含む、または完了していない場合はNone
+    """
+    role = "assistant"
+    blocks: dict[int, list[str]] = {}
+    stop_reason: str | None = None
+    metadata: dict[str, Any] = {}
+    for event in events:
+        if "messageStart" in event:
+            role = event["messageStart"]["role"]
+        elif "contentBlockStart" in event:
+            return None
+        elif "contentBlockDelta" in event:
+            delta = event["contentBlockDelta"]["delta"]
+            if "text" not in delta:
+                return None
+            blocks.setdefault(event["contentBlockDelta"]["contentBlockIndex"], []).append(delta["text"])
+        elif "messageStop" in event:
+            stop_reason = event["messageStop"]["stopReason"]
+        elif "metadata" in event:
+            metadata = dict(event["metadata"])
+
+    if stop_reason is None or not blocks:
+        return None
+    return {
+        "output": {"message": {"role": role, "content": [{"text": "".join(blocks[index])} for index in sorted(blocks)]}},
+        "stopReason": stop_reason,
+        "usage": metadata.get("usage", {}),
+        "metrics": metadata.get("metrics", {}),
+    }
+
+
+async def _replay_converse_stream(completion: dict[str, Any]) -> AsyncGenerator[ConverseStreamOutputTypeDef]:
+    """
+    キャッシュした生成結果を converse_stream のイベントとして再生する。
+
+    Args:
+        completion (dict[str, Any]): converse の生成結果
+
+    Yields:
+        ConverseStreamOutputTypeDef: ストリームのイベント
+    """
+    message = completion["output"]["message"]
+    yield {"messageStart": {"role": message["role"]}}
+    for index, block in enumerate(message["content"]):
+        yield {"contentBlockDelta": {"contentBlockIndex": index, "delta": {"text": block["text"]}}}
+        yield {"contentBlockStop": {"contentBlockIndex": index}}
+    yield {"messageStop": {"stopReason": completion["stopReason"]}}
+    yield cast("ConverseStreamOutputTypeDef", {"metadata": {"usage": completion["usage"], "metrics": completion["metrics"]}})
+
+
+async def _replay_invoke_stream(chunks: list[str]) -> AsyncGenerator[ResponseStreamTypeDef]:
+    """
+    キャッシュしたチャンクを invoke_model_with_response_stream のイベントとして再生する。
+
+    Args:
+        chunks (list[str]): Base64 エンコードしたチャンク
+
+    Yields:
+        ResponseStreamTypeDef: ストリームのイベント
+    """
+    for chunk in chunks:
+        yield {"chunk": {"bytes": base64.b64decode(chunk)}}
@@ -0,0 +1,210 @@
+"""
+1 つの WebSocket 接続で複数ターンの会話を行い、応答の差分をストリーミングで返す処理を実装する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+from typing import TYPE_CHECKING, Any, cast
+
+import orjson
+from fastapi import HTTPException, WebSocketDisconnect
+from pydantic import TypeAdapter, ValidationError
+from starlette import status
+
+from app.config.base_config import PRODUCTION_FLAG
+from app.schemas.bedrock_schema import ChatSocketCancel, ChatSocketRequest, ChatSocketUserMessage, Message, MessageList
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from fastapi import WebSocket
+    from mypy_boto3_bedrock_runtime.type_defs import MessageTypeDef
+
+    from app.interfaces.bedrock_interface import ISupportsConverseStream
+    from app.services.bedrock.attachment_offload import AttachmentOffloader
+    from app.types.bedrock_type_defs import ChatSocketConfigTypeDef
+
+
+logger = logging.getLogger(__name__)
+
+CHAT_SOCKET_REQUEST_ADAPTER: TypeAdapter[ChatSocketUserMessage | ChatSocketCancel] = TypeAdapter(ChatSocketRequest)
+
+
+class ChatSocketSession:
+    """
+    1 つの WebSocket 接続の会話
+    - 会話履歴は接続が続く間サーバー側で保持し、クライアントは新しい発話のみを送る。検証も新しい発話のみに行う。
+    - 応答は converse_stream_events のイベントを、応答のIDを付けた JSON のテキストフレームとして返す。
+    - 生成中の応答はクライアントの cancel で取り消せる。取り消した、もしくは失敗したターンは会話履歴に残さない。
+    - 同時に生成できる応答の数を max_concurrent_turns に制限し、超えた発話は 429 のエラーを返す。
+      複数の応答を同時に生成する場合、各ターンは開始時点の会話履歴を使い、完了した順に会話履歴へ追加する。
+    - 生成中の応答がなく、idle_timeout 秒メッセージを受信しない場合は接続を閉じる。
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        service: ISupportsConverseStream,
+        config: ChatSocketConfigTypeDef,
+        attachment_offloader: AttachmentOffloader | None = None,
+    ) -> None:
+        self.websocket = websocket
+        self.service = service
+        self.config = config
+        self.attachment_offloader = attachment_offloader
+        self.history: list[MessageTypeDef] = []
+        self._turns: dict[str, asyncio.Task[None]] = {}
+        self._turn_ids = itertools.count(1)
+        self._last_activity = 0.0
+
+    async def run(self) -> None:
+        """
+        接続が閉じられるまで、クライアントからのメッセージを処理する。終了時は生成中の応答を取り消す。
+        """
+        loop = asyncio.get_running_loop()
+        self._last_activity = loop.time()
+        try:
+            while True:
+                # 生成中は待ち時間を延長し、生成が終わってから idle_timeout 秒で閉じる
+                idle_since = loop.time() if self._turns else self._last_activity
+                try:
+                    async with asyncio.timeout_at(idle_since + self.config["idle_timeout"]):
+                        message = await self.websocket.receive()
+                except TimeoutError:
+                    if self._turns or loop.time() < self._last_activity + self.config["idle_timeout"]:
+                        continue
+                    logger.info("WebSocket の接続を閉じます (無通信の時間が上限を超えました)")
+                    await self.websocket.close(code=status.WS_1000_NORMAL_CLOSURE, reason="idle timeout")
+                    return
+                if message["type"] == "websocket.disconnect":
+                    return
+                self._last_activity = loop.time()
+                await self._dispatch(message)
+        except WebSocketDisconnect:
+            return
+        finally:
+            await self._cancel_turns(list(self._turns))
+
+    async def _dispatch(self, message: Mapping[str, Any]) -> None:
+        """
+        クライアントからのメッセージを検証し、発話であれば応答の生成を開始し、cancel であれば取り消す。
+
+        Args:
+            message (Mapping[str, Any]): 受信した ASGI のメッセージ
+        """
+        text = message.get("text")
+        if text is None:
+            await self._send_error(None, status.HTTP_400_BAD_REQUEST, "メッセージは JSON のテキストで送信してください")
+            return
+        try:
+            request = CHAT_SOCKET_REQUEST_ADAPTER.validate_json(text)
+        except ValidationError as e:
+            await self._send_error(None, status.HTTP_422_UNPROCESSABLE_ENTITY, e.json(include_url=False))
+            return
+
+        if isinstance(request, ChatSocketCancel):
+            turn_ids = list(self._turns) if request.id is None else [request.id]
+            for turn_id in await self._cancel_turns(turn_ids):
+                await self._send({"type": "cancelled", "id": turn_id})
+            return
+
+        turn_id = request.id if request.id is not None else str(next(self._turn_ids))
+        if turn_id in self._turns:
+            await self._send_error(turn_id, status.HTTP_409_CONFLICT, "同じIDの応答を生成中です")
+            return
+        if len(self._turns) >= self.config["max_concurrent_turns"]:
+            await self._send_error(turn_id, status.HTTP_429_TOO_MANY_REQUESTS, "生成中の応答が上限に達しています")
+            return
+        turn = asyncio.create_task(self._run_turn(turn_id, request))
+        self._turns[turn_id] = turn
+        turn.add_done_callback(lambda _: self._finish_turn(turn_id))
+
+    async def _run_turn(self, turn_id: str, request: ChatSocketUserMessage) -> None:
+        """
+        新しい発話に対する応答を生成して返し、完了したら発話と応答を会話履歴に追加する。
+
+        Args:
+            turn_id (str): 応答のID
+            request (ChatSocketUserMessage): 新しい発話
+        """
+        try:
+            message_list = MessageList.model_construct(messages=[Message.model_construct(role="user", content=request.content)])
+            new_messages = list(self.service.generate_converse_stream_messages(message_list))
+            if self.attachment_offloader is not None:
+                new_messages = cast("list[MessageTypeDef]", await self.attachment_offloader.offload(new_messages))
+
+            reply: list[str] = []
+            events = self.service.converse_stream_events([*self.history, *new_messages])
+            try:
+                async for event in events:
+                    if event["event"] == "delta":
+                        reply.append(event["data"]["text"])
+                    await self._send({"type": event["event"], "id": turn_id, **event["data"]})
+            finally:
+                await events.aclose()
+        except HTTPException as e:
+            await self._send_error(turn_id, e.status_code, e.detail)
+            return
+        except WebSocketDisconnect:
+            raise
+        except Exception:
+            logger.exception("WebSocket の応答の生成中にエラーが発生しました")
+            await self._send_error(turn_id, status.HTTP_500_INTERNAL_SERVER_ERROR, "応答の生成中にエラーが発生しました")
+            return
+
+        self.history.extend([*new_messages, {"role": "assistant", "content": [{"text": "".join(reply)}]}])
+
+    def _finish_turn(self, turn_id: str) -> None:
+        """
+        終了したターンを生成中の一覧から除く。
+
+        Args:
+            turn_id (str): 応答のID
+        """
+        turn = self._turns.pop(turn_id, None)
+        self._last_activity = asyncio.get_running_loop().time()
+        if turn is not None and not turn.cancelled() and turn.exception() is not None:
+            # 接続が閉じられて送信できなかった場合。接続の終了は受信側で検知する
+            logger.debug("WebSocket の応答を送信できませんでした", exc_info=turn.exception())
+
+    async def _cancel_turns(self, turn_ids: list[str]) -> list[str]:
+        """
+        生成中の応答を取り消し、終了を待つ。
+
+        Args:
+            turn_ids (list[str]): 取り消す応答のID
+
+        Returns:
+            list[str]: 取り消した応答のID
+        """
+        turns = {turn_id: self._turns[turn_id] for turn_id in turn_ids if turn_id in self._turns}
+        for turn in turns.values():
+            turn.cancel()
+        if turns:
+            await asyncio.wait(turns.values())
+        return [turn_id for turn_id, turn in turns.items() if turn.cancelled()]
+
+    async def _send(self, payload: dict[str, Any]) -> None:
+        """
+        JSON のテキストフレームを送信する。
+
+        Args:
+            payload (dict[str, Any]): 送信する内容
+        """
+        await self.websocket.send_text(orjson.dumps(payload).decode())
+
+    async def _send_error(self, turn_id: str | None, status_code: int, detail: Any) -> None:  # noqa: ANN401
+        """
+        エラーを送信する。HTTP のエラーハンドラーと同じく、本番環境では流量制限(429)以外の詳細を隠す。
+
+        Args:
+            turn_id (str | None): 応答のID。特定の応答に対するエラーでない場合はNone
+            status_code (int): HTTP のステータスコード
+            detail (Any): エラーの詳細
+        """
+        if PRODUCTION_FLAG and status_code != status.HTTP_429_TOO_MANY_REQUESTS:
+            status_code, detail = status.HTTP_500_INTERNAL_SERVER_ERROR, "Internal Server Error"
+        await self._send({"type": "error", "id": turn_id, "status_code": status_code, "detail": detail})
@@ -0,0 +1,277 @@
+"""
+プロセス全体で共有する Bedrock ランタイムクライアントのレジストリを実装する。
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from app.services.bedrock.cached_runtime import CachedBedrockRuntime
+from app.services.bedrock.concurrency_limiter import ConcurrencyLimitedBedrockRuntime
+from app.services.bedrock.hedging import HedgedBedrockRuntime
+from app.services.bedrock.instrumented_runtime import InstrumentedBedrockRuntime
+from app.services.bedrock.region_router import RoutedBedrockRuntime
+from app.services.bedrock.single_flight import SingleFlightBedrockRuntime
+from app.services.metrics.thread_pool import InstrumentedThreadPoolExecutor
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    import httpx
+
+    from app.interfaces.bedrock_interface import BedrockRuntimeBase
+    from app.types.bedrock_type_defs import BedrockClientConfigTypeDef, BedrockClientLayersTypeDef, BedrockClientPoolStatsTypeDef, ModelType
+
+
+logger = logging.getLogger(__name__)
+
+
+class BedrockClientRegistry:
+    """
+    (リージョン, モデル) ごとに Bedrock ランタイムを 1 つだけ生成して使い回すレジストリ。
+    FastAPI の lifespan で生成し、リクエスト間で共有する。
+    設定の transport に応じて boto3 経由のランタイムかネイティブ非同期 HTTP のランタイムを生成する。
+    生成結果キャッシュ・single-flight・ヘッジ・リージョンの選択・同時実行数制御が指定された場合は、
+    キャッシュ → single-flight → ヘッジ → リージョンの選択 → 同時実行数制御 → 通信の順に包む。
+    同時実行数制御 → 通信のランタイムはリージョンごとに生成してレジストリが所有し、ヘッジとリージョンの選択はそれを共有する。
+    メトリクスの記録が指定された場合は、通信のランタイムを直接包んで上流の呼び出しのみを記録する。
+    """
+
+    def __init__(
+        self,
+        default_region: str,
+        client_config: BedrockClientConfigTypeDef,
+        layers: BedrockClientLayersTypeDef | None = None,
+    ) -> None:
+        layers = layers or {}
+        self.default_region = default_region
+        self.client_config = client_config
+        self.completion_cache = layers.get("completion_cache")
+        self.single_flight = layers.get("single_flight")
+        self.concurrency_limiter = layers.get("concurrency_limiter")
+        self.hedger = layers.get("hedger")
+        self.region_router = layers.get("region_router")
+        self.instrumented = layers.get("instrumented", False)
+        # boto3 は読み込みに時間がかかるため、モジュールの読み込み時ではなくレジストリの生成時(lifespan のウォームアップ)に読み込む
+        import boto3.session
+        import botocore.session
+
+        # boto3 の Session はスレッドセーフではないため、クライアント生成はロック内で行う
+        self._botocore_session = botocore.session.get_session()
+        self._session = boto3.session.Session(botocore_session=self._botocore_session)
+        self._clients: dict[tuple[str | None, ModelType], BedrockRuntimeBase] = {}
+        self._region_clients: dict[tuple[str, ModelType], BedrockRuntimeBase] = {}
+        self._lock = threading.Lock()
+        self._http_client: httpx.AsyncClient | None = None
+        self._stream_executor: ThreadPoolExecutor | None = None
+
+    def get_client(self, model_type: ModelType, region: str | None = None) -> BedrockRuntimeBase:
+        """
+        指定されたモデル・リージョン用のランタイムを返す。未生成の場合は生成して登録する。
+
+        Args:
+            model_type (ModelType): モデルの種類
+            region (str | None, optional): リージョン。省略時はリージョンの選択が有効であればリクエストごとに選び、無効であればデフォルトリージョン
+
+        Returns:
+            BedrockRuntimeBase: bedrock用ランタイム
+        """
+        key = (region, model_type)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._create_wrapped_client(model_type, region)
+                self._clients[key] = client
+        return client
+
+    async def warm_up(self, model_types: Iterable[ModelType], region: str | None = None) -> None:
+        """
+        ランタイムを生成し、コネクションを事前に確立しておく。
+
+        Args:
+            model_types (Iterable[ModelType]): 事前に準備するモデルの種類
+            region (str | None, optional): リージョン。省略時は get_client と同じ
+        """
+        for model_type in model_types:
+            self.get_client(model_type, region)
+            for (client_region, client_model_type), client in list(self._region_clients.items()):
+                if client_model_type == model_type:
+                    await client.warm_up(self.client_config["warmup_connections"])
+                    logger.info("ランタイムの準備が完了しました (model=%s, region=%s)", model_type.value, client_region)
+
+    def pool_stats(self) -> list[BedrockClientPoolStatsTypeDef]:
+        """
+        各ランタイムのコネクションプール使用状況を返す。
+
+        Returns:
+            list[BedrockClientPoolStatsTypeDef]: ランタイムごとのプール使用状況
+        """
+        stats: list[BedrockClientPoolStatsTypeDef] = []
+        for (region, model_type), client in list(self._region_clients.items()):
+            pool_stats = client.pool_stats()
+            if pool_stats is not None:
+                stats.append({"region": region, "model_type": model_type.value, **pool_stats})
+        return stats
+
+    async def aclose(self) -> None:
+        """
+        すべてのランタイムと共有コネクションプールを閉じる。
+        """
+        with self._lock:
+            clients = list(self._region_clients.values())
+            self._clients.clear()
+            self._region_clients.clear()
+        for client in clients:
+            await client.aclose()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        if self._stream_executor is not None:
+            self._stream_executor.shutdown(wait=False, cancel_futures=True)
+            self._stream_executor = None
+
+    def _create_wrapped_client(self, model_type: ModelType, region: str | None) -> BedrockRuntimeBase:
+        """
+        リージョンごとのランタイムを、設定に応じてリージョンの選択・ヘッジ・single-flight・キャッシュで包む。
+
+        Args:
+            model_type (ModelType): モデルの種類
+            region (str | None): リージョン。Noneの場合はリージョンの選択が有効であればリクエストごとに選ぶ
+
+        Returns:
+            BedrockRuntimeBase: bedrock用ランタイム
+        """
+        client: BedrockRuntimeBase
+        hedge_client: BedrockRuntimeBase | None = None
+        if region is None and self.region_router is not None:
+            region_clients = {routing_region: self._region_client(routing_region, model_type) for routing_region in self.region_router.config["regions"]}
+            client = RoutedBedrockRuntime(region_clients, self.region_router)
+            if self.hedger is not None and len(region_clients) > 1:
+                hedge_client = RoutedBedrockRuntime(region_clients, self.region_router, hedge=True)
+        else:
+            region = region or self.default_region
+            client = self._region_client(region, model_type)
+            if self.hedger is not None and self.hedger.config["region"] != region:
+                hedge_client = self._region_client(self.hedger.config["region"], model_type)
+
+        if self.hedger is not None and hedge_client is not None:
+            client = HedgedBedrockRuntime(client, hedge_client, self.hedger)
+        if self.single_flight is not None:
+            client = SingleFlightBedrockRuntime(client, self.single_flight)
+        if self.completion_cache is not None:
+            client = CachedBedrockRuntime(client, self.completion_cache)
+        return client
+
+    def _region_client(self, region: str, model_type: ModelType) -> BedrockRuntimeBase:
+        """
+        リージョンごとのランタイムを返す。未生成の場合は生成して登録する。ロック内で呼び出すこと。
+
+        Args:
+            region (str): リージョン
+            model_type (ModelType): モデルの種類
+
+        Returns:
+            BedrockRuntimeBase: 同時実行数制御で包んだ bedrock用ランタイム
+        """
+        key = (region, model_type)
+        client = self._region_clients.get(key)
+        if client is None:
+            client = self._region_clients[key] = self._create_limited_client(region)
+        return client
+
+    def _create_limited_client(self, region: str) -> BedrockRuntimeBase:
+        """
+        ランタイムを生成し、メトリクスの記録・同時実行数制御が指定された場合はそれで包む。
+
+        Args:
+            region (str): リージョン
+
+        Returns:
+            BedrockRuntimeBase: bedrock用ランタイム
+        """
+        client = self._create_client(region)
+        if self.instrumented:
+            client = InstrumentedBedrockRuntime(client, region)
+        if self.concurrency_limiter is not None:
+            client = ConcurrencyLimitedBedrockRuntime(client, self.concurrency_limiter)
+        return client
+
+    def _create_client(self, region: str) -> BedrockRuntimeBase:
+        """
+        設定値を適用したランタイムを生成する。
+
+        Args:
+            region (str): リージョン
+
+        Returns:
+            BedrockRuntimeBase: bedrock用ランタイム
+        """
+        # 使う通信方式のランタイムのみ読み込む
+        if self.client_config["transport"] == "http":
+            from app.services.bedrock.http_runtime import HttpBedrockRuntime
+
+            return HttpBedrockRuntime(
+                http_client=self._shared_http_client(),
+                service_model=self._botocore_session.get_service_model("bedrock-runtime"),
+                credentials=self._session.get_credentials(),
+                region=region,
+                client_config=self.client_config,
+            )
+
+        from botocore.config import Config
+
+        from app.services.bedrock.boto3_runtime import Boto3BedrockRuntime
+
+        config = Config(
+            max_pool_connections=self.client_config["max_pool_connections"],
+            connect_timeout=self.client_config["connect_timeout"],
+            read_timeout=self.client_config["read_timeout"],
+            retries={"max_attempts": self.client_config["max_attempts"], "mode": self.client_config["retry_mode"]},
+            tcp_keepalive=self.client_config["tcp_keepalive"],
+        )
+        client = self._session.client(service_name="bedrock-runtime", region_name=region, endpoint_url=self.client_config["endpoint_url"], config=config)
+        return Boto3BedrockRuntime(client, stream_executor=self._shared_stream_executor(), client_config=self.client_config)
+
+    def _shared_stream_executor(self) -> ThreadPoolExecutor:
+        """
+        boto3 のストリーム読み込み用に全ランタイムで共有するスレッドプールを返す。
+        `asyncio.to_thread` が使う既定のスレッドプールとは分け、長時間のストリームが API 呼び出しを詰まらせないようにする。
+
+        Returns:
+            ThreadPoolExecutor: ストリーム読み込み用のスレッドプール
+        """
+        if self._stream_executor is None:
+            if self.instrumented:
+                self._stream_executor = InstrumentedThreadPoolExecutor(
+                    "bedrock-stream", max_workers=self.client_config["stream_pump_threads"], thread_name_prefix="bedrock-stream"
+                )
+            else:
+                self._stream_executor = ThreadPoolExecutor(max_workers=self.client_config["stream_pump_threads"], thread_name_prefix="bedrock-stream")
+        return self._stream_executor
+
+    def _shared_http_client(self) -> httpx.AsyncClient:
+        """
+        全ランタイムで共有する HTTP/2 対応の非同期コネクションプールを返す。
+
+        Returns:
+            httpx.AsyncClient: 非同期HTTPクライアント
+        """
+        if self._http_client is None:
+            import httpx
+
+            self._http_client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=self.client_config["max_pool_connections"],
+                    max_keepalive_connections=self.client_config["max_pool_connections"],
+                ),
+                timeout=httpx.Timeout(self.client_config["read_timeout"], connect=self.client_config["connect_timeout"]),
+            )
+        return self._http_client
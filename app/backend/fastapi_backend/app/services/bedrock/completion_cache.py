@@ -0,0 +1,271 @@
+"""
+生成結果をメモリ(LRU)とディスク(sqlite)の 2 層で保持するキャッシュを実装する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from app.types.bedrock_type_defs import CompletionCacheMode
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from app.types.bedrock_type_defs import CompletionCacheConfigTypeDef, CompletionCacheStatsTypeDef
+
+
+logger = logging.getLogger(__name__)
+
+# リクエストごとのキャッシュの利用方法。依存関数でリクエストヘッダーから設定する
+COMPLETION_CACHE_MODE: ContextVar[CompletionCacheMode] = ContextVar("completion_cache_mode", default=CompletionCacheMode.USE)
+
+# キャッシュの利用方法を指定するリクエストヘッダー
+COMPLETION_CACHE_HEADER: str = "x-bedrock-cache"
+
+# ディスク層の期限切れ・超過分を削除する間隔(保存回数)
+DISK_PRUNE_INTERVAL: int = 100
+
+# ディスク層のロック待ちの最大時間(秒)。複数ワーカーで同じファイルを共有する場合に使用する
+DISK_BUSY_TIMEOUT: float = 5.0
+
+
+def completion_cache_mode_from_headers(headers: Mapping[str, str]) -> CompletionCacheMode:
+    """
+    リクエストヘッダーからキャッシュの利用方法を判定する。
+    `X-Bedrock-Cache` を優先し、指定がない場合は `Cache-Control` の no-store / no-cache を参照する。
+
+    Args:
+        headers (Mapping[str, str]): リクエストヘッダー
+
+    Returns:
+        CompletionCacheMode: キャッシュの利用方法
+    """
+    value = headers.get(COMPLETION_CACHE_HEADER)
+    if value is not None:
+        try:
+            return CompletionCacheMode(value.strip().lower())
+        except ValueError:
+            logger.warning("不明なキャッシュ指定のため無視します: %s", value)
+
+    directives = {directive.strip().lower() for directive in headers.get("cache-control", "").split(",")}
+    if "no-store" in directives:
+        return CompletionCacheMode.BYPASS
+    if "no-cache" in directives:
+        return CompletionCacheMode.REFRESH
+    return CompletionCacheMode.USE
+
+
+class CompletionCache:
+    """
+    シリアライズ済みの生成結果を保持する 2 層キャッシュ
+    - メモリ層: 使用バイト数で上限を設けた LRU。期限切れのエントリは参照時に破棄する。
+    - ディスク層: sqlite に保存し、再起動後も利用できる。読み書きはスレッドで行い、書き込みは応答を待たせない。
+    """
+
+    def __init__(self, config: CompletionCacheConfigTypeDef) -> None:
+        self.max_bytes = config["max_bytes"]
+        self.ttl_seconds = config["ttl_seconds"]
+        self.max_temperature = config["max_temperature"]
+        self.disk_max_entries = config["disk_max_entries"]
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._bytes = 0
+        self._disk: sqlite3.Connection | None = None
+        self._disk_lock = threading.Lock()
+        self._disk_writes = 0
+        self._pending_writes: set[asyncio.Task[None]] = set()
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._bypasses = 0
+        self._stores = 0
+        self._evictions = 0
+        if config["disk_path"]:
+            self._disk = self._open_disk(Path(config["disk_path"]))
+
+    async def get(self, key: str) -> bytes | None:
+        """
+        キャッシュからエントリを取得する。メモリ層になければディスク層を参照し、見つかればメモリ層へ昇格する。
+
+        Args:
+            key (str): キャッシュキー
+
+        Returns:
+            bytes | None: シリアライズ済みの生成結果。存在しない場合はNone
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self._memory_hits += 1
+                return value
+            self._discard(key)
+
+        if self._disk is not None:
+            row = await asyncio.to_thread(self._disk_get, key)
+            if row is not None:
+                value, expires_at = row
+                self._put_memory(key, value, expires_at - time.time())
+                self._disk_hits += 1
+                return value
+
+        self._misses += 1
+        return None
+
+    def set(self, key: str, value: bytes) -> None:
+        """
+        エントリを保存する。ディスク層への書き込みはバックグラウンドで行う。
+
+        Args:
+            key (str): キャッシュキー
+            value (bytes): シリアライズ済みの生成結果
+        """
+        self._put_memory(key, value, self.ttl_seconds)
+        self._stores += 1
+        if self._disk is not None:
+            task = asyncio.create_task(asyncio.to_thread(self._disk_set, key, value, time.time() + self.ttl_seconds))
+            self._pending_writes.add(task)
+            task.add_done_callback(self._pending_writes.discard)
+
+    def record_bypass(self) -> None:
+        """
+        キャッシュを素通りしたリクエストを記録する。
+        """
+        self._bypasses += 1
+
+    def stats(self) -> CompletionCacheStatsTypeDef:
+        """
+        キャッシュの統計情報を返す。
+
+        Returns:
+            CompletionCacheStatsTypeDef: キャッシュの統計情報
+        """
+        hits = self._memory_hits + self._disk_hits
+        lookups = hits + self._misses
+        return {
+            "memory_hits": self._memory_hits,
+            "disk_hits": self._disk_hits,
+            "misses": self._misses,
+            "bypasses": self._bypasses,
+            "stores": self._stores,
+            "evictions": self._evictions,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "disk_enabled": self._disk is not None,
+        }
+
+    async def aclose(self) -> None:
+        """
+        未完了のディスク書き込みを待ってから、ディスク層を閉じる。
+        """
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.close()
+            self._disk = None
+
+    def _put_memory(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        """
+        メモリ層にエントリを保存し、上限を超えた分を古い順に追い出す。
+
+        Args:
+            key (str): キャッシュキー
+            value (bytes): シリアライズ済みの生成結果
+            ttl_seconds (float): 有効期間(秒)
+        """
+        if len(value) > self.max_bytes or ttl_seconds <= 0:
+            return
+        self._discard(key)
+        self._entries[key] = (time.monotonic() + ttl_seconds, value)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._evictions += 1
+
+    def _discard(self, key: str) -> None:
+        """
+        メモリ層からエントリを削除する。
+
+        Args:
+            key (str): キャッシュキー
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    @staticmethod
+    def _open_disk(path: Path) -> sqlite3.Connection:
+        """
+        ディスク層の sqlite データベースを開き、期限切れのエントリを削除する。
+
+        Args:
+            path (Path): データベースのファイルパス
+
+        Returns:
+            sqlite3.Connection: データベース接続
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        disk = sqlite3.connect(path, timeout=DISK_BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+        disk.execute("PRAGMA journal_mode=WAL")
+        disk.execute("PRAGMA synchronous=NORMAL")
+        disk.execute("CREATE TABLE IF NOT EXISTS completion_cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)")
+        disk.execute("CREATE INDEX IF NOT EXISTS completion_cache_expires_at ON completion_cache (expires_at)")
+        disk.execute("DELETE FROM completion_cache WHERE expires_at <= ?", (time.time(),))
+        logger.info("生成結果キャッシュのディスク層を開きました (path=%s)", path)
+        return disk
+
+    def _disk_get(self, key: str) -> tuple[bytes, float] | None:
+        """
+        ディスク層から有効期限内のエントリを取得する。
+
+        Args:
+            key (str): キャッシュキー
+
+        Returns:
+            tuple[bytes, float] | None: シリアライズ済みの生成結果と有効期限(UNIX時間)
+        """
+        with self._disk_lock:
+            if self._disk is None:
+                return None
+            try:
+                row = self._disk.execute("SELECT value, expires_at FROM completion_cache WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+            except sqlite3.Error as e:
+                logger.warning("生成結果キャッシュのディスク層の読み込みに失敗しました: %s", e)
+                return None
+        return (row[0], row[1]) if row is not None else None
+
+    def _disk_set(self, key: str, value: bytes, expires_at: float) -> None:
+        """
+        ディスク層にエントリを保存し、一定回数ごとに期限切れ・超過分を削除する。
+
+        Args:
+            key (str): キャッシュキー
+            value (bytes): シリアライズ済みの生成結果
+            expires_at (float): 有効期限(UNIX時間)
+        """
+        with self._disk_lock:
+            if self._disk is None:
+                return
+            try:
+                self._disk.execute("INSERT OR REPLACE INTO completion_cache (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at))
+                self._disk_writes += 1
+                if self._disk_writes % DISK_PRUNE_INTERVAL == 0:
+                    self._disk.execute("DELETE FROM completion_cache WHERE expires_at <= ?", (time.time(),))
+                    self._disk.execute(
+                        "DELETE FROM completion_cache WHERE key IN (SELECT key FROM completion_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                        (self.disk_max_entries,),
+                    )
+            except sqlite3.Error as e:
+                logger.warning("生成結果キャッシュのディスク層への書き込みに失敗しました: %s", e)
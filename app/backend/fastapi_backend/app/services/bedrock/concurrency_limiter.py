@@ -0,0 +1,375 @@
+"""
+Bedrock のスロットリングに追従して、モデルごとの同時実行数を適応的に制御する(AIMD)。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import weakref
+from collections import deque
+from typing import TYPE_CHECKING, AsyncGenerator, TypeVar
+
+from app.services.bedrock.bedrock_errors import BedrockThrottlingError, is_throttling_error
+from app.services.bedrock.runtime_wrapper import BedrockRuntimeWrapper
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from mypy_boto3_bedrock_runtime.type_defs import (
+        ConverseRequestRequestTypeDef,
+        ConverseResponseTypeDef,
+        ConverseStreamOutputTypeDef,
+        ConverseStreamRequestRequestTypeDef,
+        InvokeModelRequestRequestTypeDef,
+        InvokeModelWithResponseStreamRequestRequestTypeDef,
+        ResponseStreamTypeDef,
+    )
+
+    from app.interfaces.bedrock_interface import BedrockRuntimeBase
+    from app.types.bedrock_type_defs import (
+        ConcurrencyLimiterConfigTypeDef,
+        ConcurrencyLimiterStatsTypeDef,
+        ConverseStreamResultTypeDef,
+        InvokeModelResultTypeDef,
+        InvokeModelStreamResultTypeDef,
+    )
+
+
+logger = logging.getLogger(__name__)
+
+ResultT = TypeVar("ResultT")
+EventT = TypeVar("EventT")
+
+# 待機時間の指数移動平均の平滑化係数
+WAIT_TIME_EWMA_ALPHA = 0.2
+
+
+class _ModelLimiter:
+    """
+    1 モデル分の同時実行数の上限と、空きを待つリクエストのキュー
+    - 成功するたびに上限を additive_increase / 上限 だけ増やす(上限 1 つ分の成功で additive_increase 増える)。
+    - スロットリングされると上限に multiplicative_decrease を乗じる。
+      同じ上限のもとで開始したリクエストが続けてスロットリングされても、減らすのは 1 回のみとする。
+    """
+
+    def __init__(self, model_id: str, config: ConcurrencyLimiterConfigTypeDef) -> None:
+        self.model_id = model_id
+        self.config = config
+        self.limit = float(config["initial_limit"])
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._last_decrease = 0.0
+        self._wait_time_ewma = 0.0
+        self._wait_time_max = 0.0
+        self._successes = 0
+        self._throttles = 0
+        self._rejections = 0
+
+    async def acquire(self, operation_name: str) -> float:
+        """
+        実行枠を確保する。空きがない場合は queue_timeout まで待機する。
+
+        Args:
+            operation_name (str): 呼び出す API 名
+
+        Raises:
+            BedrockThrottlingError: 待機の上限を超えた、または待機がタイムアウトした場合
+
+        Returns:
+            float: 実行枠を確保した時刻(time.monotonic)
+        """
+        started_at = time.monotonic()
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return started_at
+
+        if len(self._waiters) >= self.config["max_queue"]:
+            self._rejections += 1
+            msg = "同時実行数の空きを待つリクエストが上限に達しています"
+            raise BedrockThrottlingError(msg, operation_name, self.config["retry_after"])
+
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.config["queue_timeout"])
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # 枠を割り当てられた直後に打ち切られた場合は、次の待機者へ譲る
+                self.release()
+            if isinstance(e, TimeoutError):
+                self._rejections += 1
+                msg = "同時実行数の空きを待つ間にタイムアウトしました"
+                raise BedrockThrottlingError(msg, operation_name, self.config["retry_after"]) from e
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+        acquired_at = time.monotonic()
+        wait_time = acquired_at - started_at
+        self._wait_time_ewma += WAIT_TIME_EWMA_ALPHA * (wait_time - self._wait_time_ewma)
+        self._wait_time_max = max(self._wait_time_max, wait_time)
+        return acquired_at
+
+    def release(self) -> None:
+        """
+        実行枠を解放し、空いた枠を待機中のリクエストに割り当てる。
+        """
+        self.in_flight -= 1
+        self._wake()
+
+    def on_success(self) -> None:
+        """
+        成功を記録し、上限を加算的に増やす。
+        """
+        self._successes += 1
+        self.limit = min(float(self.config["max_limit"]), self.limit + self.config["additive_increase"] / self.limit)
+        self._wake()
+
+    def on_throttle(self, acquired_at: float) -> None:
+        """
+        スロットリングを記録し、上限を乗算的に減らす。
+
+        Args:
+            acquired_at (float): スロットリングされたリクエストが実行枠を確保した時刻
+        """
+        self._throttles += 1
+        if acquired_at < self._last_decrease:
+            return
+        previous = self.limit
+        self.limit = max(float(self.config["min_limit"]), self.limit * self.config["multiplicative_decrease"])
+        self._last_decrease = time.monotonic()
+        logger.warning("スロットリングのため同時実行数の上限を下げました (model=%s, limit=%.1f -> %.1f)", self.model_id, previous, self.limit)
+
+    def stats(self) -> ConcurrencyLimiterStatsTypeDef:
+        """
+        統計情報を返す。
+
+        Returns:
+            ConcurrencyLimiterStatsTypeDef: 統計情報
+        """
+        return {
+            "model_id": self.model_id,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "wait_time_ewma_ms": round(self._wait_time_ewma * 1000, 2),
+            "wait_time_max_ms": round(self._wait_time_max * 1000, 2),
+            "successes": self._successes,
+            "throttles": self._throttles,
+            "rejections": self._rejections,
+        }
+
+    def _wake(self) -> None:
+        """
+        上限に空きがある分だけ、待機中のリクエストに実行枠を割り当てる。
+        """
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self.in_flight += 1
+
+
+class _StreamPermit:
+    """
+    ストリームが保持する実行枠。解放は 1 回のみ行う。
+    """
+
+    def __init__(self, limiter: _ModelLimiter, acquired_at: float) -> None:
+        self.limiter = limiter
+        self.acquired_at = acquired_at
+        self._released = False
+
+    def release(self) -> None:
+        """
+        実行枠を解放する。解放済みの場合は何もしない。
+        """
+        if not self._released:
+            self._released = True
+            self.limiter.release()
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    モデルごとに同時実行数の上限を持ち、Bedrock のスロットリングに応じて上限を調整する制御器
+    リージョン・プロセス内のランタイムで共有し、モデル単位のクォータに対して同時実行数を抑える。
+    """
+
+    def __init__(self, config: ConcurrencyLimiterConfigTypeDef) -> None:
+        self.config = config
+        self._limiters: dict[str, _ModelLimiter] = {}
+
+    async def call(self, model_id: str, operation_name: str, fn: Callable[[], Awaitable[ResultT]]) -> ResultT:
+        """
+        実行枠を確保して呼び出し、結果に応じて上限を調整する。
+
+        Args:
+            model_id (str): モデルID
+            operation_name (str): 呼び出す API 名
+            fn (Callable[[], Awaitable[ResultT]]): 上流の呼び出し
+
+        Returns:
+            ResultT: 呼び出しの結果
+        """
+        limiter = self._limiter(model_id)
+        acquired_at = await limiter.acquire(operation_name)
+        try:
+            result = await fn()
+        except Exception as e:
+            if is_throttling_error(e):
+                limiter.on_throttle(acquired_at)
+            raise
+        finally:
+            limiter.release()
+        limiter.on_success()
+        return result
+
+    async def stream(self, model_id: str, operation_name: str, fn: Callable[[], Awaitable[AsyncGenerator[EventT]]]) -> AsyncGenerator[EventT]:
+        """
+        実行枠を確保してストリームを開始する。実行枠はストリームを読み終えるか閉じるまで保持する。
+        上流の呼び出し自体のエラーは、通常の呼び出しと同様にこの時点で送出する。
+
+        Args:
+            model_id (str): モデルID
+            operation_name (str): 呼び出す API 名
+            fn (Callable[[], Awaitable[AsyncGenerator[EventT]]]): 上流のストリームを開始する呼び出し
+
+        Returns:
+            AsyncGenerator[EventT]: 上流のイベントを返す非同期ジェネレーター
+        """
+        limiter = self._limiter(model_id)
+        permit = _StreamPermit(limiter, await limiter.acquire(operation_name))
+        try:
+            stream = await fn()
+        except BaseException as e:
+            if is_throttling_error(e):
+                limiter.on_throttle(permit.acquired_at)
+            permit.release()
+            raise
+        held = self._hold(permit, stream)
+        # 一度も読まれずに破棄されたジェネレーターは finally が実行されないため、破棄時にも実行枠を解放する
+        weakref.finalize(held, permit.release)
+        return held
+
+    def stats(self) -> list[ConcurrencyLimiterStatsTypeDef]:
+        """
+        モデルごとの統計情報を返す。
+
+        Returns:
+            list[ConcurrencyLimiterStatsTypeDef]: モデルごとの統計情報
+        """
+        return [limiter.stats() for limiter in list(self._limiters.values())]
+
+    @staticmethod
+    async def _hold(permit: _StreamPermit, stream: AsyncGenerator[EventT]) -> AsyncGenerator[EventT]:
+        """
+        ストリームのイベントを返し、終了時に実行枠を解放する。
+
+        Args:
+            permit (_StreamPermit): ストリームが保持する実行枠
+            stream (AsyncGenerator[EventT]): 上流のストリーム
+
+        Yields:
+            EventT: ストリームのイベント
+        """
+        try:
+            async for event in stream:
+                yield event
+        except Exception as e:
+            if is_throttling_error(e):
+                permit.limiter.on_throttle(permit.acquired_at)
+            raise
+        else:
+            permit.limiter.on_success()
+        finally:
+            await stream.aclose()
+            permit.release()
+
+    def _limiter(self, model_id: str) -> _ModelLimiter:
+        """
+        モデルの制御器を返す。未生成の場合は生成して登録する。
+
+        Args:
+            model_id (str): モデルID
+
+        Returns:
+            _ModelLimiter: モデルの制御器
+        """
+        limiter = self._limiters.get(model_id)
+        if limiter is None:
+            limiter = self._limiters[model_id] = _ModelLimiter(model_id, self.config)
+        return limiter
+
+
+class ConcurrencyLimitedBedrockRuntime(BedrockRuntimeWrapper):
+    """
+    モデルごとの同時実行数の上限を守って Bedrock を呼び出すランタイム
+    """
+
+    def __init__(self, inner: BedrockRuntimeBase, limiter: AdaptiveConcurrencyLimiter) -> None:
+        super().__init__(inner)
+        self.limiter = limiter
+
+    async def converse(self, request_args: ConverseRequestRequestTypeDef) -> ConverseResponseTypeDef:
+        """
+        実行枠を確保して Converse API を呼び出す。
+
+        Args:
+            request_args (ConverseRequestRequestTypeDef): converseに渡すパラメータ
+
+        Returns:
+            ConverseResponseTypeDef: モデルからのレスポンス
+        """
+        return await self.limiter.call(request_args["modelId"], "Converse", lambda: self.inner.converse(request_args))
+
+    async def converse_stream(self, request_args: ConverseStreamRequestRequestTypeDef) -> ConverseStreamResultTypeDef:
+        """
+        実行枠を確保して Converse Stream API を呼び出す。
+
+        Args:
+            request_args (ConverseStreamRequestRequestTypeDef): converse_streamに渡すパラメータ
+
+        Returns:
+            ConverseStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+
+        async def _open() -> AsyncGenerator[ConverseStreamOutputTypeDef]:
+            return (await self.inner.converse_stream(request_args))["stream"]
+
+        return {"stream": await self.limiter.stream(request_args["modelId"], "ConverseStream", _open)}
+
+    async def invoke_model(self, request_args: InvokeModelRequestRequestTypeDef) -> InvokeModelResultTypeDef:
+        """
+        実行枠を確保して Invoke Model API を呼び出す。
+
+        Args:
+            request_args (InvokeModelRequestRequestTypeDef): invoke_modelに渡すパラメータ
+
+        Returns:
+            InvokeModelResultTypeDef: 読み込み済みのボディを含むレスポンス
+        """
+        return await self.limiter.call(request_args["modelId"], "InvokeModel", lambda: self.inner.invoke_model(request_args))
+
+    async def invoke_model_with_response_stream(self, request_args: InvokeModelWithResponseStreamRequestRequestTypeDef) -> InvokeModelStreamResultTypeDef:
+        """
+        実行枠を確保して Invoke Model With Response Stream API を呼び出す。
+
+        Args:
+            request_args (InvokeModelWithResponseStreamRequestRequestTypeDef): invoke_model_with_response_streamに渡すパラメータ
+
+        Returns:
+            InvokeModelStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        content_type = ""
+
+        async def _open() -> AsyncGenerator[ResponseStreamTypeDef]:
+            nonlocal content_type
+            response = await self.inner.invoke_model_with_response_stream(request_args)
+            content_type = response["contentType"]
+            return response["body"]
+
+        body = await self.limiter.stream(request_args["modelId"], "InvokeModelWithResponseStream", _open)
+        return {"body": body, "contentType": content_type}
@@ -0,0 +1,281 @@
+"""
+会話履歴を入力トークン数の上限に収める処理(古いターンの切り捨てと要約への置き換え)を実装する。
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import re
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+import orjson
+from botocore.exceptions import BotoCoreError, ClientError
+
+from app.services.bedrock.request_key import request_key
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Sequence
+
+    from mypy_boto3_bedrock_runtime.type_defs import MessageUnionTypeDef, SystemContentBlockTypeDef
+
+    from app.types.bedrock_type_defs import ConversationHistoryConfigTypeDef
+
+
+logger = logging.getLogger(__name__)
+
+# 1 メッセージあたりのロールヘッダー等のトークン数(<|start_header_id|>role<|end_header_id|> ... <|eot_id|>)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# テキスト以外のブロック(画像・文書・動画)を 1 つあたりのトークン数として見積もる値
+NON_TEXT_BLOCK_TOKENS = 1024
+
+# 要約をプロセス内に保持する最大件数
+SUMMARY_CACHE_MAX_ENTRIES = 1024
+
+# 要約を最初に残すメッセージへ付加する際の見出し
+SUMMARY_HEADER = "(これまでの会話の要約)"
+
+# ASCII の連続部分
+_ASCII_RUN = re.compile(r"[\x00-\x7f]+")
+
+# 要約の文字起こしで使用するロールの表示名
+_ROLE_LABELS = {"user": "ユーザー", "assistant": "アシスタント"}
+
+
+def estimate_llama3_tokens(text: str) -> int:
+    """
+    Llama 3 のトークナイザーでのトークン数をローカルで見積もる。
+    英数字・記号は約 4 文字で 1 トークン、日本語などの非 ASCII 文字は 1 文字 1 トークンとして数える。
+
+    Args:
+        text (str): テキスト
+
+    Returns:
+        int: 見積もったトークン数
+    """
+    ascii_chars = 0
+    tokens = 0
+    for run in _ASCII_RUN.findall(text):
+        ascii_chars += len(run)
+        tokens += math.ceil(len(run) / 4)
+    return tokens + len(text) - ascii_chars
+
+
+class ConversationSummaryCache:
+    """
+    会話の先頭部分の要約を保持する LRU キャッシュ
+    キーは先頭からのメッセージを順に連鎖させたハッシュのため、会話が伸びても前回の要約を引き継いで要約できる。
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, str] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        """
+        要約を取得する。
+
+        Args:
+            key (str): 要約した範囲のキー
+
+        Returns:
+            str | None: 要約。ない場合はNone
+        """
+        summary = self._entries.get(key)
+        if summary is not None:
+            self._entries.move_to_end(key)
+        return summary
+
+    def put(self, key: str, summary: str) -> None:
+        """
+        要約を保存する。上限を超えた場合は最も古く使われた要約を削除する。
+
+        Args:
+            key (str): 要約した範囲のキー
+            summary (str): 要約
+        """
+        self._entries[key] = summary
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+CONVERSATION_SUMMARY_CACHE = ConversationSummaryCache(SUMMARY_CACHE_MAX_ENTRIES)
+
+
+class ConversationHistoryManager:
+    """
+    会話履歴を入力トークン数の上限に収める
+    - システムプロンプトと直近のターンを残し、収まらない古いターンを切り捨てる。
+    - 残す範囲は user ロールのメッセージから始め、ツール結果とその呼び出しの組を分断しない。
+    - 要約が有効な場合は、切り捨てたターンを要約して最初に残すメッセージの先頭に付加する。
+      要約はキャッシュし、次のリクエストでは前回の要約と新たに切り捨てたターンだけを要約する。
+    """
+
+    def __init__(
+        self,
+        config: ConversationHistoryConfigTypeDef,
+        estimate_tokens: Callable[[str], int],
+        summary_cache: ConversationSummaryCache = CONVERSATION_SUMMARY_CACHE,
+    ) -> None:
+        self.config = config
+        self.estimate_tokens = estimate_tokens
+        self.summary_cache = summary_cache
+
+    async def fit(
+        self,
+        messages: Sequence[MessageUnionTypeDef],
+        system: Sequence[SystemContentBlockTypeDef] | None = None,
+        summarize: Callable[[str], Awaitable[str]] | None = None,
+    ) -> list[MessageUnionTypeDef]:
+        """
+        会話履歴を入力トークン数の上限に収める。
+
+        Args:
+            messages (Sequence[MessageUnionTypeDef]): 会話履歴
+            system (Sequence[SystemContentBlockTypeDef] | None, optional): システムプロンプト。常に残し、上限の計算に含める
+            summarize (Callable[[str], Awaitable[str]] | None, optional): 文字起こしした会話を要約する呼び出し。省略時は要約しない
+
+        Returns:
+            list[MessageUnionTypeDef]: 上限に収めた会話履歴
+        """
+        system_tokens = sum(self._block_tokens(block) for block in system or [])
+        message_tokens = [self.estimate_message_tokens(message) for message in messages]
+        budget = self.config["max_input_tokens"] - system_tokens
+        if sum(message_tokens) <= budget:
+            return list(messages)
+
+        use_summary = summarize is not None and self.config["summary_enabled"]
+        if use_summary:
+            budget -= self.config["summary_max_tokens"] + MESSAGE_OVERHEAD_TOKENS
+        start = self._recent_start(messages, message_tokens, budget)
+        kept = list(messages[start:])
+        if start == 0 or summarize is None or not use_summary:
+            logger.info("会話履歴を切り詰めました (messages=%d -> %d)", len(messages), len(kept))
+            return kept
+
+        try:
+            summary = await self._summary(messages[:start], summarize)
+        except (ClientError, BotoCoreError, KeyError, IndexError):
+            # 要約の呼び出しの失敗(スロットリング・タイムアウト等)や想定外の形式の応答でも、切り詰めた履歴で応答を続ける
+            logger.warning("会話履歴の要約に失敗したため、切り詰めのみ行います", exc_info=True)
+            return kept
+
+        logger.info("会話履歴を要約しました (messages=%d -> %d + 要約)", len(messages), len(kept))
+        first = kept[0]
+        kept[0] = {**first, "content": [{"text": f"{SUMMARY_HEADER}\n{summary}"}, *first["content"]]}
+        return kept
+
+    def estimate_message_tokens(self, message: MessageUnionTypeDef) -> int:
+        """
+        メッセージのトークン数を見積もる。
+
+        Args:
+            message (MessageUnionTypeDef): メッセージ
+
+        Returns:
+            int: 見積もったトークン数
+        """
+        return MESSAGE_OVERHEAD_TOKENS + sum(self._block_tokens(block) for block in message["content"])
+
+    def _block_tokens(self, block: Any) -> int:  # noqa: ANN401
+        """
+        コンテンツブロックのトークン数を見積もる。
+
+        Args:
+            block (Any): コンテンツブロック
+
+        Returns:
+            int: 見積もったトークン数
+        """
+        if block.get("text") is not None:
+            return self.estimate_tokens(block["text"])
+        for name in ("toolUse", "toolResult"):
+            if block.get(name) is not None:
+                return self.estimate_tokens(orjson.dumps(block[name], default=str).decode())
+        return NON_TEXT_BLOCK_TOKENS
+
+    @staticmethod
+    def _recent_start(messages: Sequence[MessageUnionTypeDef], message_tokens: list[int], budget: int) -> int:
+        """
+        上限に収まる直近のターンの開始位置を返す。
+        開始位置は user ロールかつツール結果を含まないメッセージとする。収まらない場合も最後のユーザーの発話は残す。
+
+        Args:
+            messages (Sequence[MessageUnionTypeDef]): 会話履歴
+            message_tokens (list[int]): メッセージごとのトークン数
+            budget (int): 会話履歴に使えるトークン数
+
+        Returns:
+            int: 残す範囲の開始位置
+        """
+        start: int | None = None
+        fallback: int | None = None
+        used = 0
+        for index in range(len(messages) - 1, -1, -1):
+            used += message_tokens[index]
+            message = messages[index]
+            can_start = message["role"] == "user" and not any(block.get("toolResult") is not None for block in message["content"])
+            if not can_start:
+                continue
+            if fallback is None:
+                fallback = index
+            if used > budget:
+                break
+            start = index
+        if start is not None:
+            return start
+        return fallback if fallback is not None else 0
+
+    async def _summary(self, dropped: Sequence[MessageUnionTypeDef], summarize: Callable[[str], Awaitable[str]]) -> str:
+        """
+        切り捨てたターンの要約を返す。キャッシュに前回までの要約があれば、それと新たに切り捨てたターンから要約する。
+
+        Args:
+            dropped (Sequence[MessageUnionTypeDef]): 切り捨てたターン
+            summarize (Callable[[str], Awaitable[str]]): 文字起こしした会話を要約する呼び出し
+
+        Returns:
+            str: 要約
+        """
+        keys: list[str] = []
+        previous_key = ""
+        for message in dropped:
+            previous_key = request_key("conversation_summary", {"previous": previous_key, "message": message})
+            keys.append(previous_key)
+
+        previous_summary: str | None = None
+        summarized = 0
+        for count in range(len(keys), 0, -1):
+            previous_summary = self.summary_cache.get(keys[count - 1])
+            if previous_summary is not None:
+                summarized = count
+                break
+        if previous_summary is not None and summarized == len(dropped):
+            return previous_summary
+
+        transcript = self._transcript(dropped[summarized:])
+        if previous_summary is not None:
+            transcript = f"{SUMMARY_HEADER}\n{previous_summary}\n\n{transcript}"
+        summary = await summarize(transcript)
+        self.summary_cache.put(keys[-1], summary)
+        return summary
+
+    @staticmethod
+    def _transcript(messages: Sequence[MessageUnionTypeDef]) -> str:
+        """
+        要約するために会話を文字起こしする。テキスト以外のブロックは種類のみ記載する。
+
+        Args:
+            messages (Sequence[MessageUnionTypeDef]): 会話
+
+        Returns:
+            str: 文字起こしした会話
+        """
+        lines: list[str] = []
+        for message in messages:
+            parts = [block["text"] if block.get("text") is not None else f"[{next(iter(block), 'content')}]" for block in message["content"]]
+            lines.append(f"{_ROLE_LABELS.get(message['role'], message['role'])}: {' '.join(parts)}")
+        return "\n".join(lines)
@@ -0,0 +1,131 @@
+"""
+botocore の EventStream をワーカースレッドで読み込み、イベントループへ受け渡すアダプターを実装する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, AsyncGenerator
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    from botocore.eventstream import EventStream
+
+
+logger = logging.getLogger(__name__)
+
+# ワーカースレッドがバッファの空きを待つ際に、停止要求を確認する間隔(秒)
+PUMP_POLL_INTERVAL: float = 0.1
+
+# ストリームを閉じた後、ワーカースレッドの終了を待つ最大時間(秒)
+PUMP_JOIN_TIMEOUT: float = 5.0
+
+# キューに流すメッセージの種類
+_EVENT = 0
+_END = 1
+_ERROR = 2
+
+
+class EventStreamPump[EventT]:
+    """
+    ブロッキングする EventStream の読み込みをワーカースレッドで行い、イベントを非同期に返すアダプター
+
+    - イベントループ上ではソケットの読み込みを行わないため、遅いストリームが他のリクエストを止めない。
+    - バッファに積めるイベント数を制限し、利用側の読み込みが遅い場合は
+      ワーカースレッドの読み込みを止めて上流に背圧をかける。
+    - 利用側がジェネレーターを閉じた時点でストリームを閉じ、ワーカースレッドの終了まで待つ。
+    """
+
+    def __init__(self, event_stream: EventStream[EventT], executor: Executor, max_buffered: int) -> None:
+        self.event_stream = event_stream
+        self.executor = executor
+        self._queue: asyncio.Queue[tuple[int, Any]] = asyncio.Queue()
+        self._slots = threading.Semaphore(max_buffered)
+        self._stopped = threading.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def iterate(self) -> AsyncGenerator[EventT]:
+        """
+        ワーカースレッドで読み込んだイベントを順に返す。
+
+        Yields:
+            EventT: ストリームのイベント
+        """
+        self._loop = asyncio.get_running_loop()
+        worker = self._loop.run_in_executor(self.executor, self._pump)
+        try:
+            while True:
+                kind, item = await self._queue.get()
+                self._slots.release()
+                if kind == _END:
+                    return
+                if kind == _ERROR:
+                    raise item
+                yield item
+        finally:
+            self._stopped.set()
+            if not worker.done():
+                # 読み込み中のソケットを閉じて、ワーカースレッドのブロッキングを解除する
+                self.event_stream.close()
+                try:
+                    await asyncio.wait_for(asyncio.shield(worker), timeout=PUMP_JOIN_TIMEOUT)
+                except TimeoutError:
+                    logger.warning("イベントストリームの読み込みスレッドが時間内に終了しませんでした")
+
+    def _pump(self) -> None:
+        """
+        ワーカースレッドでストリームを読み込み、キューに積む。
+        """
+        try:
+            for event in self.event_stream:
+                if not self._put(_EVENT, event):
+                    return
+            self._put(_END, None)
+        except Exception as e:  # noqa: BLE001
+            # 停止要求でストリームを閉じた場合の例外は利用側に返さない
+            if not self._stopped.is_set():
+                self._put(_ERROR, e)
+        finally:
+            self.event_stream.close()
+
+    def _put(self, kind: int, item: object) -> bool:
+        """
+        バッファに空きができるまで待ってから、イベントループ側のキューに積む。
+
+        Args:
+            kind (int): メッセージの種類
+            item (object): イベントまたは例外
+
+        Returns:
+            bool: 積めた場合はTrue、停止要求により破棄した場合はFalse
+        """
+        while not self._slots.acquire(timeout=PUMP_POLL_INTERVAL):
+            if self._stopped.is_set():
+                return False
+        if self._stopped.is_set() or self._loop is None:
+            return False
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (kind, item))
+        return True
+
+
+def pump_event_stream[EventT](event_stream: EventStream[EventT], executor: Executor, max_buffered: int) -> AsyncGenerator[EventT]:
+    """
+    EventStream をワーカースレッドで読み込み、非同期ジェネレーターとして返す。
+    ジェネレーターが一度も読まれずに破棄された場合も EventStream を閉じる。
+
+    Args:
+        event_stream (EventStream[EventT]): botocore の EventStream
+        executor (Executor): 読み込みを行うワーカースレッドのプール
+        max_buffered (int): バッファに積めるイベントの最大数
+
+    Returns:
+        AsyncGenerator[EventT]: ストリームのイベントを返す非同期ジェネレーター
+    """
+    events = EventStreamPump(event_stream, executor, max_buffered).iterate()
+    # 一度も読まれずに破棄されたジェネレーターは finally が実行されないため、破棄時にもストリームを閉じる
+    weakref.finalize(events, event_stream.close)
+    return events
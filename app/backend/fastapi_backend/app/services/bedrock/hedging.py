@@ -0,0 +1,281 @@
+"""
+応答が遅い Bedrock 呼び出しを別リージョンにも送り、先に完了した結果を使うヘッジリクエストを実装する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import TYPE_CHECKING, TypeVar
+
+from app.services.bedrock.region_router import share_region_selection
+from app.services.bedrock.runtime_wrapper import BedrockRuntimeWrapper
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from mypy_boto3_bedrock_runtime.type_defs import (
+        ConverseRequestRequestTypeDef,
+        ConverseResponseTypeDef,
+        InvokeModelRequestRequestTypeDef,
+    )
+
+    from app.interfaces.bedrock_interface import BedrockRuntimeBase
+    from app.types.bedrock_type_defs import HedgingConfigTypeDef, HedgingStatsTypeDef, InvokeModelResultTypeDef
+
+
+logger = logging.getLogger(__name__)
+
+ResultT = TypeVar("ResultT")
+
+# ヘッジを送るまでの待機時間を再計算する間隔(サンプル数)
+DELAY_RECOMPUTE_INTERVAL = 16
+
+
+class _OperationHedger:
+    """
+    1 モデル・1 API 分の応答時間の分布とヘッジの予算
+    - 直近 window_size 件の応答時間から percentile を求め、ヘッジを送るまでの待機時間とする。
+    - 予算はトークンバケットで管理する。リクエストごとに budget_ratio 分のトークンを貯め、ヘッジ 1 回で 1 トークン消費する。
+    """
+
+    def __init__(self, model_id: str, operation_name: str, config: HedgingConfigTypeDef) -> None:
+        self.model_id = model_id
+        self.operation_name = operation_name
+        self.config = config
+        self._latencies: deque[float] = deque(maxlen=config["window_size"])
+        self._delay = config["initial_delay"]
+        self._samples_since_recompute = 0
+        self._tokens = float(config["budget_burst"])
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.budget_denied = 0
+
+    def delay(self) -> float:
+        """
+        ヘッジを送るまでの待機時間を返す。サンプルが min_samples に満たない間は initial_delay を使う。
+
+        Returns:
+            float: 待機時間(秒)
+        """
+        if len(self._latencies) >= self.config["min_samples"] and self._samples_since_recompute >= DELAY_RECOMPUTE_INTERVAL:
+            latencies = sorted(self._latencies)
+            index = min(len(latencies) - 1, math.ceil(self.config["percentile"] * len(latencies)) - 1)
+            self._delay = max(self.config["min_delay"], latencies[index])
+            self._samples_since_recompute = 0
+        return self._delay
+
+    def record_latency(self, latency: float) -> None:
+        """
+        成功した呼び出しの応答時間を記録する。
+
+        Args:
+            latency (float): 応答時間(秒)
+        """
+        self._latencies.append(latency)
+        self._samples_since_recompute += 1
+
+    def deposit(self) -> None:
+        """
+        リクエスト 1 件分のヘッジ予算を貯める。
+        """
+        self.requests += 1
+        self._tokens = min(float(self.config["budget_burst"]), self._tokens + self.config["budget_ratio"])
+
+    def try_spend(self) -> bool:
+        """
+        ヘッジ 1 回分の予算を消費する。
+
+        Returns:
+            bool: 予算がありヘッジを送れる場合はTrue
+        """
+        if self._tokens < 1:
+            self.budget_denied += 1
+            return False
+        self._tokens -= 1
+        self.hedged += 1
+        return True
+
+    def stats(self) -> HedgingStatsTypeDef:
+        """
+        統計情報を返す。
+
+        Returns:
+            HedgingStatsTypeDef: 統計情報
+        """
+        return {
+            "model_id": self.model_id,
+            "operation": self.operation_name,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.requests, 4) if self.requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins": self.primary_wins,
+            "budget_denied": self.budget_denied,
+            "budget_tokens": round(self._tokens, 2),
+            "delay_ms": round(self._delay * 1000, 2),
+            "samples": len(self._latencies),
+        }
+
+
+class RequestHedger:
+    """
+    最初の呼び出しが応答時間の percentile を過ぎても完了しない場合に、同じリクエストを別の呼び出し先へ送る制御器
+    先に成功した結果を返し、もう一方は取り消す。送るヘッジの数は予算で上限を設ける。
+    """
+
+    def __init__(self, config: HedgingConfigTypeDef) -> None:
+        self.config = config
+        self._hedgers: dict[tuple[str, str], _OperationHedger] = {}
+
+    async def call(
+        self,
+        model_id: str,
+        operation_name: str,
+        primary: Callable[[], Awaitable[ResultT]],
+        hedge: Callable[[], Awaitable[ResultT]],
+    ) -> ResultT:
+        """
+        最初の呼び出しを行い、待機時間を過ぎても完了しなければヘッジを送る。
+        どちらも失敗した場合は先に失敗した呼び出しの例外を送出する。
+
+        Args:
+            model_id (str): モデルID
+            operation_name (str): 呼び出す API 名
+            primary (Callable[[], Awaitable[ResultT]]): 最初の呼び出し
+            hedge (Callable[[], Awaitable[ResultT]]): ヘッジの呼び出し
+
+        Returns:
+            ResultT: 先に成功した呼び出しの結果
+        """
+        hedger = self._hedger(model_id, operation_name)
+        hedger.deposit()
+        primary_task = asyncio.ensure_future(self._timed(hedger, primary))
+        hedge_task: asyncio.Future[ResultT] | None = None
+        pending: set[asyncio.Future[ResultT]] = {primary_task}
+        errors: list[BaseException] = []
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedger.delay())
+            if not done and hedger.try_spend():
+                hedge_task = asyncio.ensure_future(self._timed(hedger, hedge))
+                pending.add(hedge_task)
+                logger.debug("ヘッジリクエストを送信しました (model=%s, operation=%s)", model_id, operation_name)
+
+            while True:
+                for task in done:
+                    task_error = task.exception()
+                    if task_error is None:
+                        if hedge_task is not None:
+                            if task is hedge_task:
+                                hedger.hedge_wins += 1
+                            else:
+                                hedger.primary_wins += 1
+                        return task.result()
+                    errors.append(task_error)
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+        # 完了した呼び出しがすべて失敗した場合のみここに到達するため、errors は空にならない
+        raise errors[0]
+
+    def stats(self) -> list[HedgingStatsTypeDef]:
+        """
+        モデル・API ごとの統計情報を返す。
+
+        Returns:
+            list[HedgingStatsTypeDef]: モデル・API ごとの統計情報
+        """
+        return [hedger.stats() for hedger in list(self._hedgers.values())]
+
+    @staticmethod
+    async def _timed(hedger: _OperationHedger, fn: Callable[[], Awaitable[ResultT]]) -> ResultT:
+        """
+        呼び出しを行い、成功した場合は応答時間を記録する。
+
+        Args:
+            hedger (_OperationHedger): 応答時間を記録する制御器
+            fn (Callable[[], Awaitable[ResultT]]): 呼び出し
+
+        Returns:
+            ResultT: 呼び出しの結果
+        """
+        started_at = time.monotonic()
+        result = await fn()
+        hedger.record_latency(time.monotonic() - started_at)
+        return result
+
+    def _hedger(self, model_id: str, operation_name: str) -> _OperationHedger:
+        """
+        モデル・API の制御器を返す。未生成の場合は生成して登録する。
+
+        Args:
+            model_id (str): モデルID
+            operation_name (str): 呼び出す API 名
+
+        Returns:
+            _OperationHedger: モデル・API の制御器
+        """
+        key = (model_id, operation_name)
+        hedger = self._hedgers.get(key)
+        if hedger is None:
+            hedger = self._hedgers[key] = _OperationHedger(model_id, operation_name, self.config)
+        return hedger
+
+
+class HedgedBedrockRuntime(BedrockRuntimeWrapper):
+    """
+    応答の遅い converse / invoke_model を別リージョンのランタイムにも送るランタイム
+    ストリームは最初のイベントまでの時間しか短縮できず、二重に生成した分を捨てることになるため対象外とする。
+    取り消した側の呼び出しは、boto3 経由の場合はワーカースレッドで完了まで実行される(結果は破棄する)。
+    リージョンを選ぶランタイムの場合、ヘッジは最初の呼び出しが選んだリージョン以外に送る。
+    両リージョンのランタイムはレジストリが所有するため、このクラスでは事前接続・解放を行わない。
+    """
+
+    def __init__(self, inner: BedrockRuntimeBase, hedge_runtime: BedrockRuntimeBase, hedger: RequestHedger) -> None:
+        super().__init__(inner)
+        self.hedge_runtime = hedge_runtime
+        self.hedger = hedger
+
+    async def converse(self, request_args: ConverseRequestRequestTypeDef) -> ConverseResponseTypeDef:
+        """
+        Converse API を呼び出し、遅い場合は別リージョンにもヘッジを送る。
+
+        Args:
+            request_args (ConverseRequestRequestTypeDef): converseに渡すパラメータ
+
+        Returns:
+            ConverseResponseTypeDef: モデルからのレスポンス
+        """
+        with share_region_selection():
+            return await self.hedger.call(
+                request_args["modelId"],
+                "Converse",
+                lambda: self.inner.converse(request_args),
+                lambda: self.hedge_runtime.converse(request_args),
+            )
+
+    async def invoke_model(self, request_args: InvokeModelRequestRequestTypeDef) -> InvokeModelResultTypeDef:
+        """
+        Invoke Model API を呼び出し、遅い場合は別リージョンにもヘッジを送る。
+
+        Args:
+            request_args (InvokeModelRequestRequestTypeDef): invoke_modelに渡すパラメータ
+
+        Returns:
+            InvokeModelResultTypeDef: 読み込み済みのボディを含むレスポンス
+        """
+        with share_region_selection():
+            return await self.hedger.call(
+                request_args["modelId"],
+                "InvokeModel",
+                lambda: self.inner.invoke_model(request_args),
+                lambda: self.hedge_runtime.invoke_model(request_args),
+            )
@@ -0,0 +1,331 @@
+"""
+SigV4 署名付きの HTTP/2 リクエストで Bedrock を直接呼び出すネイティブ非同期ランタイムを実装する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from typing import TYPE_CHECKING, Any, AsyncGenerator, cast
+
+import httpx
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest, HeadersDict
+from botocore.eventstream import EventStreamBuffer
+from botocore.exceptions import (
+    ClientError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    EventStreamError,
+    NoCredentialsError,
+    ReadTimeoutError,
+)
+from botocore.parsers import EventStreamJSONParser, create_parser
+from botocore.serialize import create_serializer
+
+from app.interfaces.bedrock_interface import BedrockRuntimeBase
+from app.services.bedrock.service_model import resolve_operation_shapes
+
+if TYPE_CHECKING:
+    from botocore.credentials import Credentials, ReadOnlyCredentials
+    from botocore.model import ServiceModel, Shape, StructureShape
+    from mypy_boto3_bedrock_runtime.type_defs import (
+        ConverseRequestRequestTypeDef,
+        ConverseResponseTypeDef,
+        ConverseStreamRequestRequestTypeDef,
+        InvokeModelRequestRequestTypeDef,
+        InvokeModelWithResponseStreamRequestRequestTypeDef,
+    )
+
+    from app.types.bedrock_type_defs import (
+        BedrockClientConfigTypeDef,
+        BedrockConnectionPoolStatsTypeDef,
+        ConverseStreamResultTypeDef,
+        InvokeModelResultTypeDef,
+        InvokeModelStreamResultTypeDef,
+    )
+
+
+logger = logging.getLogger(__name__)
+
+# リトライ対象のステータスコード(スロットリング・サーバーエラー)
+RETRYABLE_STATUS_CODES: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+
+# リトライ時のバックオフ(秒)
+RETRY_BASE_DELAY: float = 0.2
+RETRY_MAX_DELAY: float = 20.0
+
+
+class HttpBedrockRuntime(BedrockRuntimeBase):
+    """
+    SigV4 署名付きの HTTP/2 リクエストを共有の非同期コネクションプールで送信するランタイム
+    スレッドプールを経由しないため、1 ワーカーで大量の同時生成を扱える。
+    リクエストのシリアライズとレスポンス・イベントストリームの解析には botocore のサービスモデルを使用する。
+    """
+
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        service_model: ServiceModel,
+        credentials: Credentials | None,
+        region: str,
+        client_config: BedrockClientConfigTypeDef,
+    ) -> None:
+        self.http_client = http_client
+        self.region = region
+        self.endpoint_url = (client_config["endpoint_url"] or f"https://bedrock-runtime.{region}.amazonaws.com").rstrip("/")
+        self.max_attempts = client_config["max_attempts"]
+        self._service_model = service_model
+        self._credentials = credentials
+        self._serializer = create_serializer(service_model.protocol)
+        self._parser = create_parser(service_model.protocol)
+        self._event_parser = EventStreamJSONParser()
+        self._requests = 0
+
+    async def converse(self, request_args: ConverseRequestRequestTypeDef) -> ConverseResponseTypeDef:
+        """
+        Converse API を呼び出す。
+
+        Args:
+            request_args (ConverseRequestRequestTypeDef): converseに渡すパラメータ
+
+        Returns:
+            ConverseResponseTypeDef: モデルからのレスポンス
+        """
+        response = await self._send("Converse", request_args)
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        return cast("ConverseResponseTypeDef", self._parse_response("Converse", response, body))
+
+    async def converse_stream(self, request_args: ConverseStreamRequestRequestTypeDef) -> ConverseStreamResultTypeDef:
+        """
+        Converse Stream API を呼び出す。
+
+        Args:
+            request_args (ConverseStreamRequestRequestTypeDef): converse_streamに渡すパラメータ
+
+        Returns:
+            ConverseStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        response = await self._send("ConverseStream", request_args)
+        shape = cast("StructureShape", self._service_model.operation_model("ConverseStream").output_shape).members["stream"]
+        return {"stream": self._iterate_event_stream(response, "ConverseStream", shape)}
+
+    async def invoke_model(self, request_args: InvokeModelRequestRequestTypeDef) -> InvokeModelResultTypeDef:
+        """
+        Invoke Model API を呼び出す。
+
+        Args:
+            request_args (InvokeModelRequestRequestTypeDef): invoke_modelに渡すパラメータ
+
+        Returns:
+            InvokeModelResultTypeDef: 読み込み済みのボディを含むレスポンス
+        """
+        response = await self._send("InvokeModel", request_args)
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        return {"body": body, "contentType": response.headers.get("Content-Type", "")}
+
+    async def invoke_model_with_response_stream(self, request_args: InvokeModelWithResponseStreamRequestRequestTypeDef) -> InvokeModelStreamResultTypeDef:
+        """
+        Invoke Model With Response Stream API を呼び出す。
+
+        Args:
+            request_args (InvokeModelWithResponseStreamRequestRequestTypeDef): invoke_model_with_response_streamに渡すパラメータ
+
+        Returns:
+            InvokeModelStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        response = await self._send("InvokeModelWithResponseStream", request_args)
+        shape = cast("StructureShape", self._service_model.operation_model("InvokeModelWithResponseStream").output_shape).members["body"]
+        return {
+            "body": self._iterate_event_stream(response, "InvokeModelWithResponseStream", shape),
+            "contentType": response.headers.get("X-Amzn-Bedrock-Content-Type", ""),
+        }
+
+    async def warm_up(self, connections: int) -> None:  # noqa: ARG002
+        """
+        リクエストで使う操作の定義を組み立て、エンドポイントへの HTTP/2 コネクションを事前に確立する。
+        HTTP/2 は 1 コネクションで多重化するため、接続数によらず 1 リクエストのみ送信する。
+
+        Args:
+            connections (int): 確立するコネクション数
+        """
+        resolve_operation_shapes(self._service_model)
+        try:
+            await self.http_client.head(self.endpoint_url)
+        except httpx.HTTPError as e:
+            logger.warning("コネクションの事前確立に失敗しました (endpoint=%s): %s", self.endpoint_url, e)
+
+    def pool_stats(self) -> BedrockConnectionPoolStatsTypeDef:
+        """
+        共有コネクションプールの使用状況を返す。
+
+        Returns:
+            BedrockConnectionPoolStatsTypeDef: コネクションプールの使用状況
+        """
+        pool = self.http_client._transport._pool  # type: ignore[attr-defined] # noqa: SLF001
+        return {
+            "transport": "http",
+            "max_pool_connections": pool._max_connections,  # noqa: SLF001
+            "opened_connections": len(pool.connections),
+            "idle_connections": sum(conn.is_idle() for conn in pool.connections),
+            "requests": self._requests,
+        }
+
+    async def _send(self, operation_name: str, params: Any) -> httpx.Response:  # noqa: ANN401
+        """
+        リクエストを署名して送信し、ステータス 200 のレスポンスを返す。
+        スロットリング・サーバーエラー・通信エラーは指数バックオフでリトライする。
+
+        Args:
+            operation_name (str): 操作名
+            params (Any): 操作のパラメータ
+
+        Raises:
+            ClientError: Bedrock がエラーを返した場合
+            ReadTimeoutError: 読み込みがタイムアウトした場合
+            ConnectTimeoutError: 接続がタイムアウトした場合
+            EndpointConnectionError: エンドポイントに接続できない場合
+
+        Returns:
+            httpx.Response: ボディ未読み込みのレスポンス。呼び出し側で必ず閉じること。
+        """
+        operation_model = self._service_model.operation_model(operation_name)
+        serialized = self._serializer.serialize_to_request(params, operation_model)
+        url = self.endpoint_url + serialized["url_path"]
+        body: bytes = serialized["body"] if isinstance(serialized["body"], bytes) else serialized["body"].encode()
+
+        attempt = 1
+        while True:
+            headers = await self._sign(serialized["method"], url, body, serialized["headers"])
+            request = self.http_client.build_request(serialized["method"], url, content=body, headers=headers)
+            try:
+                response = await self.http_client.send(request, stream=True)
+            except httpx.TransportError as e:
+                if attempt < self.max_attempts:
+                    await self._backoff(attempt)
+                    attempt += 1
+                    continue
+                if isinstance(e, httpx.ConnectTimeout):
+                    raise ConnectTimeoutError(endpoint_url=url) from e
+                if isinstance(e, httpx.TimeoutException):
+                    raise ReadTimeoutError(endpoint_url=url) from e
+                raise EndpointConnectionError(endpoint_url=url) from e
+
+            self._requests += 1
+            if response.status_code == httpx.codes.OK:
+                return response
+
+            try:
+                error_body = await response.aread()
+            finally:
+                await response.aclose()
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_attempts:
+                await self._backoff(attempt)
+                attempt += 1
+                continue
+            raise ClientError(self._parse_response(operation_name, response, error_body), operation_name)  # type: ignore[arg-type]
+
+    async def _sign(self, method: str, url: str, body: bytes, headers: dict[str, str]) -> dict[str, str]:
+        """
+        SigV4 でリクエストに署名し、送信するヘッダーを返す。
+
+        Args:
+            method (str): HTTPメソッド
+            url (str): URL
+            body (bytes): リクエストボディ
+            headers (dict[str, str]): 署名前のヘッダー
+
+        Raises:
+            NoCredentialsError: 認証情報が見つからない場合
+
+        Returns:
+            dict[str, str]: 署名済みのヘッダー
+        """
+        credentials = await self._frozen_credentials()
+        aws_request = AWSRequest(method=method, url=url, data=body, headers=dict(headers))
+        SigV4Auth(credentials, self._service_model.signing_name, self.region).add_auth(aws_request)
+        return dict(aws_request.headers.items())
+
+    async def _frozen_credentials(self) -> ReadOnlyCredentials:
+        """
+        認証情報を取得する。更新が必要な場合のみブロッキングする更新処理をスレッドで実行する。
+
+        Raises:
+            NoCredentialsError: 認証情報が見つからない場合
+
+        Returns:
+            ReadOnlyCredentials: 認証情報
+        """
+        if self._credentials is None:
+            raise NoCredentialsError
+        refresh_needed = getattr(self._credentials, "refresh_needed", None)
+        if refresh_needed is not None and refresh_needed():
+            return await asyncio.to_thread(self._credentials.get_frozen_credentials)
+        return self._credentials.get_frozen_credentials()
+
+    def _parse_response(self, operation_name: str, response: httpx.Response, body: bytes) -> dict[str, Any]:
+        """
+        レスポンスを boto3 と同じ形式の辞書に変換する。
+
+        Args:
+            operation_name (str): 操作名
+            response (httpx.Response): レスポンス
+            body (bytes): 読み込み済みのボディ
+
+        Returns:
+            dict[str, Any]: 解析したレスポンス
+        """
+        operation_model = self._service_model.operation_model(operation_name)
+        response_dict = {"status_code": response.status_code, "headers": HeadersDict(response.headers.items()), "body": body}
+        parsed: dict[str, Any] = self._parser.parse(response_dict, cast("StructureShape", operation_model.output_shape))
+        return parsed
+
+    async def _iterate_event_stream(self, response: httpx.Response, operation_name: str, shape: Shape) -> AsyncGenerator[Any]:
+        """
+        レスポンスボディのイベントストリームのフレームをデコードして返す。
+        ジェネレーターが閉じられた時点でレスポンスを閉じる。
+
+        Args:
+            response (httpx.Response): ボディ未読み込みのレスポンス
+            operation_name (str): 操作名
+            shape (Shape): イベントストリームのシェイプ
+
+        Raises:
+            EventStreamError: ストリーム中に Bedrock がエラーを返した場合
+            ReadTimeoutError: 読み込みがタイムアウトした場合
+
+        Yields:
+            Any: 解析したイベント
+        """
+        buffer = EventStreamBuffer()
+        try:
+            async for data in response.aiter_raw():
+                buffer.add_data(data)
+                for message in buffer:
+                    response_dict = message.to_response_dict()
+                    parsed = self._event_parser.parse(response_dict, shape)
+                    if response_dict["status_code"] != httpx.codes.OK:
+                        raise EventStreamError(parsed, operation_name)
+                    if parsed:
+                        yield parsed
+        except httpx.TimeoutException as e:
+            raise ReadTimeoutError(endpoint_url=str(response.url)) from e
+        finally:
+            await response.aclose()
+
+    @staticmethod
+    async def _backoff(attempt: int) -> None:
+        """
+        リトライ前に指数バックオフ(フルジッター)で待機する。
+
+        Args:
+            attempt (int): 試行回数
+        """
+        await asyncio.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)))
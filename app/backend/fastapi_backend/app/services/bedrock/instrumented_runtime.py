@@ -0,0 +1,224 @@
+"""
+Bedrock の呼び出しの所要時間と、ストリームのトークンの受信状況をメトリクスに記録するランタイムを実装する。
+"""
+
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, AsyncGenerator
+
+import orjson
+
+from app.services.bedrock.bedrock_errors import is_throttling_error
+from app.services.bedrock.runtime_wrapper import BedrockRuntimeWrapper
+from app.services.metrics.prometheus_metrics import (
+    BEDROCK_REQUEST_DURATION,
+    BEDROCK_STREAM_INTER_TOKEN,
+    BEDROCK_STREAM_OUTPUT_TOKENS,
+    BEDROCK_STREAM_TIME_TO_FIRST_TOKEN,
+    BEDROCK_STREAM_TOKENS_PER_SECOND,
+    BEDROCK_STREAMS_ABORTED,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from mypy_boto3_bedrock_runtime.type_defs import (
+        ConverseRequestRequestTypeDef,
+        ConverseResponseTypeDef,
+        ConverseStreamOutputTypeDef,
+        ConverseStreamRequestRequestTypeDef,
+        InvokeModelRequestRequestTypeDef,
+        InvokeModelWithResponseStreamRequestRequestTypeDef,
+        ResponseStreamTypeDef,
+    )
+
+    from app.interfaces.bedrock_interface import BedrockRuntimeBase
+    from app.types.bedrock_type_defs import ConverseStreamResultTypeDef, InvokeModelResultTypeDef, InvokeModelStreamResultTypeDef
+
+# Invoke Model With Response Stream の最後のチャンクに Bedrock が付ける、トークン使用量の項目
+INVOCATION_METRICS_KEY = "amazon-bedrock-invocationMetrics"
+_INVOCATION_METRICS_MARKER = f'"{INVOCATION_METRICS_KEY}"'.encode()
+
+
+class InstrumentedBedrockRuntime(BedrockRuntimeWrapper):
+    """
+    API ごとの呼び出しの所要時間と、ストリームの最初のトークンまでの時間・トークンの間隔・出力トークン数・
+    1 秒あたりの出力トークン数をメトリクスに記録するランタイム
+    - 通信のランタイムを直接包み、キャッシュや single-flight で上流を呼ばなかった分と同時実行数の空きを待った時間は含めない。
+    - トークンはアプリケーションがイベントを読み込んだ時点で数える。Converse Stream は contentBlockDelta、
+      Invoke Model With Response Stream は使用量を含まないチャンクを 1 トークンとする。
+    - 出力トークン数は Bedrock が返す使用量(metadata / amazon-bedrock-invocationMetrics)を使い、
+      受信する前にエラーや切断で終了したストリームは中断として数える。
+    """
+
+    def __init__(self, inner: BedrockRuntimeBase, region: str) -> None:
+        super().__init__(inner)
+        self.region = region
+
+    async def converse(self, request_args: ConverseRequestRequestTypeDef) -> ConverseResponseTypeDef:
+        """
+        Converse API を呼び出し、所要時間を記録する。
+
+        Args:
+            request_args (ConverseRequestRequestTypeDef): converseに渡すパラメータ
+
+        Returns:
+            ConverseResponseTypeDef: モデルからのレスポンス
+        """
+        return await self._timed("converse", request_args["modelId"], lambda: self.inner.converse(request_args))
+
+    async def converse_stream(self, request_args: ConverseStreamRequestRequestTypeDef) -> ConverseStreamResultTypeDef:
+        """
+        Converse Stream API を呼び出し、ストリームの開始までの所要時間とトークンの受信状況を記録する。
+
+        Args:
+            request_args (ConverseStreamRequestRequestTypeDef): converse_streamに渡すパラメータ
+
+        Returns:
+            ConverseStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        started_at = time.perf_counter()
+        response = await self._timed("converse_stream", request_args["modelId"], lambda: self.inner.converse_stream(request_args))
+        return {"stream": _observe_stream("converse_stream", request_args["modelId"], started_at, response["stream"], _converse_stream_tokens)}
+
+    async def invoke_model(self, request_args: InvokeModelRequestRequestTypeDef) -> InvokeModelResultTypeDef:
+        """
+        Invoke Model API を呼び出し、所要時間を記録する。
+
+        Args:
+            request_args (InvokeModelRequestRequestTypeDef): invoke_modelに渡すパラメータ
+
+        Returns:
+            InvokeModelResultTypeDef: 読み込み済みのボディを含むレスポンス
+        """
+        return await self._timed("invoke_model", request_args["modelId"], lambda: self.inner.invoke_model(request_args))
+
+    async def invoke_model_with_response_stream(self, request_args: InvokeModelWithResponseStreamRequestRequestTypeDef) -> InvokeModelStreamResultTypeDef:
+        """
+        Invoke Model With Response Stream API を呼び出し、ストリームの開始までの所要時間とトークンの受信状況を記録する。
+
+        Args:
+            request_args (InvokeModelWithResponseStreamRequestRequestTypeDef): invoke_model_with_response_streamに渡すパラメータ
+
+        Returns:
+            InvokeModelStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        api = "invoke_model_with_response_stream"
+        started_at = time.perf_counter()
+        response = await self._timed(api, request_args["modelId"], lambda: self.inner.invoke_model_with_response_stream(request_args))
+        return {
+            "body": _observe_stream(api, request_args["modelId"], started_at, response["body"], _invoke_model_stream_tokens),
+            "contentType": response["contentType"],
+        }
+
+    async def _timed[ResultT](self, api: str, model_id: str, fn: Callable[[], Awaitable[ResultT]]) -> ResultT:
+        """
+        上流を呼び出し、結果(success / throttled / error / cancelled)ごとに所要時間を記録する。
+
+        Args:
+            api (str): 呼び出す API 名
+            model_id (str): モデルID
+            fn (Callable[[], Awaitable[ResultT]]): 上流の呼び出し
+
+        Returns:
+            ResultT: 呼び出しの結果
+        """
+        started_at = time.perf_counter()
+        outcome = "cancelled"
+        try:
+            result = await fn()
+        except Exception as e:
+            outcome = "throttled" if is_throttling_error(e) else "error"
+            raise
+        else:
+            outcome = "success"
+            return result
+        finally:
+            BEDROCK_REQUEST_DURATION.labels(api, model_id, self.region, outcome).observe(time.perf_counter() - started_at)
+
+
+async def _observe_stream[EventT](
+    api: str,
+    model_id: str,
+    started_at: float,
+    stream: AsyncGenerator[EventT],
+    classify: Callable[[EventT], tuple[bool, int | None]],
+) -> AsyncGenerator[EventT]:
+    """
+    ストリームのイベントを返しながらトークンの受信状況を記録する。
+
+    Args:
+        api (str): 呼び出した API 名
+        model_id (str): モデルID
+        started_at (float): API を呼び出した時刻(time.perf_counter)
+        stream (AsyncGenerator[EventT]): 上流のストリーム
+        classify (Callable[[EventT], tuple[bool, int | None]]): イベントがトークンか、と出力トークン数(含まない場合はNone)を返す関数
+
+    Yields:
+        EventT: ストリームのイベント
+    """
+    first_token_at: float | None = None
+    last_token_at: float | None = None
+    output_tokens: int | None = None
+    try:
+        async for event in stream:
+            is_token, tokens = classify(event)
+            if is_token:
+                now = time.perf_counter()
+                if last_token_at is None:
+                    first_token_at = now
+                    BEDROCK_STREAM_TIME_TO_FIRST_TOKEN.labels(api, model_id).observe(now - started_at)
+                else:
+                    BEDROCK_STREAM_INTER_TOKEN.labels(api, model_id).observe(now - last_token_at)
+                last_token_at = now
+            if tokens is not None:
+                output_tokens = tokens
+            yield event
+    finally:
+        await stream.aclose()
+        if output_tokens is None:
+            BEDROCK_STREAMS_ABORTED.labels(api, model_id).inc()
+        else:
+            BEDROCK_STREAM_OUTPUT_TOKENS.labels(api, model_id).observe(output_tokens)
+            if first_token_at is not None and last_token_at is not None and last_token_at > first_token_at and output_tokens > 1:
+                # 最初のトークンまでの時間は含めず、生成の速さ(デコードの速度)を記録する
+                BEDROCK_STREAM_TOKENS_PER_SECOND.labels(api, model_id).observe((output_tokens - 1) / (last_token_at - first_token_at))
+
+
+def _converse_stream_tokens(event: ConverseStreamOutputTypeDef) -> tuple[bool, int | None]:
+    """
+    Converse Stream API のイベントがトークンかと、出力トークン数を返す。
+
+    Args:
+        event (ConverseStreamOutputTypeDef): ストリームのイベント
+
+    Returns:
+        tuple[bool, int | None]: 差分のイベントの場合はTrueと、metadata の場合は出力トークン数
+    """
+    if "contentBlockDelta" in event:
+        return True, None
+    if "metadata" in event:
+        return False, event["metadata"]["usage"]["outputTokens"]
+    return False, None
+
+
+def _invoke_model_stream_tokens(event: ResponseStreamTypeDef) -> tuple[bool, int | None]:
+    """
+    Invoke Model With Response Stream API のイベントがトークンかと、出力トークン数を返す。
+    チャンクの本文はモデルごとに形式が異なるため、使用量を含む最後のチャンクのみ解析する。
+
+    Args:
+        event (ResponseStreamTypeDef): ストリームのイベント
+
+    Returns:
+        tuple[bool, int | None]: 使用量を含まないチャンクの場合はTrueと、含む場合は出力トークン数
+    """
+    chunk = event.get("chunk")
+    if chunk is None:
+        return False, None
+    body = chunk["bytes"]
+    if _INVOCATION_METRICS_MARKER not in body:
+        return True, None
+    invocation_metrics = orjson.loads(body).get(INVOCATION_METRICS_KEY) or {}
+    return False, invocation_metrics.get("outputTokenCount")
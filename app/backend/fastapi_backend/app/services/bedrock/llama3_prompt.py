@@ -0,0 +1,159 @@
+"""
+Llama 3 のチャットテンプレートで invoke 系のプロンプトを組み立て、ペイロードの JSON にする処理を実装する。
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+import orjson
+from fastapi import HTTPException
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping, Sequence
+
+    from app.schemas.bedrock_schema import Message
+
+
+BEGIN_OF_TEXT = "<|begin_of_text|>"
+END_OF_TURN = "<|eot_id|>"
+
+# ロールごとのヘッダー。本文との間は空行 1 つ(Llama 3 の公式テンプレートと同じ)
+ROLE_HEADERS = {role: f"<|start_header_id|>{role}<|end_header_id|>\n\n" for role in ("system", "user", "assistant")}
+
+# シリアライズ済みのプレフィックスを保持する最大件数
+PREFIX_CACHE_MAX_ENTRIES = 64
+
+# ペイロードの JSON でプロンプトを入れる項目。会話部分を後ろにつなげるため最後の項目にする
+PROMPT_KEY = "prompt"
+
+
+class Llama3PromptBuilder:
+    """
+    Llama 3 のチャットテンプレートのプロンプトと、それを含む invoke 系のペイロードを組み立てる
+    - すべてのターンを <|start_header_id|>ロール<|end_header_id|>\\n\\n本文<|eot_id|> とし、本文の前後の空白は除く。
+      メッセージ内の複数のテキストブロックは改行でつなぐ。
+    - 最後のメッセージが user の場合は assistant のヘッダーを付けて応答を生成させ、
+      assistant の場合は応答の書き出しとして <|eot_id|> を付けずに続きを生成させる。
+    - ペイロードは prompt を最後の項目にした JSON とし、推論パラメータとシステムプロンプトまでの部分(プレフィックス)を
+      シリアライズ済みのバイト列として LRU でキャッシュする。リクエストごとには会話部分のみをエスケープしてつなぐ。
+      JSON の文字列のエスケープは文字ごとに行われるため、分けてエスケープしてつないでも全体をエスケープした結果と一致する。
+    """
+
+    def __init__(self, max_cached_prefixes: int) -> None:
+        self.max_cached_prefixes = max_cached_prefixes
+        self._prefixes: OrderedDict[tuple[bytes, str | None], bytes] = OrderedDict()
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+
+    def render(self, messages: Sequence[Message], system: str | None = None) -> str:
+        """
+        プロンプトを組み立てる。
+
+        Args:
+            messages (Sequence[Message]): 会話履歴
+            system (str | None, optional): システムプロンプト
+
+        Returns:
+            str: プロンプト
+        """
+        return render_prefix(system) + render_turns(messages)
+
+    def payload(self, params: Mapping[str, Any], messages: Sequence[Message], system: str | None = None) -> bytes:
+        """
+        推論パラメータとプロンプトを含むペイロードの JSON を組み立てる。
+
+        Args:
+            params (Mapping[str, Any]): 推論パラメータ。prompt の項目は無視する
+            messages (Sequence[Message]): 会話履歴
+            system (str | None, optional): システムプロンプト
+
+        Returns:
+            bytes: ペイロードの JSON
+        """
+        return self._serialized_prefix(params, system) + orjson.dumps(render_turns(messages))[1:-1] + b'"}'
+
+    def _serialized_prefix(self, params: Mapping[str, Any], system: str | None) -> bytes:
+        """
+        推論パラメータとシステムプロンプトまでをシリアライズした、閉じていない JSON を返す。
+
+        Args:
+            params (Mapping[str, Any]): 推論パラメータ
+            system (str | None): システムプロンプト
+
+        Returns:
+            bytes: {"...":...,"prompt":"<システムプロンプトまでのエスケープ済みのプロンプト> の形のバイト列
+        """
+        head = orjson.dumps({name: value for name, value in params.items() if name != PROMPT_KEY})
+        key = (head, system)
+        prefix = self._prefixes.get(key)
+        if prefix is not None:
+            self._prefixes.move_to_end(key)
+            self.prefix_hits += 1
+            return prefix
+
+        self.prefix_misses += 1
+        separator = b"," if head != b"{}" else b""
+        prefix = head[:-1] + separator + b'"' + PROMPT_KEY.encode() + b'":"' + orjson.dumps(render_prefix(system))[1:-1]
+        self._prefixes[key] = prefix
+        if len(self._prefixes) > self.max_cached_prefixes:
+            self._prefixes.popitem(last=False)
+        return prefix
+
+
+def render_prefix(system: str | None) -> str:
+    """
+    会話の前に置く部分(<|begin_of_text|> とシステムプロンプト)を組み立てる。
+
+    Args:
+        system (str | None): システムプロンプト
+
+    Returns:
+        str: プロンプトの先頭部分
+    """
+    if system is None or not system.strip():
+        return BEGIN_OF_TEXT
+    return BEGIN_OF_TEXT + ROLE_HEADERS["system"] + system.strip() + END_OF_TURN
+
+
+def render_turns(messages: Sequence[Message]) -> str:
+    """
+    会話履歴のターンを組み立てる。
+
+    Args:
+        messages (Sequence[Message]): 会話履歴
+
+    Raises:
+        HTTPException: メッセージがない、テキスト以外のブロックを含む、もしくは最後のメッセージが空の場合
+
+    Returns:
+        str: 会話部分のプロンプト
+    """
+    if not messages:
+        raise HTTPException(status_code=400, detail="メッセージが指定されていません")
+    parts: list[str] = []
+    for message in messages:
+        texts: list[str] = []
+        for block in message.content:
+            text = getattr(block, "text", None)
+            if text is None:
+                raise HTTPException(status_code=400, detail="invoke_model はテキスト以外のコンテンツに対応していません")
+            texts.append(text)
+        parts.append(ROLE_HEADERS[message.role])
+        parts.append("\n".join(texts).strip())
+        parts.append(END_OF_TURN)
+
+    last = messages[-1]
+    if not parts[-2]:
+        raise HTTPException(status_code=400, detail="最後のメッセージのテキストが空です")
+    if last.role == "assistant":
+        # 応答の書き出しとして、続きを生成させる
+        parts.pop()
+    else:
+        parts.append(ROLE_HEADERS["assistant"])
+    return "".join(parts)
+
+
+# プロセス内で共有するビルダー(システムプロンプトのプレフィックスをリクエスト間で再利用する)
+LLAMA3_PROMPT_BUILDER = Llama3PromptBuilder(PREFIX_CACHE_MAX_ENTRIES)
@@ -4,10 +4,9 @@ Llama3モデルとの対話処理(invoke, converse 等)を提供するサービ
 
 from __future__ import annotations
 
-import asyncio
 import json
 import logging
-from typing import TYPE_CHECKING, Any, AsyncGenerator, List
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Literal, cast
 
 from botocore.exceptions import ClientError
 from fastapi import HTTPException
@@ -15,41 +14,52 @@ from fastapi import HTTPException
 from app.interfaces.bedrock_interface import (
     BedrockModelBase,
     ConfigTypeDef,
+    SupportsBatchInferenceMixin,
     SupportsConverseMixin,
     SupportsConverseStreamMixin,
     SupportsInvokeModelMixin,
     SupportsInvokeModelStreamMixin,
 )
-from app.types.bedrock_type_defs import (
-    LlamaConfigTypeDef,
-    LlamaInvokeRequestModelConfigTypeDef,
-    LlamaInvokeRequestStreamModelConfigTypeDef,
-)
+from app.services.bedrock.bedrock_errors import to_http_exception
+from app.services.bedrock.conversation_history import ConversationHistoryManager, estimate_llama3_tokens
+from app.services.bedrock.llama3_prompt import LLAMA3_PROMPT_BUILDER
+from app.services.bedrock.message_conversion import to_messages
+from app.services.bedrock.stream_utils import delta_texts
+from app.types.bedrock_type_defs import LlamaConfigTypeDef
 
 if TYPE_CHECKING:
     from collections.abc import Sequence
 
-    from mypy_boto3_bedrock_runtime import BedrockRuntimeClient
     from mypy_boto3_bedrock_runtime.type_defs import (
         BlobTypeDef,
-        ContentBlockUnionTypeDef,
         ConverseRequestRequestTypeDef,
         ConverseResponseTypeDef,
         ConverseStreamRequestRequestTypeDef,
-        ConverseStreamResponseTypeDef,
         InvokeModelRequestRequestTypeDef,
-        InvokeModelResponseTypeDef,
         InvokeModelWithResponseStreamRequestRequestTypeDef,
-        InvokeModelWithResponseStreamResponseTypeDef,
         MessageTypeDef,
         MessageUnionTypeDef,
+        SystemContentBlockTypeDef,
     )
 
+    from app.interfaces.bedrock_interface import BedrockRuntimeBase
     from app.schemas.bedrock_schema import MessageList
+    from app.types.bedrock_type_defs import (
+        ConverseStreamResultTypeDef,
+        InvokeModelResultTypeDef,
+        InvokeModelStreamResultTypeDef,
+        StreamEventTypeDef,
+    )
 
 
 logger = logging.getLogger(__name__)
 
+# 切り捨てた会話履歴を要約する際のシステムプロンプト
+HISTORY_SUMMARY_PROMPT = (
+    "あなたは会話の要約者です。与えられた会話から、以降の応答に必要な事実・決定事項・ユーザーの要望を、"
+    "会話と同じ言語で簡潔に箇条書きで要約してください。要約以外は出力しないでください。"
+)
+
 
 class LlamaService(
     BedrockModelBase[LlamaConfigTypeDef],
@@ -57,19 +67,20 @@ class LlamaService(
     SupportsConverseStreamMixin,
     SupportsInvokeModelMixin,
     SupportsInvokeModelStreamMixin,
+    SupportsBatchInferenceMixin,
 ):
     """
     Llama3モデルに関する処理を提供するサービスクラス
     """
 
     @classmethod
-    def from_dependency(cls, client: BedrockRuntimeClient, config: ConfigTypeDef[LlamaConfigTypeDef]) -> LlamaService:
+    def from_dependency(cls, client: BedrockRuntimeBase, config: ConfigTypeDef[LlamaConfigTypeDef]) -> LlamaService:
         """
         FastAPI の `Depends` で使用する依存性注入メソッド。
         依存性を注入したサービスのインスタンスを生成する。
 
         Args:
-            client (BedrockRuntimeClient): bedrockのクライアント
+            client (BedrockRuntimeBase): bedrockのランタイム
             config (ConfigTypeDef[LlamaConfigTypeDef]): モデル設定
 
         Returns:
@@ -77,6 +88,20 @@ class LlamaService(
         """
         return cls(client, config)
 
+    def max_output_tokens(self, operation: Literal["converse_stream", "invoke_stream"]) -> int | None:
+        """
+        ストリーミング応答で生成するトークン数の上限を返す。invoke_stream は Llama の max_gen_len を返す。
+
+        Args:
+            operation (Literal["converse_stream", "invoke_stream"]): ストリーミング応答の API
+
+        Returns:
+            int | None: 生成するトークン数の上限
+        """
+        if operation == "invoke_stream":
+            return self.config["model"]["invoke_stream"]["max_gen_len"]
+        return super().max_output_tokens(operation)
+
     async def invoke_model(self, payload: BlobTypeDef) -> str:
         """
         ペイロードを用いてモデルを呼び出す。
@@ -91,15 +116,14 @@ class LlamaService(
         invoke_config["body"] = payload
         try:
             # モデルの呼び出し
-            print(invoke_config)
-            response: InvokeModelResponseTypeDef = await asyncio.to_thread(self._invoke_model, self.client, invoke_config)
+            response: InvokeModelResultTypeDef = await self._invoke_model(self.client, invoke_config)
 
             # レスポンスの解析
-            response_body: Any = json.loads(response["body"].read())
+            response_body: Any = json.loads(response["body"])
             generated_text: str = response_body["generation"]
 
         except ClientError as e:
-            raise HTTPException(status_code=400, detail="無効な入力です") from e
+            raise to_http_exception(e) from e
 
         except json.JSONDecodeError as e:
             raise HTTPException(status_code=500, detail="レスポンスのデコードに失敗しました") from e
@@ -113,6 +137,7 @@ class LlamaService(
     def generate_invoke_model_payload(self, message_list_schema: MessageList) -> BlobTypeDef:
         """
         invoke_model用のペイロードを生成する。
+        すべてのターンとシステムプロンプトを Llama 3 のチャットテンプレートで組み立てる。
 
         Args:
             message_list_schema (MessageList): ユーザーからの入力
@@ -120,52 +145,54 @@ class LlamaService(
         Returns:
             BlobTypeDef: ペイロード
         """
-        # いったん入力テキストをフォーマットするだけにする
-        dumped_schema: dict[str, Any] = message_list_schema.model_dump()
-        message: MessageTypeDef = dumped_schema["messages"][0]
-        content: ContentBlockUnionTypeDef = message["content"][0]
-
-        if "text" not in content or not content["text"].strip():
-            raise HTTPException(status_code=400, detail="textパラメータが指定されていません。")
+        return LLAMA3_PROMPT_BUILDER.payload(self.config["model"]["invoke"], message_list_schema.messages, self.config["model"].get("system_prompt"))
 
-        # Llama 3.3 Instructモデル用のプロンプトフォーマット
-        formatted_prompt: str = f"""
-        <|begin_of_text|><|start_header_id|>user<|end_header_id|>
-        {content["text"]}
-        <|eot_id|>
-        <|start_header_id|>assistant<|end_header_id|>
+    def invoke_model_stream(self, payload: BlobTypeDef) -> AsyncGenerator[str]:
         """
+        ペイロードを用いてモデルを呼び出す(ストリーミング対応)。
 
-        # リクエストペイロードの作成
-        payload: LlamaInvokeRequestModelConfigTypeDef = self.config["model"]["invoke"].copy()
-        payload["prompt"] = formatted_prompt
-        request_payload: str = json.dumps(payload)
+        Args:
+            payload (BlobTypeDef): ペイロード
 
-        return request_payload
+        Returns:
+            AsyncGenerator[str]: 各チャンクの部分的なレスポンス
+        """
+        return delta_texts(self.invoke_model_stream_events(payload))
 
-    async def invoke_model_stream(self, payload: BlobTypeDef) -> AsyncGenerator[str]:
+    async def invoke_model_stream_events(self, payload: BlobTypeDef) -> AsyncGenerator[StreamEventTypeDef]:
         """
-        ペイロードを用いてモデルを呼び出す(ストリーミング対応)。
+        ペイロードを用いてモデルを呼び出し(ストリーミング対応)、応答の差分に加えて終了理由とトークン使用量のイベントを返す。
+        Llama の stop_reason を messageStop、最後のチャンクの amazon-bedrock-invocationMetrics を metadata として
+        Converse Stream API と同じ形式で返す。
 
         Args:
             payload (BlobTypeDef): ペイロード
 
         Yields:
-            str: 各チャンクの部分的なレスポンス
+            StreamEventTypeDef: ストリーミング応答のイベント
         """
         invoke_config: InvokeModelWithResponseStreamRequestRequestTypeDef = self.config["sdk"]["invoke_stream"].copy()
         invoke_config["body"] = payload
         try:
             # モデルの呼び出し
-            response: InvokeModelWithResponseStreamResponseTypeDef = await asyncio.to_thread(self._invoke_model_stream, self.client, invoke_config)
-
-            # ストリーミング応答をリアルタイムで処理
-            for event in response["body"]:
-                chunk = json.loads(event["chunk"]["bytes"])
-                yield chunk["generation"]
+            response: InvokeModelStreamResultTypeDef = await self._invoke_model_stream(self.client, invoke_config)
+
+            # ストリーミング応答をリアルタイムで処理。途中で閉じられた場合は上流のストリームもすぐに閉じる
+            try:
+                async for event in response["body"]:
+                    chunk = json.loads(event["chunk"]["bytes"])
+                    if chunk["generation"]:
+                        yield {"event": "delta", "data": {"text": chunk["generation"]}}
+                    if chunk.get("stop_reason") is not None:
+                        yield {"event": "messageStop", "data": {"stopReason": chunk["stop_reason"]}}
+                    invocation_metrics = chunk.get("amazon-bedrock-invocationMetrics")
+                    if invocation_metrics is not None:
+                        yield {"event": "metadata", "data": _invocation_metadata(invocation_metrics)}
+            finally:
+                await response["body"].aclose()
 
         except ClientError as e:
-            raise HTTPException(status_code=400, detail="無効な入力です") from e
+            raise to_http_exception(e) from e
 
         except (json.JSONDecodeError, KeyError, TypeError) as e:
             raise HTTPException(status_code=500, detail="ストリーミングレスポンスの解析に失敗しました") from e
@@ -173,6 +200,7 @@ class LlamaService(
     def generate_invoke_model_stream_payload(self, message_list_schema: MessageList) -> BlobTypeDef:
         """
         invoke_model_stream用のペイロードを生成する。
+        すべてのターンとシステムプロンプトを Llama 3 のチャットテンプレートで組み立てる。
 
         Args:
             message_list_schema (MessageList): ユーザーからの入力
@@ -180,28 +208,7 @@ class LlamaService(
         Returns:
             BlobTypeDef: ペイロード
         """
-        # いったん入力テキストをフォーマットするだけにする
-        dumped_schema: dict[str, Any] = message_list_schema.model_dump()
-        message: MessageTypeDef = dumped_schema["messages"][0]
-        content: ContentBlockUnionTypeDef = message["content"][0]
-
-        if "text" not in content or not content["text"].strip():
-            raise HTTPException(status_code=400, detail="無効な入力です")
-
-        # Llama 3.3 Instructモデル用のプロンプトフォーマット
-        formatted_prompt: str = f"""
-        <|begin_of_text|><|start_header_id|>user<|end_header_id|>
-        {content["text"]}
-        <|eot_id|>
-        <|start_header_id|>assistant<|end_header_id|>
-        """
-
-        # リクエストペイロードの作成
-        payload: LlamaInvokeRequestStreamModelConfigTypeDef = self.config["model"]["invoke_stream"].copy()
-        payload["prompt"] = formatted_prompt
-        request_payload: str = json.dumps(payload)
-
-        return request_payload
+        return LLAMA3_PROMPT_BUILDER.payload(self.config["model"]["invoke_stream"], message_list_schema.messages, self.config["model"].get("system_prompt"))
 
     async def converse(self, messages: Sequence[MessageUnionTypeDef]) -> str:
         """
@@ -214,14 +221,13 @@ class LlamaService(
             str: モデルからのレスポンス文字列。
         """
         converse_config: ConverseRequestRequestTypeDef = self.config["sdk"]["converse"].copy()
-        converse_config["messages"] = messages
+        converse_config["messages"] = await self._fit_history(messages, converse_config.get("system"))
         try:
             # モデルの呼び出し
-            print(converse_config)
-            response: ConverseResponseTypeDef = await asyncio.to_thread(self._converse, self.client, converse_config)
+            response: ConverseResponseTypeDef = await self._converse(self.client, converse_config)
         except ClientError as e:
-            print(f"エラーが発生しました: {e}")
-            raise HTTPException(status_code=400, detail="無効な入力です") from e
+            logger.warning("Converse の呼び出しでエラーが発生しました: %s", e)
+            raise to_http_exception(e) from e
         else:
             return response["output"]["message"]["content"][0]["text"]
 
@@ -237,34 +243,52 @@ class LlamaService(
         """
         # ここでDBなどから履歴を取得して入れてもいい
         # 今はいったんこのまま返す
-        dumped_schema: dict[str, Any] = message_list_schema.model_dump(exclude_none=True)
-        messages: List[MessageTypeDef] = dumped_schema["messages"]
-        print(messages)
-        return messages
+        return to_messages(message_list_schema)
 
-    async def converse_stream(self, messages: Sequence[MessageTypeDef]) -> AsyncGenerator[str]:
+    def converse_stream(self, messages: Sequence[MessageTypeDef]) -> AsyncGenerator[str]:
         """
         Converse Stream API を使用して メッセージを送信する(ストリーミング対応)。
 
+        Args:
+            messages (Sequence[MessageUnionTypeDef]): ユーザーの会話履歴
+
+        Returns:
+            AsyncGenerator[str]: 各チャンクの部分的なレスポンス
+        """
+        return delta_texts(self.converse_stream_events(messages))
+
+    async def converse_stream_events(self, messages: Sequence[MessageTypeDef]) -> AsyncGenerator[StreamEventTypeDef]:
+        """
+        Converse Stream API を使用して メッセージを送信し(ストリーミング対応)、応答の差分に加えて
+        messageStop(終了理由)と metadata(トークン使用量とレイテンシ)のイベントを返す。
+
         Args:
             messages (Sequence[MessageUnionTypeDef]): ユーザーの会話履歴
 
         Yields:
-            str: 各チャンクの部分的なレスポンス
+            StreamEventTypeDef: ストリーミング応答のイベント
         """
         converse_config: ConverseStreamRequestRequestTypeDef = self.config["sdk"]["converse_stream"].copy()
-        converse_config["messages"] = messages
+        converse_config["messages"] = cast("list[MessageTypeDef]", await self._fit_history(messages, converse_config.get("system")))
         try:
             # モデルの呼び出し
-            streaming_response: ConverseStreamResponseTypeDef = await asyncio.to_thread(self._converse_stream, self.client, converse_config)
-
-            # ストリーミング応答をリアルタイムで処理
-            for chunk in streaming_response["stream"]:
-                if "contentBlockDelta" in chunk:
-                    yield chunk["contentBlockDelta"]["delta"]["text"]
+            streaming_response: ConverseStreamResultTypeDef = await self._converse_stream(self.client, converse_config)
+
+            # ストリーミング応答をリアルタイムで処理。途中で閉じられた場合は上流のストリームもすぐに閉じる
+            try:
+                async for chunk in streaming_response["stream"]:
+                    if "contentBlockDelta" in chunk:
+                        yield {"event": "delta", "data": {"text": chunk["contentBlockDelta"]["delta"]["text"]}}
+                    elif "messageStop" in chunk:
+                        yield {"event": "messageStop", "data": {"stopReason": chunk["messageStop"]["stopReason"]}}
+                    elif "metadata" in chunk:
+                        metadata = chunk["metadata"]
+                        yield {"event": "metadata", "data": {"usage": dict(metadata["usage"]), "metrics": dict(metadata.get("metrics", {}))}}
+            finally:
+                await streaming_response["stream"].aclose()
 
         except ClientError as e:
-            raise HTTPException(status_code=400, detail="無効な入力です") from e
+            raise to_http_exception(e) from e
 
         except (KeyError, TypeError) as e:
             raise HTTPException(status_code=500, detail="ストリーミングレスポンスの解析に失敗しました") from e
@@ -281,6 +305,93 @@ class LlamaService(
         """
         # ここでDBなどから履歴を取得して入れてもいい
         # 今はいったんこのまま返す
-        dumped_schema: dict[str, Any] = message_list_schema.model_dump(exclude_none=True)
-        messages: List[MessageTypeDef] = dumped_schema["messages"]
-        return messages
+        return to_messages(message_list_schema)
+
+    async def _fit_history(self, messages: Sequence[MessageUnionTypeDef], system: Sequence[SystemContentBlockTypeDef] | None) -> list[MessageUnionTypeDef]:
+        """
+        会話履歴を設定の入力トークン数の上限に収める。設定がない場合や無効な場合はそのまま返す。
+
+        Args:
+            messages (Sequence[MessageUnionTypeDef]): ユーザーの会話履歴
+            system (Sequence[SystemContentBlockTypeDef] | None): システムプロンプト
+
+        Returns:
+            list[MessageUnionTypeDef]: 上限に収めた会話履歴
+        """
+        history_config = self.config.get("history")
+        if history_config is None or not history_config["enabled"]:
+            return list(messages)
+        return await ConversationHistoryManager(history_config, estimate_llama3_tokens).fit(messages, system, self._summarize_history)
+
+    async def _summarize_history(self, transcript: str) -> str:
+        """
+        切り捨てた会話履歴を Converse API で要約する。
+
+        Args:
+            transcript (str): 文字起こしした会話
+
+        Returns:
+            str: 要約
+        """
+        summary_request: ConverseRequestRequestTypeDef = {
+            "modelId": self.config["sdk"]["converse"]["modelId"],
+            "system": [{"text": HISTORY_SUMMARY_PROMPT}],
+            "messages": [{"role": "user", "content": [{"text": transcript}]}],
+            "inferenceConfig": {"maxTokens": self.config["history"]["summary_max_tokens"], "temperature": 0},
+        }
+        response: ConverseResponseTypeDef = await self._converse(self.client, summary_request)
+        summary: str = response["output"]["message"]["content"][0]["text"]
+        return summary
+
+    def batch_model_id(self) -> str:
+        """
+        バッチ推論ジョブで使用するモデルIDを返す。
+
+        Returns:
+            str: モデルID
+        """
+        return self.config["sdk"]["invoke"]["modelId"]
+
+    def generate_batch_model_input(self, message_list_schema: MessageList) -> dict[str, Any]:
+        """
+        バッチ推論ジョブの入力レコードの modelInput を生成する。invoke_model と同じペイロードを使用する。
+
+        Args:
+            message_list_schema (MessageList): ユーザーからの入力
+
+        Returns:
+            dict[str, Any]: modelInput
+        """
+        model_input: dict[str, Any] = json.loads(cast("bytes", self.generate_invoke_model_payload(message_list_schema)))
+        return model_input
+
+    def parse_batch_model_output(self, model_output: dict[str, Any]) -> str:
+        """
+        バッチ推論ジョブの出力レコードの modelOutput から生成テキストを取り出す。
+
+        Args:
+            model_output (dict[str, Any]): modelOutput
+
+        Returns:
+            str: モデルからのレスポンス。
+        """
+        generated_text: str = model_output["generation"]
+        return generated_text
+
+
+def _invocation_metadata(invocation_metrics: dict[str, Any]) -> dict[str, Any]:
+    """
+    InvokeModel のストリームの amazon-bedrock-invocationMetrics を、Converse Stream API の metadata と同じ形式にする。
+
+    Args:
+        invocation_metrics (dict[str, Any]): amazon-bedrock-invocationMetrics
+
+    Returns:
+        dict[str, Any]: usage と metrics を含む metadata
+    """
+    input_tokens: int = invocation_metrics["inputTokenCount"]
+    output_tokens: int = invocation_metrics["outputTokenCount"]
+    return {
+        "usage": {"inputTokens": input_tokens, "outputTokens": output_tokens, "totalTokens": input_tokens + output_tokens},
+        "metrics": {"latencyMs": invocation_metrics["invocationLatency"], "firstByteLatencyMs": invocation_metrics["firstByteLatency"]},
+    }
@@ -0,0 +1,44 @@
+"""
+検証済みの MessageList から Bedrock のリクエストに渡す構造を直接組み立てる変換処理を実装する。
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, cast
+
+from app.schemas.bedrock_schema import TextContentBlock
+
+if TYPE_CHECKING:
+    from mypy_boto3_bedrock_runtime.type_defs import ContentBlockTypeDef, MessageTypeDef
+
+    from app.schemas.bedrock_schema import MessageContentBlock, MessageList
+
+
+def to_content_block(block: MessageContentBlock) -> ContentBlockTypeDef:
+    """
+    コンテンツブロックを Bedrock の ContentBlockTypeDef に変換する。
+    テキストのみのブロックは検証済みの文字列をそのまま参照し、それ以外のブロックのみ model_dump する。
+
+    Args:
+        block (MessageContentBlock): 検証済みのコンテンツブロック
+
+    Returns:
+        ContentBlockTypeDef: Bedrock のコンテンツブロック
+    """
+    if isinstance(block, TextContentBlock):
+        return {"text": block.text}
+    return cast("ContentBlockTypeDef", block.model_dump(exclude_none=True))
+
+
+def to_messages(message_list: MessageList) -> list[MessageTypeDef]:
+    """
+    MessageList を Bedrock の会話履歴に変換する。
+    model_dump で全体を複製してから取り出すのではなく、検証済みのモデルから必要な構造だけを組み立てる。
+
+    Args:
+        message_list (MessageList): 検証済みのユーザーの入力
+
+    Returns:
+        list[MessageTypeDef]: 会話履歴
+    """
+    return [{"role": message.role, "content": [to_content_block(block) for block in message.content]} for message in message_list.messages]
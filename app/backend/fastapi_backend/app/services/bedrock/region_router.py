@@ -0,0 +1,506 @@
+"""
+リージョンごとの応答時間とエラー率をもとに呼び出し先リージョンを選び、障害が続くリージョンをサーキットブレーカーで切り離す。
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import StrEnum
+from typing import TYPE_CHECKING, AsyncGenerator, TypeVar
+
+from app.interfaces.bedrock_interface import BedrockRuntimeBase
+from app.services.bedrock.bedrock_errors import is_region_failure
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Iterator, Mapping
+
+    from mypy_boto3_bedrock_runtime.type_defs import (
+        ConverseRequestRequestTypeDef,
+        ConverseResponseTypeDef,
+        ConverseStreamOutputTypeDef,
+        ConverseStreamRequestRequestTypeDef,
+        InvokeModelRequestRequestTypeDef,
+        InvokeModelWithResponseStreamRequestRequestTypeDef,
+        ResponseStreamTypeDef,
+    )
+
+    from app.types.bedrock_type_defs import (
+        ConverseStreamResultTypeDef,
+        InvokeModelResultTypeDef,
+        InvokeModelStreamResultTypeDef,
+        RegionRoutingConfigTypeDef,
+        RegionRoutingStatsTypeDef,
+    )
+
+
+logger = logging.getLogger(__name__)
+
+ResultT = TypeVar("ResultT")
+EventT = TypeVar("EventT")
+
+# share_region_selection の中で開始した呼び出しが選んだリージョン。ヘッジの呼び出しはこれらを除いて選ぶ
+_SELECTED_REGIONS: ContextVar[set[str] | None] = ContextVar("selected_regions", default=None)
+
+
+class CircuitState(StrEnum):
+    """サーキットブレーカーの状態を表す列挙型"""
+
+    CLOSED = "closed"  # 通常どおり呼び出す
+    OPEN = "open"  # 呼び出し先から外す
+    HALF_OPEN = "half_open"  # 試験的に 1 件だけ呼び出す
+
+
+class _RegionState:
+    """
+    1 モデル・1 リージョン分の応答時間・エラー率とサーキットブレーカー
+    - 応答時間とエラー率は指数移動平均で追跡する。ストリームは応答時間として最初のイベントまでの時間を記録する。
+    - 連続失敗数またはエラー率が閾値を超えるとサーキットを開き、open_duration の間は呼び出し先から外す。
+    - open_duration 経過後は半開状態とし、試験的な呼び出しが成功すれば閉じ、失敗すれば再び開く。
+    """
+
+    def __init__(self, model_id: str, region: str, config: RegionRoutingConfigTypeDef) -> None:
+        self.model_id = model_id
+        self.region = region
+        self.config = config
+        self.state = CircuitState.CLOSED
+        self.latency_ewma = 0.0
+        self.error_rate_ewma = 0.0
+        self.in_flight = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._consecutive_failures = 0
+        self._samples = 0
+        self._routed = 0
+        self._failures = 0
+        self._circuit_opens = 0
+        self._probes = 0
+
+    def available(self, now: float) -> bool:
+        """
+        呼び出し先として選べるか判定する。開いてから open_duration を過ぎたサーキットは半開状態にする。
+
+        Args:
+            now (float): 現在時刻(time.monotonic)
+
+        Returns:
+            bool: 呼び出し先として選べる場合はTrue
+        """
+        if self.state is CircuitState.OPEN and now - self.opened_at >= self.config["open_duration"]:
+            self.state = CircuitState.HALF_OPEN
+        if self.state is CircuitState.HALF_OPEN:
+            return not self._probe_in_flight
+        return self.state is CircuitState.CLOSED
+
+    def score(self) -> float:
+        """
+        呼び出し先を選ぶための評価値を返す。小さいほど優先する。
+        応答時間の指数移動平均に実行中の呼び出し数を乗じ、遅いリージョンへの集中を避ける。
+        応答時間をまだ記録していないリージョンは 0 となるため、同じ評価値の間では実行中の呼び出し数で比べる(rank を参照)。
+
+        Returns:
+            float: 評価値
+        """
+        return self.latency_ewma * (self.in_flight + 1)
+
+    def on_start(self) -> None:
+        """
+        呼び出しの開始を記録する。半開状態の場合は試験的な呼び出しとして扱う。
+        """
+        self.in_flight += 1
+        self._routed += 1
+        if self.state is CircuitState.HALF_OPEN:
+            self._probe_in_flight = True
+            self._probes += 1
+
+    def on_finish(self, latency: float | None, error: BaseException | None) -> None:
+        """
+        呼び出しの終了を記録し、サーキットの状態を更新する。
+
+        Args:
+            latency (float | None): 応答時間(秒)。記録しない場合はNone
+            error (BaseException | None): 失敗した場合の例外
+        """
+        self.in_flight -= 1
+        alpha = self.config["ewma_alpha"]
+        failed = error is not None and is_region_failure(error)
+        if error is not None and not failed:
+            # リクエスト自体の問題によるエラーはリージョンの状態に反映しない
+            self._probe_in_flight = False
+            return
+
+        self._samples += 1
+        self.error_rate_ewma += alpha * ((1.0 if failed else 0.0) - self.error_rate_ewma)
+        if failed:
+            self._failures += 1
+            self._consecutive_failures += 1
+        else:
+            self._consecutive_failures = 0
+            if latency is not None:
+                self.record_latency(latency)
+
+        if self.state is CircuitState.HALF_OPEN and self._probe_in_flight:
+            self._probe_in_flight = False
+            if failed:
+                self._open()
+            else:
+                self._close()
+        elif self.state is CircuitState.CLOSED and failed and self._should_open():
+            self._open()
+
+    def record_latency(self, latency: float) -> None:
+        """
+        応答時間を指数移動平均に反映する。
+
+        Args:
+            latency (float): 応答時間(秒)
+        """
+        alpha = self.config["ewma_alpha"]
+        self.latency_ewma = latency if self.latency_ewma == 0 else self.latency_ewma + alpha * (latency - self.latency_ewma)
+
+    def on_cancel(self) -> None:
+        """
+        取り消された呼び出しの終了を記録する。取り消しはリージョンの状態に反映しない。
+        """
+        self.in_flight -= 1
+        self._probe_in_flight = False
+
+    def stats(self) -> RegionRoutingStatsTypeDef:
+        """
+        統計情報を返す。
+
+        Returns:
+            RegionRoutingStatsTypeDef: 統計情報
+        """
+        return {
+            "model_id": self.model_id,
+            "region": self.region,
+            "state": self.state.value,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 2),
+            "error_rate_ewma": round(self.error_rate_ewma, 4),
+            "in_flight": self.in_flight,
+            "routed": self._routed,
+            "failures": self._failures,
+            "circuit_opens": self._circuit_opens,
+            "probes": self._probes,
+        }
+
+    def _should_open(self) -> bool:
+        """
+        サーキットを開くべきか判定する。
+
+        Returns:
+            bool: 連続失敗数、またはサンプル数が十分な状態でのエラー率が閾値を超えた場合はTrue
+        """
+        if self._consecutive_failures >= self.config["failure_threshold"]:
+            return True
+        return self._samples >= self.config["min_samples"] and self.error_rate_ewma >= self.config["error_rate_threshold"]
+
+    def _open(self) -> None:
+        """
+        サーキットを開く。
+        """
+        self.state = CircuitState.OPEN
+        self.opened_at = time.monotonic()
+        self._circuit_opens += 1
+        logger.warning(
+            "障害が続いているためリージョンを呼び出し先から外しました (model=%s, region=%s, error_rate=%.2f)",
+            self.model_id,
+            self.region,
+            self.error_rate_ewma,
+        )
+
+    def _close(self) -> None:
+        """
+        サーキットを閉じ、エラーの記録をリセットする。
+        """
+        self.state = CircuitState.CLOSED
+        self.error_rate_ewma = 0.0
+        self._consecutive_failures = 0
+        logger.info("リージョンを呼び出し先に戻しました (model=%s, region=%s)", self.model_id, self.region)
+
+
+class _StreamTicket:
+    """
+    ストリームが保持するリージョンの呼び出し記録。終了の記録は 1 回のみ行う。
+    """
+
+    def __init__(self, region_state: _RegionState, started_at: float) -> None:
+        self.region_state = region_state
+        self.started_at = started_at
+        self._first_event = False
+        self._finished = False
+
+    def first_event(self) -> None:
+        """
+        最初のイベントを受信した時点で、開始からの時間を応答時間として記録する。2 回目以降は何もしない。
+        """
+        if not self._first_event:
+            self._first_event = True
+            self.region_state.record_latency(time.monotonic() - self.started_at)
+
+    def finish(self, error: BaseException | None = None) -> None:
+        """
+        呼び出しの終了を記録する。記録済みの場合は何もしない。
+
+        Args:
+            error (BaseException | None, optional): 失敗した場合の例外
+        """
+        if not self._finished:
+            self._finished = True
+            self.region_state.on_finish(None, error)
+
+
+class RegionRouter:
+    """
+    モデルごとにリージョンの応答時間とエラー率を追跡し、呼び出し先のリージョンを選ぶ制御器
+    サーキットが閉じている(または試験的な呼び出しを受け付ける)リージョンのうち、評価値が最も小さいものを選ぶ。
+    すべてのリージョンのサーキットが開いている場合は、最も早く開いたリージョンを選ぶ。
+    """
+
+    def __init__(self, config: RegionRoutingConfigTypeDef) -> None:
+        self.config = config
+        self._states: dict[tuple[str, str], _RegionState] = {}
+
+    def rank(self, model_id: str, regions: list[str]) -> list[_RegionState]:
+        """
+        呼び出し先の候補を優先度順に返す。半開状態のリージョンは試験的な呼び出しのため最優先とする。
+
+        Args:
+            model_id (str): モデルID
+            regions (list[str]): 候補のリージョン
+
+        Returns:
+            list[_RegionState]: 優先度順のリージョンの状態
+        """
+        now = time.monotonic()
+        states = [self._state(model_id, region) for region in regions]
+        available = [state for state in states if state.available(now)]
+        if not available:
+            return sorted(states, key=lambda state: state.opened_at)
+        # 応答時間を記録していないリージョン同士も負荷を分散するため、評価値が同じ場合は実行中の呼び出し数で比べる
+        return sorted(available, key=lambda state: (state.state is not CircuitState.HALF_OPEN, state.score(), state.in_flight))
+
+    async def call(self, region_state: _RegionState, fn: Callable[[], Awaitable[ResultT]]) -> ResultT:
+        """
+        選んだリージョンを呼び出し、応答時間と結果を記録する。
+
+        Args:
+            region_state (_RegionState): 呼び出すリージョンの状態
+            fn (Callable[[], Awaitable[ResultT]]): 上流の呼び出し
+
+        Returns:
+            ResultT: 呼び出しの結果
+        """
+        region_state.on_start()
+        started_at = time.monotonic()
+        try:
+            result = await fn()
+        except Exception as e:
+            region_state.on_finish(None, e)
+            raise
+        except BaseException:
+            region_state.on_cancel()
+            raise
+        region_state.on_finish(time.monotonic() - started_at, None)
+        return result
+
+    async def stream(self, region_state: _RegionState, fn: Callable[[], Awaitable[AsyncGenerator[EventT]]]) -> AsyncGenerator[EventT]:
+        """
+        選んだリージョンでストリームを開始する。ストリームの途中のエラーもリージョンの状態に反映する。
+        応答時間として、開始から最初のイベントを受信するまでの時間を記録する。
+
+        Args:
+            region_state (_RegionState): 呼び出すリージョンの状態
+            fn (Callable[[], Awaitable[AsyncGenerator[EventT]]]): 上流のストリームを開始する呼び出し
+
+        Returns:
+            AsyncGenerator[EventT]: 上流のイベントを返す非同期ジェネレーター
+        """
+        region_state.on_start()
+        started_at = time.monotonic()
+        try:
+            stream = await fn()
+        except Exception as e:
+            region_state.on_finish(None, e)
+            raise
+        except BaseException:
+            region_state.on_cancel()
+            raise
+        ticket = _StreamTicket(region_state, started_at)
+        held = self._hold(ticket, stream)
+        # 一度も読まれずに破棄されたジェネレーターは finally が実行されないため、破棄時にも終了を記録する
+        weakref.finalize(held, ticket.finish)
+        return held
+
+    def stats(self) -> list[RegionRoutingStatsTypeDef]:
+        """
+        モデル・リージョンごとの統計情報を返す。
+
+        Returns:
+            list[RegionRoutingStatsTypeDef]: モデル・リージョンごとの統計情報
+        """
+        return [state.stats() for state in list(self._states.values())]
+
+    @staticmethod
+    async def _hold(ticket: _StreamTicket, stream: AsyncGenerator[EventT]) -> AsyncGenerator[EventT]:
+        """
+        ストリームのイベントを返し、終了時に結果を記録する。
+
+        Args:
+            ticket (_StreamTicket): ストリームが保持する呼び出し記録
+            stream (AsyncGenerator[EventT]): 上流のストリーム
+
+        Yields:
+            EventT: ストリームのイベント
+        """
+        try:
+            async for event in stream:
+                ticket.first_event()
+                yield event
+        except Exception as e:
+            ticket.finish(e)
+            raise
+        finally:
+            await stream.aclose()
+            ticket.finish()
+
+    def _state(self, model_id: str, region: str) -> _RegionState:
+        """
+        モデル・リージョンの状態を返す。未生成の場合は生成して登録する。
+
+        Args:
+            model_id (str): モデルID
+            region (str): リージョン
+
+        Returns:
+            _RegionState: モデル・リージョンの状態
+        """
+        key = (model_id, region)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _RegionState(model_id, region, self.config)
+        return state
+
+
+@contextmanager
+def share_region_selection() -> Iterator[None]:
+    """
+    この中で開始した呼び出し(とそのタスク)の間で、選んだリージョンを共有する。
+    ヘッジでは最初の呼び出しとヘッジの呼び出しを囲み、ヘッジを最初の呼び出しと同じリージョンに送らないようにする。
+
+    Yields:
+        None: 共有する範囲
+    """
+    token = _SELECTED_REGIONS.set(set())
+    try:
+        yield
+    finally:
+        _SELECTED_REGIONS.reset(token)
+
+
+class RoutedBedrockRuntime(BedrockRuntimeBase):
+    """
+    リクエストごとに呼び出し先のリージョンを選ぶランタイム
+    各リージョンのランタイムはレジストリが所有するため、このクラスでは事前接続・解放を行わない。
+    hedge に True を指定すると、share_region_selection の中で選ばれたリージョンを除いて選ぶ(ヘッジの送り先)。
+    """
+
+    def __init__(self, region_clients: Mapping[str, BedrockRuntimeBase], router: RegionRouter, *, hedge: bool = False) -> None:
+        self.region_clients = region_clients
+        self.router = router
+        self.hedge = hedge
+        self._regions = list(region_clients)
+
+    async def converse(self, request_args: ConverseRequestRequestTypeDef) -> ConverseResponseTypeDef:
+        """
+        リージョンを選んで Converse API を呼び出す。
+
+        Args:
+            request_args (ConverseRequestRequestTypeDef): converseに渡すパラメータ
+
+        Returns:
+            ConverseResponseTypeDef: モデルからのレスポンス
+        """
+        region_state = self._select(request_args["modelId"])
+        client = self.region_clients[region_state.region]
+        return await self.router.call(region_state, lambda: client.converse(request_args))
+
+    async def converse_stream(self, request_args: ConverseStreamRequestRequestTypeDef) -> ConverseStreamResultTypeDef:
+        """
+        リージョンを選んで Converse Stream API を呼び出す。
+
+        Args:
+            request_args (ConverseStreamRequestRequestTypeDef): converse_streamに渡すパラメータ
+
+        Returns:
+            ConverseStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        region_state = self._select(request_args["modelId"])
+        client = self.region_clients[region_state.region]
+
+        async def _open() -> AsyncGenerator[ConverseStreamOutputTypeDef]:
+            return (await client.converse_stream(request_args))["stream"]
+
+        return {"stream": await self.router.stream(region_state, _open)}
+
+    async def invoke_model(self, request_args: InvokeModelRequestRequestTypeDef) -> InvokeModelResultTypeDef:
+        """
+        リージョンを選んで Invoke Model API を呼び出す。
+
+        Args:
+            request_args (InvokeModelRequestRequestTypeDef): invoke_modelに渡すパラメータ
+
+        Returns:
+            InvokeModelResultTypeDef: 読み込み済みのボディを含むレスポンス
+        """
+        region_state = self._select(request_args["modelId"])
+        client = self.region_clients[region_state.region]
+        return await self.router.call(region_state, lambda: client.invoke_model(request_args))
+
+    async def invoke_model_with_response_stream(self, request_args: InvokeModelWithResponseStreamRequestRequestTypeDef) -> InvokeModelStreamResultTypeDef:
+        """
+        リージョンを選んで Invoke Model With Response Stream API を呼び出す。
+
+        Args:
+            request_args (InvokeModelWithResponseStreamRequestRequestTypeDef): invoke_model_with_response_streamに渡すパラメータ
+
+        Returns:
+            InvokeModelStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        region_state = self._select(request_args["modelId"])
+        client = self.region_clients[region_state.region]
+        content_type = ""
+
+        async def _open() -> AsyncGenerator[ResponseStreamTypeDef]:
+            nonlocal content_type
+            response = await client.invoke_model_with_response_stream(request_args)
+            content_type = response["contentType"]
+            return response["body"]
+
+        body = await self.router.stream(region_state, _open)
+        return {"body": body, "contentType": content_type}
+
+    def _select(self, model_id: str) -> _RegionState:
+        """
+        呼び出し先のリージョンを選ぶ。
+        ヘッジの場合は選択済みのリージョンを除いた候補のうち最も優先度の高いものを選ぶ。
+        他に選べるリージョンが無い場合のみ、選択済みのリージョンに送る。
+
+        Args:
+            model_id (str): モデルID
+
+        Returns:
+            _RegionState: 呼び出すリージョンの状態
+        """
+        ranked = self.router.rank(model_id, self._regions)
+        region_state = ranked[0]
+        selected = _SELECTED_REGIONS.get()
+        if selected is not None:
+            if self.hedge:
+                region_state = next((state for state in ranked if state.region not in selected), region_state)
+            selected.add(region_state.region)
+        return region_state
@@ -0,0 +1,56 @@
+"""
+Bedrock へのリクエストを識別するキーを作成する処理を実装する。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+from collections.abc import Mapping
+from typing import Any
+
+import orjson
+
+
+def request_key(operation: str, request_args: Mapping[str, Any]) -> str:
+    """
+    リクエストのパラメータを正規化した JSON のハッシュをキーとして返す。
+    同じ内容のリクエストであれば、項目の順序や None の項目の有無によらず同じキーになる。
+
+    Args:
+        operation (str): キーの名前空間(操作名)
+        request_args (Mapping[str, Any]): リクエストのパラメータ
+
+    Raises:
+        TypeError: ファイルオブジェクト等、正規化できない値を含む場合
+
+    Returns:
+        str: リクエストのキー
+    """
+    canonical = orjson.dumps({"operation": operation, "request": _normalize(request_args)}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(canonical).hexdigest()
+
+
+def _normalize(value: Any) -> Any:  # noqa: ANN401
+    """
+    キー用に値を正規化する。Noneの項目を除き、バイナリ(メモリマップした添付ファイルを含む)はハッシュ値に置き換える。
+
+    Args:
+        value (Any): 正規化する値
+
+    Raises:
+        TypeError: 正規化できない値を含む場合
+
+    Returns:
+        Any: 正規化した値
+    """
+    if isinstance(value, Mapping):
+        return {str(name): _normalize(item) for name, item in value.items() if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, (bytes, bytearray, mmap.mmap)):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    msg = f"リクエストのキーに使用できない値です: {type(value).__name__}"
+    raise TypeError(msg)
@@ -0,0 +1,297 @@
+"""
+ストリーミング応答のイベントをメモリ上のリングバッファに保持し、切断したクライアントが Last-Event-ID で途中から再開できるようにする。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, AsyncGenerator
+
+import orjson
+from fastapi import HTTPException
+
+if TYPE_CHECKING:
+    from app.types.bedrock_type_defs import ResumableStreamConfigTypeDef, ResumableStreamStatsTypeDef, StreamEventTypeDef
+
+
+logger = logging.getLogger(__name__)
+
+# イベントID の生成IDと連番の区切り
+EVENT_ID_SEPARATOR = ":"
+
+
+def parse_event_id(event_id: str) -> tuple[str, int]:
+    """
+    イベントID(<生成ID>:<連番>)を生成IDと連番に分ける。
+
+    Args:
+        event_id (str): イベントID
+
+    Raises:
+        HTTPException: イベントIDの形式が不正な場合
+
+    Returns:
+        tuple[str, int]: 生成IDと連番
+    """
+    generation_id, _, seq = event_id.strip().rpartition(EVENT_ID_SEPARATOR)
+    if not generation_id or not seq.isdigit():
+        raise HTTPException(status_code=400, detail="Last-Event-ID の形式が不正です")
+    return generation_id, int(seq)
+
+
+class _Generation:
+    """
+    1 回の生成で受信したイベントのリングバッファ
+    """
+
+    def __init__(self, generation_id: str) -> None:
+        self.generation_id = generation_id
+        self.events: deque[tuple[StreamEventTypeDef, int]] = deque()  # イベントとそのサイズ
+        self.first_seq = 0  # events の先頭のイベントの連番
+        self.next_seq = 0  # 次に受信するイベントの連番
+        self.done = False
+        self.error: BaseException | None = None
+        self.completed_at: float | None = None
+        self.task: asyncio.Task[None] | None = None
+        self._changed = asyncio.Event()
+
+    def publish(self) -> None:
+        """
+        イベントの追加・終了を待機中の購読者に通知する。
+        """
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self) -> None:
+        """
+        次のイベントの追加・終了まで待機する。
+        """
+        await self._changed.wait()
+
+
+class ResumableStreamStore:
+    """
+    再開できるストリーミング応答のストア
+    - 生成ごとにIDを割り当て、上流のストリームはクライアントの接続とは別のタスクで最後まで読み込む。
+      クライアントが切断しても生成は続き、再接続時に同じ生成を途中から返すため、上流を再び呼び出さない。
+    - イベントは生成ごとに max_events_per_stream 件のリングバッファに保持し、完了後 ttl 秒で捨てる。
+    - 全体の合計サイズが max_total_bytes を超えた場合は、古い完了済みの生成から捨て、
+      完了済みの生成がなければ生成中のものの古いイベントから捨てる。
+    """
+
+    def __init__(self, config: ResumableStreamConfigTypeDef) -> None:
+        self.config = config
+        self._generations: OrderedDict[str, _Generation] = OrderedDict()
+        self._buffered_events = 0
+        self._buffered_bytes = 0
+        self._started = 0
+        self._resumes = 0
+        self._resume_misses = 0
+        self._expired_streams = 0
+        self._evicted_streams = 0
+        self._evicted_events = 0
+
+    def start(self, events: AsyncGenerator[StreamEventTypeDef]) -> str:
+        """
+        上流のストリームの読み込みを開始し、生成IDを返す。
+
+        Args:
+            events (AsyncGenerator[StreamEventTypeDef]): 上流のストリーミング応答のイベント
+
+        Returns:
+            str: 生成ID
+        """
+        self._expire()
+        generation = _Generation(uuid.uuid4().hex)
+        generation.task = asyncio.create_task(self._produce(generation, events))
+        self._generations[generation.generation_id] = generation
+        self._started += 1
+        return generation.generation_id
+
+    def subscribe(self, generation_id: str) -> AsyncGenerator[StreamEventTypeDef]:
+        """
+        開始した生成のイベントを先頭から返す。
+
+        Args:
+            generation_id (str): 生成ID
+
+        Returns:
+            AsyncGenerator[StreamEventTypeDef]: イベントIDを付けたイベント
+        """
+        return self._subscribe(self._generations[generation_id], 0)
+
+    def resume(self, generation_id: str, last_seq: int | None) -> AsyncGenerator[StreamEventTypeDef]:
+        """
+        生成のイベントを、クライアントが最後に受信したイベントの次から返す。生成中であれば続きを待って返す。
+
+        Args:
+            generation_id (str): 生成ID
+            last_seq (int | None): クライアントが最後に受信したイベントの連番。None の場合は先頭から返す
+
+        Raises:
+            HTTPException: 生成、もしくは続きのイベントが残っていない場合(410)
+
+        Returns:
+            AsyncGenerator[StreamEventTypeDef]: イベントIDを付けたイベント
+        """
+        self._expire()
+        generation = self._generations.get(generation_id)
+        seq = 0 if last_seq is None else last_seq + 1
+        if generation is None or seq < generation.first_seq or seq > generation.next_seq:
+            self._resume_misses += 1
+            raise HTTPException(status_code=410, detail="再開できるストリームが残っていません")
+        self._resumes += 1
+        return self._subscribe(generation, seq)
+
+    def stats(self) -> ResumableStreamStatsTypeDef:
+        """
+        統計情報を返す。
+
+        Returns:
+            ResumableStreamStatsTypeDef: 統計情報
+        """
+        self._expire()
+        return {
+            "streams": len(self._generations),
+            "running_streams": sum(1 for generation in self._generations.values() if not generation.done),
+            "buffered_events": self._buffered_events,
+            "buffered_bytes": self._buffered_bytes,
+            "started": self._started,
+            "resumes": self._resumes,
+            "resume_misses": self._resume_misses,
+            "expired_streams": self._expired_streams,
+            "evicted_streams": self._evicted_streams,
+            "evicted_events": self._evicted_events,
+        }
+
+    async def aclose(self) -> None:
+        """
+        読み込み中の上流のストリームを取り消し、すべての生成を捨てる。
+        """
+        tasks = [generation.task for generation in self._generations.values() if generation.task is not None and not generation.task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+        for generation_id in list(self._generations):
+            self._discard(generation_id)
+
+    async def _produce(self, generation: _Generation, events: AsyncGenerator[StreamEventTypeDef]) -> None:
+        """
+        上流のストリームを最後まで読み込み、イベントをリングバッファに追加する。
+
+        Args:
+            generation (_Generation): 追加先の生成
+            events (AsyncGenerator[StreamEventTypeDef]): 上流のストリーミング応答のイベント
+        """
+        try:
+            async for event in events:
+                size = len(orjson.dumps(event["data"]))
+                generation.events.append((event, size))
+                generation.next_seq += 1
+                self._buffered_events += 1
+                self._buffered_bytes += size
+                if len(generation.events) > self.config["max_events_per_stream"]:
+                    self._drop_oldest_event(generation)
+                self._enforce_total_bytes()
+                generation.publish()
+        except Exception as e:  # noqa: BLE001
+            # 上流のエラーは購読者に送出する
+            generation.error = e
+        finally:
+            await events.aclose()
+            generation.done = True
+            generation.completed_at = asyncio.get_running_loop().time()
+            generation.publish()
+
+    async def _subscribe(self, generation: _Generation, seq: int) -> AsyncGenerator[StreamEventTypeDef]:
+        """
+        生成のイベントを指定した連番から返す。
+
+        Args:
+            generation (_Generation): 購読する生成
+            seq (int): 最初に返すイベントの連番
+
+        読み込みが遅れ、続きのイベントがリングバッファから捨てられた場合は、レスポンスの送信後でステータスコードを変更できないため、
+        error イベントを返して終了する。error イベントにはイベントIDを付けないため、クライアントの再接続は resume で 410 になる。
+
+        Raises:
+            BaseException: 上流のストリームでエラーが発生した場合
+
+        Yields:
+            StreamEventTypeDef: イベントIDを付けたイベント
+        """
+        while True:
+            if seq < generation.first_seq:
+                logger.warning("続きのイベントがバッファから捨てられたため、ストリームを終了します (generation_id=%s)", generation.generation_id)
+                yield {"event": "error", "data": {"status_code": 410, "detail": "続きのイベントがバッファから捨てられました"}}
+                return
+            if seq < generation.next_seq:
+                event, _ = generation.events[seq - generation.first_seq]
+                yield {**event, "id": f"{generation.generation_id}{EVENT_ID_SEPARATOR}{seq}"}
+                seq += 1
+            elif generation.done:
+                if generation.error is not None:
+                    raise generation.error
+                return
+            else:
+                await generation.wait()
+
+    def _drop_oldest_event(self, generation: _Generation) -> None:
+        """
+        生成の最も古いイベントを捨てる。
+
+        Args:
+            generation (_Generation): 対象の生成
+        """
+        _, size = generation.events.popleft()
+        generation.first_seq += 1
+        self._buffered_events -= 1
+        self._buffered_bytes -= size
+        self._evicted_events += 1
+
+    def _enforce_total_bytes(self) -> None:
+        """
+        合計サイズが上限を超えている間、古い完了済みの生成、なければ生成中のものの古いイベントから捨てる。
+        """
+        while self._buffered_bytes > self.config["max_total_bytes"]:
+            completed = next((generation_id for generation_id, generation in self._generations.items() if generation.done), None)
+            if completed is not None:
+                self._discard(completed)
+                self._evicted_streams += 1
+                continue
+            running = next((generation for generation in self._generations.values() if generation.events), None)
+            if running is None:
+                return
+            self._drop_oldest_event(running)
+
+    def _expire(self) -> None:
+        """
+        完了後に保持期間を過ぎた生成を捨てる。
+        """
+        now = asyncio.get_running_loop().time()
+        expired = [
+            generation_id
+            for generation_id, generation in self._generations.items()
+            if generation.completed_at is not None and generation.completed_at + self.config["ttl"] <= now
+        ]
+        for generation_id in expired:
+            self._discard(generation_id)
+        self._expired_streams += len(expired)
+
+    def _discard(self, generation_id: str) -> None:
+        """
+        生成を捨てる。読み込み中の購読者には続きのイベントが捨てられたことを通知する。
+
+        Args:
+            generation_id (str): 生成ID
+        """
+        generation = self._generations.pop(generation_id)
+        self._buffered_events -= len(generation.events)
+        self._buffered_bytes -= sum(size for _, size in generation.events)
+        generation.first_seq = generation.next_seq
+        generation.events.clear()
+        generation.publish()
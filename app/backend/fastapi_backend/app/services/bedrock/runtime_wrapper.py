@@ -0,0 +1,107 @@
+"""
+別の Bedrock ランタイムを包んで機能を追加するランタイムの基底クラスを実装する。
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from app.interfaces.bedrock_interface import BedrockRuntimeBase
+
+if TYPE_CHECKING:
+    from mypy_boto3_bedrock_runtime.type_defs import (
+        ConverseRequestRequestTypeDef,
+        ConverseResponseTypeDef,
+        ConverseStreamRequestRequestTypeDef,
+        InvokeModelRequestRequestTypeDef,
+        InvokeModelWithResponseStreamRequestRequestTypeDef,
+    )
+
+    from app.types.bedrock_type_defs import (
+        BedrockConnectionPoolStatsTypeDef,
+        ConverseStreamResultTypeDef,
+        InvokeModelResultTypeDef,
+        InvokeModelStreamResultTypeDef,
+    )
+
+
+class BedrockRuntimeWrapper(BedrockRuntimeBase):
+    """
+    内側のランタイムへ処理を委譲するランタイム
+    キャッシュや流量制御などの機能を追加する場合は、このクラスを継承して必要なメソッドのみ上書きすること。
+    """
+
+    def __init__(self, inner: BedrockRuntimeBase) -> None:
+        self.inner = inner
+
+    async def converse(self, request_args: ConverseRequestRequestTypeDef) -> ConverseResponseTypeDef:
+        """
+        Converse API を呼び出す。
+
+        Args:
+            request_args (ConverseRequestRequestTypeDef): converseに渡すパラメータ
+
+        Returns:
+            ConverseResponseTypeDef: モデルからのレスポンス
+        """
+        return await self.inner.converse(request_args)
+
+    async def converse_stream(self, request_args: ConverseStreamRequestRequestTypeDef) -> ConverseStreamResultTypeDef:
+        """
+        Converse Stream API を呼び出す。
+
+        Args:
+            request_args (ConverseStreamRequestRequestTypeDef): converse_streamに渡すパラメータ
+
+        Returns:
+            ConverseStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        return await self.inner.converse_stream(request_args)
+
+    async def invoke_model(self, request_args: InvokeModelRequestRequestTypeDef) -> InvokeModelResultTypeDef:
+        """
+        Invoke Model API を呼び出す。
+
+        Args:
+            request_args (InvokeModelRequestRequestTypeDef): invoke_modelに渡すパラメータ
+
+        Returns:
+            InvokeModelResultTypeDef: 読み込み済みのボディを含むレスポンス
+        """
+        return await self.inner.invoke_model(request_args)
+
+    async def invoke_model_with_response_stream(self, request_args: InvokeModelWithResponseStreamRequestRequestTypeDef) -> InvokeModelStreamResultTypeDef:
+        """
+        Invoke Model With Response Stream API を呼び出す。
+
+        Args:
+            request_args (InvokeModelWithResponseStreamRequestRequestTypeDef): invoke_model_with_response_streamに渡すパラメータ
+
+        Returns:
+            InvokeModelStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        return await self.inner.invoke_model_with_response_stream(request_args)
+
+    async def warm_up(self, connections: int) -> None:
+        """
+        内側のランタイムのコネクションを事前に確立する。
+
+        Args:
+            connections (int): 確立するコネクション数
+        """
+        await self.inner.warm_up(connections)
+
+    def pool_stats(self) -> BedrockConnectionPoolStatsTypeDef | None:
+        """
+        内側のランタイムのコネクションプールの使用状況を返す。
+
+        Returns:
+            BedrockConnectionPoolStatsTypeDef | None: コネクションプールの使用状況
+        """
+        return self.inner.pool_stats()
+
+    async def aclose(self) -> None:
+        """
+        内側のランタイムのリソースを解放する。
+        """
+        await self.inner.aclose()
@@ -0,0 +1,45 @@
+"""
+botocore のサービスモデルのうち、リクエストで使う操作の定義を事前に組み立てる処理を実装する。
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from botocore.model import ServiceModel, Shape
+
+# ランタイムが呼び出す Bedrock Runtime の操作
+BEDROCK_RUNTIME_OPERATIONS = ("Converse", "ConverseStream", "InvokeModel", "InvokeModelWithResponseStream")
+
+
+def resolve_operation_shapes(service_model: ServiceModel, operation_names: tuple[str, ...] = BEDROCK_RUNTIME_OPERATIONS) -> int:
+    """
+    操作の入出力の Shape をたどり、botocore が初回のリクエストで遅延して組み立てる定義を事前に組み立てる。
+    OperationModel と Shape のメンバーはインスタンスごとにキャッシュされるため、ランタイムが使うサービスモデルに対して呼び出すこと。
+
+    Args:
+        service_model (ServiceModel): ランタイムが使うサービスモデル
+        operation_names (tuple[str, ...], optional): 対象の操作
+
+    Returns:
+        int: 組み立てた Shape の数
+    """
+    resolved: set[str] = set()
+    pending: list[Shape] = []
+    for operation_name in operation_names:
+        operation_model = service_model.operation_model(operation_name)
+        pending.extend(shape for shape in (operation_model.input_shape, operation_model.output_shape) if shape is not None)
+
+    while pending:
+        shape = pending.pop()
+        if shape.name in resolved:
+            continue
+        resolved.add(shape.name)
+        if shape.type_name == "structure":
+            pending.extend(shape.members.values())  # type: ignore[attr-defined]
+        elif shape.type_name == "list":
+            pending.append(shape.member)  # type: ignore[attr-defined]
+        elif shape.type_name == "map":
+            pending.extend((shape.key, shape.value))  # type: ignore[attr-defined]
+    return len(resolved)
@@ -0,0 +1,303 @@
+"""
+同一内容の同時リクエストを 1 回の Bedrock 呼び出しにまとめる single-flight を実装する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import weakref
+from typing import TYPE_CHECKING, Any, AsyncGenerator, cast
+
+from app.services.bedrock.request_key import request_key
+from app.services.bedrock.runtime_wrapper import BedrockRuntimeWrapper
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from mypy_boto3_bedrock_runtime.type_defs import (
+        ConverseRequestRequestTypeDef,
+        ConverseResponseTypeDef,
+        ConverseStreamOutputTypeDef,
+        ConverseStreamRequestRequestTypeDef,
+    )
+
+    from app.interfaces.bedrock_interface import BedrockRuntimeBase
+    from app.types.bedrock_type_defs import ConverseStreamResultTypeDef, SingleFlightStatsTypeDef
+
+
+logger = logging.getLogger(__name__)
+
+
+class _CallFlight:
+    """
+    実行中の呼び出しと、その結果を待っているリクエスト数
+    """
+
+    def __init__(self, task: asyncio.Task[Any]) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class _StreamFlight[EventT]:
+    """
+    実行中のストリームと、これまでに受信したイベント
+    購読者はイベントを先頭から読むため、途中から参加した購読者も生成済みのトークンを再生してから続きを受け取る。
+    """
+
+    def __init__(self) -> None:
+        self.events: list[EventT] = []
+        self.started: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self.done = False
+        self.error: BaseException | None = None
+        self.subscribers = 0
+        self.task: asyncio.Task[None] | None = None
+        self._changed = asyncio.Event()
+
+    def publish(self) -> None:
+        """
+        イベントの追加・終了を待機中の購読者に通知する。
+        """
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self) -> None:
+        """
+        次のイベントの追加・終了まで待機する。
+        """
+        await self._changed.wait()
+
+
+class _Subscription[EventT]:
+    """
+    ストリームの購読。購読の解除は 1 回のみ行う。
+    """
+
+    def __init__(self, flight: _StreamFlight[EventT]) -> None:
+        self.flight = flight
+        self._released = False
+        flight.subscribers += 1
+
+    def release(self) -> None:
+        """
+        購読を解除する。購読者がいなくなった場合は上流のストリームを取り消す。解除済みの場合は何もしない。
+        """
+        if self._released:
+            return
+        self._released = True
+        self.flight.subscribers -= 1
+        if self.flight.subscribers == 0 and not self.flight.done and self.flight.task is not None:
+            self.flight.task.cancel()
+
+
+class SingleFlight:
+    """
+    同じキーの呼び出しが実行中であれば、新たに呼び出さずにその結果を共有するグループ
+    - 通常の呼び出しは結果を全員に返す。
+    - ストリームは 1 本の上流ストリームを全購読者に配信する。
+    - 待っているリクエストが全員離脱した場合は上流の呼び出しを取り消す。
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[str, _CallFlight] = {}
+        self._streams: dict[str, _StreamFlight[Any]] = {}
+        self._call_count = 0
+        self._coalesced_calls = 0
+        self._stream_count = 0
+        self._coalesced_streams = 0
+
+    async def call[ResultT](self, key: str, fn: Callable[[], Awaitable[ResultT]]) -> ResultT:
+        """
+        同じキーの呼び出しが実行中であればその結果を待ち、なければ呼び出す。
+
+        Args:
+            key (str): 呼び出しのキー
+            fn (Callable[[], Awaitable[ResultT]]): 上流の呼び出し
+
+        Returns:
+            ResultT: 呼び出しの結果
+        """
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = _CallFlight(asyncio.ensure_future(fn()))
+            self._calls[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget_call(key, flight))
+            self._call_count += 1
+        else:
+            self._coalesced_calls += 1
+
+        flight.waiters += 1
+        try:
+            return cast("ResultT", await asyncio.shield(flight.task))
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self._forget_call(key, flight)
+                flight.task.cancel()
+
+    async def stream[EventT](self, key: str, fn: Callable[[], Awaitable[AsyncGenerator[EventT]]]) -> AsyncGenerator[EventT]:
+        """
+        同じキーのストリームが実行中であれば購読し、なければ上流のストリームを開始する。
+        上流の呼び出し自体のエラーは、通常の呼び出しと同様にこの時点で送出する。
+
+        Args:
+            key (str): ストリームのキー
+            fn (Callable[[], Awaitable[AsyncGenerator[EventT]]]): 上流のストリームを開始する呼び出し
+
+        Returns:
+            AsyncGenerator[EventT]: 上流のイベントを先頭から返す非同期ジェネレーター
+        """
+        flight: _StreamFlight[EventT] | None = self._streams.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.create_task(self._produce(key, flight, fn))
+            self._stream_count += 1
+        else:
+            self._coalesced_streams += 1
+
+        subscription = _Subscription(flight)
+        try:
+            await asyncio.shield(flight.started)
+        except BaseException:
+            subscription.release()
+            raise
+        events = self._subscribe(subscription)
+        # 一度も読まれずに破棄されたジェネレーターは finally が実行されないため、破棄時にも購読を解除する
+        weakref.finalize(events, subscription.release)
+        return events
+
+    def stats(self) -> SingleFlightStatsTypeDef:
+        """
+        single-flight の統計情報を返す。
+
+        Returns:
+            SingleFlightStatsTypeDef: single-flight の統計情報
+        """
+        return {
+            "calls": self._call_count,
+            "coalesced_calls": self._coalesced_calls,
+            "streams": self._stream_count,
+            "coalesced_streams": self._coalesced_streams,
+            "in_flight_calls": len(self._calls),
+            "in_flight_streams": len(self._streams),
+        }
+
+    async def _produce[EventT](self, key: str, flight: _StreamFlight[EventT], fn: Callable[[], Awaitable[AsyncGenerator[EventT]]]) -> None:
+        """
+        上流のストリームを読み込み、受信したイベントを購読者に配信する。
+
+        Args:
+            key (str): ストリームのキー
+            flight (_StreamFlight[EventT]): 配信先のストリーム
+            fn (Callable[[], Awaitable[AsyncGenerator[EventT]]]): 上流のストリームを開始する呼び出し
+        """
+        try:
+            stream = await fn()
+            flight.started.set_result(None)
+            try:
+                async for event in stream:
+                    flight.events.append(event)
+                    flight.publish()
+            finally:
+                await stream.aclose()
+        except asyncio.CancelledError:
+            flight.started.cancel()
+            raise
+        except Exception as e:  # noqa: BLE001
+            # 上流のエラーは全購読者に送出する
+            flight.error = e
+            if not flight.started.done():
+                flight.started.set_exception(e)
+        finally:
+            flight.done = True
+            flight.publish()
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+
+    @staticmethod
+    async def _subscribe[EventT](subscription: _Subscription[EventT]) -> AsyncGenerator[EventT]:
+        """
+        ストリームのイベントを先頭から返す。
+
+        Args:
+            subscription (_Subscription[EventT]): 購読
+
+        Raises:
+            BaseException: 上流のストリームでエラーが発生した場合
+
+        Yields:
+            EventT: ストリームのイベント
+        """
+        flight = subscription.flight
+        index = 0
+        try:
+            while True:
+                if index < len(flight.events):
+                    yield flight.events[index]
+                    index += 1
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.wait()
+        finally:
+            subscription.release()
+
+    def _forget_call(self, key: str, flight: _CallFlight) -> None:
+        """
+        完了・取消した呼び出しを実行中の一覧から削除する。
+
+        Args:
+            key (str): 呼び出しのキー
+            flight (_CallFlight): 削除する呼び出し
+        """
+        if self._calls.get(key) is flight:
+            del self._calls[key]
+
+
+class SingleFlightBedrockRuntime(BedrockRuntimeWrapper):
+    """
+    同一内容の同時 converse / converse_stream リクエストを 1 回の呼び出しにまとめるランタイム
+    """
+
+    def __init__(self, inner: BedrockRuntimeBase, single_flight: SingleFlight) -> None:
+        super().__init__(inner)
+        self.single_flight = single_flight
+
+    async def converse(self, request_args: ConverseRequestRequestTypeDef) -> ConverseResponseTypeDef:
+        """
+        同一内容のリクエストが実行中であればその結果を共有し、なければ Converse API を呼び出す。
+
+        Args:
+            request_args (ConverseRequestRequestTypeDef): converseに渡すパラメータ
+
+        Returns:
+            ConverseResponseTypeDef: モデルからのレスポンス
+        """
+        try:
+            key = request_key("converse", request_args)
+        except TypeError:
+            return await self.inner.converse(request_args)
+        return await self.single_flight.call(key, lambda: self.inner.converse(request_args))
+
+    async def converse_stream(self, request_args: ConverseStreamRequestRequestTypeDef) -> ConverseStreamResultTypeDef:
+        """
+        同一内容のストリームが実行中であれば購読し、なければ Converse Stream API を呼び出す。
+
+        Args:
+            request_args (ConverseStreamRequestRequestTypeDef): converse_streamに渡すパラメータ
+
+        Returns:
+            ConverseStreamResultTypeDef: イベントを非同期に返すストリームを含むレスポンス
+        """
+        try:
+            key = request_key("converse_stream", request_args)
+        except TypeError:
+            return await self.inner.converse_stream(request_args)
+
+        async def _open() -> AsyncGenerator[ConverseStreamOutputTypeDef]:
+            return (await self.inner.converse_stream(request_args))["stream"]
+
+        return {"stream": await self.single_flight.stream(key, _open)}
@@ -0,0 +1,174 @@
+"""
+ストリーミング応答を Server-Sent Events(SSE)で返す処理を実装する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, AsyncGenerator
+
+import orjson
+
+if TYPE_CHECKING:
+    from app.types.bedrock_type_defs import SseConfigTypeDef, StreamEventTypeDef
+
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+# プロキシのバッファリングとキャッシュを無効にするレスポンスヘッダー
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# 送信を待たずに先読みするイベント数の上限
+READ_AHEAD_EVENTS = 64
+
+
+def encode_event(event: StreamEventTypeDef) -> bytes:
+    """
+    イベントを SSE のフレームにする。
+
+    Args:
+        event (StreamEventTypeDef): ストリーミング応答のイベント
+
+    Returns:
+        bytes: SSE のフレーム
+    """
+    frame = b"event: " + event["event"].encode() + b"\ndata: " + orjson.dumps(event["data"]) + b"\n\n"
+    if "id" in event:
+        frame = b"id: " + event["id"].encode() + b"\n" + frame
+    return frame
+
+
+async def sse_stream(events: AsyncGenerator[StreamEventTypeDef], config: SseConfigTypeDef) -> AsyncGenerator[bytes]:
+    """
+    ストリーミング応答のイベントを SSE のフレームとして返す。
+
+    - 応答の差分(delta)は、最初の差分をすぐに送信した後、バッファしてから最大 flush_interval 秒待つか、
+      flush_bytes 以上になった時点で 1 つの delta イベントにまとめて送信する。上流が止まっても待ち時間を超えて溜めない。
+    - messageStop・metadata は、バッファした差分と合わせて 1 回の書き込みで送信する。
+    - イベントに id がある場合は、まとめた差分の最後のイベントの id をフレームの id とする。
+    - イベントは別タスクで読み込み、件数を制限したキューで受け渡す。利用側がジェネレーターを閉じた場合は読み込みを取り消す。
+
+    Args:
+        events (AsyncGenerator[StreamEventTypeDef]): ストリーミング応答のイベント
+        config (SseConfigTypeDef): SSE の設定
+
+    Yields:
+        bytes: 送信する SSE のフレーム
+    """
+    queue: asyncio.Queue[StreamEventTypeDef | BaseException | None] = asyncio.Queue(maxsize=READ_AHEAD_EVENTS)
+    reader = asyncio.create_task(_read(events, queue))
+    buffer = _DeltaBuffer(config, asyncio.get_running_loop())
+    try:
+        while True:
+            if buffer.deadline is not None and queue.empty():
+                try:
+                    async with asyncio.timeout_at(buffer.deadline):
+                        item = await queue.get()
+                except TimeoutError:
+                    # 待ち時間を過ぎたため、バッファを送信する
+                    yield buffer.flush()
+                    continue
+            else:
+                item = await queue.get()
+
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            if item["event"] == "delta":
+                if (frame := buffer.add(item)) is not None:
+                    yield frame
+            else:
+                # messageStop・metadata などは、バッファした差分と合わせて 1 回で送信する
+                yield buffer.flush() + encode_event(item)
+
+        if frame := buffer.flush():
+            yield frame
+    finally:
+        reader.cancel()
+        await asyncio.wait({reader})
+
+
+class _DeltaBuffer:
+    """
+    応答の差分をまとめて 1 つの delta イベントにするバッファ
+    """
+
+    def __init__(self, config: SseConfigTypeDef, loop: asyncio.AbstractEventLoop) -> None:
+        self.config = config
+        self.loop = loop
+        self.deadline: float | None = None
+        self._texts: list[str] = []
+        self._size = 0
+        self._last_id: str | None = None
+        self._flushed_first = False
+
+    def add(self, event: StreamEventTypeDef) -> bytes | None:
+        """
+        差分をバッファに追加し、すぐに送信する場合はフレームを返す。
+
+        Args:
+            event (StreamEventTypeDef): delta イベント
+
+        Returns:
+            bytes | None: 送信する SSE のフレーム。バッファして待つ場合はNone
+        """
+        text: str = event["data"]["text"]
+        self._texts.append(text)
+        self._last_id = event.get("id")
+        self._size += len(text.encode())
+        if not self._flushed_first or self._size >= self.config["flush_bytes"] or self.config["flush_interval"] <= 0:
+            self._flushed_first = True
+            return self.flush()
+        if self.deadline is None:
+            self.deadline = self.loop.time() + self.config["flush_interval"]
+        return None
+
+    def flush(self) -> bytes:
+        """
+        バッファした差分を 1 つの delta イベントのフレームにして、バッファを空にする。
+
+        Returns:
+            bytes: SSE のフレーム。バッファが空の場合は空のバイト列
+        """
+        if not self._texts:
+            return b""
+        frame = _delta_frame(self._texts, self._last_id)
+        self._texts, self._size, self.deadline = [], 0, None
+        return frame
+
+
+async def _read(events: AsyncGenerator[StreamEventTypeDef], queue: asyncio.Queue[StreamEventTypeDef | BaseException | None]) -> None:
+    """
+    イベントを読み込んでキューに入れる。終了時は None、エラー時は例外をキューに入れる。
+
+    Args:
+        events (AsyncGenerator[StreamEventTypeDef]): ストリーミング応答のイベント
+        queue (asyncio.Queue[StreamEventTypeDef | BaseException | None]): 受け渡し用のキュー
+    """
+    try:
+        async for event in events:
+            await queue.put(event)
+    except Exception as e:  # noqa: BLE001
+        await queue.put(e)
+        return
+    finally:
+        await events.aclose()
+    await queue.put(None)
+
+
+def _delta_frame(buffer: list[str], last_id: str | None) -> bytes:
+    """
+    バッファした差分を 1 つの delta イベントのフレームにする。
+
+    Args:
+        buffer (list[str]): バッファした差分
+        last_id (str | None): 最後の差分のイベントID
+
+    Returns:
+        bytes: SSE のフレーム
+    """
+    event: StreamEventTypeDef = {"event": "delta", "data": {"text": "".join(buffer)}}
+    if last_id is not None:
+        event["id"] = last_id
+    return encode_event(event)
@@ -0,0 +1,214 @@
+"""
+ストリーミング応答の上流の生成を、クライアントの切断やサーバー側の打ち切り条件で途中で止める処理を実装する。
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from typing import TYPE_CHECKING, AsyncGenerator, Literal
+
+if TYPE_CHECKING:
+    from app.schemas.bedrock_schema import StreamStopCondition
+    from app.types.bedrock_type_defs import StreamCancellationStatsTypeDef, StreamEventTypeDef
+
+
+# 打ち切った理由
+CancelReason = Literal["disconnect", "stop_sequence", "max_chars", "json_complete"]
+
+# 打ち切り条件で止めた場合の messageStop の stopReason
+STOP_CONDITION_REASON = "stop_condition"
+
+
+class StopConditionMatcher:
+    """
+    応答の差分を順に受け取り、打ち切り条件に一致した位置を求める
+    - stop_sequences は正規表現ではなく文字列として、最も長い文字列の長さより 1 文字短い直前の部分と新しい差分をつないだ範囲で探す。
+      クライアントが指定した正規表現をイベントループ上で評価しない(ReDoS を避ける)ため、文字列の一致のみに対応する。
+      一致が送信済みの部分から始まる場合は、新しい差分をすべて捨てる。
+    - json_complete は、最初の { もしくは [ から対応する閉じ括弧までを文字列とエスケープを考慮して追跡する。
+    """
+
+    def __init__(self, condition: StreamStopCondition) -> None:
+        self.stop_sequences = condition.stop_sequences or []
+        self._tail_chars = max((len(sequence) for sequence in self.stop_sequences), default=1) - 1
+        self.max_chars = condition.max_chars
+        self.json_complete = condition.json_complete
+        self._received_chars = 0
+        self._tail = ""
+        self._json_depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str) -> tuple[str, CancelReason | None]:
+        """
+        差分を受け取り、返してよい部分と一致した打ち切り条件を返す。
+
+        Args:
+            text (str): 応答の差分
+
+        Returns:
+            tuple[str, CancelReason | None]: 返してよい部分と、一致した打ち切り条件。一致しない場合はNone
+        """
+        cuts: list[tuple[int, CancelReason]] = []
+        if self.max_chars is not None and self._received_chars + len(text) >= self.max_chars:
+            cuts.append((self.max_chars - self._received_chars, "max_chars"))
+        if self.json_complete:
+            end = self._scan_json(text)
+            if end is not None:
+                cuts.append((end, "json_complete"))
+        if self.stop_sequences:
+            end = self._find_stop_sequence(text)
+            if end is not None:
+                cuts.append((end, "stop_sequence"))
+        self._received_chars += len(text)
+
+        if not cuts:
+            return text, None
+        end, reason = min(cuts)
+        return text[:end], reason
+
+    def _find_stop_sequence(self, text: str) -> int | None:
+        """
+        いずれかの打ち切る文字列が最初に現れる位置を求める。
+
+        Args:
+            text (str): 応答の差分
+
+        Returns:
+            int | None: 一致した位置(差分内)。送信済みの部分から始まる場合は0、一致しない場合はNone
+        """
+        window = self._tail + text
+        starts = [start for sequence in self.stop_sequences if (start := window.find(sequence)) >= 0]
+        self._tail = window[-self._tail_chars :] if self._tail_chars > 0 else ""
+        if not starts:
+            return None
+        return max(0, min(starts) - (len(window) - len(text)))
+
+    def _scan_json(self, text: str) -> int | None:
+        """
+        最初の JSON のオブジェクトもしくは配列が閉じた位置を求める。
+
+        Args:
+            text (str): 応答の差分
+
+        Returns:
+            int | None: 閉じ括弧の直後の差分内の位置。閉じていない場合はNone
+        """
+        for index, char in enumerate(text):
+            if self._json_depth == 0:
+                if char in "{[":
+                    self._json_depth = 1
+            elif self._in_string:
+                self._scan_string(char)
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._json_depth += 1
+            elif char in "}]":
+                self._json_depth -= 1
+                if self._json_depth == 0:
+                    return index + 1
+        return None
+
+    def _scan_string(self, char: str) -> None:
+        """
+        JSON の文字列の中の 1 文字を読み、エスケープと文字列の終わりを追跡する。
+
+        Args:
+            char (str): 文字列の中の文字
+        """
+        if self._escaped:
+            self._escaped = False
+        elif char == "\\":
+            self._escaped = True
+        elif char == '"':
+            self._in_string = False
+
+
+class StreamCanceller:
+    """
+    ストリーミング応答の上流の生成を途中で止め、止めた回数と節約したトークン数の見積もりを集計する
+    - 利用側がジェネレーターを閉じた場合(クライアントの切断)は、上流のストリームをすぐに閉じてコネクションを解放する。
+    - 打ち切り条件に一致した場合は、一致した位置までの差分と stopReason が stop_condition の messageStop を返して上流を閉じる。
+    - 節約したトークン数は、生成するトークン数の上限から打ち切るまでの差分の数を引いて見積もる。
+      Bedrock はおおむね 1 トークンずつ差分を返すが、上限まで生成したとは限らないため、実際の節約量の上限となる。
+    """
+
+    def __init__(self) -> None:
+        self._cancelled_by: Counter[str] = Counter()
+        self._deltas_before_cancel = 0
+        self._estimated_tokens_saved = 0
+
+    async def watch(
+        self,
+        events: AsyncGenerator[StreamEventTypeDef],
+        stop_condition: StreamStopCondition | None = None,
+        max_tokens: int | None = None,
+    ) -> AsyncGenerator[StreamEventTypeDef]:
+        """
+        上流のイベントを中継し、打ち切り条件に一致するか利用側が閉じた時点で上流を閉じる。
+
+        Args:
+            events (AsyncGenerator[StreamEventTypeDef]): 上流のストリーミング応答のイベント
+            stop_condition (StreamStopCondition | None, optional): 打ち切り条件。省略時は切断時のみ止める
+            max_tokens (int | None, optional): 生成するトークン数の上限。節約したトークン数の見積もりに使う
+
+        Yields:
+            StreamEventTypeDef: ストリーミング応答のイベント
+        """
+        matcher = StopConditionMatcher(stop_condition) if stop_condition is not None else None
+        deltas = 0
+        reason: CancelReason | None = None
+        finished = False
+        try:
+            async for event in events:
+                if event["event"] == "messageStop":
+                    finished = True
+                elif event["event"] == "delta":
+                    deltas += 1
+                    if matcher is not None:
+                        text, reason = matcher.feed(event["data"]["text"])
+                        if text:
+                            yield {**event, "data": {"text": text}}
+                        if reason is not None:
+                            yield {"event": "messageStop", "data": {"stopReason": STOP_CONDITION_REASON, "stopCondition": reason}}
+                            return
+                        continue
+                yield event
+            finished = True
+        except Exception:
+            # 上流のエラーは打ち切りとして数えない
+            finished = True
+            raise
+        finally:
+            if not finished:
+                self._record(reason or "disconnect", deltas, max_tokens)
+            await events.aclose()
+
+    def stats(self) -> StreamCancellationStatsTypeDef:
+        """
+        統計情報を返す。
+
+        Returns:
+            StreamCancellationStatsTypeDef: 統計情報
+        """
+        return {
+            "cancelled_streams": self._cancelled_by.total(),
+            "cancelled_by": dict(self._cancelled_by),
+            "deltas_before_cancel": self._deltas_before_cancel,
+            "estimated_tokens_saved": self._estimated_tokens_saved,
+        }
+
+    def _record(self, reason: CancelReason, deltas: int, max_tokens: int | None) -> None:
+        """
+        打ち切ったストリームを集計する。
+
+        Args:
+            reason (CancelReason): 打ち切った理由
+            deltas (int): 打ち切るまでに受信した差分の数
+            max_tokens (int | None): 生成するトークン数の上限
+        """
+        self._cancelled_by[reason] += 1
+        self._deltas_before_cancel += deltas
+        if max_tokens is not None:
+            self._estimated_tokens_saved += max(0, max_tokens - deltas)
@@ -0,0 +1,122 @@
+"""
+ストリーミングレスポンスと、そこで使用する非同期ジェネレーターの補助関数を実装する。
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, AsyncGenerator
+
+import anyio
+from fastapi.responses import StreamingResponse
+
+if TYPE_CHECKING:
+    from starlette.types import Receive, Scope, Send
+
+    from app.types.bedrock_type_defs import StreamEventTypeDef
+
+
+class DisconnectAwareStreamingResponse(StreamingResponse):
+    """
+    クライアントが切断した時点で本文の送信を止め、本文のジェネレーターを閉じる StreamingResponse
+    - Starlette の StreamingResponse は ASGI spec 2.4 以降では切断を送信の失敗でしか検知しないため、
+      ASGI のバージョンによらず http.disconnect を待ち受ける。
+    - 送信中に切断した場合、本文のジェネレーターは yield で止まったまま GC まで閉じられないため、
+      応答の終了時に必ず閉じて上流のストリームとコネクションを解放する。
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:  # noqa: ARG002
+        """
+        本文を送信し、クライアントの切断もしくは送信の完了で本文のジェネレーターを閉じる。
+
+        Args:
+            scope (Scope): ASGI のスコープ(ASGI のバージョンによらず同じ動作のため使用しない)
+            receive (Receive): ASGI の receive
+            send (Send): ASGI の send
+        """
+        try:
+            async with anyio.create_task_group() as task_group:
+
+                async def _stream() -> None:
+                    await self.stream_response(send)
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(_stream)
+                await self.listen_for_disconnect(receive)
+                task_group.cancel_scope.cancel()
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+        if self.background is not None:
+            await self.background()
+
+
+async def prefetch_stream[ChunkT](stream: AsyncGenerator[ChunkT]) -> AsyncGenerator[ChunkT]:
+    """
+    ストリームの最初のチャンクまで読み込んでから、読み込んだチャンクを含むストリームを返す。
+    レスポンスの送信開始後はステータスコードを変更できないため、上流の呼び出しやスロットリング(429)等の
+    最初のチャンクまでに発生したエラーを、レスポンスを開始する前に HTTPException として送出させる。
+
+    Args:
+        stream (AsyncGenerator[ChunkT]): ストリーム
+
+    Returns:
+        AsyncGenerator[ChunkT]: 最初のチャンクから返すストリーム
+    """
+    try:
+        first = await anext(stream)
+    except StopAsyncIteration:
+        return _empty()
+    except BaseException:
+        await stream.aclose()
+        raise
+    return _resume(first, stream)
+
+
+async def delta_texts(events: AsyncGenerator[StreamEventTypeDef]) -> AsyncGenerator[str]:
+    """
+    ストリーミング応答のイベントから差分のテキストのみを返す。
+
+    Args:
+        events (AsyncGenerator[StreamEventTypeDef]): ストリーミング応答のイベント
+
+    Yields:
+        str: 応答の差分
+    """
+    try:
+        async for event in events:
+            if event["event"] == "delta":
+                yield event["data"]["text"]
+    finally:
+        await events.aclose()
+
+
+async def _resume[ChunkT](first: ChunkT, stream: AsyncGenerator[ChunkT]) -> AsyncGenerator[ChunkT]:
+    """
+    読み込み済みのチャンクに続けて、残りのチャンクを返す。
+
+    Args:
+        first (ChunkT): 読み込み済みのチャンク
+        stream (AsyncGenerator[ChunkT]): ストリーム
+
+    Yields:
+        ChunkT: ストリームのチャンク
+    """
+    try:
+        yield first
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await stream.aclose()
+
+
+async def _empty[ChunkT]() -> AsyncGenerator[ChunkT]:
+    """
+    空のストリームを返す。
+
+    Yields:
+        ChunkT: なし
+    """
+    return
+    yield
@@ -0,0 +1,295 @@
+"""
+会話セッションの履歴を Postgres に追記保存し、よく使うセッションをプロセス内にキャッシュするストアを実装する。
+"""
+
+from __future__ import annotations
+
+import base64
+import logging
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, AsyncGenerator
+
+import asyncpg
+import orjson
+from fastapi import HTTPException
+
+from app.types.bedrock_type_defs import ModelType
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from mypy_boto3_bedrock_runtime.type_defs import MessageTypeDef
+
+    from app.types.conversation_type_defs import ConversationStoreConfigTypeDef, ConversationStoreStatsTypeDef
+
+
+logger = logging.getLogger(__name__)
+
+# JSONB に保存する際にバイナリを置き換えるオブジェクトのキー
+BYTES_KEY = "$bytes"
+
+# database/init/init.sql と同じテーブル。init.sql はボリュームが空の場合しか実行されないため、既存のボリュームにも作成する
+CREATE_TABLES_QUERY = """
+CREATE TABLE IF NOT EXISTS conversation_sessions (
+    session_id UUID PRIMARY KEY,
+    model_type TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS conversation_messages (
+    session_id UUID NOT NULL REFERENCES conversation_sessions (session_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+    content JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (session_id, seq)
+);
+"""
+
+LOAD_SESSION_QUERY = """
+SELECT s.model_type, m.role, m.content
+FROM conversation_sessions AS s
+LEFT JOIN conversation_messages AS m ON m.session_id = s.session_id
+WHERE s.session_id = $1
+ORDER BY m.seq
+"""
+
+CREATE_SESSION_QUERY = "INSERT INTO conversation_sessions (session_id, model_type) VALUES ($1, $2)"
+
+APPEND_MESSAGE_QUERY = "INSERT INTO conversation_messages (session_id, seq, role, content) VALUES ($1, $2, $3, $4)"
+
+TOUCH_SESSION_QUERY = "UPDATE conversation_sessions SET updated_at = now() WHERE session_id = $1"
+
+
+@dataclass
+class ConversationSession:
+    """
+    会話セッションと、これまでの会話履歴
+    """
+
+    session_id: uuid.UUID
+    model_type: ModelType
+    messages: list[MessageTypeDef] = field(default_factory=list)
+
+
+class ConversationStore:
+    """
+    会話セッションのストア
+    - 履歴は (session_id, seq) を主キーとするテーブルに追記のみで保存し、1 回のクエリで読み込む。
+    - 読み込んだセッションは LRU でキャッシュし、同じセッションの次のターンではデータベースを読まない。
+    - 追記時の seq はキャッシュした履歴の件数から決めるため、同じセッションへ同時に追記した場合は主キーの重複で検出し、
+      キャッシュを破棄して 409 を返す。
+    """
+
+    def __init__(self, config: ConversationStoreConfigTypeDef) -> None:
+        self.config = config
+        self._pool: asyncpg.Pool | None = None
+        self._sessions: OrderedDict[uuid.UUID, ConversationSession] = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._conflicts = 0
+
+    async def open(self) -> None:
+        """
+        コネクションプールを生成し、テーブルがない場合は作成する。
+        """
+        self._pool = await asyncpg.create_pool(
+            dsn=self.config["dsn"],
+            min_size=self.config["min_pool_size"],
+            max_size=self.config["max_pool_size"],
+            init=self._init_connection,
+        )
+        await self._pool.execute(CREATE_TABLES_QUERY)
+        logger.info("会話セッションのコネクションプールを生成しました")
+
+    async def aclose(self) -> None:
+        """
+        コネクションプールを閉じる。
+        """
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def create(self, model_type: ModelType) -> ConversationSession:
+        """
+        会話セッションを作成する。
+
+        Args:
+            model_type (ModelType): セッションで使用するモデルの種類
+
+        Returns:
+            ConversationSession: 作成したセッション
+        """
+        session = ConversationSession(session_id=uuid.uuid4(), model_type=model_type)
+        await self._connection_pool().execute(CREATE_SESSION_QUERY, session.session_id, model_type.value)
+        self._remember(session)
+        return session
+
+    async def load(self, session_id: uuid.UUID) -> ConversationSession:
+        """
+        会話セッションと履歴を返す。キャッシュにない場合はデータベースから読み込む。
+
+        Args:
+            session_id (uuid.UUID): セッションID
+
+        Raises:
+            HTTPException: セッションが存在しない場合
+
+        Returns:
+            ConversationSession: セッション。履歴はキャッシュと共有しないコピー
+        """
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            self._cache_hits += 1
+        else:
+            self._cache_misses += 1
+            rows = await self._connection_pool().fetch(LOAD_SESSION_QUERY, session_id)
+            if not rows:
+                raise HTTPException(status_code=404, detail="会話セッションが見つかりません")
+            messages: list[MessageTypeDef] = [{"role": row["role"], "content": _decode_binary(row["content"])} for row in rows if row["role"] is not None]
+            session = ConversationSession(session_id=session_id, model_type=ModelType(rows[0]["model_type"]), messages=messages)
+            self._remember(session)
+        return ConversationSession(session_id=session.session_id, model_type=session.model_type, messages=list(session.messages))
+
+    async def append(self, session: ConversationSession, messages: Sequence[MessageTypeDef]) -> None:
+        """
+        会話セッションにメッセージを追記する。
+
+        Args:
+            session (ConversationSession): load で取得したセッション(追記前の履歴を持つもの)
+            messages (Sequence[MessageTypeDef]): 追記するメッセージ
+
+        Raises:
+            HTTPException: 同じセッションに他のリクエストが先に追記していた場合
+        """
+        rows = [
+            (session.session_id, len(session.messages) + offset, message["role"], _encode_binary(message["content"])) for offset, message in enumerate(messages)
+        ]
+        try:
+            async with self._connection_pool().acquire() as connection, connection.transaction():
+                await connection.executemany(APPEND_MESSAGE_QUERY, rows)
+                await connection.execute(TOUCH_SESSION_QUERY, session.session_id)
+        except asyncpg.UniqueViolationError as e:
+            self._conflicts += 1
+            self._sessions.pop(session.session_id, None)
+            raise HTTPException(status_code=409, detail="同じ会話セッションへの別のリクエストが先に完了しました。再度お試しください") from e
+
+        self._remember(ConversationSession(session_id=session.session_id, model_type=session.model_type, messages=[*session.messages, *messages]))
+
+    async def append_streamed_reply(self, session: ConversationSession, messages: Sequence[MessageTypeDef], stream: AsyncGenerator[str]) -> AsyncGenerator[str]:
+        """
+        応答のストリームをそのまま返し、最後まで読み終えたら新しい発話と応答をセッションに追記する。
+        途中で切断された場合は、そのターンを追記しない。
+
+        Args:
+            session (ConversationSession): load で取得したセッション(追記前の履歴を持つもの)
+            messages (Sequence[MessageTypeDef]): 新しい発話
+            stream (AsyncGenerator[str]): 応答のストリーム
+
+        Yields:
+            str: 応答のチャンク
+        """
+        chunks: list[str] = []
+        try:
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            await stream.aclose()
+
+        try:
+            await self.append(session, [*messages, {"role": "assistant", "content": [{"text": "".join(chunks)}]}])
+        except HTTPException:
+            # レスポンスの送信後はステータスコードを変更できないため、記録のみ行う
+            logger.warning("ストリームの応答を会話セッションに追記できませんでした (session_id=%s)", session.session_id)
+
+    def stats(self) -> ConversationStoreStatsTypeDef:
+        """
+        キャッシュの統計情報を返す。
+
+        Returns:
+            ConversationStoreStatsTypeDef: キャッシュの統計情報
+        """
+        return {
+            "cache_hits": self._cache_hits,
+            "cache_misses": self._cache_misses,
+            "conflicts": self._conflicts,
+            "cached_sessions": len(self._sessions),
+        }
+
+    def _remember(self, session: ConversationSession) -> None:
+        """
+        セッションをキャッシュする。上限を超えた場合は最も古く使われたセッションを削除する。
+
+        Args:
+            session (ConversationSession): キャッシュするセッション
+        """
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        while len(self._sessions) > self.config["cache_max_sessions"]:
+            self._sessions.popitem(last=False)
+
+    def _connection_pool(self) -> asyncpg.Pool:
+        """
+        コネクションプールを返す。
+
+        Raises:
+            HTTPException: コネクションプールが生成されていない場合
+
+        Returns:
+            asyncpg.Pool: コネクションプール
+        """
+        if self._pool is None:
+            raise HTTPException(status_code=503, detail="会話セッションのデータベースに接続していません")
+        return self._pool
+
+    @staticmethod
+    async def _init_connection(connection: asyncpg.Connection) -> None:
+        """
+        JSONB を orjson で変換するように、コネクションを初期化する。
+
+        Args:
+            connection (asyncpg.Connection): コネクション
+        """
+        await connection.set_type_codec("jsonb", schema="pg_catalog", encoder=lambda value: orjson.dumps(value).decode(), decoder=orjson.loads)
+
+
+def _encode_binary(value: Any) -> Any:  # noqa: ANN401
+    """
+    JSONB に保存できるよう、バイナリを base64 のオブジェクトに置き換える。
+
+    Args:
+        value (Any): 置き換える値
+
+    Returns:
+        Any: 置き換えた値
+    """
+    if isinstance(value, dict):
+        return {name: _encode_binary(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [_encode_binary(item) for item in value]
+    if isinstance(value, (bytes, bytearray)):
+        return {BYTES_KEY: base64.b64encode(value).decode()}
+    return value
+
+
+def _decode_binary(value: Any) -> Any:  # noqa: ANN401
+    """
+    _encode_binary で置き換えた base64 のオブジェクトをバイナリに戻す。
+
+    Args:
+        value (Any): 戻す値
+
+    Returns:
+        Any: 戻した値
+    """
+    if isinstance(value, dict):
+        if len(value) == 1 and BYTES_KEY in value:
+            return base64.b64decode(value[BYTES_KEY])
+        return {name: _decode_binary(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [_decode_binary(item) for item in value]
+    return value
@@ -0,0 +1,127 @@
+"""
+アプリケーション全体で記録する Prometheus のメトリクスと、/metrics で返すテキストの生成を実装する。
+PROMETHEUS_MULTIPROC_DIR が指定された場合、prometheus_client はメトリクスをワーカーごとのファイルに書き込み、
+/metrics はすべてのワーカーの値を集計して返す。ゲージは起動中のワーカーの値の合計(livesum)とする。
+"""
+
+from __future__ import annotations
+
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+from app.config.metrics_config import METRICS_CONFIG
+
+# ルートに一致しなかったリクエストの route ラベル(パスをそのまま使うとラベルの種類が際限なく増えるため)
+UNMATCHED_ROUTE = "unmatched"
+
+###################################################################
+# HTTP リクエスト
+###################################################################
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "リクエストの受信からレスポンスの送信完了までの時間(ストリーミング応答は最後のチャンクまで)",
+    ["method", "route", "model", "status"],
+    buckets=METRICS_CONFIG["latency_buckets"],
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "処理中のリクエスト数",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+
+###################################################################
+# Bedrock の呼び出し
+###################################################################
+
+BEDROCK_REQUEST_DURATION = Histogram(
+    "bedrock_request_duration_seconds",
+    "Bedrock の API の呼び出しの所要時間(ストリームの API はストリームを開始するまで)",
+    ["api", "model", "region", "outcome"],
+    buckets=METRICS_CONFIG["latency_buckets"],
+)
+BEDROCK_STREAM_TIME_TO_FIRST_TOKEN = Histogram(
+    "bedrock_stream_time_to_first_token_seconds",
+    "ストリームの API の呼び出しから最初のトークンを受信するまでの時間",
+    ["api", "model"],
+    buckets=METRICS_CONFIG["time_to_first_token_buckets"],
+)
+BEDROCK_STREAM_INTER_TOKEN = Histogram(
+    "bedrock_stream_inter_token_seconds",
+    "ストリームで続けて受信したトークンの間隔(差分のイベントごと)",
+    ["api", "model"],
+    buckets=METRICS_CONFIG["inter_token_buckets"],
+)
+BEDROCK_STREAM_OUTPUT_TOKENS = Histogram(
+    "bedrock_stream_output_tokens",
+    "ストリーム 1 本あたりの出力トークン数(Bedrock が返す使用量)",
+    ["api", "model"],
+    buckets=METRICS_CONFIG["output_tokens_buckets"],
+)
+BEDROCK_STREAM_TOKENS_PER_SECOND = Histogram(
+    "bedrock_stream_tokens_per_second",
+    "最初のトークンから最後のトークンまでの 1 秒あたりの出力トークン数",
+    ["api", "model"],
+    buckets=METRICS_CONFIG["tokens_per_second_buckets"],
+)
+BEDROCK_STREAMS_ABORTED = Counter(
+    "bedrock_streams_aborted",
+    "使用量を受信する前にエラーもしくは切断で終了したストリームの数",
+    ["api", "model"],
+)
+
+###################################################################
+# スレッドプール
+###################################################################
+
+THREAD_POOL_MAX_WORKERS = Gauge(
+    "thread_pool_max_workers",
+    "スレッドプールのスレッド数の上限",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+THREAD_POOL_ACTIVE_TASKS = Gauge(
+    "thread_pool_active_tasks",
+    "スレッドプールで実行中の処理の数",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+THREAD_POOL_QUEUED_TASKS = Gauge(
+    "thread_pool_queued_tasks",
+    "スレッドプールの空きを待っている処理の数",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+THREAD_POOL_QUEUE_WAIT = Histogram(
+    "thread_pool_queue_wait_seconds",
+    "スレッドプールに投入してから実行が始まるまでの時間",
+    ["pool"],
+    buckets=METRICS_CONFIG["queue_wait_buckets"],
+)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    /metrics で返すテキストを生成する。複数ワーカーの場合はすべてのワーカーの値を集計する。
+
+    Returns:
+        tuple[bytes, str]: Prometheus のテキスト形式のメトリクスと Content-Type
+    """
+    multiprocess_dir = METRICS_CONFIG["multiprocess_dir"]
+    if multiprocess_dir is None:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    # prometheus_client は型注釈のない関数があるため、呼び出しの型検査のみ除外する
+    multiprocess.MultiProcessCollector(registry, path=multiprocess_dir)  # type: ignore[no-untyped-call]
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_stopped() -> None:
+    """
+    終了するワーカーのゲージを集計から外す。複数ワーカーでない場合は何もしない。
+    """
+    multiprocess_dir = METRICS_CONFIG["multiprocess_dir"]
+    if multiprocess_dir is not None:
+        multiprocess.mark_process_dead(os.getpid(), multiprocess_dir)  # type: ignore[no-untyped-call]
@@ -0,0 +1,89 @@
+"""
+実行中・待機中の処理の数と、空きを待った時間をメトリクスに記録するスレッドプールを実装する。
+"""
+
+from __future__ import annotations
+
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, TypeVar
+
+from app.services.metrics.prometheus_metrics import THREAD_POOL_ACTIVE_TASKS, THREAD_POOL_MAX_WORKERS, THREAD_POOL_QUEUE_WAIT, THREAD_POOL_QUEUED_TASKS
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+ResultT = TypeVar("ResultT")
+
+
+class InstrumentedThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    飽和状況をメトリクスに記録する ThreadPoolExecutor
+    - 投入から実行開始までを待機中、実行開始から終了までを実行中として、プール名のラベルで記録する。
+    - 実行前にキャンセルされた処理は、待機中から外す。
+    """
+
+    def __init__(self, pool_name: str, max_workers: int | None = None, thread_name_prefix: str = "") -> None:
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.pool_name = pool_name
+        self._max_workers_gauge = THREAD_POOL_MAX_WORKERS.labels(pool_name)
+        self._active = THREAD_POOL_ACTIVE_TASKS.labels(pool_name)
+        self._queued = THREAD_POOL_QUEUED_TASKS.labels(pool_name)
+        self._queue_wait = THREAD_POOL_QUEUE_WAIT.labels(pool_name)
+        self._max_workers_gauge.inc(self._max_workers)
+        self._stopped = False
+
+    def submit(self, fn: Callable[..., ResultT], /, *args: Any, **kwargs: Any) -> Future[ResultT]:  # noqa: ANN401
+        """
+        処理を投入する。
+
+        Args:
+            fn (Callable[..., ResultT]): 実行する処理
+            *args (Any): 処理に渡す位置引数
+            **kwargs (Any): 処理に渡すキーワード引数
+
+        Returns:
+            Future[ResultT]: 処理の結果
+        """
+        submitted_at = time.perf_counter()
+
+        def _run() -> ResultT:
+            self._queued.dec()
+            self._queue_wait.observe(time.perf_counter() - submitted_at)
+            self._active.inc()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._active.dec()
+
+        self._queued.inc()
+        try:
+            future = super().submit(_run)
+        except BaseException:
+            self._queued.dec()
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        """
+        スレッドプールを停止し、スレッド数の上限を集計から外す。
+
+        Args:
+            wait (bool, optional): 実行中の処理の終了を待つか
+            cancel_futures (bool, optional): 待機中の処理をキャンセルするか
+        """
+        super().shutdown(wait=wait, cancel_futures=cancel_futures)
+        if not self._stopped:
+            self._stopped = True
+            self._max_workers_gauge.dec(self._max_workers)
+
+    def _on_done(self, future: Future[Any]) -> None:
+        """
+        実行前にキャンセルされた処理を待機中から外す。
+
+        Args:
+            future (Future[Any]): 完了した処理
+        """
+        if future.cancelled():
+            self._queued.dec()
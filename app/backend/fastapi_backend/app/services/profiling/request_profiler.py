@@ -0,0 +1,365 @@
+"""
+指定されたリクエストの処理中に、スタックの採取とメモリ確保の記録を行い、フレームグラフに変換できる形式で出力する。
+スタックとメモリ確保はどちらも folded 形式(`フレーム;フレーム;... 値` の 1 行ごと)で出力し、
+flamegraph.pl・speedscope・inferno などでそのままフレームグラフにできる。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import orjson
+
+if TYPE_CHECKING:
+    from types import CodeType, FrameType
+
+    from app.types.profiling_type_defs import ProfileSummaryTypeDef, ProfileTrigger, ProfilingConfigTypeDef
+
+logger = logging.getLogger(__name__)
+
+# プロファイリングを有効にするトークンを指定するヘッダー(ASGI のヘッダー名は小文字)
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+# プロファイルのIDを返すレスポンスヘッダー
+PROFILE_ID_HEADER = b"x-profile-id"
+
+# 一番内側のフレームがこれらの場合、スレッドは待機中とみなしてスタックを数えない
+# (イベントループの I/O 待ち・スレッドプールの空き・Lock や Queue の待機)
+IDLE_LEAF_FUNCTIONS = frozenset({("selectors.py", "select"), ("thread.py", "_worker"), ("threading.py", "wait")})
+
+# フレーム名を短くするため取り除くパス(長いものから順に試す)
+_PATH_PREFIXES = tuple(
+    sorted({sysconfig.get_paths()["purelib"], sysconfig.get_paths()["stdlib"], str(Path.cwd())}, key=len, reverse=True),
+)
+# スレッドプールのスレッド名の連番(asyncio_0 など)。プールごとにまとめるため取り除く
+_THREAD_NUMBER_PATTERN = re.compile(r"[_-]\d+$")
+
+
+def _short_filename(filename: str) -> str:
+    """
+    フレーム名に使うファイル名を、site-packages・標準ライブラリ・作業ディレクトリからの相対パスにする。
+
+    Args:
+        filename (str): ファイル名
+
+    Returns:
+        str: 短くしたファイル名
+    """
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            return filename[len(prefix) :].lstrip(os.sep)
+    return filename
+
+
+class StackSampler:
+    """
+    一定間隔ですべてのスレッドのスタックを採取するプロファイラー
+    - 別スレッドから sys._current_frames を読むため、計測対象のコードには手を加えない。
+    - async の処理はイベントループのスレッドのコルーチンのスタックとして、asyncio.to_thread の処理はスレッドプールのスタックとして記録される。
+    - 実行時間ではなく経過時間の採取のため、I/O を待つ同期処理も記録される。待機中のスレッドのみ除く。
+    """
+
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._labels: dict[CodeType, tuple[str, bool]] = {}
+        self._thread_names: dict[int, str] = {}
+
+    def start(self) -> None:
+        """
+        スタックの採取を開始する。
+        """
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        スタックの採取を終了する。
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        """
+        採取用のスレッドで、停止されるまでスタックを採取する。
+        """
+        own_thread_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval_seconds):
+            for thread_id, frame in sys._current_frames().items():  # noqa: SLF001
+                if thread_id == own_thread_id:
+                    continue
+                stack = self._collapse(thread_id, frame)
+                if stack is not None:
+                    self.stacks[stack] += 1
+                    self.samples += 1
+
+    def _collapse(self, thread_id: int, frame: FrameType) -> str | None:
+        """
+        スタックを外側のフレームから順に ; で繋いだ 1 行にする。
+
+        Args:
+            thread_id (int): スレッドのID
+            frame (FrameType): 一番内側のフレーム
+
+        Returns:
+            str | None: folded 形式のスタック。スレッドが待機中の場合はNone
+        """
+        label, idle = self._label(frame.f_code)
+        if idle:
+            return None
+        labels = [label]
+        current = frame.f_back
+        while current is not None:
+            labels.append(self._label(current.f_code)[0])
+            current = current.f_back
+        labels.append(self._thread_name(thread_id))
+        return ";".join(reversed(labels))
+
+    def _label(self, code: CodeType) -> tuple[str, bool]:
+        """
+        フレーム名と、待機中の関数かを返す。
+
+        Args:
+            code (CodeType): フレームのコード
+
+        Returns:
+            tuple[str, bool]: `関数名 (ファイル名:行番号)` のフレーム名と、待機中の関数の場合はTrue
+        """
+        cached = self._labels.get(code)
+        if cached is None:
+            label = f"{code.co_qualname} ({_short_filename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+            idle = (Path(code.co_filename).name, code.co_name) in IDLE_LEAF_FUNCTIONS
+            cached = self._labels[code] = (label, idle)
+        return cached
+
+    def _thread_name(self, thread_id: int) -> str:
+        """
+        スレッド名を返す。スレッドプールの連番は取り除く。
+
+        Args:
+            thread_id (int): スレッドのID
+
+        Returns:
+            str: スレッド名
+        """
+        name = self._thread_names.get(thread_id)
+        if name is None:
+            self._thread_names = {thread.ident: _THREAD_NUMBER_PATTERN.sub("", thread.name) for thread in threading.enumerate() if thread.ident is not None}
+            name = self._thread_names.setdefault(thread_id, f"thread-{thread_id}")
+        return name
+
+
+class RequestProfiler:
+    """
+    リクエストごとのプロファイリングを管理する
+    - X-Profile-Token ヘッダーに設定のトークンを指定したリクエストと、設定の割合で選んだリクエストをプロファイリングする。
+    - スタックの採取と tracemalloc はプロセス全体が対象のため、同時には 1 リクエストのみプロファイリングし、その間の他のリクエストは対象にしない。
+      同時に処理中の他のリクエストのスタックやメモリ確保も含まれるため、低負荷の時間帯かステージング環境での利用を想定する。
+    """
+
+    def __init__(self, config: ProfilingConfigTypeDef) -> None:
+        self.config = config
+        self._token = config["token"].encode() if config["token"] else None
+        self._active = False
+
+    def trigger(self, headers: list[tuple[bytes, bytes]]) -> ProfileTrigger | None:
+        """
+        リクエストをプロファイリングするかを判定する。
+
+        Args:
+            headers (list[tuple[bytes, bytes]]): ASGI のリクエストヘッダー
+
+        Returns:
+            ProfileTrigger | None: プロファイリングする場合はその理由。しない場合はNone
+        """
+        if self._token is not None:
+            for name, value in headers:
+                if name == PROFILE_TOKEN_HEADER:
+                    if hmac.compare_digest(value, self._token):
+                        return "header"
+                    break
+        if self.config["sample_rate"] > 0 and random.random() < self.config["sample_rate"]:
+            return "sampled"
+        return None
+
+    def begin(self, method: str, path: str, trigger: ProfileTrigger) -> RequestProfile | None:
+        """
+        リクエストのプロファイリングを開始する。
+
+        Args:
+            method (str): HTTP メソッド
+            path (str): リクエストのパス
+            trigger (ProfileTrigger): プロファイリングする理由
+
+        Returns:
+            RequestProfile | None: 開始したプロファイリング。他のリクエストをプロファイリング中の場合はNone
+        """
+        if self._active:
+            logger.debug("他のリクエストをプロファイリング中のため、プロファイリングしません: %s %s", method, path)
+            return None
+        self._active = True
+        try:
+            profile = RequestProfile(self.config, method, path, trigger)
+            profile.start()
+        except BaseException:
+            self._active = False
+            raise
+        return profile
+
+    async def end(self, profile: RequestProfile, status: int) -> None:
+        """
+        リクエストのプロファイリングを終了し、結果を出力する。
+        メモリ確保の集計とファイルの書き込みはイベントループを止めないようスレッドで行う。
+
+        Args:
+            profile (RequestProfile): 終了するプロファイリング
+            status (int): レスポンスのステータスコード
+        """
+        try:
+            profile.stop_sampling()
+            summary = await asyncio.to_thread(profile.write, status)
+            logger.info(
+                "リクエストのプロファイルを出力しました: %s %s (%.3fs, samples=%d) -> %s",
+                summary["method"],
+                summary["path"],
+                summary["wall_seconds"],
+                summary["samples"],
+                summary["profile_id"],
+            )
+        except Exception:
+            logger.exception("リクエストのプロファイルの出力に失敗しました: %s", profile.profile_id)
+        finally:
+            profile.stop_tracing()
+            self._active = False
+
+
+class RequestProfile:
+    """
+    1 リクエストのプロファイリング
+    - 出力先に `<ID>.cpu.folded`(スタックごとの採取回数)、`<ID>.alloc.folded`(確保箇所のスタックごとの、終了時に解放されていないバイト数)、
+      `<ID>.json`(サマリー)を書き込む。
+    """
+
+    def __init__(self, config: ProfilingConfigTypeDef, method: str, path: str, trigger: ProfileTrigger) -> None:
+        self.config = config
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._sampler = StackSampler(config["interval_seconds"])
+        self._started_tracing = False
+        self._before: tracemalloc.Snapshot | None = None
+        self._started_at = 0.0
+        self._cpu_started_at = 0.0
+        self._wall_seconds = 0.0
+        self._process_cpu_seconds = 0.0
+
+    def start(self) -> None:
+        """
+        メモリ確保の記録とスタックの採取を開始する。
+        """
+        if self.config["tracemalloc_frames"] > 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.config["tracemalloc_frames"])
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+            self._before = tracemalloc.take_snapshot()
+        self._started_at = time.perf_counter()
+        self._cpu_started_at = time.process_time()
+        self._sampler.start()
+
+    def stop_sampling(self) -> None:
+        """
+        スタックの採取を終了し、所要時間を確定する。
+        """
+        self._wall_seconds = time.perf_counter() - self._started_at
+        self._process_cpu_seconds = time.process_time() - self._cpu_started_at
+        self._sampler.stop()
+
+    def stop_tracing(self) -> None:
+        """
+        このプロファイリングで開始したメモリ確保の記録を終了する。
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def write(self, status: int) -> ProfileSummaryTypeDef:
+        """
+        プロファイルを出力先に書き込む。
+
+        Args:
+            status (int): レスポンスのステータスコード
+
+        Returns:
+            ProfileSummaryTypeDef: プロファイルのサマリー
+        """
+        allocations: Counter[str] = Counter()
+        top_allocations: list[str] = []
+        peak_traced_bytes = 0
+        if self._before is not None:
+            peak_traced_bytes = tracemalloc.get_traced_memory()[1]
+            after = tracemalloc.take_snapshot()
+            self.stop_tracing()
+            filters = [
+                tracemalloc.Filter(inclusive=False, filename_pattern=tracemalloc.__file__),
+                tracemalloc.Filter(inclusive=False, filename_pattern=__file__),
+            ]
+            differences = after.filter_traces(filters).compare_to(self._before.filter_traces(filters), "traceback")
+            for difference in differences:
+                if difference.size_diff > 0:
+                    # tracemalloc のスタックは外側のフレームから順に並ぶ
+                    stack = ";".join(f"{_short_filename(frame.filename)}:{frame.lineno}" for frame in difference.traceback)
+                    allocations[stack] += difference.size_diff
+            top_allocations = [str(difference) for difference in differences[: self.config["top_allocations"]]]
+
+        summary: ProfileSummaryTypeDef = {
+            "profile_id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "status": status,
+            "wall_seconds": self._wall_seconds,
+            "process_cpu_seconds": self._process_cpu_seconds,
+            "samples": self._sampler.samples,
+            "allocated_bytes": sum(allocations.values()),
+            "peak_traced_bytes": peak_traced_bytes,
+            "top_allocations": top_allocations,
+        }
+
+        output_dir = self.config["output_dir"]
+        output_dir.mkdir(parents=True, exist_ok=True)
+        _write_folded(output_dir / f"{self.profile_id}.cpu.folded", self._sampler.stacks)
+        if self._before is not None:
+            _write_folded(output_dir / f"{self.profile_id}.alloc.folded", allocations)
+        (output_dir / f"{self.profile_id}.json").write_bytes(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
+        return summary
+
+
+def _write_folded(path: Path, stacks: Counter[str]) -> None:
+    """
+    スタックごとの値を folded 形式で書き込む。
+
+    Args:
+        path (Path): 出力先のファイル
+        stacks (Counter[str]): スタックごとの値
+    """
+    with path.open("w", encoding="utf-8") as f:
+        f.writelines(f"{stack} {value}\n" for stack, value in stacks.most_common())
@@ -0,0 +1,96 @@
+"""
+起動時のウォームアップの段階ごとの所要時間を計測し、リクエストを受け付けられる状態かを管理する。
+"""
+
+from __future__ import annotations
+
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from app.types.startup_type_defs import StartupState, StartupStatsTypeDef
+
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfiler:
+    """
+    起動時のウォームアップを計測する
+    - lifespan の起動処理を段階に分けて phase で囲み、所要時間を記録する。
+    - すべての段階が完了してから mark_ready を呼び、readiness を受け付け可能にする。
+      終了処理の開始時に mark_stopping を呼び、ロードバランサーが新しいリクエストを送らないようにする。
+    """
+
+    def __init__(self) -> None:
+        self.state: StartupState = "warming_up"
+        self._started_at = time.perf_counter()
+        self._phases: dict[str, float] = {}
+        self._warm_up_seconds: float | None = None
+        self._loaded_modules: int | None = None
+
+    @property
+    def ready(self) -> bool:
+        """
+        リクエストを受け付けられる状態か。
+
+        Returns:
+            bool: ウォームアップが完了し、終了処理が始まっていなければTrue
+        """
+        return self.state == "ready"
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        ウォームアップの段階の所要時間を計測する。
+
+        Args:
+            name (str): 段階の名前
+
+        Yields:
+            None: 計測中の処理を実行する
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phases[name] = time.perf_counter() - started_at
+
+    def mark_ready(self) -> None:
+        """
+        ウォームアップの完了を記録し、リクエストを受け付けられる状態にする。
+        """
+        self._warm_up_seconds = time.perf_counter() - self._started_at
+        self._loaded_modules = len(sys.modules)
+        self.state = "ready"
+        logger.info(
+            "ウォームアップが完了しました (%.3fs, modules=%d): %s",
+            self._warm_up_seconds,
+            self._loaded_modules,
+            ", ".join(f"{name}={seconds:.3f}s" for name, seconds in self._phases.items()),
+        )
+
+    def mark_stopping(self) -> None:
+        """
+        終了処理の開始を記録し、リクエストを受け付けない状態にする。
+        """
+        self.state = "stopping"
+
+    def stats(self) -> StartupStatsTypeDef:
+        """
+        計測結果を返す。
+
+        Returns:
+            StartupStatsTypeDef: 計測結果
+        """
+        return {
+            "state": self.state,
+            "phases": dict(self._phases),
+            "warm_up_seconds": self._warm_up_seconds,
+            "loaded_modules": self._loaded_modules,
+        }
@@ -2,16 +2,34 @@
 Bedrock モデルで使用する型定義および設定値の構造を定義する。
 """
 
-from enum import Enum
-from typing import Generic, NotRequired, TypedDict, TypeVar
+from __future__ import annotations
+
+from enum import Enum, StrEnum
+from io import IOBase
+from typing import IO, TYPE_CHECKING, Any, AsyncGenerator, Generic, Literal, NotRequired, TypedDict, TypeVar
 
 from fastapi import UploadFile
-from mypy_boto3_bedrock_runtime.type_defs import (
-    ConverseRequestRequestTypeDef,
-    ConverseStreamRequestRequestTypeDef,
-    InvokeModelRequestRequestTypeDef,
-    InvokeModelWithResponseStreamRequestRequestTypeDef,
-)
+
+if TYPE_CHECKING:
+    # スタブパッケージは型チェック時のみ読み込む(実行時に読み込むとパッケージ全体の型定義の読み込みで起動が遅くなる)
+    from mypy_boto3_bedrock_runtime.type_defs import (
+        BlobTypeDef,
+        ConverseRequestRequestTypeDef,
+        ConverseStreamOutputTypeDef,
+        ConverseStreamRequestRequestTypeDef,
+        InvokeModelRequestRequestTypeDef,
+        InvokeModelWithResponseStreamRequestRequestTypeDef,
+        ResponseStreamTypeDef,
+    )
+
+    from app.services.bedrock.completion_cache import CompletionCache
+    from app.services.bedrock.concurrency_limiter import AdaptiveConcurrencyLimiter
+    from app.services.bedrock.hedging import RequestHedger
+    from app.services.bedrock.region_router import RegionRouter
+    from app.services.bedrock.single_flight import SingleFlight
+else:
+    # 実行時は読み込みに時間がかかる botocore.response を避け、StreamingBody の代わりにその基底クラスの IOBase で受け付ける
+    BlobTypeDef = str | bytes | IO[Any] | IOBase
 
 ###############################################################
 # 共通
@@ -19,6 +37,15 @@ from mypy_boto3_bedrock_runtime.type_defs import (
 
 T = TypeVar("T")
 
+# Bedrock Runtime の列挙値。スキーマの検証で実行時に使うため、mypy_boto3_bedrock_runtime と同じ定義をここに置く
+ConversationRoleType = Literal["assistant", "user"]
+DocumentFormatType = Literal["csv", "doc", "docx", "html", "md", "pdf", "txt", "xls", "xlsx"]
+GuardrailConverseContentQualifierType = Literal["grounding_source", "guard_content", "query"]
+GuardrailConverseImageFormatType = Literal["jpeg", "png"]
+ImageFormatType = Literal["gif", "jpeg", "png", "webp"]
+ToolResultStatusType = Literal["error", "success"]
+VideoFormatType = Literal["flv", "mkv", "mov", "mp4", "mpeg", "mpg", "three_gp", "webm", "wmv"]
+
 InvokeRequestTypeDef = str | bytes | UploadFile  # invoke_modelのリクエストで受け取るパラメーターの型
 
 
@@ -28,6 +55,385 @@ class ModelType(str, Enum):
     LLAMA3 = "Llama3"
 
 
+class BedrockClientConfigTypeDef(TypedDict):
+    """
+    Bedrockランタイムクライアント(コネクションプール・タイムアウト・リトライ)の設定の型定義
+    """
+
+    transport: Literal["boto3", "http"]  # boto3: スレッド経由でboto3を使用, http: ネイティブ非同期HTTP/2
+    endpoint_url: str | None  # エンドポイントURL(ローカルの疑似エンドポイント等)。Noneの場合は既定のURL
+    max_pool_connections: int  # 1クライアントあたりの最大コネクション数
+    connect_timeout: float  # 接続タイムアウト(秒)
+    read_timeout: float  # 読み込みタイムアウト(秒)
+    max_attempts: int  # 最大試行回数(初回を含む)
+    retry_mode: Literal["legacy", "standard", "adaptive"]  # リトライモード
+    tcp_keepalive: bool  # TCP Keep-Aliveを有効にするか
+    warmup_connections: int  # 起動時に事前に開いておくコネクション数
+    stream_pump_threads: int  # boto3 のストリームを読み込むワーカースレッド数
+    stream_buffer_size: int  # ストリーム 1 本あたりにバッファするイベントの最大数
+
+
+class BedrockConnectionPoolStatsTypeDef(TypedDict):
+    """
+    コネクションプール使用状況の型定義
+    """
+
+    transport: str
+    max_pool_connections: int
+    opened_connections: int  # これまでに開いたコネクション数
+    idle_connections: int  # プールで待機中のコネクション数
+    requests: int  # プール経由で送信したリクエスト数
+
+
+class BedrockClientPoolStatsTypeDef(BedrockConnectionPoolStatsTypeDef):
+    """
+    Bedrockランタイムクライアントごとのコネクションプール使用状況の型定義
+    """
+
+    region: str
+    model_type: str
+
+
+class BedrockClientLayersTypeDef(TypedDict):
+    """
+    BedrockClientRegistry がランタイムを包む機能の型定義。指定しない機能は使用しない
+    """
+
+    completion_cache: NotRequired[CompletionCache]  # 生成結果キャッシュ
+    single_flight: NotRequired[SingleFlight]  # 同時リクエストのまとめ
+    concurrency_limiter: NotRequired[AdaptiveConcurrencyLimiter]  # モデルごとの同時実行数制御
+    hedger: NotRequired[RequestHedger]  # ヘッジリクエスト
+    region_router: NotRequired[RegionRouter]  # リージョンの選択
+    instrumented: NotRequired[bool]  # 上流の呼び出しのメトリクスを記録するか
+
+
+class InvokeModelResultTypeDef(TypedDict):
+    """
+    BedrockRuntimeBase.invoke_model のレスポンス型定義
+    """
+
+    body: bytes
+    contentType: str
+
+
+class ConverseStreamResultTypeDef(TypedDict):
+    """
+    BedrockRuntimeBase.converse_stream のレスポンス型定義
+    """
+
+    stream: AsyncGenerator[ConverseStreamOutputTypeDef]
+
+
+class InvokeModelStreamResultTypeDef(TypedDict):
+    """
+    BedrockRuntimeBase.invoke_model_with_response_stream のレスポンス型定義
+    """
+
+    body: AsyncGenerator[ResponseStreamTypeDef]
+    contentType: str
+
+
+class StreamEventTypeDef(TypedDict):
+    """
+    モデルサービスが返すストリーミング応答のイベントの型定義。SSE ではイベント名とデータとして送る
+    """
+
+    event: Literal["delta", "messageStop", "metadata", "error"]
+    data: dict[str, Any]  # delta は text、messageStop は stopReason、metadata は usage と metrics、error は status_code と detail を含む
+    id: NotRequired[str]  # 再開用のイベントID(<生成ID>:<連番>)。SSE の id として送る
+
+
+class SseConfigTypeDef(TypedDict):
+    """
+    ストリーミング応答を Server-Sent Events で返す際の設定の型定義
+    """
+
+    flush_interval: float  # 差分を最初にバッファしてから送信するまでの最大待ち時間(秒)。0 の場合はまとめない
+    flush_bytes: int  # バッファした差分がこのサイズ(バイト)以上になった時点で送信する
+
+
+class ResumableStreamConfigTypeDef(TypedDict):
+    """
+    ストリーミング応答を Last-Event-ID で再開するためのバッファの設定の型定義
+    """
+
+    enabled: bool  # 再開を有効にするか
+    max_events_per_stream: int  # 1 つの生成で保持するイベント数の上限。超えた分は古いものから捨てる
+    max_total_bytes: int  # すべての生成で保持するイベントの合計サイズの上限(バイト)
+    ttl: float  # 生成の完了後にイベントを保持する時間(秒)
+
+
+class ResumableStreamStatsTypeDef(TypedDict):
+    """
+    ストリーミング応答を Last-Event-ID で再開するためのバッファの統計情報の型定義
+    """
+
+    streams: int  # 保持している生成の数
+    running_streams: int  # 上流のストリームを読み込み中の生成の数
+    buffered_events: int  # 保持しているイベントの数
+    buffered_bytes: int  # 保持しているイベントの合計サイズ(バイト)
+    started: int  # 開始した生成の数
+    resumes: int  # Last-Event-ID で再開した回数
+    resume_misses: int  # 生成もしくはイベントが残っておらず再開できなかった回数
+    expired_streams: int  # 保持期間を過ぎて捨てた生成の数
+    evicted_streams: int  # 合計サイズの上限を超えたため捨てた完了済みの生成の数
+    evicted_events: int  # 生成ごとのイベント数もしくは合計サイズの上限を超えたため捨てたイベントの数
+
+
+class StreamCancellationStatsTypeDef(TypedDict):
+    """
+    ストリーミング応答の途中で上流の生成を打ち切った回数の統計情報の型定義
+    """
+
+    cancelled_streams: int  # 上流の生成が終わる前に打ち切ったストリームの数
+    cancelled_by: dict[str, int]  # 打ち切った理由(disconnect・stop_sequence・max_chars・json_complete)ごとの数
+    deltas_before_cancel: int  # 打ち切るまでに受信した差分の数
+    estimated_tokens_saved: int  # 生成するトークン数の上限から、打ち切るまでの差分の数を引いた値の合計(節約したトークン数の上限の見積もり)
+
+
+class ChatSocketConfigTypeDef(TypedDict):
+    """
+    WebSocket で複数ターンの会話を行うエンドポイントの設定の型定義
+    """
+
+    max_concurrent_turns: int  # 1 接続あたりに同時に生成できる応答の数
+    idle_timeout: float  # 生成中の応答がなく、クライアントからメッセージを受信しない場合に接続を閉じるまでの時間(秒)
+
+
+class CompletionCacheMode(StrEnum):
+    """リクエストごとのキャッシュの利用方法を表す列挙型"""
+
+    USE = "use"  # キャッシュを読み書きする
+    REFRESH = "refresh"  # キャッシュを読まずに生成し、結果で上書きする
+    BYPASS = "bypass"  # キャッシュを読み書きしない
+
+
+class CompletionCacheConfigTypeDef(TypedDict):
+    """
+    生成結果キャッシュの設定の型定義
+    """
+
+    enabled: bool  # キャッシュを有効にするか
+    max_bytes: int  # メモリ上に保持する最大バイト数
+    ttl_seconds: float  # キャッシュの有効期間(秒)
+    max_temperature: float  # キャッシュ対象とする temperature の上限
+    disk_path: str | None  # ディスク層(sqlite)のファイルパス。Noneの場合はディスク層を使用しない
+    disk_max_entries: int  # ディスク層に保持する最大件数
+
+
+class CompletionCacheStatsTypeDef(TypedDict):
+    """
+    生成結果キャッシュの統計情報の型定義
+    """
+
+    memory_hits: int  # メモリ層でヒットした回数
+    disk_hits: int  # ディスク層でヒットした回数
+    misses: int  # キャッシュになく生成した回数
+    bypasses: int  # オプトアウトまたはキャッシュ対象外のため素通りした回数
+    stores: int  # キャッシュに保存した回数
+    evictions: int  # メモリ層から追い出した回数
+    hit_ratio: float  # ヒット率
+    entries: int  # メモリ層の件数
+    bytes: int  # メモリ層の使用バイト数
+    max_bytes: int
+    disk_enabled: bool
+
+
+class SingleFlightStatsTypeDef(TypedDict):
+    """
+    同一リクエストの呼び出しをまとめる single-flight の統計情報の型定義
+    """
+
+    calls: int  # 上流を呼び出した回数
+    coalesced_calls: int  # 実行中の呼び出しに相乗りした回数
+    streams: int  # 上流のストリームを開始した回数
+    coalesced_streams: int  # 実行中のストリームを購読した回数
+    in_flight_calls: int  # 実行中の呼び出し数
+    in_flight_streams: int  # 実行中のストリーム数
+
+
+class BatchConverseConfigTypeDef(TypedDict):
+    """
+    バッチ Converse の設定の型定義
+    """
+
+    max_items: int  # 1 リクエストで受け付ける最大件数
+    default_concurrency: int  # 同時実行数の既定値
+    max_concurrency: int  # 同時実行数の上限
+
+
+class ConverseBatchItemErrorTypeDef(TypedDict):
+    """
+    バッチ Converse の個々の入力で発生したエラーの型定義
+    """
+
+    status_code: int
+    detail: str
+
+
+class ConverseBatchItemResultTypeDef(TypedDict):
+    """
+    バッチ Converse の個々の入力の結果の型定義
+    """
+
+    index: int  # リクエストでの入力のインデックス
+    output: NotRequired[str]  # モデルからのレスポンス
+    error: NotRequired[ConverseBatchItemErrorTypeDef]  # エラーの場合のみ
+
+
+class BulkInferenceConfigTypeDef(TypedDict):
+    """
+    オフライン一括推論 CLI の設定の型定義
+    """
+
+    concurrency: int  # 同時実行数の既定値
+    batch_job_threshold: int  # この件数以上の場合は Bedrock のバッチ推論ジョブを使用する
+    poll_interval: float  # バッチ推論ジョブの状態を確認する間隔(秒)
+
+
+class ConcurrencyLimiterConfigTypeDef(TypedDict):
+    """
+    モデルごとの適応的な同時実行数制御(AIMD)の設定の型定義
+    """
+
+    enabled: bool  # 同時実行数制御を有効にするか
+    initial_limit: int  # 同時実行数の上限の初期値
+    min_limit: int  # 同時実行数の上限の最小値
+    max_limit: int  # 同時実行数の上限の最大値
+    additive_increase: float  # 成功時に上限へ加算する量(上限 1 つ分の成功で加算される合計)
+    multiplicative_decrease: float  # スロットリング時に上限へ乗じる係数
+    queue_timeout: float  # 空きを待つ最大時間(秒)
+    max_queue: int  # 空きを待つリクエスト数の上限
+    retry_after: float  # スロットリング時にクライアントへ返す Retry-After(秒)
+
+
+class ConcurrencyLimiterStatsTypeDef(TypedDict):
+    """
+    モデルごとの同時実行数制御の統計情報の型定義
+    """
+
+    model_id: str
+    limit: float  # 現在の同時実行数の上限
+    in_flight: int  # 実行中のリクエスト数
+    queue_depth: int  # 空きを待っているリクエスト数
+    wait_time_ewma_ms: float  # 空きを待った時間の指数移動平均(ミリ秒)
+    wait_time_max_ms: float  # 空きを待った時間の最大値(ミリ秒)
+    successes: int  # 成功した回数
+    throttles: int  # 上流でスロットリングされた回数
+    rejections: int  # 待機の上限・タイムアウトにより打ち切った回数
+
+
+class RegionRoutingConfigTypeDef(TypedDict):
+    """
+    応答時間に応じたリージョンの選択とサーキットブレーカーの設定の型定義
+    """
+
+    enabled: bool  # リージョンの選択を有効にするか
+    regions: list[str]  # 呼び出し先の候補とするリージョン
+    ewma_alpha: float  # 応答時間・エラー率の指数移動平均の平滑化係数
+    failure_threshold: int  # サーキットを開く連続失敗数
+    error_rate_threshold: float  # サーキットを開くエラー率(0-1)
+    min_samples: int  # エラー率で判定するのに必要なサンプル数
+    open_duration: float  # サーキットを開いてから試験的な呼び出しを行うまでの時間(秒)
+
+
+class RegionRoutingStatsTypeDef(TypedDict):
+    """
+    モデル・リージョンごとのリージョン選択の統計情報の型定義
+    """
+
+    model_id: str
+    region: str
+    state: str  # サーキットの状態(closed / open / half_open)
+    latency_ewma_ms: float  # 応答時間の指数移動平均(ミリ秒)
+    error_rate_ewma: float  # エラー率の指数移動平均
+    in_flight: int  # 実行中の呼び出し数
+    routed: int  # 呼び出し先に選んだ回数
+    failures: int  # 障害・スロットリングで失敗した回数
+    circuit_opens: int  # サーキットを開いた回数
+    probes: int  # 試験的な呼び出しを行った回数
+
+
+class HedgingConfigTypeDef(TypedDict):
+    """
+    別リージョンへのヘッジリクエストの設定の型定義
+    """
+
+    enabled: bool  # ヘッジリクエストを有効にするか
+    region: str  # ヘッジを送るリージョン(リージョンの選択が有効な場合は使わず、2 番目に優先度の高いリージョンへ送る)
+    percentile: float  # ヘッジを送るまでの待機時間とする応答時間の percentile (0-1)
+    initial_delay: float  # 応答時間のサンプルが揃うまでの待機時間(秒)
+    min_delay: float  # 待機時間の最小値(秒)
+    min_samples: int  # percentile を求めるのに必要なサンプル数
+    window_size: int  # percentile を求める直近のサンプル数
+    budget_ratio: float  # リクエスト 1 件あたりに貯まるヘッジ予算(ヘッジ率の上限)
+    budget_burst: int  # 貯めておけるヘッジ予算の上限(回数)
+
+
+class HedgingStatsTypeDef(TypedDict):
+    """
+    モデル・API ごとのヘッジリクエストの統計情報の型定義
+    """
+
+    model_id: str
+    operation: str
+    requests: int  # リクエスト数
+    hedged: int  # ヘッジを送った回数
+    hedge_rate: float  # ヘッジを送った割合
+    hedge_wins: int  # ヘッジの結果を使った回数
+    primary_wins: int  # ヘッジを送ったが最初の呼び出しの結果を使った回数
+    budget_denied: int  # 予算不足のためヘッジを送らなかった回数
+    budget_tokens: float  # 残りのヘッジ予算
+    delay_ms: float  # 現在のヘッジを送るまでの待機時間(ミリ秒)
+    samples: int  # 待機時間の算出に使う応答時間のサンプル数
+
+
+class ConversationHistoryConfigTypeDef(TypedDict):
+    """
+    会話履歴を入力トークン数の上限に収める処理の設定の型定義
+    """
+
+    enabled: bool  # 会話履歴を上限に収めるか
+    max_input_tokens: int  # システムプロンプトと会話履歴の合計トークン数の上限
+    summary_enabled: bool  # 切り捨てたターンを要約に置き換えるか
+    summary_max_tokens: int  # 要約の最大トークン数
+
+
+class AttachmentUploadConfigTypeDef(TypedDict):
+    """
+    multipart で受け取る添付ファイルの設定の型定義
+    """
+
+    max_files: int  # 1 リクエストあたりの添付ファイル数の上限
+    max_total_bytes: int  # 1 リクエストあたりの添付ファイルの合計サイズの上限(バイト)
+    memory_limit: int  # 1 リクエストあたりにメモリ上に保持する添付ファイルの上限(バイト)。超えた分は一時ファイルに書き出す
+
+
+class AttachmentOffloadConfigTypeDef(TypedDict):
+    """
+    大きな添付ファイルを S3 に置いて参照させる処理の設定の型定義
+    """
+
+    enabled: bool  # S3 への退避を有効にするか
+    bucket: str  # 退避先のバケット
+    prefix: str  # 退避先のキーのプレフィックス
+    bucket_owner: str | None  # バケットの所有者のアカウントID。Bedrock に s3Location と併せて渡す
+    threshold_bytes: int  # 退避する添付ファイルの最小サイズ(バイト)
+    known_keys_max_entries: int  # アップロード済みとして記憶するキーの最大件数
+
+
+class AttachmentOffloadStatsTypeDef(TypedDict):
+    """
+    大きな添付ファイルを S3 に置いて参照させる処理の統計情報の型定義
+    """
+
+    offloaded: int  # s3Location に置き換えた添付ファイルの数
+    uploads: int  # S3 にアップロードした回数
+    uploaded_bytes: int  # S3 にアップロードした合計サイズ(バイト)
+    dedupe_hits: int  # 同じ内容のオブジェクトが既にあるためアップロードを省いた回数
+    failures: int  # 退避に失敗し、バイト列のまま送った回数
+
+
 class SdkConfigTypeDef(TypedDict):
     """
     Bedrockランタイムクライアントの各メソッドで使用する設定の型定義
@@ -46,6 +452,7 @@ class ConfigTypeDef(TypedDict, Generic[T]):
 
     sdk: SdkConfigTypeDef
     model: NotRequired[T]
+    history: NotRequired[ConversationHistoryConfigTypeDef]  # 省略時は会話履歴をそのまま渡す
 
 
 ###############################################################
@@ -82,3 +489,4 @@ class LlamaConfigTypeDef(TypedDict):
 
     invoke: LlamaInvokeRequestModelConfigTypeDef
     invoke_stream: LlamaInvokeRequestStreamModelConfigTypeDef
+    system_prompt: NotRequired[str]  # invoke 系のプロンプトの先頭に入れるシステムプロンプト。空の場合は入れない
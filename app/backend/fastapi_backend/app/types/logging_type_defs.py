@@ -0,0 +1,14 @@
+"""
+ロギングで使用する型定義および設定値の構造を定義する。
+"""
+
+from typing import TypedDict
+
+
+class LogSamplingRuleTypeDef(TypedDict):
+    """
+    ロガーごとのサンプリングと流量制限の設定の型定義
+    """
+
+    sample_rate: float  # 出力するログの割合(0〜1)。1 の場合はサンプリングしない
+    max_per_second: float  # 1 秒あたりに出力するログの上限(バーストも同じ件数まで)
@@ -0,0 +1,22 @@
+"""
+メトリクスで使用する型定義および設定値の構造を定義する。
+"""
+
+from typing import TypedDict
+
+
+class MetricsConfigTypeDef(TypedDict):
+    """
+    Prometheus のメトリクスの設定の型定義
+    """
+
+    enabled: bool  # メトリクスの計測と /metrics を有効にするか
+    path: str  # メトリクスを返すパス
+    multiprocess_dir: str | None  # 複数ワーカーで集計する場合のメトリクスの保存先(PROMETHEUS_MULTIPROC_DIR)。Noneの場合はプロセス内のみ
+    default_thread_pool_workers: int | None  # asyncio.to_thread が使うスレッドプールのスレッド数。Noneの場合は ThreadPoolExecutor の既定値
+    latency_buckets: tuple[float, ...]  # リクエスト・Bedrock の呼び出しの所要時間のバケット(秒)
+    time_to_first_token_buckets: tuple[float, ...]  # 最初のトークンまでの時間のバケット(秒)
+    inter_token_buckets: tuple[float, ...]  # トークンの間隔のバケット(秒)
+    output_tokens_buckets: tuple[float, ...]  # ストリーム 1 本あたりの出力トークン数のバケット
+    tokens_per_second_buckets: tuple[float, ...]  # 1 秒あたりの出力トークン数のバケット
+    queue_wait_buckets: tuple[float, ...]  # スレッドプールの空きを待った時間のバケット(秒)
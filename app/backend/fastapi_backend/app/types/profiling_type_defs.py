@@ -0,0 +1,41 @@
+"""
+リクエストのプロファイリングで使用する型定義および設定値の構造を定義する。
+"""
+
+from pathlib import Path
+from typing import Literal, TypedDict
+
+# プロファイリングした理由(トークンのヘッダー・割合によるサンプリング)
+ProfileTrigger = Literal["header", "sampled"]
+
+
+class ProfilingConfigTypeDef(TypedDict):
+    """
+    リクエストのプロファイリングの設定の型定義
+    """
+
+    enabled: bool  # プロファイリングのミドルウェアを登録するか。Falseの場合はミドルウェア自体を登録しない
+    token: str | None  # ヘッダーで指定するとそのリクエストをプロファイリングするトークン。Noneの場合はヘッダーでは有効にしない
+    sample_rate: float  # トークンの指定がないリクエストをプロファイリングする割合(0〜1)
+    interval_seconds: float  # スタックを採取する間隔(秒)
+    tracemalloc_frames: int  # メモリ確保の箇所として記録するスタックの深さ。0の場合はメモリ確保を記録しない
+    top_allocations: int  # サマリーに出力するメモリ確保の箇所の数
+    output_dir: Path  # プロファイルの出力先のディレクトリ
+
+
+class ProfileSummaryTypeDef(TypedDict):
+    """
+    リクエストのプロファイルのサマリーの型定義
+    """
+
+    profile_id: str  # プロファイルのID(レスポンスの X-Profile-Id と出力ファイル名に使う)
+    method: str  # HTTP メソッド
+    path: str  # リクエストのパス
+    trigger: ProfileTrigger  # プロファイリングした理由
+    status: int  # レスポンスのステータスコード
+    wall_seconds: float  # リクエストの所要時間(ストリーミング応答は最後のチャンクまで)
+    process_cpu_seconds: float  # プロセス全体(全スレッド)の CPU 時間。同時に処理中のリクエストの分も含む
+    samples: int  # 採取したスタックの数(待機中のスレッドを除く)
+    allocated_bytes: int  # リクエスト中に確保され、終了時に解放されていないメモリの合計(バイト)
+    peak_traced_bytes: int  # リクエスト中に確保されたメモリのピーク(バイト)
+    top_allocations: list[str]  # 確保したメモリの多い箇所
@@ -0,0 +1,19 @@
+"""
+起動処理で使用する型定義を定義する。
+"""
+
+from typing import Literal, TypedDict
+
+# 起動の状態(ウォームアップ中・リクエストを受け付け可能・終了処理中)
+StartupState = Literal["warming_up", "ready", "stopping"]
+
+
+class StartupStatsTypeDef(TypedDict):
+    """
+    起動処理の計測結果の型定義
+    """
+
+    state: StartupState  # 起動の状態
+    phases: dict[str, float]  # ウォームアップの段階ごとの所要時間(秒)
+    warm_up_seconds: float | None  # ウォームアップ全体の所要時間(秒)。完了前はNone
+    loaded_modules: int | None  # ウォームアップ完了時に読み込み済みのモジュール数。遅延読み込みの退行の検知に使う
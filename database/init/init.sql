@@ -0,0 +1,18 @@
+-- 会話セッション
+CREATE TABLE IF NOT EXISTS conversation_sessions (
+    session_id UUID PRIMARY KEY,
+    model_type TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- 会話セッションのメッセージ(追記のみ)
+-- 主キー (session_id, seq) のインデックスで、セッションの履歴を順序どおりに 1 回のクエリで読み込む
+CREATE TABLE IF NOT EXISTS conversation_messages (
+    session_id UUID NOT NULL REFERENCES conversation_sessions (session_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+    content JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (session_id, seq)
+);